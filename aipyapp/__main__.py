@@ -107,7 +107,8 @@ def init_settings(conf, args):
         display_config = settings.setdefault('display', {})
         display_config['style'] = args.style
     if args.agent:
-        settings['agent'] = {'port': args.port, 'host': args.host}
+        agent_config = settings.setdefault('agent', {})
+        agent_config.update({'port': args.port, 'host': args.host})
 
     #TODO: remove these lines
     if conf.check_config(gui=True) == 'TrustToken':
@@ -4,7 +4,8 @@
 import uuid
 import time
 import asyncio
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
@@ -12,11 +13,20 @@ from loguru import logger
 
 from .taskmgr import TaskManager
 from .task import Task
+from .config import CONFIG_DIR
+from .metrics import REGISTRY
+from .task_store import AgentTaskStore, FINISHED_STATUSES
+
+def _to_timestamp(dt: Optional[datetime]) -> Optional[float]:
+    return dt.timestamp() if dt else None
+
+def _from_timestamp(ts: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(ts) if ts else None
 
 class AgentTask:
     """Agent任务封装"""
     
-    def __init__(self, task_id: str, instruction: str, task: Task, display: Any):
+    def __init__(self, task_id: str, instruction: str, task: Optional[Task], display: Any):
         self.task_id = task_id
         self.instruction = instruction
         self.task = task
@@ -26,9 +36,58 @@ class AgentTask:
         self.started_at = None
         self.completed_at = None
         self.error = None
-        
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典格式"""
+        # Task 释放后保留的捕获数据
+        self.captured_data = None
+        # 执行线程是否还在运行 Task（取消后线程返回前状态已经是 cancelled）
+        self.running = False
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> 'AgentTask':
+        """从持久化记录恢复（不含 Task 对象）"""
+        agent_task = cls(record['task_id'], record['instruction'], None, None)
+        agent_task.status = record['status']
+        agent_task.created_at = _from_timestamp(record['created_at'])
+        agent_task.started_at = _from_timestamp(record['started_at'])
+        agent_task.completed_at = _from_timestamp(record['completed_at'])
+        agent_task.error = record['error']
+        agent_task.captured_data = record.get('data')
+        return agent_task
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    @property
+    def is_releasable(self) -> bool:
+        """已结束且执行线程已经返回，可以释放 Task 放回任务池"""
+        return self.is_finished and not self.running
+
+    def get_captured_data(self) -> Optional[Dict]:
+        """获取捕获的数据"""
+        if self.display:
+            return self.display.get_captured_data()
+        return self.captured_data
+
+    def release(self):
+        """释放 Task 和显示对象，只保留捕获的数据"""
+        self.captured_data = self.get_captured_data()
+        self.task = None
+        self.display = None
+
+    def to_record(self) -> Dict[str, Any]:
+        """转换为持久化记录"""
+        return {
+            'task_id': self.task_id,
+            'instruction': self.instruction,
+            'status': self.status,
+            'created_at': _to_timestamp(self.created_at),
+            'started_at': _to_timestamp(self.started_at),
+            'completed_at': _to_timestamp(self.completed_at),
+            'error': self.error,
+        }
+
+    def to_summary(self) -> Dict[str, Any]:
+        """转换为摘要格式（不含捕获数据）"""
         return {
             'task_id': self.task_id,
             'instruction': self.instruction,
@@ -36,22 +95,116 @@ class AgentTask:
             'created_at': self.created_at.isoformat(),
             'started_at': self.started_at.isoformat() if self.started_at else None,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None,
-            'error': self.error,
-            'captured_data': self.display.get_captured_data() if self.display else None
         }
 
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典格式"""
+        data = self.to_summary()
+        data['error'] = self.error
+        data['captured_data'] = self.get_captured_data()
+        return data
+
 class AgentTaskManager(TaskManager):
     """Agent模式任务管理器"""
+    # 任务的生命周期由 agent_tasks 的淘汰管理，tasks 不能按数量丢弃还在执行的任务
+    MAX_TASKS = None
+    MAX_HOT_TASKS = 32
+    HOT_TTL = 600
+    EVICT_INTERVAL = 60
+    TASK_POOL_SIZE = 4
     
     def __init__(self, settings, /, display_manager=None):
         # 强制使用agent显示模式和headless设置
         super().__init__(settings, display_manager=display_manager)
         
         # Agent特有属性
-        self.agent_tasks: Dict[str, AgentTask] = {}
+        agent_config = self.settings.get('agent', {})
+        self.max_hot_tasks = agent_config.get('max_hot_tasks', self.MAX_HOT_TASKS)
+        self.hot_ttl = agent_config.get('hot_ttl', self.HOT_TTL)
+        self.evict_interval = agent_config.get('evict_interval', self.EVICT_INTERVAL)
+        self._evict_task = None
+        self.store = AgentTaskStore(agent_config.get('db_file') or CONFIG_DIR / 'agent_tasks.db')
+        self.store.mark_interrupted()
+        if not self.task_pool:
+            self._init_task_pool(agent_config.get('task_pool_size', self.TASK_POOL_SIZE))
+
+        # 内存中的热任务集合，按最近访问顺序排列
+        self.agent_tasks: OrderedDict[str, AgentTask] = OrderedDict()
         self.executor = ThreadPoolExecutor(max_workers=4)  # 支持并发
         self.log = logger.bind(src='agent_taskmgr')
+        REGISTRY.gauge('aipy_agent_tasks', 'Agent tasks in memory by status', self._count_tasks, ('status',))
+
+    def _count_tasks(self) -> Dict[Tuple[str], int]:
+        """队列深度：内存中各状态的任务数"""
+        counts = {(status,): 0 for status in ('pending', 'running')}
+        for agent_task in list(self.agent_tasks.values()):
+            counts[(agent_task.status,)] = counts.get((agent_task.status,), 0) + 1
+        return counts
         
+    def _save(self, agent_task: AgentTask, with_data: bool = False):
+        """写入任务记录到持久化存储"""
+        data = agent_task.get_captured_data() if with_data else None
+        try:
+            self.store.save(agent_task.to_record(), data)
+        except Exception as e:
+            self.log.error(f"Failed to save task {agent_task.task_id}: {e}")
+
+    def _get_agent_task(self, task_id: str) -> AgentTask:
+        """从热任务集合或持久化存储获取任务"""
+        agent_task = self.agent_tasks.get(task_id)
+        if agent_task:
+            self.agent_tasks.move_to_end(task_id)
+            return agent_task
+
+        record = self.store.get(task_id)
+        if not record:
+            raise ValueError(f"Task {task_id} not found")
+        return AgentTask.from_record(record)
+
+    def _release(self, task_id: str):
+        """将已完成任务移出内存"""
+        agent_task = self.agent_tasks.pop(task_id)
+        task = agent_task.task
+        try:
+            self.tasks.remove(task)
+        except ValueError:
+            pass
+        agent_task.release()
+        # 捕获数据已保存，Task 可以重置后放回任务池
+        if self.task_pool and task:
+            self.task_pool.release(task)
+        self.log.info(f"Task evicted from memory: {task_id}")
+
+    def _evict(self):
+        """按 TTL 和 LRU 淘汰已完成的任务"""
+        now = time.time()
+        overflow = len(self.agent_tasks) - self.max_hot_tasks
+        for task_id, agent_task in list(self.agent_tasks.items()):
+            if not agent_task.is_releasable:
+                continue
+            expired = now - agent_task.completed_at.timestamp() > self.hot_ttl
+            if overflow > 0 or expired:
+                self._release(task_id)
+                overflow -= 1
+
+    def start(self):
+        """在当前事件循环中定时淘汰任务，没有新的提交和执行时过期任务也会被释放"""
+        if self._evict_task is None and self.evict_interval > 0:
+            self._evict_task = asyncio.get_running_loop().create_task(self._evict_loop())
+
+    def stop(self):
+        if self._evict_task:
+            self._evict_task.cancel()
+            self._evict_task = None
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(self.evict_interval)
+            try:
+                self._evict()
+            except Exception as e:
+                self.log.error(f"Failed to evict tasks: {e}")
+
     async def submit_task(self, instruction: str, metadata: Dict[str, Any] = None) -> str:
         """提交新任务"""
         task_id = str(uuid.uuid4())
@@ -78,6 +231,8 @@ class AgentTaskManager(TaskManager):
             agent_task.status = 'pending'
             
             self.agent_tasks[task_id] = agent_task
+            self._save(agent_task)
+            self._evict()
             self.log.info(f"Task submitted: {task_id}")
             
             return task_id
@@ -97,26 +252,35 @@ class AgentTaskManager(TaskManager):
         
         agent_task.status = 'running'
         agent_task.started_at = datetime.now()
+        agent_task.running = True
+        self._save(agent_task)
         
         try:
             # 在线程池中执行任务
             loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                self.executor,
-                self._run_task_sync,
-                agent_task
-            )
+            try:
+                await loop.run_in_executor(
+                    self.executor,
+                    self._run_task_sync,
+                    agent_task
+                )
+            finally:
+                agent_task.running = False
             
-            agent_task.status = 'completed'
-            agent_task.completed_at = datetime.now()
+            if agent_task.status != 'cancelled':
+                agent_task.status = 'completed'
+                agent_task.completed_at = datetime.now()
             
         except Exception as e:
             agent_task.status = 'error'
             agent_task.error = str(e)
             agent_task.completed_at = datetime.now()
             self.log.error(f"Task {task_id} failed: {e}")
-            
-        return agent_task.to_dict()
+
+        result = agent_task.to_dict()
+        self._save(agent_task, with_data=True)
+        self._evict()
+        return result
     
     def _run_task_sync(self, agent_task: AgentTask):
         """同步执行任务（在线程池中运行）"""
@@ -137,22 +301,16 @@ class AgentTaskManager(TaskManager):
     
     async def get_task_status(self, task_id: str) -> Dict[str, Any]:
         """获取任务状态"""
-        if task_id not in self.agent_tasks:
-            raise ValueError(f"Task {task_id} not found")
-        
-        return self.agent_tasks[task_id].to_dict()
+        return self._get_agent_task(task_id).to_dict()
     
     async def get_task_result(self, task_id: str) -> Dict[str, Any]:
         """获取任务结果"""
-        if task_id not in self.agent_tasks:
-            raise ValueError(f"Task {task_id} not found")
-        
-        agent_task = self.agent_tasks[task_id]
+        agent_task = self._get_agent_task(task_id)
         result = agent_task.to_dict()
         
         # 添加详细的执行结果
-        if agent_task.status == 'completed':
-            captured_data = agent_task.display.get_captured_data()
+        captured_data = result['captured_data']
+        if agent_task.status == 'completed' and captured_data:
             result['output'] = {
                 'messages': captured_data['messages'],
                 'results': captured_data['results'],
@@ -162,19 +320,14 @@ class AgentTaskManager(TaskManager):
         
         return result
     
-    async def list_tasks(self) -> Dict[str, Any]:
-        """列出所有任务"""
+    async def list_tasks(self, status: Optional[str] = None, offset: int = 0, limit: int = 50) -> Dict[str, Any]:
+        """分页列出任务"""
+        total, records = self.store.list(status=status, offset=offset, limit=limit)
         tasks = {}
-        for task_id, agent_task in self.agent_tasks.items():
-            tasks[task_id] = {
-                'task_id': task_id,
-                'instruction': agent_task.instruction,
-                'status': agent_task.status,
-                'created_at': agent_task.created_at.isoformat(),
-                'started_at': agent_task.started_at.isoformat() if agent_task.started_at else None,
-                'completed_at': agent_task.completed_at.isoformat() if agent_task.completed_at else None,
-            }
-        return tasks
+        for record in records:
+            agent_task = self.agent_tasks.get(record['task_id']) or AgentTask.from_record(record)
+            tasks[agent_task.task_id] = agent_task.to_summary()
+        return {'tasks': tasks, 'total': total, 'offset': offset, 'limit': limit}
     
     async def cancel_task(self, task_id: str) -> bool:
         """取消任务"""
@@ -182,30 +335,25 @@ class AgentTaskManager(TaskManager):
             return False
         
         agent_task = self.agent_tasks[task_id]
-        if agent_task.status == 'running':
-            # 尝试停止任务
+        if agent_task.status in ('pending', 'running'):
+            # 停止任务：中断正在执行的代码块、LLM 流式响应和 MCP 调用，执行线程随即返回线程池
             if hasattr(agent_task.task, 'stop'):
                 agent_task.task.stop()
             agent_task.status = 'cancelled'
             agent_task.completed_at = datetime.now()
+            self._save(agent_task)
             return True
         
         return False
     
     def cleanup_completed_tasks(self, max_age_hours: int = 24):
         """清理完成的任务"""
-        current_time = datetime.now()
-        to_remove = []
-        
-        for task_id, agent_task in self.agent_tasks.items():
-            if agent_task.status in ['completed', 'error', 'cancelled']:
-                if agent_task.completed_at:
-                    age = (current_time - agent_task.completed_at).total_seconds() / 3600
-                    if age > max_age_hours:
-                        to_remove.append(task_id)
+        before = time.time() - max_age_hours * 3600
         
-        for task_id in to_remove:
-            del self.agent_tasks[task_id]
-            self.log.info(f"Cleaned up task: {task_id}")
+        for task_id, agent_task in list(self.agent_tasks.items()):
+            if agent_task.is_releasable and agent_task.completed_at.timestamp() < before:
+                self._release(task_id)
         
-        return len(to_remove)
\ No newline at end of file
+        count = self.store.delete_finished(before)
+        self.log.info(f"Cleaned up {count} tasks")
+        return count
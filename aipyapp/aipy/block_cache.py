@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import hashlib
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+from loguru import logger
+
+from .cache import KVCache
+from .config import CONFIG_DIR
+
+CACHE_FILE = CONFIG_DIR / "exec_cache.db"
+DEFAULT_TTL = 24 * 3600
+# 超过该大小的输入文件只比较大小和修改时间
+HASH_LIMIT = 64 * 1024 * 1024
+# 检测文件副作用时最多扫描的文件数，超过时不缓存
+MAX_SNAPSHOT_FILES = 2000
+# 会产生外部副作用（打开浏览器）的代码块不缓存
+UNCACHEABLE_LANGS = {'html'}
+
+STRING_RE = re.compile(r'''["']([^"'\n\r]{1,255})["']''')
+
+def _json_hash(value: Any) -> Optional[str]:
+    """值的哈希，无法 JSON 序列化时返回 None"""
+    try:
+        data = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+def _file_fingerprint(path: Path) -> str:
+    stat = path.stat()
+    if stat.st_size > HASH_LIMIT:
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def _serializable(value: Any) -> bool:
+    try:
+        json.dumps(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+class BlockCache:
+    """可复现代码块的执行结果缓存
+
+    缓存键由语言、代码、代码中引用的已存在文件的内容哈希组成；缓存条目同时记录代码块通过
+    get_persistent_state 读取的状态的哈希，读取时状态不一致视为未命中。命中时恢复代码块的输出、
+    set_state 设置的状态和 set_persistent_state 写入的会话状态。
+
+    代码块通过 Block-Start 中的 `cache` 选择是否缓存，未指定时使用 default。
+    只缓存执行成功、没有在工作目录中创建或修改文件、状态可以 JSON 序列化的结果。
+    共享命名空间时 Python 代码块依赖和定义的变量不在缓存键和缓存条目中，不缓存。
+    """
+    def __init__(self, cache: KVCache, ttl: int = DEFAULT_TTL, default: bool = False):
+        self.cache = cache
+        self.ttl = ttl
+        self.default = default
+        self.log = logger.bind(src='block_cache')
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional['BlockCache']:
+        conf = settings.get('exec_cache') or {}
+        if not conf.get('enabled', False):
+            return None
+        ttl = conf.get('ttl', DEFAULT_TTL)
+        return cls(KVCache(str(CACHE_FILE), ttl), ttl, conf.get('default', False))
+
+    def is_cacheable(self, block, runtime=None) -> bool:
+        if block.get_lang() in UNCACHEABLE_LANGS:
+            return False
+        if block.get_lang() == 'python' and getattr(runtime, 'persistent_namespace', False):
+            return False
+        return self.default if block.cache is None else bool(block.cache)
+
+    def input_files(self, block, cwd: Path) -> Dict[str, str]:
+        """代码中引用的已存在文件及其指纹"""
+        names = set(block.inputs or [])
+        names.update(s for s in STRING_RE.findall(block.code) if '://' not in s)
+        files = {}
+        for name in names:
+            path = Path(name).expanduser()
+            if not path.is_absolute():
+                path = cwd / path
+            try:
+                if path.is_file() and path.resolve() != (block.abs_path and block.abs_path.resolve()):
+                    files[name] = _file_fingerprint(path)
+            except (OSError, ValueError):
+                continue
+        return files
+
+    def make_key(self, block, cwd: Path) -> str:
+        data = {'lang': block.get_lang(), 'code': block.code, 'inputs': self.input_files(block, cwd)}
+        return 'block:' + _json_hash(data)
+
+    def snapshot(self, cwd: Path) -> Optional[Dict[str, tuple]]:
+        """工作目录中文件的 (大小, 修改时间)，文件太多时返回 None"""
+        files = {}
+        for root, _, names in os.walk(cwd):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files[path] = (stat.st_size, stat.st_mtime_ns)
+                if len(files) > MAX_SNAPSHOT_FILES:
+                    return None
+        return files
+
+    def get(self, key: str, block, runtime=None) -> Optional[Dict[str, Any]]:
+        """返回缓存的执行结果并恢复状态，未命中返回 None"""
+        entry = self.cache.get(key)
+        if not entry:
+            return None
+        session = runtime.session if runtime else {}
+        for name, value_hash in entry.get('state_deps', {}).items():
+            if _json_hash(session.get(name)) != value_hash:
+                return None
+
+        if runtime and block.get_lang() == 'python':
+            runtime.start_block(block)
+            runtime.current_state.update(entry.get('state', {}))
+            runtime.session.update(entry.get('session', {}))
+        for dep_name, values in entry.get('deps', {}).items():
+            block.add_dep(dep_name, values)
+        self.log.info(f"Cache hit: {block.name}")
+        return entry['result']
+
+    def put(self, key: str, block, result: Dict[str, Any], runtime=None, session_before: Dict[str, Any] = None, snapshot=None, cwd: Path = None) -> bool:
+        """缓存执行结果，返回是否已缓存"""
+        if result.get('errstr') or result.get('traceback') or result.get('returncode') not in (None, 0):
+            return False
+        if result.get('__state__', {}).get('success') is False:
+            return False
+        if snapshot is None or cwd is None or self.snapshot(cwd) != snapshot:
+            return False
+
+        deps = {name: sorted(values) for name, values in (block.deps or {}).items()}
+        state_deps = {}
+        for name in deps.get('get_state', []):
+            value_hash = _json_hash((session_before or {}).get(name))
+            if value_hash is None:
+                return False
+            state_deps[name] = value_hash
+
+        state, session = {}, {}
+        if runtime and block.get_lang() == 'python':
+            if runtime.block is block:
+                state = runtime.current_state
+            session = {name: runtime.session.get(name) for name in deps.get('set_state', [])}
+
+        entry = {'result': result, 'state': state, 'session': session, 'state_deps': state_deps, 'deps': deps}
+        if not _serializable(entry):
+            return False
+        self.cache.set(key, entry, self.ttl)
+        self.log.info(f"Cached result: {block.name}")
+        return True
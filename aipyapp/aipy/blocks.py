@@ -6,11 +6,11 @@ import json
 from pathlib import Path
 from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 from loguru import logger
 
-from .libmcp import extract_call_tool_str, extra_call_tool_blocks
+from .libmcp import extract_call_tools, extract_call_tools_from_blocks
 from ..interface import Trackable
 
 @dataclass
@@ -22,6 +22,10 @@ class CodeBlock:
     code: str
     path: Optional[str] = None
     deps: Optional[Dict[str, set]] = None
+    # 是否缓存执行结果，None 表示使用全局默认值（见 BlockCache）
+    cache: Optional[bool] = None
+    # 额外声明的输入文件，参与缓存键计算
+    inputs: Optional[List[str]] = None
 
     def add_dep(self, dep_name: str, dep_value: Any):
         """添加依赖"""
@@ -68,7 +72,9 @@ class CodeBlock:
             'lang': self.lang,
             'code': self.code,
             'path': self.path,
-            'deps': self.deps
+            'deps': self.deps,
+            'cache': self.cache,
+            'inputs': self.inputs
         }
     
     @classmethod
@@ -80,7 +86,9 @@ class CodeBlock:
             lang=data.get('lang', ''),
             code=data.get('code', ''),
             path=data.get('path'),
-            deps=data.get('deps')
+            deps=data.get('deps'),
+            cache=data.get('cache'),
+            inputs=data.get('inputs')
         )
 
     def __repr__(self):
@@ -140,6 +148,8 @@ class CodeBlocks(Trackable):
                 lang=lang,
                 code=content,
                 path=start_meta.get('path'),
+                cache=start_meta.get('cache'),
+                inputs=start_meta.get('inputs'),
             )
 
             blocks[code_name] = block
@@ -212,11 +222,11 @@ class CodeBlocks(Trackable):
 
         if parse_mcp:
             # 首先尝试从代码块中提取 MCP 调用, 然后尝试从markdown文本中提取
-            json_content = extra_call_tool_blocks(list(blocks.values())) or extract_call_tool_str(markdown_text)
+            call_tools = extract_call_tools_from_blocks(list(blocks.values())) or extract_call_tools(markdown_text)
 
-            if json_content:
-                ret['call_tool'] = json_content
-                self.log.info("Parsed MCP call_tool", json_content=json_content)
+            if call_tools:
+                ret['call_tools'] = call_tools
+                self.log.info("Parsed MCP call_tool", count=len(call_tools), json_content=call_tools)
 
         return ret
     
@@ -279,7 +289,9 @@ class CodeBlocks(Trackable):
             lang=original_block.lang,
             code=new_code,
             path=original_block.path,
-            deps=original_block.deps.copy() if original_block.deps else None
+            deps=original_block.deps.copy() if original_block.deps else None,
+            cache=original_block.cache,
+            inputs=original_block.inputs
         )
         
         # 保存新代码块到文件
@@ -324,7 +336,9 @@ class CodeBlocks(Trackable):
                     lang=block_data['lang'],
                     code=block_data['code'],
                     path=block_data.get('path'),
-                    deps=block_data.get('deps')
+                    deps=block_data.get('deps'),
+                    cache=block_data.get('cache'),
+                    inputs=block_data.get('inputs')
                 )
                 self.history.append(code_block)
                 self.blocks[code_block.name] = code_block
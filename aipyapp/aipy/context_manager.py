@@ -10,8 +10,12 @@ from enum import Enum
 from loguru import logger
 
 from ..llm import ChatMessage
+from ..llm.stats import TIMING_KEYS
 from ..interface import Trackable
 
+# 重复图片的文字引用
+IMAGE_REFERENCE = "(image identical to the one attached earlier in this conversation)"
+
 
 class ContextStrategy(Enum):
     """上下文管理策略"""
@@ -106,7 +110,9 @@ class ChatHistory:
                     role=chat_item['role'],
                     content=chat_item['content'],
                     reason=chat_item.get('reason'),
-                    usage=usage
+                    usage=usage,
+                    tool_calls=chat_item.get('tool_calls'),
+                    tool_call_id=chat_item.get('tool_call_id')
                 )
                 self.add_message(message)
     
@@ -141,10 +147,18 @@ class ChatHistory:
         summary = {'time': 0, 'input_tokens': 0, 'output_tokens': 0, 'total_tokens': 0}
         summary.update(dict(self._total_tokens))
         summary['rounds'] = sum(1 for row in self.messages if row.role == "assistant")
+        # 时间指标不能直接相加：ttft 取平均值，tps 为总输出 token 数除以总生成时间
+        for key in TIMING_KEYS:
+            summary.pop(key, None)
+        usages = [row.usage for row in self.messages if row.role == "assistant" and 'ttft' in row.usage]
+        summary['ttft'] = sum(usage['ttft'] for usage in usages) / len(usages) if usages else None
+        usages = [usage for usage in usages if usage.get('tps')]
+        gen_time = sum(usage['gen_time'] for usage in usages)
+        summary['tps'] = sum(usage['output_tokens'] for usage in usages) / gen_time if gen_time else None
         return summary
 
     def get_messages(self):
-        return [{"role": msg.role, "content": msg.content} for msg in self.messages]
+        return [msg.to_message() for msg in self.messages]
     
 class MessageCompressor:
     """消息压缩器"""
@@ -171,6 +185,39 @@ class MessageCompressor:
         else:
             return messages, current_tokens
     
+    def _split_units(self, messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """把消息分成压缩时整体保留或丢弃的单元
+
+        带 tool_calls 的 assistant 消息和紧随其后的对应 tool 消息是一个单元，因为 API 不接受缺少对应调用的 tool 消息；
+        找不到对应调用的 tool 消息直接丢弃。
+        """
+        units = []
+        for msg in messages:
+            if msg.get('role') == 'tool':
+                calls = units[-1][0].get('tool_calls') if units else None
+                if calls and msg.get('tool_call_id') in {call.get('id') for call in calls}:
+                    units[-1].append(msg)
+                continue
+            units.append([msg])
+        return units
+
+    def _unit_tokens(self, unit: List[Dict[str, Any]]) -> int:
+        return sum(self._estimate_message_tokens(msg) for msg in unit)
+
+    def _recent_units(self, messages: List[Dict[str, Any]]) -> Tuple[List[List[Dict[str, Any]]], List[List[Dict[str, Any]]]]:
+        """把非系统消息分成 (较早的单元, 最近的单元)
+
+        最近的单元共不超过 preserve_recent * 2 条消息，但至少包含最后一个单元。
+        """
+        units = self._split_units([msg for msg in messages if msg['role'] != 'system'])
+        max_recent = self.config.preserve_recent * 2  # 用户+助手消息
+        count = 0
+        index = len(units)
+        while index > 0 and (count == 0 or count + len(units[index - 1]) <= max_recent):
+            index -= 1
+            count += len(units[index])
+        return units[:index], units[index:]
+
     def _sliding_window_compress(self, messages: List[Dict[str, Any]], 
                                 current_tokens: int) -> Tuple[List[Dict[str, Any]], int]:
         """滑动窗口压缩"""
@@ -183,15 +230,13 @@ class MessageCompressor:
             preserved_messages.append(msg)
             preserved_tokens += self._estimate_message_tokens(msg)
         
-        # 保留最近的对话
-        recent_messages = [msg for msg in messages if msg['role'] != 'system']
-        max_recent = self.config.preserve_recent * 2  # 用户+助手消息
-        
-        for msg in recent_messages[-max_recent:]:
-            msg_tokens = self._estimate_message_tokens(msg)
-            if preserved_tokens + msg_tokens <= self.config.max_tokens:
-                preserved_messages.append(msg)
-                preserved_tokens += msg_tokens
+        # 保留最近的对话，工具调用和结果一起保留
+        _, recent_units = self._recent_units(messages)
+        for unit in recent_units:
+            unit_tokens = self._unit_tokens(unit)
+            if preserved_tokens + unit_tokens <= self.config.max_tokens:
+                preserved_messages.extend(unit)
+                preserved_tokens += unit_tokens
             else:
                 break
         
@@ -201,28 +246,32 @@ class MessageCompressor:
     def _importance_filter_compress(self, messages: List[Dict[str, Any]], 
                                    current_tokens: int) -> Tuple[List[Dict[str, Any]], int]:
         """重要性过滤压缩"""
-        # 计算消息重要性分数
-        scored_messages = []
-        for i, msg in enumerate(messages):
-            score = self._calculate_importance_score(msg, i, len(messages))
-            scored_messages.append((score, msg))
+        # 计算消息重要性分数，工具调用单元按其中的 assistant 消息评分
+        units = self._split_units(messages)
+        scored_units = []
+        index = 0
+        for i, unit in enumerate(units):
+            score = self._calculate_importance_score(unit[0], index, len(messages))
+            scored_units.append((score, i, unit))
+            index += len(unit)
         
         # 按重要性排序
-        scored_messages.sort(key=lambda x: x[0], reverse=True)
+        scored_units.sort(key=lambda x: x[0], reverse=True)
         
-        preserved_messages = []
+        preserved_units = []
         preserved_tokens = 0
         
-        for score, msg in scored_messages:
-            msg_tokens = self._estimate_message_tokens(msg)
-            if preserved_tokens + msg_tokens <= self.config.max_tokens:
-                preserved_messages.append(msg)
-                preserved_tokens += msg_tokens
+        for score, i, unit in scored_units:
+            unit_tokens = self._unit_tokens(unit)
+            if preserved_tokens + unit_tokens <= self.config.max_tokens:
+                preserved_units.append((i, unit))
+                preserved_tokens += unit_tokens
             else:
                 break
         
         # 按原始顺序重新排序
-        preserved_messages.sort(key=lambda x: messages.index(x))
+        preserved_units.sort(key=lambda x: x[0])
+        preserved_messages = [msg for _, unit in preserved_units for msg in unit]
         
         self.log.info(f"Importance filter compression: {len(messages)} -> {len(preserved_messages)} messages")
         return preserved_messages, preserved_tokens
@@ -239,14 +288,10 @@ class MessageCompressor:
             preserved_messages.append(msg)
             preserved_tokens += self._estimate_message_tokens(msg)
         
-        # 保留最近的对话
-        recent_messages = [msg for msg in messages if msg['role'] != 'system']
-        max_recent = self.config.preserve_recent * 2
-        
-        # 分割消息
-        if len(recent_messages) > max_recent:
-            old_messages = recent_messages[:-max_recent]
-            new_messages = recent_messages[-max_recent:]
+        # 分割消息，工具调用和结果在同一侧
+        old_units, recent_units = self._recent_units(messages)
+        if old_units:
+            old_messages = [msg for unit in old_units for msg in unit]
             
             # 创建摘要消息
             summary_content = self._create_summary(old_messages)
@@ -259,11 +304,11 @@ class MessageCompressor:
             preserved_tokens += self._estimate_message_tokens(summary_msg)
         
         # 添加新消息
-        for msg in recent_messages[-max_recent:]:
-            msg_tokens = self._estimate_message_tokens(msg)
-            if preserved_tokens + msg_tokens <= self.config.max_tokens:
-                preserved_messages.append(msg)
-                preserved_tokens += msg_tokens
+        for unit in recent_units:
+            unit_tokens = self._unit_tokens(unit)
+            if preserved_tokens + unit_tokens <= self.config.max_tokens:
+                preserved_messages.extend(unit)
+                preserved_tokens += unit_tokens
             else:
                 break
         
@@ -370,10 +415,7 @@ class ContextManager(Trackable):
         self.chat_history.add_message(message)
         
         # 转换为字典格式添加到缓存
-        msg_dict = {
-            'role': message.role,
-            'content': message.content
-        }
+        msg_dict = message.to_message()
         
         # 更新token计数
         self.token_counter.add_message(message)
@@ -400,7 +442,34 @@ class ContextManager(Trackable):
             if should_compress:
                 self._compress_messages()
         
-        return self._messages_cache.copy()
+        return self._dedup_images(self._messages_cache)
+
+    def _dedup_images(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """同一张本地图片在上下文中只发送一次，之后重复的改为文字引用
+
+        只和压缩后仍在上下文中的图片比较：之前的图片被压缩掉时，再次引用会重新发送完整图片。
+        """
+        seen = set()
+        result = []
+        for msg in messages:
+            content = msg.get('content')
+            if not isinstance(content, list):
+                result.append(msg)
+                continue
+            items = []
+            changed = False
+            for item in content:
+                url = item.get('image_url', {}).get('url', '') if item.get('type') == 'image_url' else ''
+                if url.startswith('data:'):
+                    # data URL 由 MMContent 按内容哈希缓存，相同图片通常是同一个字符串，哈希值只计算一次
+                    if url in seen:
+                        item = {"type": "text", "text": IMAGE_REFERENCE}
+                        changed = True
+                    else:
+                        seen.add(url)
+                items.append(item)
+            result.append({**msg, 'content': items} if changed else msg)
+        return result
     
     def get_usage(self):
         """获取使用统计"""
@@ -439,11 +508,14 @@ class ContextManager(Trackable):
     
     def get_stats(self) -> Dict[str, Any]:
         """获取上下文统计信息"""
+        summary = self.chat_history.get_summary()
         return {
             'message_count': len(self._messages_cache),
             'total_tokens': self._cached_tokens,
             'max_tokens': self.config.max_tokens,
             'compression_ratio': len(self._messages_cache) / max(len(self.chat_history), 1),
+            'ttft': summary['ttft'],
+            'tps': summary['tps'],
             'last_compression': self._last_compression_time
         }
     
@@ -484,10 +556,7 @@ class ContextManager(Trackable):
         self.token_counter.reset()
         
         for message in self.chat_history.messages:
-            msg_dict = {
-                'role': message.role,
-                'content': message.content
-            }
+            msg_dict = message.to_message()
             self._messages_cache.append(msg_dict)
             self._cached_tokens += self.compressor._estimate_message_tokens(msg_dict)
             self.token_counter.add_message(message)
@@ -1,9 +1,96 @@
 import inspect
-from typing import Any, Callable, Dict, Optional, List
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Optional, List, Mapping, Tuple
 
 from loguru import logger
 from pydantic import create_model, ValidationError
 
+# Parameter types accepted by the fast-path validator
+FAST_TYPES = (str, int, float, bool, Any)
+
+# Process-wide schema registry: (qualified name, code hash) -> frozen schema
+_schema_registry: Dict[Tuple[str, int], Mapping[str, Any]] = {}
+_schema_lock = threading.Lock()
+
+def _schema_key(func: Callable, func_name: str) -> Tuple[str, int]:
+    """Build the registry key from the function's qualified name and code hash"""
+    raw = getattr(func, '__func__', func)
+    code = getattr(raw, '__code__', None)
+    qualname = f"{getattr(raw, '__module__', '')}.{getattr(raw, '__qualname__', repr(raw))}:{func_name}"
+    if code is None:
+        return qualname, id(raw)
+    code_hash = hash((
+        code.co_code,
+        code.co_consts,
+        code.co_varnames,
+        repr(raw.__defaults__),
+        repr(raw.__kwdefaults__),
+        repr(getattr(raw, '__annotations__', None)),
+    ))
+    return qualname, code_hash
+
+def _fast_params(sig: inspect.Signature) -> Optional[Tuple[Tuple[str, Any, bool], ...]]:
+    """Return (name, type, required) for simple scalar signatures, None otherwise"""
+    params = []
+    for name, param in sig.parameters.items():
+        if param.kind not in (inspect.Parameter.POSITIONAL_OR_KEYWORD, inspect.Parameter.KEYWORD_ONLY):
+            return None
+        annotation = Any if param.annotation is inspect.Parameter.empty else param.annotation
+        if annotation not in FAST_TYPES:
+            return None
+        params.append((name, annotation, param.default is inspect.Parameter.empty))
+    return tuple(params)
+
+def _fast_validate(fast_params, kwargs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Validate arguments whose types match exactly, None means fall back to pydantic
+
+    Values that would need coercion (other than int -> float) and missing required
+    parameters are left to the pydantic model so errors and lax conversions stay the same.
+    """
+    params = {}
+    for name, annotation, required in fast_params:
+        if name not in kwargs:
+            if required:
+                return None
+            continue
+        value = kwargs[name]
+        if annotation is float and type(value) is int:
+            value = float(value)
+        elif annotation is not Any and type(value) is not annotation:
+            return None
+        params[name] = value
+    return params
+
+def get_function_schema(func: Callable, func_name: str = None) -> Mapping[str, Any]:
+    """Get the frozen schema (signature, doc, parameter model) of a function
+
+    Schemas are cached process-wide, keyed by qualified name and code hash,
+    so re-registering the same plugin method on each task skips inspect and create_model.
+    """
+    func_name = func_name or func.__name__
+    key = _schema_key(func, func_name)
+    schema = _schema_registry.get(key)
+    if schema is not None:
+        return schema
+
+    sig = inspect.signature(func)
+    fields = {}
+    for param_name, param in sig.parameters.items():
+        annotation = param.annotation if param.annotation != inspect.Parameter.empty else Any
+        default = param.default if param.default != inspect.Parameter.empty else ...
+        fields[param_name] = (annotation, default)
+
+    ParamModel = create_model(f"{func_name}_Params", **fields)
+    schema = MappingProxyType({
+        "signature": str(sig),
+        "doc": inspect.getdoc(func) or "",
+        "param_model": ParamModel,
+        "fast_params": _fast_params(sig),
+    })
+    with _schema_lock:
+        return _schema_registry.setdefault(key, schema)
+
 
 class FunctionError(Exception):
     """Base exception for function calls"""
@@ -25,46 +112,44 @@ class FunctionManager:
         self.function_registry: Dict[str, Dict[str, Any]] = {}
         self.logger = logger.bind(src=self.__class__.__name__)
     
-    def register_function(self, func: Callable, name: str = None) -> bool:
+    def register_function(self, func: Callable, name: str = None, schema: Mapping[str, Any] = None) -> bool:
         """Register function
         
         Args:
             func: Function to register
             name: Custom function name, default is the function name
+            schema: Prebuilt frozen schema, skip signature parsing if given
             
         Returns:
             Whether the function is registered successfully
         """
         func_name = name or func.__name__
-        sig = inspect.signature(func)
-        
-        fields = {}
-        for param_name, param in sig.parameters.items():
-            annotation = param.annotation if param.annotation != inspect.Parameter.empty else Any
-            default = param.default if param.default != inspect.Parameter.empty else ...
-            fields[param_name] = (annotation, default)
-        
-        ParamModel = create_model(f"{func_name}_Params", **fields)
+        if schema is None:
+            schema = get_function_schema(func, func_name)
         
         self.function_registry[func_name] = {
             "func": func,
-            "signature": str(sig),
-            "doc": inspect.getdoc(func) or "",
-            "param_model": ParamModel
+            **schema
         }
         
-        self.logger.debug(f"Registered function: {func_name}")
+        self.logger.debug("Registered function: {}", func_name)
         return True
 
-    def register_functions(self, functions: Dict[str, Callable]) -> int:
+    def register_functions(self, functions: Dict[str, Callable], schemas: Dict[str, Mapping[str, Any]] = None) -> int:
         """Batch register object instance methods
         
         Args:
             functions: Function name list
+            schemas: Shared schema cache, missing entries are built and added to it
         """
         success_count = 0
         for func_name, func in functions.items():
-            if self.register_function(func, func_name):
+            schema = None
+            if schemas is not None:
+                schema = schemas.get(func_name)
+                if schema is None:
+                    schema = schemas[func_name] = get_function_schema(func, func_name)
+            if self.register_function(func, func_name, schema):
                 success_count += 1
         self.logger.info(f"Registered {success_count}/{len(functions)} functions")
         return success_count
@@ -89,12 +174,14 @@ class FunctionManager:
             raise FunctionNotFoundError(f"Function '{func_name}' not found")
         
         fn = entry["func"]
-        ParamModel = entry.get("param_model")
+        fast_params = entry.get("fast_params")
         
         try:
-            parsed = ParamModel(**kwargs)
-            self.logger.info(f"Calling function {func_name}, parameters: {parsed.model_dump()}")
-            result = fn(**parsed.model_dump())
+            params = _fast_validate(fast_params, kwargs) if fast_params is not None else None
+            if params is None:
+                params = entry["param_model"](**kwargs).model_dump()
+            self.logger.info("Calling function {}, parameters: {}", func_name, params)
+            result = fn(**params)
             return result
         
         except ValidationError as e:
@@ -118,6 +205,23 @@ class FunctionManager:
             }
         return functions
     
+    def get_tool_schemas(self) -> List[Dict[str, Any]]:
+        """Get the tool definitions used for native function calling
+
+        Returns:
+            [{'name', 'description', 'parameters'}], parameters is the JSON schema of the arguments
+        """
+        tools = []
+        for name, meta in self.function_registry.items():
+            parameters = meta["param_model"].model_json_schema()
+            parameters.pop("title", None)
+            tools.append({
+                "name": name,
+                "description": meta["doc"] or name,
+                "parameters": parameters,
+            })
+        return tools
+
     def unregister_function(self, func_name: str) -> bool:
         """Unregister function
         
@@ -1,18 +1,21 @@
 import asyncio
+import atexit
+import concurrent.futures
 import contextlib
 import json
-import os
 import re
-import sys
+import threading
 from datetime import timedelta
 
+import anyio
 from loguru import logger
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 from mcp.client.sse import sse_client
 from mcp.client.streamable_http import streamablehttp_client
+from mcp.shared.exceptions import McpError
 from mcp.shared.message import SessionMessage
-from mcp.types import JSONRPCMessage
+from mcp.types import JSONRPCMessage, ServerNotification, ToolListChangedNotification
 from .. import T
 
 # 猴子补丁：修复第三方库中的 _handle_json_response 方法
@@ -71,6 +74,32 @@ CODE_BLOCK_PATTERN = re.compile(r"```(?:json)?\s*([\s\S]*?)\s*```")
 JSON_PATTERN = re.compile(r"(\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\})")
 
 
+def _parse_call_tools(content) -> list:
+    """解析 call_tool JSON（单个对象或对象数组），返回 JSON 字符串列表"""
+    try:
+        data = json.loads(content.strip())
+    except json.JSONDecodeError:
+        return []
+    items = data if isinstance(data, list) else [data]
+    calls = []
+    for item in items:
+        # 验证是否是 call_tool 动作
+        if not isinstance(item, dict):
+            continue
+        if "action" not in item or "name" not in item:
+            continue
+        if "arguments" in item and not isinstance(item["arguments"], dict):
+            continue
+        # 返回 JSON 字符串
+        calls.append(json.dumps(item, ensure_ascii=False))
+    return calls
+
+
+def _unique(calls) -> list:
+    """去掉重复的调用，保持顺序"""
+    return list(dict.fromkeys(calls))
+
+
 def extra_call_tool_blocks(blocks) -> str:
     """
     从代码块列表中提取 MCP call_tool JSON。
@@ -81,32 +110,32 @@ def extra_call_tool_blocks(blocks) -> str:
     Returns:
         str: 找到的 JSON 字符串，如果没找到则返回空字符串
     """
+    calls = extract_call_tools_from_blocks(blocks)
+    return calls[0] if calls else ""
+
+
+def extract_call_tools_from_blocks(blocks) -> list:
+    """
+    从代码块列表中提取所有 MCP call_tool JSON。
+
+    Args:
+        blocks (list): CodeBlock 对象列表
+
+    Returns:
+        list: 找到的 JSON 字符串列表
+    """
     if not blocks:
-        return ""
+        return []
 
+    calls = []
     for block in blocks:
         # 检查代码块是否是 JSON 格式
         if hasattr(block, 'lang') and block.lang and block.lang.lower() in ['json', '']:
             # 尝试解析代码块内容
             content = getattr(block, 'code', '') if hasattr(block, 'code') else str(block)
             if content:
-                content = content.strip()
-                try:
-                    data = json.loads(content)
-                    # 验证是否是 call_tool 动作
-                    if not isinstance(data, dict):
-                        continue
-                    if "action" not in data or "name" not in data:
-                        continue
-                    if "arguments" in data and not isinstance(data["arguments"], dict):
-                        continue
-
-                    # 返回 JSON 字符串
-                    return json.dumps(data, ensure_ascii=False)
-                except json.JSONDecodeError:
-                    continue
-
-    return ""
+                calls.extend(_parse_call_tools(content))
+    return _unique(calls)
 
 
 def extract_call_tool_str(text) -> str:
@@ -119,6 +148,20 @@ def extract_call_tool_str(text) -> str:
     Returns:
         str: The JSON str if found and valid, otherwise empty str.
     """
+    calls = extract_call_tools(text)
+    return calls[0] if calls else ""
+
+
+def extract_call_tools(text) -> list:
+    """
+    Extract all MCP call_tool JSON from text.
+
+    Args:
+        text (str): The input text that may contain MCP call_tool JSON.
+
+    Returns:
+        list: The JSON strs found, in order and without duplicates.
+    """
 
     # 使用预编译的正则模式
     code_blocks = CODE_BLOCK_PATTERN.findall(text)
@@ -130,25 +173,10 @@ def extract_call_tool_str(text) -> str:
     standalone_jsons = JSON_PATTERN.findall(text)
     candidates.extend(standalone_jsons)
 
-    # Try to parse each candidate
+    calls = []
     for candidate in candidates:
-        candidate = candidate.strip()
-        try:
-            data = json.loads(candidate)
-            # Validate that it's a call_tool action
-            if not isinstance(data, dict):
-                continue
-            if "action" not in data or "name" not in data:
-                continue
-            if "arguments" in data and not isinstance(data["arguments"], dict):
-                continue
-
-            # return json string. not dict
-            return json.dumps(data, ensure_ascii=False)
-        except json.JSONDecodeError:
-            continue
-
-    return ""
+        calls.extend(_parse_call_tools(candidate))
+    return _unique(calls)
 
 
 class MCPConfigReader:
@@ -226,9 +254,9 @@ class MCPConfigReader:
         }
 
 class MCPClientSync:
-    def __init__(self, server_config, suppress_output=True):
+    """根据服务器配置建立 MCP 会话，会话由 MCPDiscovery 和 MCPSessionPool 在后台事件循环中保持"""
+    def __init__(self, server_config):
         self.server_config = server_config
-        self.suppress_output = suppress_output
         self.connection_type = self._determine_connection_type()
 
     def _determine_connection_type(self):
@@ -243,41 +271,6 @@ class MCPClientSync:
         else:
             return "stdio"
 
-    @contextlib.contextmanager
-    def _suppress_stdout_stderr(self):
-        """上下文管理器：临时重定向 stdout 和 stderr 到空设备"""
-        if not self.suppress_output:
-            yield  # 如果不需要抑制输出，直接返回
-            return
-
-        # 保存原始的 stdout 和 stderr
-        original_stdout = sys.stdout
-        original_stderr = sys.stderr
-
-        try:
-            # 使用 os.devnull - 跨平台解决方案
-            with open(os.devnull, "w") as devnull:
-                sys.stdout = devnull
-                sys.stderr = devnull
-                yield
-        finally:
-            # 恢复原始的 stdout 和 stderr
-            sys.stdout = original_stdout
-            sys.stderr = original_stderr
-
-    def _run_async(self, coro):
-        with self._suppress_stdout_stderr():
-            try:
-                return asyncio.run(coro)
-            except Exception as e:
-                print(f"Error running async function: {e}")
-
-    def list_tools(self) -> list:
-        return self._run_async(self._list_tools()) or []
-
-    def call_tool(self, tool_name, arguments):
-        return self._run_async(self._call_tool(tool_name, arguments))
-
     async def _create_client_session(self):
         """根据连接类型创建相应的客户端会话"""
         if self.connection_type == "stdio":
@@ -313,51 +306,303 @@ class MCPClientSync:
         else:
             raise ValueError(f"Unsupported connection type: {self.connection_type}")
 
-    async def _execute_with_session(self, operation):
-        """统一的会话执行方法，处理不同客户端类型的差异"""
+    @contextlib.asynccontextmanager
+    async def open_session(self, message_handler=None):
+        """打开一个未初始化的会话，处理不同客户端类型的差异"""
         client_session = await self._create_client_session()
+        async with client_session as streams:
+            read, write = streams[0], streams[1]
+            async with ClientSession(read, write, message_handler=message_handler) as session:
+                yield session
+
+
+class _BackgroundLoop:
+    """在后台线程中运行的事件循环，_sessions 中保存长期运行的会话任务，关闭时取消"""
+    thread_name = 'mcp-loop'
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name=self.thread_name, daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            return self._loop
+
+    def _on_close(self):
+        pass
+
+    def close(self):
+        """关闭保持的会话并停止事件循环"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
 
-        if self.connection_type == "streamable_http":
-            async with client_session as (read, write, _):
-                async with ClientSession(read, write) as session:
-                    await session.initialize()
-                    return await operation(session)
-        else:
-            async with client_session as (read, write):
-                async with ClientSession(read, write) as session:
-                    await session.initialize()
-                    return await operation(session)
+        async def shutdown():
+            tasks = list(self._sessions.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
-    async def _list_tools(self):
         try:
-            async def list_operation(session):
-                server_tools = await session.list_tools()
-                return server_tools.model_dump().get("tools", [])
-            
-            tools = await self._execute_with_session(list_operation)
-            
-            if sys.platform == "win32":
-                # FIX windows下抛异常的问题
-                await asyncio.sleep(3)
-            return tools
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=5)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout=5)
+        with self._lock:
+            self._loop = None
+            self._on_close()
+
+
+class MCPDiscovery:
+    """通过 MCPSessionPool 保持的会话并发获取多个 MCP 服务器的工具列表
+
+    获取工具列表和调用工具使用同一个会话，每个服务器只运行一个服务器进程或连接。
+    每个服务器独立超时，结果通过 on_tools(server_name, tools, error) 回调返回（在后台线程中调用）。
+    服务器声明支持 tools.listChanged 时保持会话，收到 tools/list_changed 通知后重新获取并回调；
+    否则获取后关闭会话（没有正在进行的调用时），第一次调用工具时再建立。
+    """
+    def __init__(self, on_tools, timeout=60, pool=None):
+        self.on_tools = on_tools
+        self.timeout = timeout
+        self.pool = pool or MCPSessionPool(timeout)
+        self.log = logger.bind(src='mcp_discovery')
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._watchers = {}
+
+    def discover(self, servers: dict) -> dict:
+        """开始获取服务器的工具列表，返回 {服务器名: concurrent.futures.Future}，已在获取中的服务器复用"""
+        loop = self.pool._ensure_loop()
+        futures = {}
+        with self._lock:
+            for name, config in servers.items():
+                future = self._futures.get(name)
+                if future is None or future.done():
+                    future = asyncio.run_coroutine_threadsafe(self._discover(name, config), loop)
+                    self._futures[name] = future
+                futures[name] = future
+        return futures
+
+    def wait(self, futures: dict, timeout=None) -> set:
+        """等待最多 timeout 秒，返回已完成的服务器名"""
+        if futures:
+            concurrent.futures.wait(list(futures.values()), timeout=timeout)
+        return {name for name, future in futures.items() if future.done()}
+
+    def _supports_list_changed(self, name):
+        capability = self.pool._capabilities.get(name)
+        return bool(capability and capability.tools and capability.tools.listChanged)
+
+    async def _fetch(self, name, config):
+        session = await self.pool._get_session(name, config)
+        if self._supports_list_changed(name):
+            # 在请求工具列表之前注册，获取期间收到的通知不会丢失
+            self.pool._watch(name)
+        result = await session.list_tools()
+        return result.model_dump().get("tools", [])
+
+    async def _discover(self, name, config):
+        old = self._watchers.pop(name, None)
+        if old:
+            old.cancel()
+        timeout = config.get("init_timeout", self.timeout)
+        try:
+            tools = await asyncio.wait_for(self._fetch(name, config), timeout)
+        except asyncio.TimeoutError:
+            self.pool._unwatch(name)
+            self.pool._release(name)
+            self._deliver(name, [], f"Timed out after {timeout}s")
+            return []
         except Exception as e:
-            logger.exception(f"Failed to list tools: {e}")
+            self.pool._unwatch(name)
+            self.pool._release(name)
+            self._deliver(name, [], str(e) or e.__class__.__name__)
             return []
+        self._deliver(name, tools)
+
+        if self._supports_list_changed(name):
+            self._watchers[name] = asyncio.create_task(self._watch(name, config))
+        else:
+            self.pool._release(name)
+        return tools
+
+    async def _watch(self, name, config):
+        """收到 tools/list_changed 通知后重新获取工具列表"""
+        changed = self.pool._watch(name)
+        try:
+            while True:
+                await changed.wait()
+                changed.clear()
+                try:
+                    tools = await self._fetch(name, config)
+                except Exception as e:
+                    self.log.warning(f"Failed to refresh tools of {name}: {e}")
+                    continue
+                self.log.info(f"Tool list changed: {name}")
+                self._deliver(name, tools)
+        finally:
+            self.pool._unwatch(name, changed)
+            if self._watchers.get(name) is asyncio.current_task():
+                del self._watchers[name]
+
+    def _deliver(self, name, tools, error=None):
+        try:
+            self.on_tools(name, tools, error)
+        except Exception:
+            self.log.exception(f"Failed to handle tools of {name}")
+
+    def close(self):
+        """停止获取和监听工具列表，保持的会话由 MCPSessionPool.close 关闭"""
+        with self._lock:
+            futures = list(self._futures.values())
+            self._futures.clear()
+        for future in futures:
+            future.cancel()
+        loop = self.pool._loop
+        if loop is None or loop.is_closed():
+            return
 
-    async def _call_tool(self, tool_name, arguments):
+        async def stop():
+            for task in list(self._watchers.values()):
+                task.cancel()
         try:
-            async def call_operation(session):
-                result = await session.call_tool(tool_name, arguments=arguments)
-                return result.model_dump()
-            
-            ret = await self._execute_with_session(call_operation)
-            
-            if sys.platform == "win32":
-                # FIX windows下抛异常的问题
-                await asyncio.sleep(3)
-            return ret
+            asyncio.run_coroutine_threadsafe(stop(), loop).result(timeout=5)
+        except Exception:
+            pass
+
+
+class MCPSessionPool(_BackgroundLoop):
+    """复用 MCP 服务器会话获取工具列表和调用工具
+
+    每个服务器第一次使用时建立会话并保持，之后的调用（包括同时进行的多个调用）复用该会话，
+    省去每次启动服务器进程或建立连接的开销。会话断开后下次调用时重新建立。
+    """
+    thread_name = 'mcp-sessions'
+
+    def __init__(self, init_timeout=60):
+        super().__init__()
+        self.init_timeout = init_timeout
+        self.log = logger.bind(src='mcp_sessions')
+        self._ready = {}
+        # 服务器初始化时返回的能力
+        self._capabilities = {}
+        # 收到 tools/list_changed 通知时设置的事件
+        self._changed = {}
+        # 正在进行的调用数
+        self._calls = {}
+
+    def call_tool(self, server_name, server_config, tool_name, arguments, progress_callback=None):
+        """开始调用工具，返回 concurrent.futures.Future，结果为 CallToolResult 字典，可以用 cancel() 取消"""
+        loop = self._ensure_loop()
+        coro = self._call_tool(server_name, server_config, tool_name, arguments, progress_callback)
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    async def _get_session(self, name, config):
+        ready = self._ready.get(name)
+        if ready is None or (ready.done() and (ready.cancelled() or ready.exception())):
+            ready = asyncio.get_running_loop().create_future()
+            self._ready[name] = ready
+            self._sessions[name] = asyncio.create_task(self._hold_session(name, config, ready))
+        timeout = config.get("init_timeout", self.init_timeout)
+        return await asyncio.wait_for(asyncio.shield(ready), timeout)
+
+    async def _hold_session(self, name, config, ready):
+        """在单独的任务中保持会话，直到会话断开或被取消"""
+        async def message_handler(message):
+            if isinstance(message, ServerNotification) and isinstance(message.root, ToolListChangedNotification):
+                changed = self._changed.get(name)
+                if changed:
+                    changed.set()
+
+        try:
+            async with MCPClientSync(config).open_session(message_handler) as session:
+                init = await session.initialize()
+                self._capabilities[name] = init.capabilities
+                ready.set_result(session)
+                self.log.info(f"Opened MCP session: {name}")
+                await asyncio.Future()
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.exception(f"Failed to call tool {tool_name}: {e}")
-            print(f"Failed to call tool {tool_name}: {e}")
-            return {"error": str(e), "tool_name": tool_name, "arguments": arguments}
+            if not ready.done():
+                ready.set_exception(Exception(str(e) or e.__class__.__name__))
+            else:
+                self.log.warning(f"MCP session {name} closed: {e}")
+        finally:
+            if self._sessions.get(name) is asyncio.current_task():
+                del self._sessions[name]
+                self._ready.pop(name, None)
+
+    def _watch(self, name) -> asyncio.Event:
+        """返回收到服务器 tools/list_changed 通知时设置的事件，会话重新建立后继续有效"""
+        return self._changed.setdefault(name, asyncio.Event())
+
+    def _unwatch(self, name, changed=None):
+        """取消监听，changed 不为 None 时只在仍是该事件时取消"""
+        if changed is None or self._changed.get(name) is changed:
+            self._changed.pop(name, None)
+
+    def _release(self, name):
+        """没有正在进行的调用时关闭服务器会话（包括正在建立的会话）"""
+        if self._calls.get(name):
+            return
+        task = self._sessions.pop(name, None)
+        self._ready.pop(name, None)
+        if task:
+            task.cancel()
+
+    def _drop_session(self, name, session):
+        ready = self._ready.get(name)
+        if ready is not None and ready.done() and not ready.cancelled() and not ready.exception() and ready.result() is session:
+            task = self._sessions.pop(name, None)
+            self._ready.pop(name, None)
+            if task:
+                task.cancel()
+
+    async def _call_tool(self, name, config, tool_name, arguments, progress_callback=None):
+        on_progress = None
+        if progress_callback:
+            async def on_progress(progress, total, message):
+                try:
+                    progress_callback(progress, total, message)
+                except Exception as e:
+                    self.log.warning(f"Progress callback failed: {e}")
 
+        self._calls[name] = self._calls.get(name, 0) + 1
+        try:
+            for attempt in range(2):
+                reused = name in self._ready
+                session = await self._get_session(name, config)
+                try:
+                    result = await session.call_tool(tool_name, arguments=arguments, progress_callback=on_progress)
+                    return result.model_dump()
+                except McpError:
+                    raise
+                except (anyio.ClosedResourceError, anyio.BrokenResourceError) as e:
+                    # 请求没有发出：保持的会话在调用前已经断开（例如服务器进程退出），重新建立会话后重试一次。
+                    # 请求发出后的错误不重试，避免有副作用的工具执行两次
+                    self._drop_session(name, session)
+                    if attempt or not reused:
+                        raise
+                    self.log.warning(f"MCP session {name} closed, reconnecting: {e!r}")
+                except Exception:
+                    self._drop_session(name, session)
+                    raise
+        finally:
+            self._calls[name] -= 1
+            if not self._calls[name]:
+                del self._calls[name]
+
+    def _on_close(self):
+        self._ready.clear()
+        self._capabilities.clear()
+        self._changed.clear()
+        self._calls.clear()
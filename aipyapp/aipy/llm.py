@@ -5,8 +5,9 @@ from collections import defaultdict, namedtuple
 from loguru import logger
 
 from .. import T, __respath__
-from ..llm import CLIENTS, ModelRegistry, ModelCapability
+from ..llm import CLIENTS, ModelRegistry, ModelCapability, StreamCancelled, RouterClient
 from .multimodal import LLMContext
+from .llm_cache import ResponseCache
 
 class LineReceiver(list):
     def __init__(self):
@@ -47,6 +48,8 @@ class StreamProcessor:
         self.name = name
         self.lr = LineReceiver()
         self.lr_reason = LineReceiver()
+        self.response = None
+        self.cancelled = False
 
     @property
     def content(self):
@@ -67,8 +70,20 @@ class StreamProcessor:
             self.process_chunk('\n')        
         self.task.emit('stream_end', llm=self.name)
     
+    def cancel(self):
+        """取消流式读取：关闭响应连接（可在其它线程调用）"""
+        self.cancelled = True
+        response = self.response
+        if response is not None and hasattr(response, 'close'):
+            try:
+                response.close()
+            except Exception:
+                pass
+
     def process_chunk(self, content, *, reason=False):
         """处理流式数据块并发送事件"""
+        if self.cancelled:
+            raise StreamCancelled()
         if not content: 
             return
 
@@ -99,6 +114,11 @@ class ClientManager(object):
         self.current = None
         self.log = logger.bind(src='client_manager')
         self.names = self._init_clients(settings)
+        response_cache = ResponseCache.from_settings(settings)
+        if response_cache:
+            self.log.info('LLM response cache enabled', mode=response_cache.mode)
+            for client in self.clients.values():
+                client.response_cache = response_cache
         self.model_registry = ModelRegistry(__respath__ / "models.yaml")
         
     def _create_client(self, config):
@@ -112,32 +132,28 @@ class ClientManager(object):
     def _init_clients(self, settings):
         names = defaultdict(set)
         max_tokens = settings.get('max_tokens', self.MAX_TOKENS)
+        routers = []
         for name, config in settings.llm.items():
             if not config.get('enable', True):
                 names['disabled'].add(name)
                 continue
             
             config['name'] = name
+            if config.get('type', 'openai').lower() == 'router':
+                # 路由客户端在其它客户端创建之后创建
+                routers.append(config)
+                continue
             try:
                 client = self._create_client(config)
             except Exception as e:
                 self.log.exception('Error creating LLM client', config=config)
                 names['error'].add(name)
                 continue
+            self._add_client(names, config, client, max_tokens)
 
-            if not client or not client.usable():
-                names['disabled'].add(name)
-                self.log.error('LLM client not usable', name=name, config=config)
-                continue
-
-            names['enabled'].add(name)
-            if not client.max_tokens:
-                client.max_tokens = max_tokens
-            self.clients[name] = client
-
-            if config.get('default', False) and not self.default:
-                self.default = client
-                names['default'] = name
+        for config in routers:
+            providers = [self.clients[name] for name in config.get('providers', []) if name in self.clients]
+            self._add_client(names, config, RouterClient(config, providers), max_tokens)
 
         if not self.default:
             name = list(self.clients.keys())[0]
@@ -147,6 +163,22 @@ class ClientManager(object):
         self.current = self.default
         return names
 
+    def _add_client(self, names, config, client, max_tokens):
+        name = config['name']
+        if not client or not client.usable():
+            names['disabled'].add(name)
+            self.log.error('LLM client not usable', name=name, config=config)
+            return
+
+        names['enabled'].add(name)
+        if not client.max_tokens:
+            client.max_tokens = max_tokens
+        self.clients[name] = client
+
+        if config.get('default', False) and not self.default:
+            self.default = client
+            names['default'] = name
+
     def __len__(self):
         return len(self.clients)
     
@@ -233,11 +265,43 @@ class Client:
         
         return any(capability in model_info.capabilities for capability in capabilities)
     
-    def __call__(self, content: LLMContext, *, system_prompt=None):
+    def get_image_options(self) -> dict:
+        """从模型元数据获取图片预处理参数（最大尺寸、编码格式）"""
+        model = self.current.model.rsplit('/', 1)[-1]
+        model_info = self.manager.get_model_info(model)
+        if not model_info:
+            return {}
+        options = {}
+        for key in ('max_side', 'max_short_side', 'format'):
+            value = model_info.get_extra(f'image_{key}')
+            if value:
+                options[key] = value
+        return options
+
+    def supports_native_tools(self, mode: str = 'auto') -> bool:
+        """是否使用原生工具调用
+
+        mode 为 off 时关闭；为 on 时只要客户端支持就使用；为 auto 时还要求模型元数据声明 FUNCTION_CALLING
+        """
+        if mode == 'off' or not self.current.SUPPORTS_TOOLS:
+            return False
+        if mode == 'on':
+            return True
+        model = self.current.model.rsplit('/', 1)[-1]
+        model_info = self.manager.get_model_info(model)
+        return bool(model_info and model_info.has_capability(ModelCapability.FUNCTION_CALLING))
+
+    def __call__(self, content: LLMContext, *, system_prompt=None, tools=None):
         client = self.current
         stream_processor = StreamProcessor(self.task, client.name)
         
         # 直接传递 ContextManager，它已经实现了所需的接口
-        msg = client(self.context_manager, content, system_prompt=system_prompt, stream_processor=stream_processor)
+        with self.task.tracer.span('llm_call', llm=client.name, model=client.model) as span:
+            with self.task.cancel_scope(stream_processor.cancel):
+                msg = client(self.context_manager, content, system_prompt=system_prompt, stream_processor=stream_processor, tools=tools)
+            if span and msg:
+                span.set(**{key: msg.usage.get(key) for key in ('input_tokens', 'output_tokens', 'ttft', 'tps', 'cached')})
+                if msg.role == 'error':
+                    span.set_error(msg.content)
         return msg
     
\ No newline at end of file
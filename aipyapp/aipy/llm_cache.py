@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+import json
+import time
+import hashlib
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from .. import T
+from ..llm import ChatMessage, StreamCancelled
+from ..llm.stats import TIMING_KEYS
+from .cache import KVCache
+from .config import CONFIG_DIR
+
+CACHE_FILE = CONFIG_DIR / "llm_cache.db"
+MODES = ('off', 'read', 'record', 'replay')
+# 录制的回复默认不过期（约 100 年）
+NEVER_EXPIRE = 100 * 365 * 24 * 3600
+# 计算指纹前替换消息中每次运行都会变化的内容：日期和任务 id
+DEFAULT_NORMALIZE = [r'\b\d{4}-\d{2}-\d{2}\b', r'\b[0-9a-f]{32}\b']
+
+class ResponseCache:
+    """LLM 回复缓存
+
+    以模型、规范化后的消息、温度和请求参数的哈希为键保存回复，用于重复运行相同任务（CI、演示、回归测试）。
+
+    - off: 关闭
+    - read: 命中时直接返回缓存的回复，未命中时请求 LLM 并保存
+    - record: 总是请求 LLM 并保存回复
+    - replay: 只使用缓存的回复，未命中时返回错误
+
+    流式客户端命中时通过 StreamProcessor 重放回复，replay_speed 为每秒输出的字符数，0 表示立即输出。
+    """
+    def __init__(self, cache: KVCache, mode: str = 'read', ttl: int = NEVER_EXPIRE,
+                 replay_speed: float = 0, normalize: Optional[List[str]] = None):
+        self.cache = cache
+        self.mode = mode
+        self.ttl = ttl
+        self.replay_speed = replay_speed
+        self.normalize = [re.compile(pattern) for pattern in (DEFAULT_NORMALIZE if normalize is None else normalize)]
+        self.log = logger.bind(src='llm_cache')
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional['ResponseCache']:
+        conf = settings.get('llm_cache') or {}
+        mode = conf.get('mode', 'off')
+        if mode not in MODES:
+            logger.bind(src='llm_cache').error(f"Invalid llm_cache mode: {mode}")
+            return None
+        if mode == 'off':
+            return None
+        ttl = conf.get('ttl') or NEVER_EXPIRE
+        path = conf.get('path') or str(CACHE_FILE)
+        return cls(KVCache(path, ttl), mode, ttl, conf.get('replay_speed', 0), conf.get('normalize'))
+
+    def _normalize(self, value: Any) -> Any:
+        if isinstance(value, str):
+            for pattern in self.normalize:
+                value = pattern.sub('*', value)
+            return value
+        if isinstance(value, list):
+            return [self._normalize(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self._normalize(item) for key, item in value.items()}
+        return value
+
+    def make_key(self, fingerprint: Dict[str, Any]) -> str:
+        """fingerprint 由客户端的 get_fingerprint 返回"""
+        data = json.dumps(self._normalize(fingerprint), sort_keys=True, ensure_ascii=False, default=str)
+        return f"llm:{hashlib.sha256(data.encode('utf-8')).hexdigest()}"
+
+    def load(self, key: str, stream_processor=None) -> Optional[ChatMessage]:
+        """返回缓存的回复；未命中时返回 None（需要请求 LLM），replay 模式下返回错误消息"""
+        if self.mode == 'record':
+            return None
+        entry = self.cache.get(key)
+        if entry is None:
+            if self.mode == 'replay':
+                self.log.error('Cache miss in replay mode', key=key)
+                return ChatMessage(role='error', content=f"{T('LLM cache miss in replay mode')}: {key}")
+            return None
+
+        self.log.info('Cache hit', key=key)
+        start = time.time()
+        try:
+            msg = self._replay(entry, stream_processor)
+        except StreamCancelled:
+            return ChatMessage(role='error', content=T('Cancelled'))
+        msg.usage['time'] = round(time.time() - start, 3)
+        # 标记为缓存的回复，指标和追踪据此区分实际请求
+        msg.usage['cached'] = 1
+        return msg
+
+    def _replay(self, entry: Dict[str, Any], stream_processor) -> ChatMessage:
+        msg = ChatMessage.from_dict(entry)
+        if stream_processor is None:
+            return msg
+        with stream_processor as lm:
+            for text, reason in ((msg.reason, True), (msg.content, False)):
+                if not isinstance(text, str):
+                    continue
+                for line in text.splitlines(keepends=True):
+                    lm.process_chunk(line, reason=reason)
+                    if self.replay_speed:
+                        time.sleep(len(line) / self.replay_speed)
+        return msg
+
+    def save(self, key: str, msg: ChatMessage):
+        if self.mode not in ('read', 'record') or msg.role == 'error':
+            return
+        entry = msg.to_dict()
+        usage = Counter(entry['usage'])
+        # 时间指标只对实际请求有意义
+        for name in ('time', *TIMING_KEYS):
+            usage.pop(name, None)
+        entry['usage'] = dict(usage)
+        try:
+            self.cache.set(key, entry, self.ttl)
+        except ValueError as e:
+            self.log.error(f"Failed to cache LLM response: {e}")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+import json
+import uuid
+import base64
+import binascii
+import mimetypes
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+ARTIFACTS_DIR = 'mcp'
+DEFAULT_MAX_CHARS = 8000
+# 结果中保留的文本少于该长度时不再截断，避免只剩下几个字符
+MIN_KEEP_CHARS = 200
+
+class MCPResultProcessor:
+    """压缩 MCP 工具调用结果，减少发送给 LLM 的内容
+
+    - 图片、音频和二进制资源（base64）保存为任务目录下 mcp/ 中的文件，结果中只保留文件路径
+    - 文本内容和 structuredContent 合计超过 max_chars 个字符时截断，完整内容保存为文件
+
+    artifacts 为 False 时不保存文件，超出的内容直接丢弃。
+    """
+    def __init__(self, max_chars: int = DEFAULT_MAX_CHARS, artifacts: bool = True):
+        self.max_chars = max_chars
+        self.artifacts = artifacts
+        self.log = logger.bind(src='mcp_result')
+
+    @classmethod
+    def from_settings(cls, settings) -> 'MCPResultProcessor':
+        conf = settings.get('mcp_result') or {}
+        return cls(conf.get('max_chars', DEFAULT_MAX_CHARS), conf.get('artifacts', True))
+
+    def process(self, result: Dict[str, Any], tool_name: str, base_dir: Path) -> Dict[str, Any]:
+        """返回压缩后的结果，文件路径相对于 base_dir（任务目录）"""
+        if not isinstance(result, dict):
+            return result
+        return _Compactor(self, tool_name, Path(base_dir)).compact(result)
+
+class _Compactor:
+    """处理一次工具调用结果，记录剩余的文本预算"""
+    def __init__(self, processor: MCPResultProcessor, tool_name: str, base_dir: Path):
+        self.processor = processor
+        self.base_dir = base_dir
+        self.prefix = re.sub(r'[^a-zA-Z0-9_-]', '_', tool_name)[:32] or 'tool'
+        self.budget = processor.max_chars
+
+    def compact(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        result = dict(result)
+        content = result.get('content')
+        if isinstance(content, list):
+            result['content'] = [self.compact_item(item) for item in content]
+        structured = result.get('structuredContent')
+        if structured is not None:
+            result['structuredContent'] = self.compact_structured(structured)
+        return result
+
+    def compact_item(self, item: Any) -> Any:
+        if not isinstance(item, dict):
+            return item
+        item_type = item.get('type')
+        if item_type == 'text' and isinstance(item.get('text'), str):
+            return dict(item, text=self.compact_text(item['text'], '.txt'))
+        if item_type in ('image', 'audio') and isinstance(item.get('data'), str):
+            return self.offload_data(item, 'data', item.get('mimeType'))
+        if item_type == 'resource' and isinstance(item.get('resource'), dict):
+            resource = item['resource']
+            if isinstance(resource.get('blob'), str):
+                return dict(item, resource=self.offload_data(resource, 'blob', resource.get('mimeType')))
+            if isinstance(resource.get('text'), str):
+                ext = _guess_ext(resource.get('mimeType'), resource.get('uri'), '.txt')
+                return dict(item, resource=dict(resource, text=self.compact_text(resource['text'], ext)))
+        return item
+
+    def compact_text(self, text: str, ext: str) -> str:
+        if len(text) <= self.budget:
+            self.budget -= len(text)
+            return text
+        keep = self.budget if self.budget >= MIN_KEEP_CHARS else 0
+        self.budget -= keep
+        path = self.save(text.encode('utf-8'), ext)
+        where = f", full content saved to {path}" if path else ""
+        return f"{text[:keep]}\n... [truncated {len(text) - keep} of {len(text)} chars{where}]"
+
+    def compact_structured(self, value: Any) -> Any:
+        try:
+            data = json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return value
+        if len(data) <= self.budget:
+            self.budget -= len(data)
+            return value
+        return {'truncated': self.compact_text(data, '.json')}
+
+    def offload_data(self, item: Dict[str, Any], key: str, mime_type: Optional[str]) -> Dict[str, Any]:
+        """把 base64 数据保存为文件，结果中只保留路径"""
+        item = dict(item)
+        data = item.pop(key)
+        try:
+            raw = base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError):
+            raw = data.encode('utf-8')
+        item['size'] = len(raw)
+        path = self.save(raw, _guess_ext(mime_type, item.get('uri'), '.bin'))
+        if path:
+            item['path'] = path
+        else:
+            item[key] = f"[{len(raw)} bytes omitted]"
+        return item
+
+    def save(self, data: bytes, ext: str) -> Optional[str]:
+        if not self.processor.artifacts:
+            return None
+        name = f"{self.prefix}-{uuid.uuid4().hex[:8]}{ext}"
+        try:
+            path = self.base_dir / ARTIFACTS_DIR / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+        except OSError as e:
+            self.processor.log.error(f"Failed to save MCP artifact: {e}")
+            return None
+        self.processor.log.info(f"Saved MCP artifact: {path}", size=len(data))
+        return f"{ARTIFACTS_DIR}/{name}"
+
+def _guess_ext(mime_type: Optional[str], uri: Optional[str], default: str) -> str:
+    ext = mimetypes.guess_extension(mime_type) if mime_type else None
+    if not ext and uri:
+        suffix = Path(uri.split('?')[0]).suffix
+        ext = suffix if re.fullmatch(r'\.[A-Za-z0-9]{1,8}', suffix) else None
+    return ext or default
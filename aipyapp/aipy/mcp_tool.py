@@ -1,11 +1,22 @@
 import json
 import re
 import hashlib
+import threading
+import concurrent.futures
 from collections import namedtuple
+from contextlib import nullcontext
+
+from loguru import logger
+
 from . import cache
-from .libmcp import MCPClientSync, MCPConfigReader
+from .libmcp import MCPConfigReader, MCPDiscovery, MCPSessionPool
 from .. import T
 
+TOOLS_CACHE_TTL = 60 * 60 * 24 * 2
+
+# 工具索引条目：required 为 None 表示工具没有声明参数，调用时不检查参数
+ToolEntry = namedtuple("ToolEntry", ["tool", "server", "required", "properties", "spec"])
+
 def build_function_call_tool_name(server_name: str, tool_name: str) -> str:
     """
     构建函数调用工具名称
@@ -51,15 +62,58 @@ def build_function_call_tool_name(server_name: str, tool_name: str) -> str:
     return name
 
 
+def error_result(text):
+    """工具调用失败时返回给 LLM 的结果"""
+    return {
+        "isError": True,
+        "content": [{
+            "type": "text",
+            "text": text
+        }]
+    }
+
+def make_tool_entry(server_name, tool):
+    """预先计算工具的参数集合和提示中的描述"""
+    input_schema = tool.get("inputSchema") or {}
+    properties = input_schema.get("properties")
+    required = None
+    if properties is not None:
+        required = frozenset(input_schema.get("required", []))
+    # 去掉 inputSchema里的additionalProperties、$schema
+    arguments = {k: v for k, v in input_schema.items() if k not in ("additionalProperties", "$schema")}
+    spec = {
+        "name": tool.get("id", ""),
+        "description": tool.get("description", ""),
+        "arguments": arguments,
+    }
+    return ToolEntry(tool, server_name, required, frozenset(properties or ()), spec)
+
 class MCPToolManager:
-    def __init__(self, config_path, tt_api_key):
+    # 单个服务器获取工具列表的超时时间（秒），可在服务器配置中用 init_timeout 覆盖
+    DISCOVERY_TIMEOUT = 60
+    # list_tools 最多等待的时间（秒），超时后先返回已加载的工具，其余服务器在后台继续加载
+    WAIT_TIMEOUT = 10
+
+    def __init__(self, config_path, tt_api_key, discovery_timeout=None, wait_timeout=None):
         self.config_path = config_path
         self.config_reader = MCPConfigReader(config_path, tt_api_key=tt_api_key)
         self.user_mcp = self.config_reader.get_user_mcp()
         self.sys_mcp = self.config_reader.get_sys_mcp()
         self.mcp_servers = self.sys_mcp | self.user_mcp
         self._tools_dict = {}  # 缓存已获取的工具列表
+        self._index = {}  # 工具 id -> [ToolEntry]
+        self._server_entries = {}  # 服务器名 -> [ToolEntry]
+        self._version = 0  # 工具列表或启用状态变化时递增
+        self._available = None  # (版本, 已启用的 ToolEntry 列表)
+        self._prompt = None  # (版本, 工具提示)
+        self._loading = set()  # 正在后台加载的服务器
+        self._lock = threading.RLock()
         self._inited = False
+        self.log = logger.bind(src='mcp_tool')
+        self.wait_timeout = self.WAIT_TIMEOUT if wait_timeout is None else wait_timeout
+        discovery_timeout = self.DISCOVERY_TIMEOUT if discovery_timeout is None else discovery_timeout
+        self.sessions = MCPSessionPool(discovery_timeout)
+        self.discovery = MCPDiscovery(self._on_tools, discovery_timeout, self.sessions)
 
         # 全局启用/禁用用户MCP标志，默认禁用
         self._user_mcp_enabled = False
@@ -108,102 +162,151 @@ class MCPToolManager:
             if not self._user_mcp_enabled and not force_load:
                 return []
             mcp_servers = self.user_mcp
-            if self._user_mcp_enabled:
+        else:
+            mcp_servers = self.sys_mcp
+
+        missing = self._load_cached(mcp_servers)
+        if missing:
+            if mcp_type == "user" and self._user_mcp_enabled:
                 print(
                     T(
                         "Initializing MCP server, this may take a while if it's "
                         "the first load, please wait patiently..."
                     )
                 )
-        else:
-            mcp_servers = self.sys_mcp
+            for server_name in missing:
+                print("+ Loading MCP", server_name)
+            with self._lock:
+                self._loading.update(missing)
+            futures = self.discovery.discover({name: mcp_servers[name] for name in missing})
+            done = self.discovery.wait(futures, self.wait_timeout)
+            pending = set(missing) - done
+            if pending:
+                self.log.warning(f"MCP servers still loading in background: {sorted(pending)}")
 
         all_tools = []
-        for server_name, server_config in mcp_servers.items():
-            if server_name not in self._tools_dict:
-                try:
-                    print("+ Loading MCP", server_name)
-                    key = f"mcp_tool:{server_name}:{cache.cache_key(server_config)}"
-                    tools = cache.get_cache(key)
-                    if tools is not None:
-                        # 如果缓存中有工具列表，直接使用
-                        self._tools_dict[server_name] = tools
-                        continue
-
-                    client = MCPClientSync(server_config)
-                    tools = client.list_tools()
-
-                    # 为每个工具添加服务器标识
-                    for tool in tools:
-                        tool["server"] = server_name
-                        tool["id"] = build_function_call_tool_name(
-                            server_name, tool.get("name", "")
-                        )
-
-                    if tools:
-                        cache.set_cache(key, tools, ttl=60 * 60 * 24 * 2)
-
-                    self._tools_dict[server_name] = tools
-                except Exception as e:
-                    print(f"Error listing tools for server {server_name}: {e}")
-                    self._tools_dict[server_name] = []
-
-            # 添加到总工具列表
-            all_tools.extend(self._tools_dict[server_name])
+        with self._lock:
+            for server_name in mcp_servers:
+                all_tools.extend(self._tools_dict.get(server_name, []))
+        if mcp_servers:
             self._inited = True
-
         return all_tools
 
+    def _load_cached(self, mcp_servers):
+        """从缓存加载工具列表，返回需要连接服务器获取的服务器名"""
+        missing = []
+        for server_name, server_config in mcp_servers.items():
+            with self._lock:
+                if server_name in self._tools_dict or server_name in self._loading:
+                    continue
+            tools = cache.get_cache(self._cache_key(server_name, server_config))
+            if tools is not None:
+                self._set_tools(server_name, tools)
+            else:
+                missing.append(server_name)
+        return missing
+
+    def _cache_key(self, server_name, server_config):
+        return f"mcp_tool:{server_name}:{cache.cache_key(server_config)}"
+
+    def _on_tools(self, server_name, tools, error=None):
+        """服务器工具列表加载完成或变化（在后台线程中调用）"""
+        if error:
+            print(f"Error listing tools for server {server_name}: {error}")
+            tools = []
+        # 为每个工具添加服务器标识
+        for tool in tools:
+            tool["server"] = server_name
+            tool["id"] = build_function_call_tool_name(server_name, tool.get("name", ""))
+        if tools:
+            server_config = self.mcp_servers.get(server_name, {})
+            cache.set_cache(self._cache_key(server_name, server_config), tools, ttl=TOOLS_CACHE_TTL)
+        with self._lock:
+            self._set_tools(server_name, tools)
+            self._loading.discard(server_name)
+
+    def _set_tools(self, server_name, tools):
+        """更新服务器的工具列表和索引"""
+        with self._lock:
+            for tool_id in {entry.tool.get("id") for entry in self._server_entries.pop(server_name, [])}:
+                entries = [e for e in self._index.get(tool_id, []) if e.server != server_name]
+                if entries:
+                    self._index[tool_id] = entries
+                else:
+                    self._index.pop(tool_id, None)
+            entries = []
+            for tool in tools:
+                tool["server"] = server_name
+                entry = make_tool_entry(server_name, tool)
+                self._index.setdefault(tool.get("id"), []).append(entry)
+                entries.append(entry)
+            self._server_entries[server_name] = entries
+            self._tools_dict[server_name] = tools
+            self._changed()
+
+    def _changed(self):
+        """工具列表或启用状态变化，使已生成的工具提示失效"""
+        with self._lock:
+            self._version += 1
+
+    def _is_server_enabled(self, server_name):
+        # user_mcp服务器需要同时满足全局启用和服务器启用
+        # sys_mcp服务器只需要服务器启用
+        server_enabled = self._server_status.get(server_name, True)
+        if server_name in self.user_mcp:
+            server_enabled = server_enabled and self._user_mcp_enabled
+        return server_enabled
+
+    def _available_entries(self):
+        """返回已启用的工具索引条目，只在工具列表或启用状态变化后重新计算"""
+        if not self._inited:
+            self.list_tools()
+
+        with self._lock:
+            if self._available and self._available[0] == self._version:
+                return self._available[1]
+            entries = []
+            for server_name, server_entries in self._server_entries.items():
+                if self._is_server_enabled(server_name):
+                    entries.extend(server_entries)
+            self._available = (self._version, entries)
+            return entries
+
+    @property
+    def loading_servers(self):
+        """正在后台加载工具列表的服务器"""
+        with self._lock:
+            return set(self._loading)
+
     def get_tools_prompt(self):
-        """获取工具列表并转换为 Markdown 格式"""
-        tools = self.get_available_tools()  # 获取启用的工具
-        if not tools:
-            return ""
+        """获取工具列表并转换为 Markdown 格式，工具列表和启用状态不变时复用上次的结果"""
+        entries = self._available_entries()  # 获取启用的工具
+        with self._lock:
+            if self._prompt and self._prompt[0] == self._version:
+                return self._prompt[1]
+            version = self._version
+
+        prompt = ""
+        if entries:
+            # 转换为 JSON 字符串并添加到 Markdown 中
+            json_str = json.dumps([entry.spec for entry in entries], ensure_ascii=False)
+            prompt = f"```json\n{json_str}\n```\n"
+        with self._lock:
+            self._prompt = (version, prompt)
+        return prompt
+
+    def get_tool_specs(self):
+        """返回已启用工具的定义 [{'name', 'description', 'arguments'}]，用于原生工具调用"""
+        return [entry.spec for entry in self._available_entries()]
 
-        ret = []
-        for tool in tools:
-            # 构建工具信息的 JSON 对象
-            # 去掉 inputSchema里的additionalProperties、$schema
-            input_schema = tool.get("inputSchema", {}).copy()
-            if "additionalProperties" in input_schema:
-                del input_schema["additionalProperties"]
-            if "$schema" in input_schema:
-                del input_schema["$schema"]
-
-            ret.append(
-                {
-                    "name": tool.get("id", ""),
-                    "description": tool.get("description", ""),
-                    "arguments": input_schema,
-                }
-            )
-
-        # 转换为 JSON 字符串并添加到 Markdown 中
-        json_str = json.dumps(ret, ensure_ascii=False)
-        return f"```json\n{json_str}\n```\n"
+    @property
+    def version(self):
+        """工具列表或启用状态变化时递增"""
+        return self._version
 
     def get_available_tools(self):
         """返回已经启用的工具列表"""
-
-        if not self._inited:
-            self.list_tools()
-
-        all_tools = []
-        for server_name, tools in self._tools_dict.items():
-            # 检查全局启用状态和单个服务器状态
-            is_user_server = server_name in self.user_mcp
-
-            # user_mcp服务器需要同时满足全局启用和服务器启用
-            # sys_mcp服务器只需要服务器启用
-            server_enabled = self._server_status.get(server_name, True)
-            if is_user_server:
-                server_enabled = server_enabled and self._user_mcp_enabled
-
-            if server_enabled:
-                for tool in tools:
-                    tool["server"] = server_name
-                    all_tools.append(tool)
-        return all_tools
+        return [entry.tool for entry in self._available_entries()]
 
     def get_server_info(self, mcp_type="user") -> dict:
         """返回所有服务器的列表及其启用状态"""
@@ -227,95 +330,98 @@ class MCPToolManager:
 
         return servers_info
 
-    def call_tool(self, tool_name, arguments):
-        """调用指定名称的工具，自动选择最匹配的服务器"""
-        # 获取所有工具
-        all_tools = self.get_available_tools()
-        if not all_tools:
-            return {
-                "isError": True,
-                "content": [{
-                    "type": "text",
-                    "text": "No tools available to call."
-                }]
-            }
-
-        # 查找匹配的工具，根据id查找
-        matching_tools = [t for t in all_tools if t["id"] == tool_name]
-        if not matching_tools:
-            return {
-                "isError": True,
-                "content": [{
-                    "type": "text",
-                    "text": f"No tool found with name: {tool_name}"
-                }]
-            }
+    def call_tool(self, tool_name, arguments, cancel_scope=None, progress_callback=None):
+        """调用指定名称的工具，自动选择最匹配的服务器
 
-        # 选择参数匹配度最高的工具
-        best_match = None
-        best_score = -1
-
-        for tool in matching_tools:
-            score = 0
-            required_params = []
-
-            # 检查工具的输入模式
-            if "inputSchema" in tool and "properties" in tool["inputSchema"]:
-                properties = tool["inputSchema"]["properties"]
-                required_params = tool["inputSchema"].get("required", [])
-
-                # 检查所有必需参数是否提供
-                required_provided = all(param in arguments for param in required_params)
-                if not required_provided:
-                    continue
-
-                # 计算匹配的参数数量
-                matching_params = sum(1 for param in arguments if param in properties)
-                extra_params = len(arguments) - matching_params
+        cancel_scope: 可选，接受取消回调并返回上下文管理器（如 Task.cancel_scope），任务停止时中止调用
+        progress_callback: 可选，progress_callback(progress, total, message) 接收工具执行进度
+        """
+        call = {"name": tool_name, "arguments": arguments}
+        callback = (lambda name, *args: progress_callback(*args)) if progress_callback else None
+        return self.call_tools([call], cancel_scope=cancel_scope, progress_callback=callback)[0]
 
-                # 评分：匹配参数越多越好，额外参数越少越好
-                score = matching_params - 0.1 * extra_params
+    def call_tools(self, calls, cancel_scope=None, progress_callback=None):
+        """同时调用多个工具，返回与 calls 顺序一致的结果列表
 
-            if score > best_score:
-                best_score = score
-                best_match = tool
+        calls: [{"name": 工具名称, "arguments": 参数}]
+        progress_callback: 可选，progress_callback(tool_name, progress, total, message) 接收工具执行进度
+        """
+        futures = []
+        for call in calls:
+            tool_name, arguments = call["name"], call.get("arguments") or {}
+            callback = None
+            if progress_callback:
+                def callback(*args, name=tool_name):
+                    progress_callback(name, *args)
+            futures.append(self._start_call(tool_name, arguments, callback))
+
+        pending = [f for f in futures if isinstance(f, concurrent.futures.Future)]
+
+        def cancel():
+            for future in pending:
+                future.cancel()
+
+        with cancel_scope(cancel) if cancel_scope else nullcontext():
+            concurrent.futures.wait(pending)
+        return [self._get_result(f) if isinstance(f, concurrent.futures.Future) else f for f in futures]
+
+    def _start_call(self, tool_name, arguments, progress_callback=None):
+        """开始调用工具，返回 Future；找不到合适的工具时直接返回错误结果"""
+        if not self._available_entries():
+            return error_result("No tools available to call.")
+
+        # 根据id查找匹配的工具
+        with self._lock:
+            matching_tools = [e for e in self._index.get(tool_name, []) if self._is_server_enabled(e.server)]
+        if not matching_tools:
+            return error_result(f"No tool found with name: {tool_name}")
 
+        best_match = self.select_tool(matching_tools, arguments)
         if not best_match:
             # 返回错误信息而不是抛出异常
-            error_msg = f"No suitable tool found for {tool_name} with given arguments"
-            return {
-                "isError": True,
-                "content": [{
-                    "type": "text",
-                    "text": error_msg
-                }]
-            }
+            return error_result(f"No suitable tool found for {tool_name} with given arguments")
 
         # 获取服务器配置
-        server_name = best_match["server"]
-        real_tool_name = best_match["name"]
+        server_name = best_match.server
+        real_tool_name = best_match.tool["name"]
         server_config = self.mcp_servers[server_name]
+        return self.sessions.call_tool(server_name, server_config, real_tool_name, arguments, progress_callback)
 
+    def _get_result(self, future):
         try:
-            # 创建客户端并调用工具
-            client = MCPClientSync(server_config)
-            ret = client.call_tool(real_tool_name, arguments)
-            # ret需要是字典，并且如果同时包含content和structuredContent字段，
-            # 则丢弃content
-            if (isinstance(ret, dict) and ret.get("content")
-                and ret.get("structuredContent")):
-                del ret["content"]
-            return ret
+            ret = future.result()
+        except concurrent.futures.CancelledError:
+            return error_result("Cancelled")
         except Exception as e:
             # 捕获工具调用异常，返回错误信息给LLM
-            error_msg = f"Tool call failed: {str(e)}"
-            return {
-                "isError": True,
-                "content": [{
-                    "type": "text",
-                    "text": error_msg
-                }]
-            }
+            return error_result(f"Tool call failed: {str(e)}")
+        # ret需要是字典，并且如果同时包含content和structuredContent字段，
+        # 则丢弃content
+        if (isinstance(ret, dict) and ret.get("content")
+            and ret.get("structuredContent")):
+            del ret["content"]
+        return ret
+
+    @staticmethod
+    def select_tool(entries, arguments):
+        """选择参数匹配度最高的工具，没有工具提供了全部必需参数时返回 None"""
+        best_match = None
+        best_score = -1
+        for entry in entries:
+            score = 0
+            if entry.required is not None:
+                # 检查所有必需参数是否提供
+                if not entry.required.issubset(arguments):
+                    continue
+                # 评分：匹配参数越多越好，额外参数越少越好
+                matching_params = len(entry.properties.intersection(arguments))
+                extra_params = len(arguments) - matching_params
+                score = matching_params - 0.1 * extra_params
+
+            if score > best_score:
+                best_score = score
+                best_match = entry
+        return best_match
 
     @property
     def is_mcp_enabled(self):
@@ -344,6 +450,7 @@ class MCPToolManager:
     def enable_user_mcp(self, enable=True):
         """全局启用/禁用用户MCP"""
         self._user_mcp_enabled = enable
+        self._changed()
         if enable:
             self.list_tools(mcp_type="user")
         return True
@@ -353,6 +460,7 @@ class MCPToolManager:
         self._sys_mcp_enabled = enable
         for server_name in self.sys_mcp:
             self._server_status[server_name] = enable
+        self._changed()
         if enable:
             self.list_tools(mcp_type="sys")
         return True
@@ -368,7 +476,8 @@ class MCPToolManager:
             ret = True
         else:
             return False
-            
+
+        self._changed()
         self.list_tools(mcp_type="user")
         return ret
 
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import math
+import time
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from ..interface import Event
+
+# Prometheus 文本格式
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# 秒级延迟的默认桶
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = '') -> str:
+    items = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        items.append(extra)
+    return '{' + ','.join(items) + '}' if items else ''
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+class _Cells:
+    """每个线程一组预分配的计数单元：写入时不加锁，读取时把所有线程的单元相加"""
+    def __init__(self, size: int):
+        self.size = size
+        self._local = threading.local()
+        self._cells: List[List[float]] = []
+
+    def get(self) -> List[float]:
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._local.cell = [0] * self.size
+            # list.append 在 GIL 下是原子的
+            self._cells.append(cell)
+            return cell
+
+    def sum(self) -> List[float]:
+        total = [0] * self.size
+        for cell in list(self._cells):
+            for i, value in enumerate(cell):
+                total[i] += value
+        return total
+
+class _Metric:
+    TYPE = None
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """返回指定标签值的子指标，标签值按 labelnames 顺序传入"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {key}")
+            # 只有第一次出现的标签组合需要加锁
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def collect(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.TYPE}']
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render(key, child))
+        return lines
+
+    def _render(self, key, child) -> List[str]:
+        raise NotImplementedError
+
+class _CounterChild:
+    __slots__ = ('_cells',)
+
+    def __init__(self):
+        self._cells = _Cells(1)
+
+    def inc(self, amount: float = 1):
+        self._cells.get()[0] += amount
+
+    @property
+    def value(self) -> float:
+        return self._cells.sum()[0]
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    TYPE = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _render(self, key, child):
+        return [f'{self.name}{_labels(self.labelnames, key)} {_number(child.value)}']
+
+class _HistogramChild:
+    __slots__ = ('buckets', '_cells')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # 每个桶的计数（不累计），最后一个桶为 +Inf，再加上总和
+        self._cells = _Cells(len(buckets) + 1)
+
+    def observe(self, value: float):
+        cell = self._cells.get()
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        """返回 (累计桶计数, 总和)，最后一个累计计数即观测次数"""
+        values = self._cells.sum()
+        cumulative = []
+        count = 0
+        for value in values[:-1]:
+            count += value
+            cumulative.append(count)
+        return cumulative, values[-1]
+
+class Histogram(_Metric):
+    """按预分配的桶统计观测值的分布"""
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(float(bucket) for bucket in buckets if bucket != math.inf)) + (math.inf,)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render(self, key, child):
+        cumulative, total = child.snapshot()
+        lines = []
+        for bucket, count in zip(self.buckets, cumulative):
+            labels = _labels(self.labelnames, key, f'le="{_number(bucket)}"')
+            lines.append(f'{self.name}_bucket{labels} {count}')
+        labels = _labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_number(total)}')
+        lines.append(f'{self.name}_count{labels} {cumulative[-1]}')
+        return lines
+
+class Gauge(_Metric):
+    """读取时通过回调取值的指标，回调返回数值或 {标签值元组: 数值}"""
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, help: str, callback: Callable[[], Any], labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+
+    def collect(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.TYPE}']
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.bind(src='metrics').error(f"Failed to collect {self.name}: {e}")
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, key)} {_number(value)}')
+        return lines
+
+class MetricsRegistry:
+    """进程内的指标注册表，按 Prometheus 文本格式导出"""
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} already registered with a different type or labels")
+                if isinstance(metric, Gauge):
+                    existing.callback = metric.callback
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, callback: Callable[[], Any], labelnames: Tuple[str, ...] = ()) -> Gauge:
+        """注册回调取值的指标，同名指标再次注册时替换回调"""
+        return self._register(Gauge(name, help, callback, labelnames))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """把当前指标写入文件（先写临时文件再替换，方便 node_exporter textfile 采集）"""
+        path = Path(path)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + '.tmp')
+            tmp.write_text(self.render(), encoding='utf-8')
+            tmp.replace(path)
+        except OSError as e:
+            logger.bind(src='metrics').error(f"Failed to dump metrics to {path}: {e}")
+
+# 默认注册表，所有任务共享
+REGISTRY = MetricsRegistry()
+
+class MetricsListener:
+    """把任务事件转换为指标，每个任务一个实例，通过 EventBus.add_listener 注册"""
+    def __init__(self, registry: MetricsRegistry = REGISTRY):
+        r = registry
+        self.tasks = r.counter('aipy_tasks_total', 'Tasks started')
+        self.rounds = r.counter('aipy_rounds_total', 'Task rounds completed')
+        self.llm_requests = r.counter('aipy_llm_requests_total', 'LLM requests', ('llm', 'status'))
+        self.llm_latency = r.histogram('aipy_llm_latency_seconds', 'LLM request duration', ('llm',))
+        self.llm_ttft = r.histogram('aipy_llm_ttft_seconds', 'LLM time to first token', ('llm',))
+        self.llm_tokens = r.counter('aipy_llm_tokens_total', 'LLM tokens', ('llm', 'type'))
+        self.exec_total = r.counter('aipy_exec_total', 'Code blocks executed', ('lang', 'status'))
+        self.exec_duration = r.histogram('aipy_exec_duration_seconds', 'Code block wall time', ('lang',))
+        self.mcp_calls = r.counter('aipy_mcp_calls_total', 'MCP tool calls', ('status',))
+        self.mcp_latency = r.histogram('aipy_mcp_latency_seconds', 'MCP tool call duration')
+        self.function_calls = r.counter('aipy_function_calls_total', 'Plugin function calls', ('status',))
+        # 同一回复中的 MCP 调用先全部发出 mcp_call 事件，再并发执行
+        self._mcp_started: List[float] = []
+
+    def get_handlers(self) -> Dict[str, Callable[[Event], None]]:
+        return {
+            'task_start': self.on_task_start,
+            'round_end': self.on_round_end,
+            'response_complete': self.on_response_complete,
+            'exec_result': self.on_exec_result,
+            'mcp_call': self.on_mcp_call,
+            'mcp_result': self.on_mcp_result,
+            'call_function_result': self.on_call_function_result,
+        }
+
+    def on_task_start(self, event: Event):
+        self.tasks.inc()
+
+    def on_round_end(self, event: Event):
+        self.rounds.inc()
+
+    def on_response_complete(self, event: Event):
+        msg = event.data.get('msg')
+        llm = event.data.get('llm') or ''
+        if not msg or msg.role == 'error':
+            self.llm_requests.labels(llm, 'error').inc()
+            return
+        usage = msg.usage or {}
+        if usage.get('cached'):
+            # 缓存的回复没有请求 LLM，不计入耗时和 token 用量
+            self.llm_requests.labels(llm, 'cached').inc()
+            return
+        self.llm_requests.labels(llm, 'ok').inc()
+        if usage.get('time') is not None:
+            self.llm_latency.labels(llm).observe(usage['time'])
+        if usage.get('ttft') is not None:
+            self.llm_ttft.labels(llm).observe(usage['ttft'])
+        for kind in ('input', 'output'):
+            if usage.get(f'{kind}_tokens'):
+                self.llm_tokens.labels(llm, kind).inc(usage[f'{kind}_tokens'])
+
+    def on_exec_result(self, event: Event):
+        block = event.data.get('block')
+        lang = getattr(block, 'lang', None) or ''
+        result = event.data.get('result') or {}
+        if event.data.get('cached'):
+            status = 'cached'
+        elif result.get('errstr') or result.get('returncode'):
+            status = 'error'
+        else:
+            status = 'ok'
+        self.exec_total.labels(lang, status).inc()
+        usage = event.data.get('usage')
+        if usage and usage.get('wall_time') is not None:
+            self.exec_duration.labels(lang).observe(usage['wall_time'])
+
+    def on_mcp_call(self, event: Event):
+        self._mcp_started.append(time.time())
+
+    def on_mcp_result(self, event: Event):
+        result = event.data.get('result')
+        failed = isinstance(result, dict) and result.get('isError')
+        self.mcp_calls.labels('error' if failed else 'ok').inc()
+        if self._mcp_started:
+            self.mcp_latency.observe(time.time() - self._mcp_started.pop(0))
+
+    def on_call_function_result(self, event: Event):
+        self.function_calls.labels('ok' if event.data.get('success') else 'error').inc()
@@ -2,14 +2,28 @@
 # -*- coding: utf-8 -*-
 
 from base64 import b64encode
+import io
+import os
 import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
-from typing import Union, List, Dict, Any
+from typing import Union, List, Dict, Any, Optional
 import mimetypes
 
 from loguru import logger
 from charset_normalizer import from_bytes
 
+from .utils import format_size
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
 MessageList = List[Dict[str, Any]]
 LLMContext = Union[str, MessageList]
 
@@ -24,30 +38,167 @@ class FileReadError(MMContentError):
         self.original_error = original_error
         super().__init__(f"无法读取文件 {file_path}: {original_error}")
 
-def is_text_file(path, blocksize=4096):
+# 读取和 base64 编码的分块大小（3 的倍数，保证分块编码结果可直接拼接）
+READ_CHUNK_SIZE = 3 * 256 * 1024
+
+@lru_cache(maxsize=1024)
+def _detect_encoding(path: str, mtime_ns: int, size: int, blocksize: int) -> Optional[str]:
+    """检测文件编码，按路径、修改时间和大小缓存；非文本文件返回 None"""
     try:
         with open(path, 'rb') as f:
             chunk = f.read(blocksize)
         result = from_bytes(chunk)
         if not result:
-            return False
+            return None
         best = result.best()
         if best is None:
-            return False
+            return None
         # encoding 存在且 chaos 很低，认为是文本
         if best.encoding and best.chaos < 0.1:
-            return True
-        return False
+            return best.encoding
+        return None
     except Exception:
         logger.exception('Failed to check if file is text')
-        return False
+        return None
+
+def detect_encoding(path, blocksize=4096) -> Optional[str]:
+    """检测文本文件编码，非文本文件返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return _detect_encoding(str(path), stat.st_mtime_ns, stat.st_size, blocksize)
+
+def is_text_file(path, blocksize=4096):
+    return detect_encoding(path, blocksize) is not None
+
+# 图片预处理默认参数，模型元数据（models.yaml 中的 image_* 字段）可覆盖
+IMAGE_MAX_SIDE = 2048
+IMAGE_MAX_SHORT_SIDE = 2048
+IMAGE_FORMAT = 'webp'
+IMAGE_QUALITY = 85
+# 未缩放的图片超过该大小时也尝试重新压缩
+IMAGE_RECOMPRESS_SIZE = 256 * 1024
+# 编码结果缓存的总大小上限
+IMAGE_MEMO_SIZE = 64 * 1024 * 1024
+
+_image_memo: "OrderedDict[tuple, str]" = OrderedDict()
+_image_memo_bytes = 0
+_image_memo_lock = threading.Lock()
+
+def prepare_image(data: bytes, mime: str, max_side: int = IMAGE_MAX_SIDE,
+                  max_short_side: int = IMAGE_MAX_SHORT_SIDE, format: str = IMAGE_FORMAT,
+                  quality: int = IMAGE_QUALITY) -> tuple:
+    """按模型可用分辨率缩小并重新压缩图片，结果不更小时返回原图
+
+    format 为 webp 且 Pillow 支持时输出 WebP，否则带透明通道的输出 PNG，其余输出 JPEG。
+
+    Returns:
+        (图片数据, MIME 类型)
+    """
+    if Image is None:
+        return data, mime
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if getattr(img, 'is_animated', False):
+                return data, mime
+            width, height = img.size
+            scale = min(1.0, max_side / max(width, height), max_short_side / min(width, height))
+            if scale >= 1.0 and len(data) <= IMAGE_RECOMPRESS_SIZE:
+                return data, mime
+
+            if scale < 1.0:
+                size = (max(1, round(width * scale)), max(1, round(height * scale)))
+                img = img.resize(size, Image.LANCZOS)
+            has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+            output = io.BytesIO()
+            if format == 'webp' and features.check('webp'):
+                img.convert('RGBA' if has_alpha else 'RGB').save(output, format='WEBP', quality=quality, method=4)
+                new_mime = 'image/webp'
+            elif has_alpha:
+                img.save(output, format='PNG', optimize=True)
+                new_mime = 'image/png'
+            else:
+                img.convert('RGB').save(output, format='JPEG', quality=quality, optimize=True)
+                new_mime = 'image/jpeg'
+    except Exception as e:
+        logger.warning(f"Failed to prepare image, using original: {e}")
+        return data, mime
+
+    result = output.getvalue()
+    if len(result) >= len(data):
+        return data, mime
+    return result, new_mime
+
+def _memo_get(key: tuple) -> Optional[str]:
+    with _image_memo_lock:
+        data_url = _image_memo.get(key)
+        if data_url is not None:
+            _image_memo.move_to_end(key)
+        return data_url
+
+def _memo_put(key: tuple, data_url: str):
+    global _image_memo_bytes
+    with _image_memo_lock:
+        if key in _image_memo:
+            return
+        _image_memo[key] = data_url
+        _image_memo_bytes += len(data_url)
+        while _image_memo_bytes > IMAGE_MEMO_SIZE and len(_image_memo) > 1:
+            _, old = _image_memo.popitem(last=False)
+            _image_memo_bytes -= len(old)
+
+def clear_image_memo():
+    """清空图片编码缓存"""
+    global _image_memo_bytes
+    with _image_memo_lock:
+        _image_memo.clear()
+        _image_memo_bytes = 0
+
+def _json_schema(value: Any, depth: int = 0, max_keys: int = 20) -> Any:
+    """生成 JSON 值的结构示例：字典保留键，列表只保留首个元素"""
+    if isinstance(value, dict):
+        if depth >= 3:
+            return '{...}'
+        keys = list(value)[:max_keys]
+        schema = {key: _json_schema(value[key], depth + 1) for key in keys}
+        if len(value) > max_keys:
+            schema['...'] = f"{len(value) - max_keys} more keys"
+        return schema
+    if isinstance(value, list):
+        if not value:
+            return []
+        if depth >= 3:
+            return f"[... {len(value)} items]"
+        return [_json_schema(value[0], depth + 1), f"... {len(value)} items"]
+    if isinstance(value, str):
+        return value[:40] + '...' if len(value) > 40 else value
+    return value
 
 class MMContent:
     """
     多模态内容类，支持文本、图片、文件的统一处理。
+
+    超过 max_inline_size 的文本文件不会完整放入提示词，而是给出文件头尾和结构概要，
+    完整文件保留在磁盘上供生成的代码读取；超过 max_image_size 的图片只给出路径。
+
+    本地图片按 image_options（max_side/max_short_side/format，通常来自模型元数据）缩小并重新压缩，
+    编码结果按内容哈希在进程内缓存，相同图片得到同一个 data URL，由 ContextManager 在发送时去重。
     """
-    def __init__(self, string: str, base_path: Path = None):
+    MAX_INLINE_SIZE = 64 * 1024
+    MAX_IMAGE_SIZE = 20 * 1024 * 1024
+    MAX_JSON_PARSE_SIZE = 16 * 1024 * 1024
+    HEAD_LINES = 20
+    TAIL_LINES = 10
+    LOG_TAIL_LINES = 50
+    MAX_LINE_LENGTH = 500
+
+    def __init__(self, string: str, base_path: Path = None, *, max_inline_size: int = None, max_image_size: int = None,
+                 image_options: Dict[str, Any] = None):
         self.string = string
+        self.max_inline_size = max_inline_size or self.MAX_INLINE_SIZE
+        self.max_image_size = max_image_size or self.MAX_IMAGE_SIZE
+        self.image_options = image_options or {}
         self.items = self._from_string(string, base_path)
         self.log = logger.bind(type='multimodal')
 
@@ -105,17 +256,101 @@ class MMContent:
         mime, _ = mimetypes.guess_type(file_path)
         return mime or default_mime
     
-    def _read_file(self, file_path: str, base64: bool = False) -> str:
-        """读取文件内容，支持 base64 编码"""
+    def _read_file(self, file_path: str, base64: bool = False, encoding: str = None) -> str:
+        """读取文件内容，支持 base64 编码（分块编码，避免同时持有原始数据和编码结果）"""
         try:
             with open(file_path, 'rb') as f:
-                data = f.read()
-            if base64:
-                data = b64encode(data)
-            return data.decode('utf-8')
+                if not base64:
+                    return f.read().decode(encoding or 'utf-8', errors='replace' if encoding else 'strict')
+                chunks = []
+                while True:
+                    chunk = f.read(READ_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    chunks.append(b64encode(chunk).decode('ascii'))
+                return ''.join(chunks)
         except Exception as e:
             raise FileReadError(file_path, e)
 
+    def _read_head(self, file_path: str, lines: int, encoding: str) -> List[str]:
+        """读取文件开头若干行"""
+        result = []
+        with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+            for line in f:
+                result.append(line.rstrip('\r\n')[:self.MAX_LINE_LENGTH])
+                if len(result) >= lines:
+                    break
+        return result
+
+    def _read_tail(self, file_path: str, lines: int, encoding: str) -> List[str]:
+        """从文件末尾向前分块读取最后若干行"""
+        block = 64 * 1024
+        with open(file_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            data = b''
+            while pos > 0 and data.count(b'\n') <= lines:
+                step = min(block, pos)
+                pos -= step
+                f.seek(pos)
+                data = f.read(step) + data
+        text = data.decode(encoding, errors='replace')
+        return [line[:self.MAX_LINE_LENGTH] for line in text.splitlines()[-lines:]]
+
+    def _count_lines(self, file_path: str) -> int:
+        """分块统计行数"""
+        count = 0
+        last = b''
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                count += chunk.count(b'\n')
+                last = chunk
+        if last and not last.endswith(b'\n'):
+            count += 1
+        return count
+
+    def _get_outline(self, file_path: str, encoding: str, size: int) -> Optional[str]:
+        """根据文件类型生成结构概要"""
+        ext = Path(file_path).suffix.lower()
+        try:
+            if ext in ('.csv', '.tsv'):
+                header = self._read_head(file_path, 1, encoding)
+                rows = max(self._count_lines(file_path) - 1, 0)
+                return f"CSV columns: {header[0] if header else ''}\nData rows: {rows}"
+            if ext == '.jsonl':
+                first = self._read_head(file_path, 1, encoding)
+                sample = _json_schema(json.loads(first[0])) if first else None
+                return f"JSON Lines records: {self._count_lines(file_path)}\nFirst record schema: {json.dumps(sample, ensure_ascii=False)}"
+            if ext == '.json' and size <= self.MAX_JSON_PARSE_SIZE:
+                with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+                    sample = _json_schema(json.load(f))
+                return f"JSON schema sample: {json.dumps(sample, ensure_ascii=False)}"
+            if ext == '.log':
+                return f"Log lines: {self._count_lines(file_path)}"
+        except Exception as e:
+            self.log.warning(f"Failed to build outline for {file_path}: {e}")
+        return None
+
+    def _summarize_document(self, path: str, encoding: str, size: int) -> str:
+        """大文本文件只给出头尾和结构概要"""
+        is_log = Path(path).suffix.lower() == '.log'
+        head_lines = 5 if is_log else self.HEAD_LINES
+        tail_lines = self.LOG_TAIL_LINES if is_log else self.TAIL_LINES
+
+        parts = [f"[File is too large to inline ({format_size(size)}). "
+                 f"The full file is at {path}, read it with code instead of asking for its content.]"]
+        outline = self._get_outline(path, encoding, size)
+        if outline:
+            parts.append(outline)
+        parts.append(f"--- first {head_lines} lines ---")
+        parts.extend(self._read_head(path, head_lines, encoding))
+        parts.append(f"--- last {tail_lines} lines ---")
+        parts.extend(self._read_tail(path, tail_lines, encoding))
+        return '\n'.join(parts)
+
     def _process_image_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
         """处理图片项"""
         url = item['path']
@@ -124,10 +359,32 @@ class MMContent:
         if self._is_network_url(url):
             return {"type": "image_url", "image_url": {"url": url}}
         
-        # 本地图片转换为data URL
-        mime = self._get_mime_type(url, 'image/jpeg')
-        b64_data = self._read_file(url, base64=True)
-        data_url = f"data:{mime};base64,{b64_data}"
+        size = os.path.getsize(url)
+        if size > self.max_image_size:
+            self.log.warning(f"Image too large to attach: {url} ({size} bytes)")
+            return {"type": "text", "text": f"image file (too large to attach, {format_size(size)}): {url}"}
+
+        try:
+            with open(url, 'rb') as f:
+                data = f.read()
+        except Exception as e:
+            raise FileReadError(url, e)
+        digest = hashlib.sha256(data).hexdigest()
+
+        # 本地图片预处理后转换为data URL
+        options = self.image_options
+        max_side = options.get('max_side', IMAGE_MAX_SIDE)
+        max_short_side = options.get('max_short_side', IMAGE_MAX_SHORT_SIDE)
+        format = options.get('format', IMAGE_FORMAT)
+        key = (digest, max_side, max_short_side, format)
+        data_url = _memo_get(key)
+        if data_url is None:
+            mime = self._get_mime_type(url, 'image/jpeg')
+            image, mime = prepare_image(data, mime, max_side, max_short_side, format)
+            if len(image) < len(data):
+                self.log.info(f"Image prepared: {url} ({len(data)} -> {len(image)} bytes, {mime})")
+            data_url = f"data:{mime};base64,{b64encode(image).decode('ascii')}"
+            _memo_put(key, data_url)
         return {"type": "image_url", "image_url": {"url": data_url}}
     
     def _process_file_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
@@ -137,8 +394,17 @@ class MMContent:
     def _process_document_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
         """处理文本文件项（document）"""
         path = str(item['path'])
-        content = self._read_file(path, base64=False)
-        text = f"<attachment filename=\"{path}\">{content}</attachment>"
+        size = os.path.getsize(path)
+        encoding = detect_encoding(path) or 'utf-8'
+        if encoding == 'ascii':
+            # 只检测了文件开头，按兼容 ASCII 的 UTF-8 读取
+            encoding = 'utf-8'
+        if size <= self.max_inline_size:
+            content = self._read_file(path, base64=False, encoding=encoding)
+            text = f"<attachment filename=\"{path}\">{content}</attachment>"
+        else:
+            content = self._summarize_document(path, encoding, size)
+            text = f"<attachment filename=\"{path}\" size=\"{size}\" truncated=\"true\">{content}</attachment>"
         return {"type": "text", "text": text}
 
     def _process_text_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+# OpenAI 等 API 要求工具名只包含字母、数字、下划线和短横线，最长 64 个字符
+NAME_RE = re.compile(r'[^a-zA-Z0-9_-]')
+MAX_NAME_LENGTH = 64
+MODES = ('auto', 'on', 'off')
+EMPTY_PARAMETERS = {'type': 'object', 'properties': {}}
+
+def _tool_name(name: str, used: set) -> str:
+    base = NAME_RE.sub('_', name)[:MAX_NAME_LENGTH] or 'tool'
+    tool_name, i = base, 2
+    while tool_name in used:
+        suffix = f"_{i}"
+        tool_name = base[:MAX_NAME_LENGTH - len(suffix)] + suffix
+        i += 1
+    used.add(tool_name)
+    return tool_name
+
+class NativeTools:
+    """原生工具调用
+
+    把已启用的 MCP 工具和插件函数转换为 LLM API 的工具定义 [{'name', 'description', 'parameters'}]，
+    并把模型返回的工具名映射回 MCP 工具 id 或插件函数名。工具定义只在 MCP 工具列表、启用状态或插件函数变化时重新生成。
+    """
+    def __init__(self, mcp, function_manager):
+        self.mcp = mcp
+        self.function_manager = function_manager
+        self.log = logger.bind(src='native_tools')
+        self._key = None
+        self._specs: List[Dict[str, Any]] = []
+        self._targets: Dict[str, Tuple[str, str]] = {}
+
+    def _cache_key(self):
+        mcp_version = self.mcp.version if self.mcp else None
+        return mcp_version, tuple(self.function_manager.function_registry)
+
+    def _build(self):
+        specs, targets, used = [], {}, set()
+        if self.mcp:
+            for spec in self.mcp.get_tool_specs():
+                name = _tool_name(spec['name'], used)
+                specs.append({'name': name, 'description': spec['description'],
+                              'parameters': spec['arguments'] or EMPTY_PARAMETERS})
+                targets[name] = ('mcp', spec['name'])
+        for schema in self.function_manager.get_tool_schemas():
+            name = _tool_name(schema['name'], used)
+            specs.append(dict(schema, name=name))
+            targets[name] = ('function', schema['name'])
+        self._specs, self._targets = specs, targets
+        self.log.info(f"Built {len(specs)} native tools")
+
+    def get_specs(self) -> List[Dict[str, Any]]:
+        """返回工具定义列表"""
+        key = self._cache_key()
+        if key != self._key:
+            self._build()
+            self._key = key
+        return self._specs
+
+    def resolve(self, name: str) -> Optional[Tuple[str, str]]:
+        """返回 ('mcp', 工具 id) 或 ('function', 函数名)，未知工具返回 None"""
+        self.get_specs()
+        return self._targets.get(name)
@@ -141,6 +141,14 @@ class Prompts:
         :return: 渲染后的字符串
         """
         return self.get_prompt('result_mcp', result=result)
+
+    def get_mcp_results_prompt(self, results: list) -> str:
+        """
+        获取多个 MCP 工具调用结果提示
+        :param results: 结果列表，每项包含 name、arguments 和 result
+        :return: 渲染后的字符串
+        """
+        return self.get_prompt('result_mcp', results=results)
     
     def get_chat_prompt(self, instruction: str, task: str) -> str:
         """
@@ -32,10 +32,11 @@ class CliPythonRuntime(PythonRuntime):
         self.display = task.display
         self._auto_install = task.settings.get('auto_install')
         self._auto_getenv = task.settings.get('auto_getenv')
+        self.persistent_namespace = task.settings.get('persistent_namespace', False)
         self.function_manager = FunctionManager()
 
-    def register_plugin(self, plugin: TaskPlugin):
-        self.function_manager.register_functions(plugin.get_functions())
+    def register_plugin(self, plugin: TaskPlugin, schemas: Dict[str, Any] = None):
+        self.function_manager.register_functions(plugin.get_functions(), schemas)
 
     @restore_output
     def install_packages(self, *packages: str) -> bool:
@@ -16,8 +16,12 @@ import requests
 from loguru import logger
 
 from .. import T, __respkg__
-from ..exec import BlockExecutor
+from ..exec import BlockExecutor, ResourceLimits
+from ..exec.repl import get_repl_overrides
 from .runtime import CliPythonRuntime
+from .block_cache import BlockCache
+from .mcp_result import MCPResultProcessor
+from .native_tools import NativeTools
 from .utils import get_safe_filename
 from .blocks import CodeBlocks, CodeBlock
 from ..interface import Stoppable, EventBus
@@ -26,6 +30,9 @@ from .multimodal import MMContent, LLMContext
 from .context_manager import ContextManager, ContextConfig
 from .event_recorder import EventRecorder
 from .task_state import TaskState
+from .metrics import MetricsListener
+from .tracing import Tracer
+from ..llm import ChatMessage
 
 CONSOLE_WHITE_HTML = read_text(__respkg__, "console_white.html")
 CONSOLE_CODE_HTML = read_text(__respkg__, "console_code.html")
@@ -79,13 +86,25 @@ class Task(Stoppable, EventBus):
         context_settings = self.settings.get('context_manager', {})
         self.context_manager = ContextManager(ContextConfig.from_dict(context_settings))
         
+        # 任务的 span 记录，Client 调用 LLM 时也会用到
+        self.tracer = Tracer.from_settings(self.settings)
+
         # 创建Client时传入context_manager
         self.client = context.client_manager.Client(self, self.context_manager)
         self.role = context.role_manager.current_role
         self.code_blocks = CodeBlocks()
         self.runtime = CliPythonRuntime(self)
-        self.runner = BlockExecutor()
+        repl_conf = self.settings.get('repl') or {}
+        self.runner = BlockExecutor(ResourceLimits.from_dict(self.settings.get('limits')),
+                                    get_repl_overrides(repl_conf.get('langs'), repl_conf.get('idle_timeout')))
         self.runner.set_python_runtime(self.runtime)
+        self.block_cache = BlockCache.from_settings(self.settings)
+        self.mcp_results = MCPResultProcessor.from_settings(self.settings)
+        self.native_tools = NativeTools(self.mcp, self.runtime.function_manager)
+        self.function_calling = self.settings.get('function_calling', 'auto')
+        self._tool_calls = None
+        self.env = None
+        self._init_env()
         
         # 注册所有可追踪对象到步骤管理器
         self.step_manager = StepManager()
@@ -140,23 +159,91 @@ class Task(Stoppable, EventBus):
             'steps': len(self.step_manager),
         }
 
+    def _init_env(self):
+        """按 venv.mode 获取任务或角色的 overlay 环境，代码块在其中执行"""
+        env_manager = self.context.env_manager
+        if env_manager and env_manager.enabled:
+            name = self.task_id if env_manager.mode == 'task' else self.role.name
+            try:
+                self.env = env_manager.acquire(name)
+            except Exception:
+                self.log.exception('Failed to create overlay env, using the shared environment')
+                self.env = None
+        self.runner.env = self.env
+
+    def _release_env(self):
+        if self.env:
+            self.context.env_manager.release(self.env)
+            self.env = None
+            self.runner.env = None
+
     def init_plugins(self):
         """初始化插件"""
         plugin_manager = self.context.plugin_manager
+        # 同一角色的插件函数模式在所有任务间共享
+        schemas = self.context.function_schemas.setdefault(self.role.name, {}) if self.role.plugins else None
         for plugin_name, plugin_data in self.role.plugins.items():
             plugin = plugin_manager.create_task_plugin(plugin_name, plugin_data)
             if not plugin:
                 self.log.warning(f"Create task plugin {plugin_name} failed")
                 continue
-            self.add_listener(plugin)
-            self.runtime.register_plugin(plugin)
+            self.runtime.register_plugin(plugin, schemas)
             self.plugins[plugin_name] = plugin
-            
+
         # 注册显示效果插件
         if self.context.display_manager:
             self.display = self.context.display_manager.create_display_plugin()
+        self._add_listeners()
+
+    def _add_listeners(self):
+        """注册插件、运行指标、span 记录和显示插件的事件处理器"""
+        for plugin in self.plugins.values():
+            self.add_listener(plugin)
+
+        # 运行指标
+        if (self.settings.get('metrics') or {}).get('enabled', True):
+            self.add_listener(MetricsListener())
+        if self.tracer.enabled:
+            self.add_listener(self.tracer)
+        if self.display:
             self.add_listener(self.display)
 
+    def recycle(self):
+        """重置任务状态以便复用（由任务池调用）
+
+        保留已创建的插件、Python 运行时和显示对象，插件和显示对象通过各自的 reset() 重置。
+        上一次运行期间注册的事件处理器全部丢弃后重新注册。代码执行器（包括常驻解释器）
+        已在 done() 中关闭，复用后首次执行代码块时重新创建。
+        """
+        self.reset()
+        self._release_env()
+        self.task_id = uuid.uuid4().hex
+        self.log = logger.bind(src='task', id=self.task_id)
+        self.cwd = self.context.cwd / self.task_id
+        self._init_env()
+
+        self.start_time = None
+        self.done_time = None
+        self.instruction = None
+        self.title = None
+        self.saved = None
+        self._tool_calls = None
+        self.tracer.reset()
+
+        # 清空执行历史、代码块和事件记录，消息上下文直接重建
+        self.step_manager.clear_all()
+        context_settings = self.settings.get('context_manager', {})
+        self.context_manager = ContextManager(ContextConfig.from_dict(context_settings))
+        self.step_manager.register_trackable('messages', self.context_manager)
+        self.client = self.context.client_manager.Client(self, self.context_manager)
+        self.runtime.reset()
+        for plugin in self.plugins.values():
+            plugin.reset()
+        if self.display:
+            self.context.display_manager.reset_display_plugin(self.display)
+        self.clear_listeners()
+        self._add_listeners()
+
     def to_record(self):
         TaskRecord = namedtuple('TaskRecord', ['task_id', 'start_time', 'done_time', 'instruction'])
         start_time = datetime.fromtimestamp(self.start_time).strftime('%H:%M:%S') if self.start_time else '-'
@@ -197,22 +284,27 @@ class Task(Stoppable, EventBus):
             return
         
         self.done_time = time.time()
-        try:
-            # 创建 TaskState 对象并保存
-            task_state = TaskState(self)
-            task_state.save_to_file(self.cwd / "task.json")
-            
-            # 保存 HTML 控制台
-            filename = self.cwd / "console.html"
-            self.save(filename)
-            
-            self.saved = True
-            self.log.info('Task auto saved')
-        except Exception as e:
-            self.log.exception('Error saving task')
-            self.emit('exception', msg='save_task', exception=e)
+        with self.tracer.span('save') as span:
+            try:
+                # 创建 TaskState 对象并保存
+                task_state = TaskState(self)
+                task_state.save_to_file(self.cwd / "task.json")
+
+                # 保存 HTML 控制台
+                filename = self.cwd / "console.html"
+                self.save(filename)
+
+                self.saved = True
+                self.log.info('Task auto saved')
+            except Exception as e:
+                self.log.exception('Error saving task')
+                if span:
+                    span.set_error(e)
+                self.emit('exception', msg='save_task', exception=e)
 
     def done(self):
+        self.runner.close()
+        self._release_env()
         if not self.instruction or not self.start_time:
             self.log.warning('Task not started, skipping save')
             return
@@ -241,13 +333,18 @@ class Task(Stoppable, EventBus):
             self.sync_to_cloud()
         
     def process_reply(self, markdown):
+        if self._tool_calls:
+            tool_calls, self._tool_calls = self._tool_calls, None
+            self.emit('parse_reply', result={'tool_calls': tool_calls})
+            return self.process_tool_calls(tool_calls)
+
         ret = self.code_blocks.parse(markdown, parse_mcp=self.mcp)
         self.emit('parse_reply', result=ret)
         if not ret:
             return None
 
-        if 'call_tool' in ret:
-            return self.process_mcp_reply(ret['call_tool'])
+        if 'call_tools' in ret:
+            return self.process_mcp_reply(ret['call_tools'])
 
         errors = ret.get('errors')
         if errors:
@@ -263,13 +360,29 @@ class Task(Stoppable, EventBus):
     def run_code_block(self, block):
         """运行代码块"""
         self.emit('exec', block=block)
-        result = self.runner(block)
-        self.emit('exec_result', result=result, block=block)
+        cache = self.block_cache if self.block_cache and self.block_cache.is_cacheable(block, self.runtime) else None
+        if cache:
+            key = cache.make_key(block, self.cwd)
+            result = cache.get(key, block, self.runtime)
+            if result is not None:
+                self.runner.add_history(block, result, cached=True)
+                self.emit('exec_result', result=result, block=block, usage=None, cached=True)
+                return result
+            session_before = dict(self.runtime.session)
+            snapshot = cache.snapshot(self.cwd)
+
+        with self.cancel_scope(self.runner.cancel):
+            result = self.runner(block)
+        if cache and not self.is_stopped():
+            cache.put(key, block, result, self.runtime, session_before, snapshot, self.cwd)
+        self.emit('exec_result', result=result, block=block, usage=self.runner.last_usage)
         return result
 
     def process_code_reply(self, exec_blocks):
         results = OrderedDict()
         for block in exec_blocks:
+            if self.is_stopped():
+                break
             result = self.run_code_block(block)
             results[block.name] = result
 
@@ -282,6 +395,8 @@ class Task(Stoppable, EventBus):
         failed_blocks = set()  # 记录编辑失败的代码块
         
         for command in commands:
+            if self.is_stopped():
+                break
             cmd_type = command['type']
             
             if cmd_type == 'exec':
@@ -366,23 +481,74 @@ class Task(Stoppable, EventBus):
         msg = self.prompts.get_edit_results_prompt(results)
         return self.chat(msg)
 
-    def process_mcp_reply(self, json_content):
-        """处理 MCP 工具调用的回复"""
-        block = {'content': json_content, 'language': 'json'}
-        self.emit('mcp_call', block=block)
-
-        call_tool = json.loads(json_content)
-        result = self.mcp.call_tool(call_tool['name'], call_tool.get('arguments', {}))
-        code_block = CodeBlock(
-            code=json_content,
-            lang='json',
-            name=call_tool.get('name', 'MCP Tool Call'),
-            version=1,
-        )
-        self.emit('mcp_result', block=code_block, result=result)
-        msg = self.prompts.get_mcp_result_prompt(result)
+    def _call_mcp_tools(self, json_contents):
+        """同时执行多个 MCP 工具调用，返回处理后的结果列表"""
+        calls = []
+        for json_content in json_contents:
+            block = {'content': json_content, 'language': 'json'}
+            self.emit('mcp_call', block=block)
+            calls.append(json.loads(json_content))
+
+        def on_progress(name, progress, total, message):
+            self.emit('mcp_progress', name=name, progress=progress, total=total, message=message)
+
+        results = self.mcp.call_tools(calls, cancel_scope=self.cancel_scope, progress_callback=on_progress)
+        items = []
+        for json_content, call_tool, result in zip(json_contents, calls, results):
+            # 大的文本和图片等内容保存到任务目录，只把摘要发送给 LLM
+            result = self.mcp_results.process(result, call_tool['name'], self.cwd)
+            code_block = CodeBlock(
+                code=json_content,
+                lang='json',
+                name=call_tool.get('name', 'MCP Tool Call'),
+                version=1,
+            )
+            self.emit('mcp_result', block=code_block, result=result)
+            items.append({'name': call_tool['name'], 'arguments': call_tool.get('arguments', {}), 'result': result})
+        return items
+
+    def process_mcp_reply(self, json_contents):
+        """处理 MCP 工具调用的回复，同一回复中的多个调用同时执行，结果一起返回给 LLM"""
+        items = self._call_mcp_tools(json_contents)
+        if len(items) == 1:
+            msg = self.prompts.get_mcp_result_prompt(items[0]['result'])
+        else:
+            msg = self.prompts.get_mcp_results_prompt(items)
         return self.chat(msg)
 
+    def _call_function_tool(self, name, arguments):
+        try:
+            result = self.runtime.call_function(name, **arguments)
+        except Exception as e:
+            return json.dumps({'error': str(e)}, ensure_ascii=False)
+        return json.dumps({'result': result}, default=str, ensure_ascii=False)
+
+    def process_tool_calls(self, tool_calls):
+        """处理原生工具调用：MCP 工具同时执行，插件函数直接调用，结果作为 tool 消息返回给 LLM"""
+        contents = {}
+        mcp_calls = []
+        for call in tool_calls:
+            target = self.native_tools.resolve(call['name'])
+            arguments = call['arguments']
+            if '__raw__' in arguments:
+                error = f"Invalid JSON arguments: {arguments['__raw__']}"
+                contents[call['id']] = json.dumps({'error': error}, ensure_ascii=False)
+            elif not target:
+                contents[call['id']] = json.dumps({'error': f"Unknown tool: {call['name']}"}, ensure_ascii=False)
+            elif target[0] == 'function':
+                contents[call['id']] = self._call_function_tool(target[1], arguments)
+            else:
+                mcp_calls.append((call['id'], json.dumps({'name': target[1], 'arguments': arguments}, ensure_ascii=False)))
+
+        if mcp_calls:
+            items = self._call_mcp_tools([json_content for _, json_content in mcp_calls])
+            for (call_id, _), item in zip(mcp_calls, items):
+                contents[call_id] = json.dumps(item['result'], default=str, ensure_ascii=False)
+
+        for call in tool_calls:
+            self.client.add_message(ChatMessage(role='tool', content=contents[call['id']], tool_call_id=call['id']))
+        return self.chat(None)
+
     def _get_summary(self, detail=False):
         data = {}
         context_manager = self.context_manager
@@ -392,21 +558,37 @@ class Task(Stoppable, EventBus):
         summary = context_manager.get_summary()
         summary['elapsed_time'] = time.time() - self.start_time
         summarys = "{rounds} | {time:.3f}s/{elapsed_time:.3f}s | Tokens: {input_tokens}/{output_tokens}/{total_tokens}".format(**summary)
+        if summary['ttft'] is not None:
+            summarys += " | TTFT: {ttft:.2f}s".format(**summary)
+        if summary['tps'] is not None:
+            summarys += " | {tps:.1f} tokens/s".format(**summary)
         data['summary'] = summarys
         return data
 
     def chat(self, context: LLMContext, *, system_prompt=None):
+        if self.is_stopped():
+            return None
         self.emit('query_start', llm=self.client.name)
-        msg = self.client(context, system_prompt=system_prompt)
+        tools = self.native_tools.get_specs() if self._use_native_tools() else None
+        msg = self.client(context, system_prompt=system_prompt, tools=tools or None)
         self.emit('response_complete', llm=self.client.name, msg=msg)
+        if self.is_stopped():
+            return None
+        self._tool_calls = msg.tool_calls if msg else None
         return msg.content if msg else None
 
+    def _use_native_tools(self):
+        return self.client.supports_native_tools(self.function_calling)
+
     def _get_system_prompt(self):
         params = {}
-        if self.mcp:
+        # 原生工具调用时 MCP 工具通过 API 的 tools 参数传递，不再写入系统提示词
+        if self.mcp and not self._use_native_tools():
             params['mcp_tools'] = self.mcp.get_tools_prompt()
         params['util_functions'] = self.runtime.get_builtin_functions()
         params['tool_functions'] = self.runtime.get_plugin_functions()
+        params['persistent_namespace'] = self.runtime.persistent_namespace
+        params['exec_cache'] = self.block_cache is not None
         params['role'] = self.role
         return self.prompts.get_default_prompt(**params)
 
@@ -444,7 +626,14 @@ class Task(Stoppable, EventBus):
         执行自动处理循环，直到 LLM 不再返回代码消息
         instruction: 用户输入的字符串（可包含@file等多模态标记）
         """
-        mmc = MMContent(instruction, base_path=self.context.cwd)
+        mm_settings = self.settings.get('multimodal', {})
+        mmc = MMContent(
+            instruction,
+            base_path=self.context.cwd,
+            max_inline_size=mm_settings.get('max_inline_size'),
+            max_image_size=mm_settings.get('max_image_size'),
+            image_options=self.client.get_image_options(),
+        )
         try:
             content = mmc.content
         except Exception as e:
@@ -480,7 +669,7 @@ class Task(Stoppable, EventBus):
         self.saved = False
         
         response = self.chat(user_prompt, system_prompt=system_prompt)
-        if not response:
+        if not response and not self._tool_calls:
             self.log.error('No response from LLM')
             # 使用新的步骤管理器记录失败的步骤
             self.step_manager.create_checkpoint(instruction, 0, '')
@@ -498,7 +687,7 @@ class Task(Stoppable, EventBus):
             if self.is_stopped():
                 self.log.info('Task stopped')
                 break
-            if not response:
+            if not response and not self._tool_calls:
                 response = prev_response
                 break
 
@@ -561,6 +750,22 @@ class Task(Stoppable, EventBus):
         """列出所有步骤 - 使用新的步骤管理器"""
         return self.step_manager.list_steps()
 
+    def list_variables(self, top=10):
+        """列出共享命名空间中占用内存最多的变量（persistent_namespace 模式）"""
+        VariableRecord = namedtuple('VariableRecord', ['Name', 'Type', 'Size'])
+        executor = self.runner.get_lang_executor('python')
+        if not executor:
+            return 0, []
+        total, usage = executor.get_namespace_usage(top)
+        return total, [VariableRecord(Name=name, Type=type_name, Size=size) for name, type_name, size in usage]
+
+    def reset_namespace(self):
+        """清空共享命名空间"""
+        executor = self.runner.get_lang_executor('python')
+        if executor:
+            executor.reset()
+        return True
+
     def list_code_blocks(self):
         """列出所有代码块"""
         BlockRecord = namedtuple('BlockRecord', ['Index', 'Name', 'Version', 'Language', 'Path', 'Size'])
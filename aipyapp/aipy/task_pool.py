@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import deque
+from typing import Dict, Tuple
+
+from loguru import logger
+
+from .task import Task
+
+class TaskPool:
+    """预热的 Task 池
+
+    预先构建 Task 外壳（上下文、运行时、插件、显示插件），任务结束后重置状态放回池中复用。
+    代码执行器不复用，每个任务首次执行代码块时创建，任务结束时关闭。
+    按 (角色, 显示风格) 分组，切换角色或风格后自动使用对应分组。
+    """
+    DEFAULT_SIZE = 4
+
+    def __init__(self, context, size: int = DEFAULT_SIZE):
+        self.context = context
+        self.size = size
+        self._idle: Dict[Tuple[str, str], deque] = {}
+        self._lock = threading.Lock()
+        self.log = logger.bind(src='task_pool')
+        self.stats = {'created': 0, 'reused': 0, 'recycled': 0, 'dropped': 0}
+
+    def _current_key(self) -> Tuple[str, str]:
+        role = self.context.role_manager.current_role
+        display_manager = self.context.display_manager
+        return role.name, display_manager.style if display_manager else None
+
+    def _task_key(self, task: Task) -> Tuple[str, str]:
+        return task.role.name, task.display.name if task.display else None
+
+    def _create(self) -> Task:
+        task = Task(self.context)
+        self.stats['created'] += 1
+        return task
+
+    def prewarm(self, count: int = None) -> int:
+        """预先创建 Task 直到当前分组达到指定数量
+
+        Returns:
+            新创建的 Task 数量
+        """
+        count = self.size if count is None else min(count, self.size)
+        key = self._current_key()
+        created = 0
+        while True:
+            with self._lock:
+                if len(self._idle.setdefault(key, deque())) >= count:
+                    break
+            task = self._create()
+            with self._lock:
+                self._idle[key].append(task)
+            created += 1
+        if created:
+            self.log.info(f"Prewarmed {created} tasks", key=key)
+        return created
+
+    def acquire(self) -> Task:
+        """获取一个可用的 Task，池为空时新建"""
+        key = self._current_key()
+        with self._lock:
+            idle = self._idle.get(key)
+            task = idle.popleft() if idle else None
+        if task:
+            self.stats['reused'] += 1
+            return task
+        return self._create()
+
+    def release(self, task: Task) -> bool:
+        """重置 Task 并放回池中
+
+        Returns:
+            是否放回池中，池已满或重置失败时丢弃
+        """
+        key = self._task_key(task)
+        with self._lock:
+            if len(self._idle.get(key, ())) >= self.size:
+                self.stats['dropped'] += 1
+                return False
+
+        try:
+            task.recycle()
+        except Exception as e:
+            self.log.error(f"Failed to recycle task {task.task_id}: {e}")
+            self.stats['dropped'] += 1
+            return False
+
+        with self._lock:
+            self._idle.setdefault(key, deque()).append(task)
+        self.stats['recycled'] += 1
+        return True
+
+    def clear(self):
+        """清空池中的所有 Task"""
+        with self._lock:
+            self._idle.clear()
+
+    def get_status(self) -> Dict[str, int]:
+        """获取池状态"""
+        with self._lock:
+            idle = sum(len(tasks) for tasks in self._idle.values())
+        return {'size': self.size, 'idle': idle, **self.stats}
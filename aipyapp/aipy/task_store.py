@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sqlite3
+import time
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+FINISHED_STATUSES = ('completed', 'error', 'cancelled')
+ACTIVE_STATUSES = ('pending', 'running')
+
+class AgentTaskStore:
+    """基于SQLite的Agent任务持久化存储"""
+
+    FIELDS = ('task_id', 'instruction', 'status', 'created_at', 'started_at', 'completed_at', 'error')
+
+    def __init__(self, db_path: str = "agent_tasks.db"):
+        """
+        初始化任务存储
+
+        Args:
+            db_path: SQLite数据库文件路径
+        """
+        self.db_path = str(Path(db_path).expanduser())
+        self._lock = threading.RLock()
+        self.log = logger.bind(src='task_store')
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path)
+
+    def _init_db(self):
+        """初始化数据库表和索引"""
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS agent_tasks (
+                    task_id TEXT PRIMARY KEY,
+                    instruction TEXT,
+                    status TEXT,
+                    created_at REAL,
+                    started_at REAL,
+                    completed_at REAL,
+                    error TEXT,
+                    data TEXT
+                )
+            ''')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_agent_tasks_status ON agent_tasks(status, created_at)'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_agent_tasks_created ON agent_tasks(created_at)'
+            )
+            conn.commit()
+
+    def save(self, record: Dict[str, Any], data: Optional[Dict[str, Any]] = None) -> None:
+        """
+        保存任务记录
+
+        Args:
+            record: 任务基本信息，时间字段为时间戳
+            data: 任务捕获的输出数据，None表示保留已有数据
+        """
+        values = [record.get(field) for field in self.FIELDS]
+        with self._lock:
+            with self._connect() as conn:
+                if data is None:
+                    conn.execute(
+                        '''INSERT INTO agent_tasks (task_id, instruction, status, created_at, started_at, completed_at, error)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)
+                           ON CONFLICT(task_id) DO UPDATE SET
+                               instruction=excluded.instruction, status=excluded.status,
+                               created_at=excluded.created_at, started_at=excluded.started_at,
+                               completed_at=excluded.completed_at, error=excluded.error''',
+                        values,
+                    )
+                else:
+                    serialized = json.dumps(data, ensure_ascii=False, default=str)
+                    conn.execute(
+                        'INSERT OR REPLACE INTO agent_tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        values + [serialized],
+                    )
+                conn.commit()
+
+    def get(self, task_id: str, with_data: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        获取任务记录
+
+        Args:
+            task_id: 任务ID
+            with_data: 是否包含捕获的输出数据
+
+        Returns:
+            任务记录或None
+        """
+        columns = ', '.join(self.FIELDS + (('data',) if with_data else ()))
+        with self._connect() as conn:
+            row = conn.execute(
+                f'SELECT {columns} FROM agent_tasks WHERE task_id = ?', (task_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return self._row_to_record(row, with_data)
+
+    def list(self, status: Optional[str] = None, offset: int = 0, limit: int = 50) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        分页列出任务记录（不含输出数据），按创建时间倒序
+
+        Args:
+            status: 按状态过滤，None表示全部
+            offset: 偏移量
+            limit: 返回数量
+
+        Returns:
+            (总数, 记录列表)
+        """
+        where, params = ('WHERE status = ?', [status]) if status else ('', [])
+        columns = ', '.join(self.FIELDS)
+        with self._connect() as conn:
+            total = conn.execute(f'SELECT COUNT(*) FROM agent_tasks {where}', params).fetchone()[0]
+            rows = conn.execute(
+                f'SELECT {columns} FROM agent_tasks {where} ORDER BY created_at DESC LIMIT ? OFFSET ?',
+                params + [limit, offset],
+            ).fetchall()
+        return total, [self._row_to_record(row, False) for row in rows]
+
+    def delete_finished(self, before: float) -> int:
+        """
+        删除指定时间之前完成的任务
+
+        Args:
+            before: 时间戳
+
+        Returns:
+            删除的任务数量
+        """
+        placeholders = ', '.join('?' * len(FINISHED_STATUSES))
+        with self._lock:
+            with self._connect() as conn:
+                cursor = conn.execute(
+                    f'DELETE FROM agent_tasks WHERE status IN ({placeholders}) AND completed_at < ?',
+                    list(FINISHED_STATUSES) + [before],
+                )
+                conn.commit()
+                return cursor.rowcount
+
+    def mark_interrupted(self, error: str = 'Interrupted by server restart') -> int:
+        """
+        将上次运行遗留的未完成任务标记为错误
+
+        Returns:
+            标记的任务数量
+        """
+        placeholders = ', '.join('?' * len(ACTIVE_STATUSES))
+        with self._lock:
+            with self._connect() as conn:
+                cursor = conn.execute(
+                    f'''UPDATE agent_tasks SET status = 'error', error = ?, completed_at = ?
+                        WHERE status IN ({placeholders})''',
+                    [error, time.time()] + list(ACTIVE_STATUSES),
+                )
+                conn.commit()
+                count = cursor.rowcount
+        if count:
+            self.log.warning(f"Marked {count} interrupted tasks as error")
+        return count
+
+    def count(self) -> int:
+        """获取任务数量"""
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM agent_tasks').fetchone()[0]
+
+    def _row_to_record(self, row, with_data: bool) -> Dict[str, Any]:
+        record = dict(zip(self.FIELDS, row))
+        if with_data:
+            try:
+                record['data'] = json.loads(row[-1]) if row[-1] else None
+            except (json.JSONDecodeError, TypeError):
+                record['data'] = None
+        return record
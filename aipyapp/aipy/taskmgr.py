@@ -2,21 +2,26 @@
 # -*- coding: utf-8 -*-
 
 import os
+import atexit
 from pathlib import Path
 from collections import deque, namedtuple
-from dataclasses import dataclass
-from typing import Optional, Any
+from dataclasses import dataclass, field
+from typing import Optional, Any, Dict
 
 from loguru import logger
 
 from .task import Task
+from .task_pool import TaskPool
 from .plugins import PluginManager
 from .prompts import Prompts
 from .diagnose import Diagnose
 from .llm import ClientManager
-from .config import PLUGINS_DIR, ROLES_DIR, get_mcp_config_file, get_tt_api_key
+from .config import CONFIG_DIR, PLUGINS_DIR, ROLES_DIR, get_mcp_config_file, get_tt_api_key
 from .role import RoleManager
 from .mcp_tool import MCPToolManager
+from .metrics import REGISTRY
+from ..exec.python.packages import configure as configure_packages, get_package_manager, WHEEL_CACHE_SIZE
+from ..exec.venv import EnvManager
 
 @dataclass
 class TaskContext:
@@ -30,8 +35,13 @@ class TaskContext:
     diagnose: Diagnose
     mcp: Optional[MCPToolManager]
     prompts: Prompts
+    # 按角色共享的插件函数模式（签名、文档、参数模型）
+    function_schemas: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # 任务/角色隔离的 overlay 虚拟环境，None 表示所有任务共用 aipy 所在环境
+    env_manager: Optional[EnvManager] = None
 
 class TaskManager:
+    # 内存中保留的最近任务数，None 表示不限制
     MAX_TASKS = 16
 
     def __init__(self, settings, /, display_manager=None):
@@ -52,6 +62,10 @@ class TaskManager:
         # 创建任务上下文
         self.task_context = self._create_task_context()
 
+        # 任务池，默认关闭
+        self.task_pool = None
+        self._init_task_pool(self.settings.get('task_pool_size', 0))
+
     def _init_workenv(self):
         """初始化工作环境"""
         # 环境变量
@@ -90,6 +104,9 @@ class TaskManager:
         self.role_manager = RoleManager(ROLES_DIR, api_conf)
         self.role_manager.load_roles()
         self.role_manager.use(self.settings.get('role', 'aipy'))
+
+        # 第三方包安装管理
+        self._init_packages()
         
         # MCP 工具管理器
         mcp_config_file = get_mcp_config_file(self.settings.get('_config_dir'))
@@ -98,6 +115,41 @@ class TaskManager:
         # 提示管理器
         self.prompts = Prompts()
 
+        # 退出时把运行指标写入文件
+        metrics_file = (self.settings.get('metrics') or {}).get('file')
+        if metrics_file:
+            atexit.register(REGISTRY.dump, Path(metrics_file).expanduser())
+
+    def _init_packages(self):
+        """配置包安装记录和 wheel 缓存，按需在后台预装角色声明的包"""
+        conf = self.settings.get('packages') or {}
+        record_dir = CONFIG_DIR / 'packages' if conf.get('record', True) else None
+        wheel_cache = conf.get('wheel_cache', False)
+        if wheel_cache is True:
+            wheel_cache = CONFIG_DIR / 'wheels'
+        configure_packages(record_dir=record_dir, wheel_dir=wheel_cache or None, pip_args=conf.get('pip_args'),
+                           wheel_max_size=conf.get('wheel_cache_size', WHEEL_CACHE_SIZE))
+
+        # 隔离环境
+        venv_conf = self.settings.get('venv') or {}
+        mode = venv_conf.get('mode', 'none')
+        self.env_manager = None
+        if mode != 'none':
+            self.env_manager = EnvManager(venv_conf.get('dir') or CONFIG_DIR / 'venvs', mode)
+        self.preinstall_packages()
+
+    def preinstall_packages(self):
+        """在后台安装当前角色声明的 Python 包（需开启 packages.preinstall）"""
+        conf = self.settings.get('packages') or {}
+        if not conf.get('preinstall', False):
+            return None
+        role = self.role_manager.current_role
+        packages = role.packages.get('python', [])
+        manager = get_package_manager()
+        if self.env_manager and self.env_manager.mode == 'role':
+            manager = self.env_manager.acquire(role.name).package_manager
+        return manager.preinstall(sorted(packages))
+
     def get_status(self):
         status = {
             'tasks': len(self.tasks),
@@ -108,6 +160,8 @@ class TaskManager:
             'display': self.display_manager.style,
             'mcp_enabled': self.mcp.is_mcp_enabled,
         }
+        if self.task_pool:
+            status['task_pool'] = self.task_pool.get_status()
         return status
 
     def _create_task_context(self) -> TaskContext:
@@ -121,9 +175,20 @@ class TaskManager:
             role_manager=self.role_manager,
             diagnose=self.diagnose,
             mcp=self.mcp,
-            prompts=self.prompts
+            prompts=self.prompts,
+            env_manager=self.env_manager
         )
 
+    def _init_task_pool(self, size: int):
+        """初始化并预热任务池"""
+        if not size or size <= 0:
+            return
+        self.task_pool = TaskPool(self.task_context, size)
+        try:
+            self.task_pool.prewarm()
+        except Exception as e:
+            self.log.error(f"Failed to prewarm task pool: {e}")
+
     @property
     def workdir(self):
         return str(self.cwd)
@@ -172,12 +237,14 @@ class TaskManager:
         if role:
             ret = self.role_manager.use(role)
             rets['role'] = ret
+            if ret:
+                self.preinstall_packages()
         return rets
 
     def new_task(self):
         """创建新任务"""
         # 创建新任务
-        task = Task(self.task_context)
+        task = self.task_pool.acquire() if self.task_pool else Task(self.task_context)
         self.tasks.append(task)
         self.log.info('New task created', task_id=task.task_id)
         return task
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import random
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from .. import __version__
+from ..interface import Event
+
+# OTLP 的 span kind 和状态码
+SPAN_KIND_INTERNAL = 1
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+_export_lock = threading.Lock()
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        # OTLP JSON 中的 64 位整数用字符串表示
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+def _nano(seconds: float) -> str:
+    return str(int(seconds * 1e9))
+
+class Span:
+    """一段有开始和结束时间的操作，parent_id 为 None 表示根 span"""
+    __slots__ = ('name', 'span_id', 'parent_id', 'start', 'end', 'attributes', 'error')
+
+    def __init__(self, name: str, parent_id: Optional[str], start: float, attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.start = start
+        self.end = None
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.error = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.end is None else self.end - self.start
+
+    def set(self, **attributes):
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def set_error(self, message: str):
+        self.error = str(message)[:256]
+
+    def to_otlp(self, trace_id: str, now: float) -> Dict[str, Any]:
+        """转换为 OTLP JSON 格式，未结束的 span 以 now 为结束时间"""
+        data = {
+            'traceId': trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': SPAN_KIND_INTERNAL,
+            'startTimeUnixNano': _nano(self.start),
+            'endTimeUnixNano': _nano(self.end if self.end is not None else now),
+            'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in self.attributes.items()],
+            'status': {'code': STATUS_ERROR, 'message': self.error} if self.error else {'code': STATUS_UNSET},
+        }
+        if self.parent_id:
+            data['parentSpanId'] = self.parent_id
+        return data
+
+class Tracer:
+    """记录单个任务的 span：task → round → llm_call / parse / exec_block / mcp_call / save
+
+    作为任务的事件监听器，由 Task.emit 发出的事件创建和结束 span；llm_call 由 Client.__call__ 创建，
+    save 由 Task 保存时创建。span 按任务 id 组成一个 trace，任务结束时导出到 OTLP JSON 文件（每行一个 trace）。
+    """
+    def __init__(self, enabled: bool = True, file: Optional[str] = None):
+        self.enabled = enabled
+        self.file = Path(file).expanduser() if file else None
+        self.log = logger.bind(src='tracing')
+        self.reset()
+
+    @classmethod
+    def from_settings(cls, settings) -> 'Tracer':
+        conf = settings.get('tracing') or {}
+        return cls(conf.get('enabled', True), conf.get('file'))
+
+    def reset(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id
+        self.spans: List[Span] = []
+        # 当前打开的 span，新 span 的父 span 为栈顶
+        self._stack: List[Span] = []
+        # 同时执行的 MCP 调用，按发起顺序结束
+        self._mcp_spans: List[Span] = []
+        self._exec_span = None
+        self._round_span = None
+        self._last_llm_end = None
+
+    @property
+    def current(self) -> Optional[Span]:
+        return self._stack[-1] if self._stack else None
+
+    def start(self, name: str, *, push: bool = True, **attributes) -> Span:
+        parent = self.current
+        span = Span(name, parent.span_id if parent else None, time.time(), attributes)
+        self.spans.append(span)
+        if push:
+            self._stack.append(span)
+        return span
+
+    def end(self, span: Optional[Span], end: Optional[float] = None):
+        if span is None or span.end is not None:
+            return
+        span.end = end or time.time()
+        if span in self._stack:
+            # 结束父 span 时同时结束其中还没有结束的子 span
+            index = self._stack.index(span)
+            for child in self._stack[index + 1:]:
+                if child.end is None:
+                    child.end = span.end
+            del self._stack[index:]
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """在 with 块中记录一个 span，关闭时 yield None"""
+        if not self.enabled:
+            yield None
+            return
+        span = self.start(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            self.end(span)
+            if name == 'llm_call':
+                self._last_llm_end = span.end
+
+    def get_handlers(self) -> Dict[str, Callable[[Event], None]]:
+        return {
+            'task_start': self.on_task_start,
+            'round_start': self.on_round_start,
+            'parse_reply': self.on_parse_reply,
+            'exec': self.on_exec,
+            'exec_result': self.on_exec_result,
+            'mcp_call': self.on_mcp_call,
+            'mcp_result': self.on_mcp_result,
+            'round_end': self.on_round_end,
+            'task_end': self.on_task_end,
+        }
+
+    def on_task_start(self, event: Event):
+        self.reset(event.data.get('task_id'))
+        self.start('task', task_id=self.trace_id, title=event.data.get('title') or event.data.get('instruction'))
+        self._round_span = self.start('round', step=1, instruction=event.data.get('instruction'))
+
+    def on_round_start(self, event: Event):
+        self.end(self._round_span)
+        self._round_span = self.start('round', step=event.data.get('step'), instruction=event.data.get('instruction'))
+
+    def on_parse_reply(self, event: Event):
+        # 解析在 LLM 回复之后进行，没有开始事件，从上一次 LLM 调用结束时开始计时
+        now = time.time()
+        span = self.start('parse', push=False)
+        span.start = self._last_llm_end or now
+        result = event.data.get('result') or {}
+        if isinstance(result, dict):
+            span.set(commands=len(result.get('commands') or []),
+                     tool_calls=len(result.get('tool_calls') or result.get('call_tools') or []))
+            if result.get('errors'):
+                span.set_error(f"{len(result['errors'])} errors")
+        self.end(span, now)
+
+    def on_exec(self, event: Event):
+        block = event.data.get('block')
+        self._exec_span = self.start('exec_block', block=getattr(block, 'name', None), lang=getattr(block, 'lang', None),
+                                     version=getattr(block, 'version', None))
+
+    def on_exec_result(self, event: Event):
+        span = self._exec_span
+        if span is None:
+            return
+        result = event.data.get('result') or {}
+        span.set(cached=bool(event.data.get('cached')))
+        if result.get('errstr'):
+            span.set_error(result['errstr'])
+        elif result.get('returncode'):
+            span.set_error(f"returncode {result['returncode']}")
+        self.end(span)
+        self._exec_span = None
+
+    def on_mcp_call(self, event: Event):
+        block = event.data.get('block') or {}
+        try:
+            name = json.loads(block.get('content', '')).get('name')
+        except (ValueError, AttributeError):
+            name = None
+        self._mcp_spans.append(self.start('mcp_call', push=False, tool=name))
+
+    def on_mcp_result(self, event: Event):
+        if not self._mcp_spans:
+            return
+        span = self._mcp_spans.pop(0)
+        result = event.data.get('result')
+        if isinstance(result, dict) and result.get('isError'):
+            span.set_error('isError')
+        self.end(span)
+
+    def on_round_end(self, event: Event):
+        self.end(self._round_span)
+        self._round_span = None
+
+    def on_task_end(self, event: Event):
+        if self.spans:
+            self.spans[0].set(path=event.data.get('path'))
+            self.end(self.spans[0])
+        self.export()
+
+    def get_tree(self) -> List[Tuple[int, Span]]:
+        """按开始时间深度优先排列的 (深度, span) 列表"""
+        children: Dict[Optional[str], List[Span]] = {}
+        for span in self.spans:
+            children.setdefault(span.parent_id, []).append(span)
+        rows = []
+
+        def walk(parent_id, depth):
+            for span in sorted(children.get(parent_id, []), key=lambda s: s.start):
+                rows.append((depth, span))
+                walk(span.span_id, depth + 1)
+        walk(None, 0)
+        return rows
+
+    def to_otlp(self) -> Dict[str, Any]:
+        now = time.time()
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'aipyapp'}}]},
+            'scopeSpans': [{
+                'scope': {'name': 'aipyapp', 'version': __version__},
+                'spans': [span.to_otlp(self.trace_id, now) for span in self.spans],
+            }],
+        }]}
+
+    def export(self):
+        """把 trace 追加到 OTLP JSON 文件"""
+        if not self.file or not self.spans or not self.trace_id:
+            return
+        line = json.dumps(self.to_otlp(), ensure_ascii=False)
+        try:
+            with _export_lock:
+                self.file.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.file, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+        except OSError as e:
+            self.log.error(f"Failed to export trace to {self.file}: {e}")
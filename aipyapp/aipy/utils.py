@@ -57,3 +57,11 @@ def get_safe_filename(input_str, extension=".html", max_length=16):
         counter += 1
 
     return filename
+
+def format_size(size):
+    """把字节数格式化为便于阅读的 B/KB/MB/GB 字符串"""
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
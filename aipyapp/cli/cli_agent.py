@@ -5,13 +5,14 @@ from typing import Dict, Any, Optional
 from datetime import datetime
 
 import uvicorn
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Response
 from pydantic import BaseModel, Field
 
 from loguru import logger
 
 from .. import T, __version__
 from ..aipy.agent_taskmgr import AgentTaskManager
+from ..aipy.metrics import REGISTRY, CONTENT_TYPE
 from ..display import DisplayManager
 
 # API 数据模型
@@ -55,11 +56,15 @@ app = FastAPI(
 async def startup_event():
     """应用启动时初始化"""
     logger.info("Starting AIPython Agent API server...")
+    if agent_manager:
+        agent_manager.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭时清理"""
     logger.info("Shutting down AIPython Agent API server...")
+    if agent_manager:
+        agent_manager.stop()
     if agent_manager and hasattr(agent_manager, 'executor'):
         agent_manager.executor.shutdown(wait=True)
 
@@ -77,7 +82,8 @@ async def root():
             "get_task_result": "GET /tasks/{task_id}/result",
             "list_tasks": "GET /tasks",
             "cancel_task": "DELETE /tasks/{task_id}",
-            "health": "GET /health"
+            "health": "GET /health",
+            "metrics": "GET /metrics"
         }
     }
 
@@ -90,6 +96,11 @@ async def health_check():
         "agent_manager": "initialized" if agent_manager else "not_initialized"
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 格式的运行指标"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
 @app.post("/tasks", response_model=TaskResponse)
 async def submit_task(task_request: TaskRequest, background_tasks: BackgroundTasks):
     """提交新任务"""
@@ -155,14 +166,13 @@ async def get_task_result(task_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/tasks")
-async def list_tasks():
-    """列出所有任务"""
+async def list_tasks(status: Optional[str] = None, offset: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
+    """分页列出任务"""
     if not agent_manager:
         raise HTTPException(status_code=500, detail="Agent manager not initialized")
     
     try:
-        tasks = await agent_manager.list_tasks()
-        return {"tasks": tasks}
+        return await agent_manager.list_tasks(status=status, offset=offset, limit=limit)
     except Exception as e:
         logger.error(f"Failed to list tasks: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -226,6 +236,7 @@ def main(settings):
     print(f"✅ {T('Agent manager initialized')}")
     print(f"🔗 API Documentation: http://{host}:{port}/docs")
     print(f"📊 Health Check: http://{host}:{port}/health")
+    print(f"📈 Metrics: http://{host}:{port}/metrics")
     
     # 启动服务器
     try:
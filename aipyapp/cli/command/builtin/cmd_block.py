@@ -7,6 +7,7 @@ from rich.syntax import Syntax
 from .utils import record2table
 from ..base import CommandMode, ParserCommand
 from aipyapp import T
+from aipyapp.aipy.utils import format_size
 
 class BlockCommand(ParserCommand):
     """Block command"""
@@ -26,6 +27,9 @@ class BlockCommand(ParserCommand):
         parser.add_argument('index', type=int, help=T('Index of the code block'))
         parser = subparsers.add_parser('run', help=T('Run code block'))
         parser.add_argument('index', type=int, help=T('Index of the code block'))
+        parser = subparsers.add_parser('vars', help=T('Show memory usage of variables in the shared namespace'))
+        parser.add_argument('--top', type=int, default=10, help=T('Number of variables to show'))
+        subparsers.add_parser('reset', help=T('Reset the shared namespace'))
 
     def cmd(self, args, ctx):
         return self.cmd_list(args, ctx)
@@ -62,4 +66,22 @@ class BlockCommand(ParserCommand):
         task = ctx.task
         blocks = task.list_code_blocks()
         table = record2table(blocks, title=T("Code Blocks"))
-        ctx.console.print(table)
\ No newline at end of file
+        ctx.console.print(table)
+
+    def cmd_vars(self, args, ctx):
+        """显示共享命名空间中占用内存最多的变量"""
+        task = ctx.task
+        total, records = task.list_variables(args.top)
+        if not records:
+            ctx.console.print(T("No variables in the shared namespace"))
+            return True
+        records = [record._replace(Size=format_size(record.Size)) for record in records]
+        table = record2table(records, title=f"{T('Variables')} ({format_size(total)})")
+        ctx.console.print(table)
+        return True
+
+    def cmd_reset(self, args, ctx):
+        """清空共享命名空间"""
+        ctx.task.reset_namespace()
+        ctx.console.print(T("Shared namespace reset"))
+        return True
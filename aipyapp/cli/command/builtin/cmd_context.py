@@ -73,6 +73,10 @@ class ContextCommand(ParserCommand):
         table.add_row(T("Current token"), str(stats['total_tokens']))
         table.add_row(T("Max tokens"), str(stats['max_tokens']))
         table.add_row(T("Compression ratio"), f"{stats['compression_ratio']:.2f}")
+        if stats['ttft'] is not None:
+            table.add_row(T("Avg time to first token"), f"{stats['ttft']:.2f}s")
+        if stats['tps'] is not None:
+            table.add_row(T("Output speed"), f"{stats['tps']:.1f} tokens/s")
         
         console.print(table)
     
@@ -1,6 +1,6 @@
 from aipyapp import T
 from ..base import CommandMode, ParserCommand
-from .utils import record2table
+from .utils import record2table, row2table
 
 class LLMCommand(ParserCommand):
     name = 'llm'
@@ -11,6 +11,7 @@ class LLMCommand(ParserCommand):
         use_parser = subparsers.add_parser('use', help=T('Use a LLM provider'))
         use_parser.add_argument('provider', type=str, help=T('Provider name'))
         subparsers.add_parser('list', help=T('List LLM providers'))
+        subparsers.add_parser('stats', help=T('Show LLM latency stats'))
 
     def get_arg_values(self, name, subcommand=None):
         if name == 'provider':
@@ -23,6 +24,19 @@ class LLMCommand(ParserCommand):
         table = record2table(rows)
         ctx.console.print(table)
         
+    def cmd_stats(self, args, ctx):
+        def fmt(value, spec):
+            return '-' if value is None else format(value, spec)
+
+        rows = []
+        for name, client in ctx.tm.client_manager.clients.items():
+            stats = client.stats.to_dict()
+            rows.append((name, stats['requests'], stats['errors'],
+                         fmt(stats['avg_ttfb'], '.2f'), fmt(stats['avg_ttft'], '.2f'), fmt(stats['recent_ttft'], '.2f'),
+                         fmt(stats['avg_tps'], '.1f'), fmt(stats['recent_tps'], '.1f')))
+        headers = ['Name', 'Requests', 'Errors', 'Avg TTFB (s)', 'Avg TTFT (s)', 'Recent TTFT (s)', 'Avg tokens/s', 'Recent tokens/s']
+        ctx.console.print(row2table(rows, title=T('LLM latency stats'), headers=headers))
+
     def cmd_use(self, args, ctx):
         if ctx.task:
             ret = ctx.task.use(args.provider)
@@ -2,6 +2,8 @@ import time
 import os
 
 from rich.panel import Panel
+from rich.table import Table
+from rich.text import Text
 
 from aipyapp import T, EventBus
 from aipyapp.aipy.event_serializer import EventSerializer
@@ -10,6 +12,10 @@ from ..base import ParserCommand
 from ..common import TaskModeResult
 from .utils import record2table
 
+# 时间线中各类 span 的颜色
+SPAN_STYLES = {'task': 'white', 'round': 'cyan', 'llm_call': 'magenta', 'parse': 'yellow',
+               'exec_block': 'green', 'mcp_call': 'blue', 'save': 'bright_black'}
+TIMELINE_WIDTH = 40
 
 class TaskCommand(ParserCommand):
     name = 'task'
@@ -24,6 +30,8 @@ class TaskCommand(ParserCommand):
         parser = subparsers.add_parser('replay', help=T('Replay task from task.json file'))
         parser.add_argument('path', type=str, help=T('Path to task.json file'))
         parser.add_argument('--speed', type=float, default=1.0, help=T('Replay speed multiplier (default: 1.0)'))
+        parser = subparsers.add_parser('trace', help=T('Show task timeline'))
+        parser.add_argument('tid', type=str, nargs='?', help=T('Task ID'))
 
     def cmd_list(self, args, ctx):
         rows = ctx.tm.list_tasks()
@@ -192,5 +200,41 @@ class TaskCommand(ParserCommand):
             console.print("\n⚠️  检测到非交互式环境，自动继续重放")
             return True
 
+    def cmd_trace(self, args, ctx):
+        """按时间线显示任务各阶段（轮次、LLM 调用、解析、代码块执行、MCP 调用、保存）的耗时"""
+        tasks = ctx.tm.get_tasks()
+        task = ctx.tm.get_task_by_id(args.tid) if args.tid else (tasks[-1] if tasks else None)
+        if not task:
+            ctx.console.print(T('Task not found'), style='red')
+            return
+        rows = task.tracer.get_tree()
+        if not rows:
+            ctx.console.print(T('No trace recorded'), style='yellow')
+            return
+
+        now = time.time()
+        origin = min(span.start for _, span in rows)
+        total = max((span.end or now) for _, span in rows) - origin or 1e-6
+        table = Table(title=f"{T('Task timeline')} {task.task_id} ({total:.2f}s)")
+        table.add_column(T('Span'), no_wrap=True)
+        table.add_column(T('Start'), justify='right')
+        table.add_column(T('Duration'), justify='right')
+        table.add_column(T('Timeline'), no_wrap=True)
+        table.add_column(T('Details'))
+        for depth, span in rows:
+            end = span.end or now
+            offset = int((span.start - origin) / total * TIMELINE_WIDTH)
+            width = max(1, round((end - span.start) / total * TIMELINE_WIDTH))
+            width = min(width, TIMELINE_WIDTH - offset) or 1
+            style = 'red' if span.error else SPAN_STYLES.get(span.name, 'white')
+            bar = Text(' ' * offset) + Text('█' * width, style=style)
+            details = ', '.join(f'{k}={v}' for k, v in span.attributes.items() if k not in ('task_id', 'instruction'))
+            details = Text(details)
+            if span.error:
+                details.append(f" {span.error}" if details else span.error, style='red')
+            duration = f'{end - span.start:.2f}s' + ('' if span.end else '…')
+            table.add_row(Text('  ' * depth + span.name, style=style), f'{span.start - origin:.2f}s', duration, bar, details)
+        ctx.console.print(table)
+
     def cmd(self, args, ctx):
         self.cmd_list(args, ctx)
\ No newline at end of file
@@ -85,7 +85,11 @@ class DisplayProtocol(Protocol):
         
     def on_mcp_call(self, event: Event):
         """工具调用事件处理"""
-        pass 
+        pass
+
+    def on_mcp_progress(self, event: Event):
+        """MCP 工具调用进度事件处理"""
+        pass
 
     def on_upload_result(self, event: Event):
         """云端上传结果事件处理"""
@@ -114,6 +118,10 @@ class DisplayPlugin(DisplayProtocol, Plugin):
         """初始化显示效果插件"""
         pass
 
+    def reset(self):
+        """重置插件状态，Task 复用时调用"""
+        pass
+
     @classmethod
     def get_type(cls) -> PluginType:
         """Get plugin type
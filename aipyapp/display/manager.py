@@ -74,6 +74,14 @@ class DisplayManager:
             return None
         return plugin
         
+    def reset_display_plugin(self, plugin: DisplayPlugin):
+        """重置显示插件以便复用，避免重新创建 Console"""
+        console = plugin.console
+        if console.record:
+            with console._record_buffer_lock:
+                console._record_buffer[:] = self._record_buffer
+        plugin.reset()
+        
     def register_plugin(self, plugin_class: Type[DisplayPlugin], name: str = None):
         """注册新的显示效果插件"""
         if name is None:
@@ -1,5 +1,6 @@
 
-from .executor import BlockExecutor
+from .executor import BlockExecutor, register_executor
 from .python import PythonRuntime
+from .limits import ResourceLimits, ResourceUsage, ResourceLimitExceeded
 
-__all__ = ['BlockExecutor', 'PythonRuntime']
\ No newline at end of file
+__all__ = ['BlockExecutor', 'register_executor', 'PythonRuntime', 'ResourceLimits', 'ResourceUsage', 'ResourceLimitExceeded']
\ No newline at end of file
@@ -2,13 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import traceback
-from typing import Optional
+from importlib import metadata
+from contextlib import nullcontext
+from typing import Optional, Dict, Callable
 
 from loguru import logger
 
 from ..interface import Trackable
+from .limits import ResourceLimits, ResourceMonitor, ResourceLimitExceeded, BlockCancelled, BlockInterrupted
 from .python import PythonRuntime, PythonExecutor
 from .html import HtmlExecutor
+from .venv import OverlayEnv
 from .prun import BashExecutor, PowerShellExecutor, AppleScriptExecutor, NodeExecutor
 
 EXECUTORS = {executor.name: executor for executor in [
@@ -20,11 +24,49 @@ EXECUTORS = {executor.name: executor for executor in [
     NodeExecutor
 ]}
 
+ENTRY_POINT_GROUP = 'aipyapp.executors'
+_entry_points_loaded = False
+
+def register_executor(executor_cls=None, *, name: str = None):
+    """注册代码块执行器，可作为类装饰器使用
+
+    执行器以 `executor_cls(runtime)` 创建，调用时传入代码块并返回结果字典，可选实现 close() 释放资源。
+    同名执行器会被替换。插件目录中的插件文件可以在导入时调用本函数注册执行器，
+    第三方包也可以通过 `aipyapp.executors` entry point 提供执行器类。
+    """
+    def register(cls):
+        lang = name or cls.name
+        if not lang:
+            raise ValueError(f"Executor {cls} has no name")
+        EXECUTORS[lang] = cls
+        logger.bind(src='block_executor').info(f'Registered executor class for {lang}: {cls}')
+        return cls
+    return register(executor_cls) if executor_cls is not None else register
+
+def load_entry_points():
+    """加载 entry point 提供的执行器（只加载一次）"""
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    log = logger.bind(src='block_executor')
+    for entry_point in metadata.entry_points(group=ENTRY_POINT_GROUP):
+        try:
+            register_executor(entry_point.load(), name=entry_point.name)
+        except Exception as e:
+            log.error(f'Failed to load executor {entry_point.name}: {e}')
+
 class BlockExecutor(Trackable):
-    def __init__(self):
+    def __init__(self, limits: Optional[ResourceLimits] = None, overrides: Optional[Dict[str, Callable]] = None):
         self.history = []
         self.executors = {}
+        # 按语言覆盖全局注册的执行器，值为 factory(runtime)，例如开启常驻解释器时
+        self.overrides = overrides or {}
         self.runtimes = {}
+        self.limits = limits or ResourceLimits()
+        self._monitor = None
+        # 代码块执行时激活的 overlay 环境，None 表示使用 aipy 所在环境
+        self.env: Optional[OverlayEnv] = None
         self.log = logger.bind(src='block_executor')
 
     def _set_runtime(self, lang, runtime):
@@ -45,33 +87,71 @@ class BlockExecutor(Trackable):
         if lang in self.executors:
             return self.executors[lang]
         
-        if lang not in EXECUTORS:
+        load_entry_points()
+        factory = self.overrides.get(lang) or EXECUTORS.get(lang)
+        if not factory:
             self.log.warning(f'No executor found for {lang}')
             return None 
         
         runtime = self.runtimes.get(lang)
-        executor = EXECUTORS[lang](runtime)
+        executor = factory(runtime)
         self.executors[lang] = executor
         self.log.info(f'Registered executor for {lang}: {executor}')
         return executor
 
+    def get_lang_executor(self, lang):
+        """返回已创建的指定语言执行器，未创建时返回 None"""
+        return self.executors.get(lang)
+
     def __call__(self, block):
         self.log.info(f'Exec: {block}')
-        history = {}
+        usage = None
         executor = self.get_executor(block)
         if executor:
+            monitor = ResourceMonitor(self.limits)
+            self._monitor = monitor
             try:
-                result = executor(block)
+                with monitor, (self.env.activated() if self.env else nullcontext()):
+                    result = executor(block)
+            except BlockInterrupted:
+                result = {}
             except Exception as e:
                 result = {'errstr': str(e), 'traceback': traceback.format_exc()}
+            finally:
+                self._monitor = None
+            usage = monitor.usage.to_dict()
+            # 执行器可能已经捕获了异步抛出的异常，统一替换为明确的错误信息
+            if monitor.cancelled:
+                result.pop('traceback', None)
+                result['errstr'] = str(BlockCancelled())
+            elif monitor.usage.limit_exceeded:
+                result.pop('traceback', None)
+                result['errstr'] = str(ResourceLimitExceeded(monitor.usage.limit_exceeded))
+            self.log.info(f'Usage: {block.name}', **usage)
         else:
             result = {'stderr': f'Exec: Ignore unsupported block: {block}'}
 
-        history['block'] = block
-        history['result'] = result
-        self.history.append(history)
+        self.add_history(block, result, usage)
         return result
 
+    def add_history(self, block, result, usage=None, cached=False):
+        """记录一次执行，cached 表示结果来自执行缓存"""
+        history = {'block': block, 'result': result, 'usage': usage}
+        if cached:
+            history['cached'] = True
+        self.history.append(history)
+
+    def cancel(self):
+        """取消正在执行的代码块（可在其它线程调用）"""
+        monitor = self._monitor
+        if monitor:
+            monitor.cancel()
+
+    @property
+    def last_usage(self):
+        """最近一次执行的资源使用情况"""
+        return self.history[-1].get('usage') if self.history else None
+
     def get_state(self):
         """获取需要持久化的状态数据"""
         return self.history.copy()
@@ -83,8 +163,21 @@ class BlockExecutor(Trackable):
             self.history = runner_data.copy()
     
     
+    def close(self):
+        """关闭执行器（例如常驻解释器进程）"""
+        for executor in self.executors.values():
+            close = getattr(executor, 'close', None)
+            if close:
+                try:
+                    close()
+                except Exception as e:
+                    self.log.error(f'Failed to close executor {executor}: {e}')
+        self.executors.clear()
+
     def clear(self):
         self.history.clear()
+        # 丢弃执行器，避免复用任务时残留上一个任务的代码块模块和解释器状态
+        self.close()
     
     # Trackable接口实现
     def get_checkpoint(self) -> int:
@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" per-block resource accounting, limits and cancellation """
+
+import os
+import signal
+import subprocess
+import time
+import ctypes
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from typing import Optional, Dict, Any
+
+import psutil
+from loguru import logger
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+MB = 1024 * 1024
+
+class BlockInterrupted(BaseException):
+    """代码块执行被中断
+
+    继承 BaseException，避免被代码块中的 `except Exception` 吞掉。
+    """
+
+class ResourceLimitExceeded(BlockInterrupted):
+    """代码块超出资源限制"""
+    def __init__(self, reason: str = None):
+        self.reason = reason
+        super().__init__(f"Resource limit exceeded: {reason}" if reason else "Resource limit exceeded")
+
+class BlockCancelled(BlockInterrupted):
+    """代码块被取消（任务停止）"""
+    def __init__(self, reason: str = None):
+        super().__init__("Execution cancelled")
+
+@dataclass
+class ResourceLimits:
+    """代码块资源限制，None 表示不限制
+
+    - wall_time: 墙钟时间（秒）
+    - cpu_time: CPU 时间（秒）
+    - max_memory: 内存增长（MB），即代码块启动的子进程树的 RSS 增量，只有一个代码块在执行时还包括本进程的 RSS 增量
+    - max_output: 子进程单个文件最大写入量（MB）
+    """
+    wall_time: Optional[float] = None
+    cpu_time: Optional[float] = None
+    max_memory: Optional[float] = None
+    max_output: Optional[float] = None
+    interval: float = 0.1
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> 'ResourceLimits':
+        data = data or {}
+        return cls(**{k: data[k] for k in cls.__dataclass_fields__ if data.get(k) is not None})
+
+    @property
+    def enabled(self) -> bool:
+        return any(v is not None for v in (self.wall_time, self.cpu_time, self.max_memory, self.max_output))
+
+    def apply_to(self, pid: int):
+        """启动子进程后通过 prlimit 设置 CPU 时间和文件大小的 rlimit（仅 Linux），其它平台由看门狗采样限制
+
+        不使用 preexec_fn：在多线程进程中 fork 后执行 Python 代码并不安全。
+        """
+        if resource is None or not hasattr(resource, 'prlimit'):
+            return
+        try:
+            if self.cpu_time is not None:
+                seconds = max(1, int(self.cpu_time))
+                resource.prlimit(pid, resource.RLIMIT_CPU, (seconds, seconds + 1))
+            if self.max_output is not None:
+                size = int(self.max_output * MB)
+                resource.prlimit(pid, resource.RLIMIT_FSIZE, (size, size))
+        except (OSError, ValueError):
+            pass
+
+@dataclass
+class ResourceUsage:
+    """代码块资源使用情况"""
+    wall_time: float = 0.0
+    cpu_user: float = 0.0
+    cpu_sys: float = 0.0
+    max_rss: int = 0
+    mem_delta: int = 0
+    bytes_written: int = 0
+    children: int = 0
+    limit_exceeded: Optional[str] = None
+    cancelled: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+_current_monitor = ContextVar('current_resource_monitor', default=None)
+
+def get_current_limits() -> Optional[ResourceLimits]:
+    """返回当前正在执行的代码块的资源限制"""
+    monitor = _current_monitor.get()
+    return monitor.limits if monitor else None
+
+def _thread_times():
+    """当前线程（Linux）或进程的 CPU 时间"""
+    if resource is not None and hasattr(resource, 'RUSAGE_THREAD'):
+        usage = resource.getrusage(resource.RUSAGE_THREAD)
+        return usage.ru_utime, usage.ru_stime
+    times = psutil.Process().cpu_times()
+    return times.user, times.system
+
+def _write_bytes(proc) -> int:
+    try:
+        return proc.io_counters().write_bytes
+    except (AttributeError, psutil.Error):
+        return 0
+
+@contextmanager
+def interruptible():
+    """标记正在执行用户代码，只有这段时间内才会向执行线程注入中断异常"""
+    monitor = _current_monitor.get()
+    if monitor is None:
+        yield
+        return
+    monitor._set_interruptible(True)
+    try:
+        yield
+    finally:
+        monitor._set_interruptible(False)
+
+def add_process_group(pgid: int):
+    """登记代码块启动的进程组，中断时整组终止，组长进程及其子进程计入代码块的资源使用"""
+    monitor = _current_monitor.get()
+    if monitor is not None:
+        monitor.process_groups.add(pgid)
+        # 新启动的进程已经由 Popen 登记，这里登记的是复用的常驻进程
+        monitor.add_process(pgid, existing=True)
+
+def add_process(pid: int):
+    """登记代码块启动的子进程，该进程及其子进程计入代码块的资源使用，中断时终止"""
+    monitor = _current_monitor.get()
+    if monitor is not None:
+        monitor.add_process(pid)
+
+_popen_init = subprocess.Popen.__init__
+
+def _tracking_popen_init(self, *args, **kwargs):
+    _popen_init(self, *args, **kwargs)
+    add_process(self.pid)
+
+def _track_popen():
+    """让代码块中的 Python 代码通过 subprocess 启动的进程也登记到当前代码块（其它线程不受影响）"""
+    if subprocess.Popen.__init__ is not _tracking_popen_init:
+        subprocess.Popen.__init__ = _tracking_popen_init
+
+# 正在执行的代码块，只有一个时本进程的内存和写入量增长才计入该代码块
+_active_monitors = set()
+_active_lock = threading.Lock()
+
+def _raise_in_thread(thread_id: int, exc_type) -> bool:
+    ret = ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), ctypes.py_object(exc_type))
+    return ret == 1
+
+def _clear_async_exc(thread_id: int):
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), None)
+
+class ResourceMonitor:
+    """统计并限制一个代码块的资源使用
+
+    在执行代码块的线程中使用 with 语句。资源只按代码块自己的范围统计：执行线程的 CPU 时间，
+    加上代码块登记的子进程（add_process/add_process_group，以及代码块中通过 subprocess 启动的进程）
+    及其子进程的内存、写入量和 CPU 时间；只有一个代码块在执行时，本进程的 RSS 和写入量增长也计入。
+    后台线程按 limits.interval 采样，已退出的子进程按最后一次采样计入。
+    超出限制或调用 cancel() 时只终止这些登记的进程和进程组，
+    并在执行线程处于 interruptible() 区域时注入 ResourceLimitExceeded/BlockCancelled，
+    在代码块结束前每个采样周期重新注入一次，防止异常被用户代码吞掉。
+    进程内执行的 Python 代码只有回到解释器时才会被中断，长时间阻塞在 C 扩展中的调用无法立即停止。
+    """
+    def __init__(self, limits: Optional[ResourceLimits] = None):
+        self.limits = limits or ResourceLimits()
+        self.usage = ResourceUsage()
+        self.log = logger.bind(src='resource_monitor')
+        self._proc = psutil.Process()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._done = False
+        self._fired = None
+        self._interruptible = False
+        self.cancelled = False
+        self.process_groups = set()
+        # 登记的根进程和采样到的子进程
+        self._roots: Dict[int, psutil.Process] = {}
+        self._children: Dict[int, psutil.Process] = {}
+        # 代码块开始前已经存在的进程的基线 (rss, user, system, written)
+        self._baseline: Dict[int, tuple] = {}
+        # 每个进程最后一次采样的 (rss, user, system, written)，已减去基线
+        self._child_stats: Dict[int, tuple] = {}
+        # 执行期间是否有其它代码块同时执行
+        self._shared = False
+
+    def add_process(self, pid: int, existing: bool = False):
+        """登记代码块的子进程，existing 表示代码块开始前已经存在的进程（如常驻解释器），记录当前的资源使用作为基线"""
+        if pid in self._roots:
+            return
+        try:
+            root = psutil.Process(pid)
+            tree = [root] + root.children(recursive=True) if existing else []
+        except psutil.Error:
+            return
+        for proc in tree:
+            stats = self._read(proc)
+            if stats:
+                self._baseline.setdefault(proc.pid, stats)
+        self._roots[pid] = root
+
+    def __enter__(self):
+        _track_popen()
+        self._thread_id = threading.get_ident()
+        self._native_id = threading.get_native_id()
+        self._start_thread_cpu = 0.0
+        if self.limits.cpu_time is not None:
+            self._start_thread_cpu = self._thread_cpu()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = _thread_times()
+        self._start_rss = self._proc.memory_info().rss
+        self._start_written = _write_bytes(self._proc)
+        self._proc_rss = 0
+        self.usage.max_rss = self._start_rss
+        with _active_lock:
+            _active_monitors.add(self)
+            self._shared = len(_active_monitors) > 1
+            for monitor in _active_monitors:
+                monitor._shared = monitor._shared or self._shared
+        self._token = _current_monitor.set(self)
+        self._watchdog = threading.Thread(target=self._watch, name='block-watchdog', daemon=True)
+        self._watchdog.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self._lock:
+            self._done = True
+            if self._fired:
+                # 异常可能还没有投递，清除掉避免在执行线程后续代码中抛出
+                _clear_async_exc(self._thread_id)
+        self._stop.set()
+        self._watchdog.join()
+        _current_monitor.reset(self._token)
+
+        self._sample()
+        with _active_lock:
+            _active_monitors.discard(self)
+        user, system = _thread_times()
+        usage = self.usage
+        usage.wall_time = round(time.perf_counter() - self._start_wall, 3)
+        usage.cpu_user = round(user - self._start_cpu[0] + sum(s[1] for s in self._child_stats.values()), 3)
+        usage.cpu_sys = round(system - self._start_cpu[1] + sum(s[2] for s in self._child_stats.values()), 3)
+        usage.mem_delta = max(0, usage.max_rss - self._start_rss)
+        usage.bytes_written = sum(s[3] for s in self._child_stats.values())
+        if not self._shared:
+            usage.bytes_written += max(0, _write_bytes(self._proc) - self._start_written)
+        usage.children = len([pid for pid in self._children if pid not in self._baseline])
+        if self._fired and exc_type is None:
+            raise self._fired(usage.limit_exceeded)
+        return False
+
+    @staticmethod
+    def _read(proc) -> Optional[tuple]:
+        try:
+            with proc.oneshot():
+                rss = proc.memory_info().rss
+                times = proc.cpu_times()
+                written = _write_bytes(proc)
+        except psutil.Error:
+            return None
+        return rss, times.user, times.system, written
+
+    def _tree(self):
+        """登记的进程及其子进程"""
+        procs = {}
+        for pid, root in list(self._roots.items()):
+            procs[pid] = root
+            try:
+                for child in root.children(recursive=True):
+                    procs[child.pid] = child
+            except psutil.Error:
+                pass
+        return procs
+
+    def _sample(self):
+        """采样一次，返回 (内存增长, 子进程 CPU 时间)"""
+        children_rss = 0
+        for pid, proc in self._tree().items():
+            stats = self._read(proc)
+            if stats is None:
+                continue
+            self._children.setdefault(pid, proc)
+            base = self._baseline.get(pid, (0, 0.0, 0.0, 0))
+            stats = tuple(max(0, value - start) for value, start in zip(stats, base))
+            children_rss += stats[0]
+            self._child_stats[pid] = stats
+        # 已退出的子进程不再占用内存，CPU 时间和写入量保留最后一次采样
+        children_cpu = sum(s[1] + s[2] for s in self._child_stats.values())
+        if not self._shared:
+            try:
+                self._proc_rss = max(0, self._proc.memory_info().rss - self._start_rss)
+            except psutil.Error:
+                pass
+        else:
+            # 有其它代码块同时执行时无法区分本进程的内存增长属于哪个代码块
+            self._proc_rss = 0
+        mem_growth = self._proc_rss + children_rss
+        self.usage.max_rss = max(self.usage.max_rss, self._start_rss + mem_growth)
+        return mem_growth, children_cpu
+
+    def _check(self, mem_growth: int, children_cpu: float) -> Optional[str]:
+        limits = self.limits
+        elapsed = time.perf_counter() - self._start_wall
+        if limits.wall_time is not None and elapsed > limits.wall_time:
+            return f"wall time {elapsed:.1f}s > {limits.wall_time}s"
+        if limits.max_memory is not None and mem_growth > limits.max_memory * MB:
+            return f"memory {mem_growth / MB:.0f}MB > {limits.max_memory}MB"
+        if limits.cpu_time is not None:
+            cpu = self._thread_cpu() + children_cpu
+            if cpu > limits.cpu_time:
+                return f"cpu time {cpu:.1f}s > {limits.cpu_time}s"
+        return None
+
+    def _thread_cpu(self) -> float:
+        """执行线程已使用的 CPU 时间，无法获取时返回 0"""
+        try:
+            for thread in self._proc.threads():
+                if thread.id == self._native_id:
+                    return thread.user_time + thread.system_time - self._start_thread_cpu
+        except psutil.Error:
+            pass
+        return 0.0
+
+    def _watch(self):
+        while not self._stop.wait(self.limits.interval):
+            if self._fired:
+                self._inject()
+                continue
+            mem_growth, children_cpu = self._sample()
+            if not self.limits.enabled:
+                continue
+            reason = self._check(mem_growth, children_cpu)
+            if reason:
+                self._fire(ResourceLimitExceeded, reason)
+
+    def cancel(self):
+        """取消正在执行的代码块（可在任意线程调用）"""
+        self._fire(BlockCancelled)
+
+    def _fire(self, exc_type, reason: str = None):
+        with self._lock:
+            if self._done or self._fired:
+                return
+            self._fired = exc_type
+            if exc_type is BlockCancelled:
+                self.cancelled = self.usage.cancelled = True
+                self.log.warning("Block cancelled")
+            else:
+                self.usage.limit_exceeded = reason
+                self.log.warning(f"Block exceeded resource limit: {reason}")
+        self._kill_processes()
+        self._inject()
+
+    def _kill_processes(self):
+        """只终止代码块登记的进程组和进程树，不影响同一进程中其它代码块、任务和 MCP 服务的子进程"""
+        for pgid in list(self.process_groups):
+            try:
+                os.killpg(pgid, signal.SIGKILL)
+            except (OSError, AttributeError):
+                pass
+        procs = dict(self._children)
+        procs.update(self._tree())
+        for proc in procs.values():
+            try:
+                proc.kill()
+            except psutil.Error:
+                pass
+
+    def _inject(self):
+        with self._lock:
+            if self._done or not self._interruptible:
+                return
+            _raise_in_thread(self._thread_id, self._fired)
+
+    def _set_interruptible(self, value: bool):
+        with self._lock:
+            self._interruptible = value
+            if not value and self._fired:
+                # 离开用户代码后不再投递尚未处理的中断异常
+                _clear_async_exc(self._thread_id)
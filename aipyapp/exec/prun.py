@@ -3,12 +3,17 @@
 
 """ subprocess-based bash/powershell code execution """
 
+import os
+import signal
 import traceback
 import subprocess
 from typing import Any, Dict, Optional
 
 from loguru import logger
 
+from .limits import get_current_limits, add_process_group, add_process
+from .venv import get_current_env
+
 class SubprocessExecutor:
     """使用 subprocess 执行代码块"""
     name = None
@@ -37,30 +42,67 @@ class SubprocessExecutor:
 
         self.log.info(f"Exec: {cmd}")
 
+        # 墙钟时间限制同时作为超时时间
+        limits = get_current_limits()
+        timeout = self.timeout
+        if limits and limits.wall_time is not None:
+            timeout = limits.wall_time
+
+        # 在 overlay 环境中启动，python/pip 命令使用该环境
+        env = get_current_env()
+        environ = env.environ() if env else None
+
+        # POSIX 下在新的进程组中运行，超时或取消时终止整个进程树
+        new_session = os.name == 'posix'
         try:
-            cp = subprocess.run(
+            proc = subprocess.Popen(
                 cmd,
                 shell=False,
-                capture_output=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
                 text=True,
                 encoding="utf-8",
                 errors="ignore",
-                timeout=self.timeout
+                env=environ,
+                start_new_session=new_session
             )
-            stdout = cp.stdout.strip() if cp.stdout else None
-            stderr = cp.stderr.strip() if cp.stderr else None
+            if new_session:
+                add_process_group(proc.pid)
+            else:
+                add_process(proc.pid)
+            # 启动后设置 CPU 时间和文件大小的 rlimit
+            if limits:
+                limits.apply_to(proc.pid)
+            try:
+                stdout, stderr = proc.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self.kill(proc, new_session)
+                proc.communicate()
+                raise
+            stdout = stdout.strip() if stdout else None
+            stderr = stderr.strip() if stderr else None
 
             result = {
                 'stdout': stdout,
                 'stderr': stderr,
-                'returncode': cp.returncode
+                'returncode': proc.returncode
             }
         except subprocess.TimeoutExpired:
-            result = {'errstr': f'Execution timed out after {self.timeout} seconds'}
+            result = {'errstr': f'Execution timed out after {timeout} seconds'}
         except Exception as e:
             result = {'errstr': str(e), 'traceback': str(traceback.format_exc())}
 
         return result
+
+    def kill(self, proc, process_group: bool):
+        """终止子进程，POSIX 下终止整个进程组"""
+        try:
+            if process_group:
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except OSError:
+            pass
     
 class BashExecutor(SubprocessExecutor):
     name = 'bash'
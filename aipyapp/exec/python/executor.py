@@ -3,13 +3,16 @@
 
 import sys
 import json
+import types
 import traceback
 from io import StringIO
+from itertools import islice
 
 from loguru import logger
 
 from .mod_obj import ObjectImporter
 from .mod_dict import DictModuleImporter
+from ..limits import interruptible, BlockInterrupted
 
 INIT_IMPORTS = """
 import os
@@ -42,23 +45,106 @@ def diff_dicts(dict1, dict2):
             pass
     return diff
 
+# 容器元素超过该数量时抽样估算大小
+SIZEOF_SAMPLE = 1000
+
+def sizeof(obj, max_depth=4):
+    """估算对象占用的内存（字节），递归统计容器元素，识别 numpy/pandas 对象"""
+    seen = set()
+
+    def _sizeof(o, depth):
+        if id(o) in seen:
+            return 0
+        seen.add(id(o))
+
+        module = type(o).__module__
+        if module.startswith('pandas'):
+            try:
+                usage = o.memory_usage(deep=True)
+                return int(usage.sum() if hasattr(usage, 'sum') else usage)
+            except Exception:
+                pass
+        elif module.startswith('numpy') and isinstance(getattr(o, 'nbytes', None), int):
+            return sys.getsizeof(o) if o.base is None else o.nbytes
+
+        size = sys.getsizeof(o, 0)
+        if depth >= max_depth or isinstance(o, (str, bytes, bytearray, types.ModuleType, type)):
+            return size
+        if isinstance(o, dict):
+            items = [v for kv in islice(o.items(), SIZEOF_SAMPLE) for v in kv]
+            total = len(o) * 2
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            items = list(islice(o, SIZEOF_SAMPLE))
+            total = len(o)
+        elif hasattr(o, '__dict__') and not callable(o):
+            return size + _sizeof(vars(o), depth + 1)
+        else:
+            return size
+
+        if not items:
+            return size
+        sampled = sum(_sizeof(item, depth + 1) for item in items)
+        return size + sampled * total // len(items)
+
+    return _sizeof(obj, 0)
+
 class PythonExecutor():
+    """执行 Python 代码块
+
+    默认每个代码块在全局变量的副本中执行；persistent 模式下所有代码块共享同一个命名空间，
+    变量在同一任务的代码块之间保留（类似 notebook 内核），可通过 reset() 清空。
+    """
     name = 'python'
 
-    def __init__(self, runtime):
+    def __init__(self, runtime, persistent=None):
         self.runtime = runtime
         self.log = logger.bind(src='PythonExecutor')
+        self.persistent = getattr(runtime, 'persistent_namespace', False) if persistent is None else persistent
         self._globals = {'__name__': '__main__', 'input': self.runtime.input}
+        exec(INIT_IMPORTS, self._globals)
+        self._base_names = frozenset(self._globals)
+        self._namespace = None
         self.block_importer = DictModuleImporter()
         self.runtime_importer = ObjectImporter({'utils': runtime})
-        exec(INIT_IMPORTS, self._globals)
+        self._stdout = StringIO()
+        self._stderr = StringIO()
 
     def __repr__(self):
-        return "<PythonExecutor>"
+        return f"<PythonExecutor persistent={self.persistent}>"
     
     @property
     def globals(self):
         return self._globals
+
+    @property
+    def namespace(self):
+        """persistent 模式下的共享命名空间"""
+        if self._namespace is None:
+            self._namespace = self._globals.copy()
+        return self._namespace
+
+    def reset(self):
+        """清空共享命名空间和代码块模块缓存"""
+        self._namespace = None
+        self.block_importer.clear()
+
+    def get_namespace_usage(self, top=10):
+        """返回共享命名空间中占用内存最多的变量
+
+        Returns:
+            (总字节数, [(变量名, 类型, 字节数), ...])
+        """
+        if self._namespace is None:
+            return 0, []
+        usage = []
+        for name, value in list(self._namespace.items()):
+            if name.startswith('__') or (name in self._base_names and value is self._globals.get(name)):
+                continue
+            if isinstance(value, (types.ModuleType, types.FunctionType, types.BuiltinFunctionType, type)):
+                continue
+            usage.append((name, type(value).__name__, sizeof(value)))
+        usage.sort(key=lambda item: item[2], reverse=True)
+        return sum(item[2] for item in usage), usage[:top]
     
     def __call__(self, block):
         result = {}
@@ -71,16 +157,20 @@ class PythonExecutor():
 
         runtime = self.runtime
         old_stdout, old_stderr = sys.stdout, sys.stderr
-        captured_stdout = StringIO()
-        captured_stderr = StringIO()
+        captured_stdout, captured_stderr = self._stdout, self._stderr
+        captured_stdout.seek(0)
+        captured_stdout.truncate()
+        captured_stderr.seek(0)
+        captured_stderr.truncate()
         sys.stdout, sys.stderr = captured_stdout, captured_stderr
-        gs = self._globals.copy()
+        gs = self.namespace if self.persistent else self._globals.copy()
         runtime.start_block(block)
         try:
             with self.block_importer, self.runtime_importer:
-                exec(co, gs)
-            self.block_importer.add_module(block.name, co)
-        except (SystemExit, Exception) as e:
+                with interruptible():
+                    exec(co, gs)
+            self.block_importer.add_module(block.name, co, block.version)
+        except (SystemExit, Exception, BlockInterrupted) as e:
             self.runtime.set_state(success=False, error=str(e))
             self.log.error(f"Error in code block {block.name}: {str(e)}")
             result['errstr'] = str(e)
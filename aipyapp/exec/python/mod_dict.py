@@ -1,9 +1,11 @@
-import sys
+import types
 import importlib.abc
 import importlib.util
 
 from loguru import logger
 
+from .mod_hook import activate, deactivate
+
 class DictModuleLoader(importlib.abc.Loader):
     def __init__(self, fullname, source):
         self.fullname = fullname
@@ -18,55 +20,102 @@ class DictModuleLoader(importlib.abc.Loader):
             code_obj = compile(self.source, f"<{self.fullname}>", "exec")
         exec(code_obj, module.__dict__)
 
-class DictModuleFinder(importlib.abc.MetaPathFinder):
-    def __init__(self, package, source_map):
-        self.package = package
-        self.source_map = source_map
-
-    def find_spec(self, fullname, path, target=None):
-        if fullname == self.package:
-            # 返回一个虚拟包的 spec，必须带 submodule_search_locations 说明这是包
-            spec = importlib.util.spec_from_loader(fullname, loader=None)
-            spec.submodule_search_locations = []
-            return spec
-
-        if not fullname.startswith(self.package + "."):
-            return None
-        subname = fullname[len(self.package) + 1:]
-        if subname in self.source_map:
-            loader = DictModuleLoader(fullname, self.source_map[subname])
-            return importlib.util.spec_from_loader(fullname, loader)
-        return None
-
 
 class DictModuleImporter:
+    """以 `from blocks import xxx` 方式导入已执行过的代码块
+
+    模块按代码块名称和版本缓存：同一版本只执行一次模块体，版本变化时才失效。
+    with 语句在当前线程/上下文中激活导入器，import 钩子直接从导入器的缓存返回模块，
+    不经过进程共享的 sys.modules，不同执行器之间互不影响。
+    """
     def __init__(self, package="blocks"):
         self.package = package
+        self.prefix = package + "."
+        # name -> (version, code)
         self.source_map = {}
-        self.finder = DictModuleFinder(self.package, self.source_map)
+        # fullname -> module
+        self.modules = {}
         self.log = logger.bind(src='BlockImporter')
 
-    def add_module(self, name, code):
-        self.log.info('Add module', name=name)
-        self.source_map[name] = code
-        fullname = f"{self.package}.{name}"
-        if fullname in sys.modules:
-            del sys.modules[fullname]
+    def _get_package(self):
+        package = self.modules.get(self.package)
+        if package is None:
+            # 虚拟包，必须带 __path__ 说明这是包
+            package = types.ModuleType(self.package)
+            package.__path__ = []
+            self.modules[self.package] = package
+        return package
+
+    def _load(self, name):
+        """返回代码块模块，未缓存时执行模块体，代码块不存在时返回 None"""
+        fullname = self.prefix + name
+        module = self.modules.get(fullname)
+        if module is not None:
+            return module
+        entry = self.source_map.get(name)
+        if entry is None:
+            return None
+
+        spec = importlib.util.spec_from_loader(fullname, DictModuleLoader(fullname, entry[1]))
+        module = importlib.util.module_from_spec(spec)
+        # 先放入缓存，支持代码块之间循环导入
+        self.modules[fullname] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            self.modules.pop(fullname, None)
+            raise
+        setattr(self._get_package(), name, module)
+        return module
+
+    def import_module(self, fullname, fromlist=()):
+        """import 钩子的回调，不属于本导入器的模块返回 None"""
+        if fullname == self.package:
+            package = self._get_package()
+            for name in fromlist or ():
+                # 不存在的名字留给 from ... import 报 ImportError
+                if name != '*':
+                    self._load(name)
+            return package
+
+        if not fullname.startswith(self.prefix):
+            return None
+        module = self._load(fullname[len(self.prefix):])
+        if module is None:
+            raise ModuleNotFoundError(f"No module named '{fullname}'", name=fullname)
+        return module if fromlist else self._get_package()
+
+    def add_module(self, name, code, version=None):
+        """注册代码块，版本未变化时保留已缓存的模块"""
+        entry = self.source_map.get(name)
+        if entry and entry[0] == version and (version is not None or entry[1] is code):
+            return False
+        self.log.info('Add module', name=name, version=version)
+        self.source_map[name] = (version, code)
+        self.modules.pop(f"{self.prefix}{name}", None)
+        package = self.modules.get(self.package)
+        if package is not None:
+            # 导入子模块时会设置包属性，不清除的话 from blocks import xxx 仍会拿到旧模块
+            package.__dict__.pop(name, None)
+        return True
+
+    def clear(self):
+        self.source_map.clear()
+        self.modules.clear()
 
     def reload(self, fullname):
-        import importlib
-        if fullname in sys.modules:
-            return importlib.reload(sys.modules[fullname])
-        __import__(fullname)
-        return sys.modules[fullname]
+        name = fullname[len(self.prefix):]
+        self.modules.pop(fullname, None)
+        self._get_package().__dict__.pop(name, None)
+        with self:
+            return self.import_module(fullname, [name])
 
     def __enter__(self):
-        self._old_meta_path = sys.meta_path[:]
-        sys.meta_path.insert(0, self.finder)
+        self._token = activate(self)
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        sys.meta_path = self._old_meta_path
+        deactivate(self._token)
 
 # ========== 测试 ==========
 
@@ -0,0 +1,37 @@
+import builtins
+import threading
+from contextvars import ContextVar
+
+# 当前线程/上下文中激活的导入器，后进入的优先
+_active_importers = ContextVar('active_importers', default=())
+_original_import = None
+_install_lock = threading.Lock()
+
+def _import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level == 0:
+        for importer in reversed(_active_importers.get()):
+            module = importer.import_module(name, fromlist)
+            if module is not None:
+                return module
+    return _original_import(name, globals, locals, fromlist, level)
+
+def install_hook():
+    """安装 import 钩子（只安装一次）
+
+    钩子转发给当前上下文中激活的导入器，导入器返回 None 时交给原来的 __import__。
+    导入器生成的模块只保存在导入器自己的缓存中，不写入进程共享的 sys.modules，
+    并发执行代码块的任务之间不会互相覆盖。
+    """
+    global _original_import
+    with _install_lock:
+        if _original_import is None:
+            _original_import = builtins.__import__
+            builtins.__import__ = _import
+
+def activate(importer):
+    """在当前上下文中激活导入器，返回用于 deactivate 的 token"""
+    install_hook()
+    return _active_importers.set(_active_importers.get() + (importer,))
+
+def deactivate(token):
+    _active_importers.reset(token)
@@ -1,61 +1,80 @@
-import sys
 import types
-import importlib.abc
-import importlib.util
+import importlib
 
-from loguru import logger
+from .mod_hook import activate, deactivate
 
-class ObjectModuleLoader(importlib.abc.Loader):
-    def __init__(self, fullname, obj):
-        self.fullname = fullname
-        self.obj = obj
+def make_object_module(fullname, obj):
+    """创建代理对象属性的模块，属性在访问时才从对象上获取"""
+    def __dir__():
+        return [attr for attr in dir(obj) if not attr.startswith("__")]
 
-    def create_module(self, spec):
-        mod = types.ModuleType(self.fullname)
-        # 注入所有非魔法属性，包括方法
-        for attr in dir(self.obj):
-            if not attr.startswith("__"):
-                setattr(mod, attr, getattr(self.obj, attr))
-        return mod
+    def __getattr__(name):
+        if name == "__all__":
+            return [attr for attr in __dir__() if not attr.startswith("_")]
+        return getattr(obj, name)
 
-    def exec_module(self, module):
-        pass
+    mod = types.ModuleType(fullname)
+    mod.__getattr__ = __getattr__
+    mod.__dir__ = __dir__
+    return mod
 
-class ObjectModuleFinder(importlib.abc.MetaPathFinder):
-    def __init__(self, package, object_map):
+class ObjectImporter:
+    """以 `from aipyapp import utils` 方式导入运行时对象
+
+    每个对象对应的模块只创建一次。with 语句在当前线程/上下文中激活导入器，import 钩子返回
+    导入器自己的包对象，不写入进程共享的 sys.modules，也不修改真实的包，避免不同任务之间互相串用。
+    """
+    def __init__(self, object_map, package='aipyapp'):
         self.package = package
+        self.prefix = package + "."
         self.object_map = object_map
-        self.logger = logger.bind(src='ObjectModuleFinder')
-
-    def find_spec(self, fullname, path, target=None):
-        self.logger.info(f"find_spec: {fullname}, {path}, {target}")
+        self.modules = {}
+        self._package_module = None
+
+    def get_module(self, subname):
+        module = self.modules.get(subname)
+        if module is None:
+            module = make_object_module(self.prefix + subname, self.object_map[subname])
+            self.modules[subname] = module
+        return module
+
+    def _get_package(self):
+        """返回只包含运行时对象模块的包，其它属性从真实的包上获取"""
+        if self._package_module is None:
+            package = self.package
+
+            def __getattr__(name):
+                return getattr(importlib.import_module(package), name)
+
+            mod = types.ModuleType(package)
+            mod.__path__ = []
+            mod.__getattr__ = __getattr__
+            for subname in self.object_map:
+                setattr(mod, subname, self.get_module(subname))
+            self._package_module = mod
+        return self._package_module
+
+    def import_module(self, fullname, fromlist=()):
+        """import 钩子的回调，不属于本导入器的模块返回 None"""
         if fullname == self.package:
-            spec = importlib.util.spec_from_loader(fullname, loader=None)
-            spec.submodule_search_locations = []
-            return spec
-
-        if not fullname.startswith(self.package + "."):
+            # 只有导入运行时对象时才接管，其它情况使用真实的包
+            if fromlist and any(name in self.object_map for name in fromlist):
+                return self._get_package()
             return None
 
-        subname = fullname[len(self.package) + 1:]
-        if subname in self.object_map:
-            loader = ObjectModuleLoader(fullname, self.object_map[subname])
-            return importlib.util.spec_from_loader(fullname, loader)
-        return None
-
-class ObjectImporter:
-    def __init__(self, object_map, package='aipyapp'):
-        self.package = package
-        self.finder = ObjectModuleFinder(package, object_map)
+        if not fullname.startswith(self.prefix):
+            return None
+        subname = fullname[len(self.prefix):]
+        if subname not in self.object_map:
+            return None
+        return self.get_module(subname) if fromlist else self._get_package()
 
     def __enter__(self):
-        self._old_meta_path = sys.meta_path[:]
-        if self.finder not in sys.meta_path:
-            sys.meta_path.insert(0, self.finder)
+        self._token = activate(self)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        sys.meta_path = self._old_meta_path
+        deactivate(self._token)
 
 if __name__ == "__main__":
     class Runtime:
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" third-party package detection, batched installation and install records """
+
+import re
+import sys
+import json
+import hashlib
+import importlib
+import threading
+import subprocess
+from importlib import metadata
+from pathlib import Path
+from typing import Optional, List, Dict, Iterable, Tuple
+
+from loguru import logger
+
+try:
+    from packaging.requirements import Requirement, InvalidRequirement
+except ImportError:
+    Requirement = None
+
+NAME_RE = re.compile(r'^\s*([A-Za-z0-9][A-Za-z0-9._-]*)\s*(.*)$')
+PINNED_RE = re.compile(r'^\s*[A-Za-z0-9][A-Za-z0-9._-]*\s*(\[[^\]]*\])?\s*===?\s*[^\s,;*]+\s*$')
+# 本地 wheel 缓存默认的大小上限（MB）
+WHEEL_CACHE_SIZE = 1024
+
+def canonical_name(name: str) -> str:
+    """PEP 503 规范化的发行版名称"""
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+def parse_requirement(requirement: str) -> Tuple[Optional[str], str, bool]:
+    """解析需求字符串
+
+    返回 (规范化的包名, 规范化的需求字符串, 是否为不带版本/extras 的包名)，无法解析时包名为 None
+    """
+    requirement = requirement.strip()
+    if Requirement is not None:
+        try:
+            req = Requirement(requirement)
+        except InvalidRequirement:
+            return None, requirement, False
+        req.name = canonical_name(req.name)
+        bare = not (req.specifier or req.extras or req.url or req.marker)
+        return req.name, str(req), bare
+
+    match = NAME_RE.match(requirement)
+    if not match:
+        return None, requirement, False
+    name, rest = canonical_name(match.group(1)), match.group(2).strip()
+    return name, f"{name}{rest}", not rest
+
+def is_pinned(requirement: str) -> bool:
+    """需求是否固定到一个确切版本（== 或 ===，不含通配符）"""
+    return bool(PINNED_RE.match(requirement))
+
+class PackageManager:
+    """管理一个 Python 环境中的第三方包
+
+    - 先用 importlib.metadata 检测已安装的发行版，已满足的需求不再调用 pip
+    - 多个线程（代码块、Agent 任务、后台预装）同时请求安装时合并为一次 pip install
+    - 安装成功的需求及其版本保存在 record_file 中，跨进程复用
+    - 配置 wheel_dir 时先构建 wheel 到该目录再从中安装；需求都固定版本时优先直接从本地 wheel 离线安装。
+      目录超过 wheel_max_size（MB）时删除最早构建的 wheel
+    """
+    def __init__(self, python: str = None, path: List[str] = None, record_file=None, wheel_dir=None, pip_args: List[str] = None,
+                 wheel_max_size: int = WHEEL_CACHE_SIZE):
+        self.python = python or sys.executable
+        # 查找已安装发行版的目录，None 表示当前进程的 sys.path
+        self.path = path
+        self.record_file = Path(record_file) if record_file else None
+        self.wheel_dir = Path(wheel_dir) if wheel_dir else None
+        self.wheel_max_size = wheel_max_size
+        self.pip_args = list(pip_args or [])
+        self.log = logger.bind(src='packages')
+        self._lock = threading.Lock()
+        self._install_lock = threading.Lock()
+        self._pending: Dict[str, None] = {}
+        self._failed = set()
+        self._record = self._load_record()
+
+    def _load_record(self) -> Dict[str, str]:
+        if not self.record_file or not self.record_file.exists():
+            return {}
+        try:
+            data = json.loads(self.record_file.read_text(encoding='utf-8'))
+            return dict(data.get('packages', {}))
+        except Exception as e:
+            self.log.warning(f"Failed to load package record {self.record_file}: {e}")
+            return {}
+
+    def _save_record(self):
+        if not self.record_file:
+            return
+        data = {'python': self.python, 'packages': self._record}
+        try:
+            self.record_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.record_file.with_suffix('.tmp')
+            tmp.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding='utf-8')
+            tmp.replace(self.record_file)
+        except OSError as e:
+            self.log.warning(f"Failed to save package record {self.record_file}: {e}")
+
+    @property
+    def installed(self) -> Dict[str, str]:
+        """已记录的由本管理器安装的需求及版本"""
+        with self._lock:
+            return dict(self._record)
+
+    def installed_version(self, name: str) -> Optional[str]:
+        """返回已安装发行版的版本，未安装时返回 None"""
+        kwargs = {'name': name}
+        if self.path is not None:
+            kwargs['path'] = self.path
+        dist = next(iter(metadata.Distribution.discover(**kwargs)), None)
+        return dist.version if dist else None
+
+    def is_satisfied(self, requirement: str) -> bool:
+        """检查需求是否已被当前环境满足"""
+        name, key, bare = parse_requirement(requirement)
+        if not name:
+            return False
+        version = self.installed_version(name)
+        if version is None:
+            return False
+        if bare:
+            return True
+        with self._lock:
+            if self._record.get(key) == version:
+                return True
+        if Requirement is None:
+            return False
+        req = Requirement(key)
+        if req.url or req.extras:
+            return False
+        if req.marker and not req.marker.evaluate():
+            return True
+        return req.specifier.contains(version, prereleases=True)
+
+    def missing(self, requirements: Iterable[str]) -> List[str]:
+        return [req for req in requirements if not self.is_satisfied(req)]
+
+    def ensure(self, *requirements: str, upgrade: bool = False, quiet: bool = False) -> bool:
+        """确保需求已安装，返回是否全部满足
+
+        未满足的需求加入待安装队列，由第一个拿到安装锁的线程一次性安装队列中的所有需求。
+        """
+        requirements = [req.strip() for req in requirements if req and req.strip()]
+        missing = requirements if upgrade else self.missing(requirements)
+        if not missing:
+            return True
+
+        if upgrade:
+            with self._install_lock:
+                return self._install(missing, upgrade=True, quiet=quiet)
+
+        with self._lock:
+            for req in missing:
+                self._pending[req] = None
+                self._failed.discard(req)
+
+        with self._install_lock:
+            with self._lock:
+                batch = list(self._pending)
+                self._pending.clear()
+            # 等待安装锁期间其它线程可能已经安装
+            batch = self.missing(batch)
+            if batch:
+                self._install(batch, quiet=quiet)
+
+        with self._lock:
+            return not any(req in self._failed for req in missing)
+
+    def preinstall(self, requirements: Iterable[str]) -> Optional[threading.Thread]:
+        """在后台线程中安装需求，返回线程，无需安装时返回 None"""
+        requirements = [req for req in requirements if req]
+        if not requirements:
+            return None
+        thread = threading.Thread(target=self._preinstall, args=(requirements,), name='package-preinstall', daemon=True)
+        thread.start()
+        return thread
+
+    def _preinstall(self, requirements: List[str]):
+        try:
+            if self.ensure(*requirements, quiet=True):
+                self.log.info(f"Preinstalled packages: {requirements}")
+        except Exception as e:
+            self.log.error(f"Failed to preinstall packages: {e}")
+
+    def _pip(self, *args: str, quiet: bool = False, silent: bool = False) -> bool:
+        cmd = [self.python, '-m', 'pip', *args]
+        if quiet or silent:
+            cmd.insert(4, '-q')
+        stdout = subprocess.DEVNULL if quiet or silent else None
+        stderr = subprocess.DEVNULL if silent else None
+        try:
+            subprocess.check_call(cmd, stdout=stdout, stderr=stderr)
+            return True
+        except (subprocess.CalledProcessError, OSError):
+            return False
+
+    def _pip_install(self, requirements: List[str], upgrade: bool = False, quiet: bool = False) -> bool:
+        args = ['install', *self.pip_args]
+        if upgrade:
+            args.append('--upgrade')
+
+        if self.wheel_dir:
+            # 多个环境（overlay）共用同一个 wheel 缓存，构建、清理和从缓存安装按目录串行执行
+            with _wheel_lock(self.wheel_dir):
+                local = ['--no-index', '--find-links', str(self.wheel_dir)]
+                # 固定版本的需求在本地已有全部 wheel 时直接离线安装；未固定版本时本地的 wheel 可能已经过时，不尝试
+                pinned = not upgrade and all(is_pinned(req) for req in requirements)
+                if pinned and self.wheel_dir.exists() and self._pip(*args, *local, *requirements, silent=True):
+                    return True
+                self.wheel_dir.mkdir(parents=True, exist_ok=True)
+                wheel = ['wheel', *self.pip_args, '--wheel-dir', str(self.wheel_dir), '--find-links', str(self.wheel_dir)]
+                built = self._pip(*wheel, *requirements, quiet=quiet)
+                if built:
+                    self._prune_wheels()
+                if built and self._pip(*args, *local, *requirements, quiet=quiet):
+                    return True
+
+        return self._pip(*args, *requirements, quiet=quiet)
+
+    def _prune_wheels(self):
+        """wheel 缓存超过大小上限时按修改时间从旧到新删除"""
+        if not self.wheel_max_size:
+            return
+        try:
+            wheels = [(path.stat(), path) for path in self.wheel_dir.glob('*.whl')]
+        except OSError:
+            return
+        total = sum(stat.st_size for stat, _ in wheels)
+        limit = self.wheel_max_size * 1024 * 1024
+        for stat, path in sorted(wheels, key=lambda item: item[0].st_mtime):
+            if total <= limit:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= stat.st_size
+            self.log.info(f"Removed cached wheel: {path.name}")
+
+    def _install(self, requirements: List[str], upgrade: bool = False, quiet: bool = False) -> bool:
+        self.log.info(f"Installing packages: {requirements}")
+        if self._pip_install(requirements, upgrade=upgrade, quiet=quiet):
+            failed = []
+        elif len(requirements) > 1:
+            # 一个需求失败会导致整批失败，逐个重试以免影响其它需求
+            failed = [req for req in requirements if not self._pip_install([req], upgrade=upgrade, quiet=quiet)]
+        else:
+            failed = list(requirements)
+
+        importlib.invalidate_caches()
+        with self._lock:
+            self._failed.update(failed)
+            for req in requirements:
+                if req in failed:
+                    continue
+                name, key, _ = parse_requirement(req)
+                version = self.installed_version(name) if name else None
+                if version:
+                    self._record[key] = version
+            self._save_record()
+
+        if failed:
+            self.log.error(f"Failed to install packages: {failed}")
+        return not failed
+
+_options = {}
+_managers: Dict[tuple, PackageManager] = {}
+_managers_lock = threading.Lock()
+_wheel_locks: Dict[str, threading.Lock] = {}
+
+def _wheel_lock(wheel_dir: Path) -> threading.Lock:
+    with _managers_lock:
+        return _wheel_locks.setdefault(str(wheel_dir), threading.Lock())
+
+def configure(record_dir=None, wheel_dir=None, pip_args: List[str] = None, wheel_max_size: int = WHEEL_CACHE_SIZE):
+    """设置新建 PackageManager 的默认选项
+
+    - record_dir: 保存安装记录的目录，每个环境一个文件，None 表示不保存
+    - wheel_dir: 本地 wheel 缓存目录，None 表示不使用
+    - pip_args: 额外的 pip 参数，例如 ['--index-url', '...']
+    - wheel_max_size: wheel 缓存的大小上限（MB），0 表示不限制
+    """
+    with _managers_lock:
+        _options.update(record_dir=record_dir, wheel_dir=wheel_dir, pip_args=pip_args, wheel_max_size=wheel_max_size)
+        _managers.clear()
+
+def get_package_manager(python: str = None, path: List[str] = None) -> PackageManager:
+    """返回指定 Python 环境的 PackageManager，同一环境在进程内共享一个实例"""
+    python = python or sys.executable
+    key = (python, tuple(path) if path is not None else None)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            record_file = None
+            record_dir = _options.get('record_dir')
+            if record_dir:
+                env_id = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:12]
+                record_file = Path(record_dir) / f"{env_id}.json"
+            manager = new_package_manager(python, path, record_file)
+            _managers[key] = manager
+        return manager
+
+def new_package_manager(python: str, path: List[str] = None, record_file=None) -> PackageManager:
+    """使用 configure() 设置的 wheel 缓存和 pip 参数创建不共享的 PackageManager（例如 overlay 环境各自一个）"""
+    return PackageManager(python, path, record_file, _options.get('wheel_dir'), _options.get('pip_args'),
+                          _options.get('wheel_max_size', WHEEL_CACHE_SIZE))
+
+def get_wheel_dir() -> Optional[Path]:
+    """configure() 设置的本地 wheel 缓存目录"""
+    wheel_dir = _options.get('wheel_dir')
+    return Path(wheel_dir) if wheel_dir else None
@@ -1,13 +1,17 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
-import sys
-import subprocess
 from abc import ABC, abstractmethod
 from typing import Any
 
 from loguru import logger
 
+from .packages import PackageManager, get_package_manager
+from ..venv import get_current_env
+
 class PythonRuntime(ABC):
+    # 代码块是否共享同一个命名空间（见 PythonExecutor）
+    persistent_namespace = False
+
     def __init__(self, envs=None):
         self.envs = envs or {}
         self.packages = set()
@@ -17,6 +21,13 @@ class PythonRuntime(ABC):
         self.block = None
         self.log = logger.bind(src='runtime')
 
+    def reset(self):
+        """重置运行时状态，用于复用"""
+        self.session = {}
+        self.block_states = {}
+        self.current_state = {}
+        self.block = None
+
     def start_block(self, block):
         """开始一个新的代码块执行"""
         self.current_state = {}
@@ -83,29 +94,26 @@ class PythonRuntime(ABC):
     def set_env(self, name, value, desc):
         self.envs[name] = (value, desc)
 
+    @property
+    def package_manager(self) -> PackageManager:
+        """当前环境的包管理器，代码块在 overlay 环境中执行时安装到该环境"""
+        env = get_current_env()
+        return env.package_manager if env else get_package_manager()
+
     def ensure_packages(self, *packages, upgrade=False, quiet=False):
         if not packages:
             return True
 
-        packages = list(set(packages) - self.packages)
+        packages = [pkg for pkg in packages if pkg not in self.packages]
         if not packages:
             return True
-        
-        cmd = [sys.executable, "-m", "pip", "install"]
-        if upgrade:
-            cmd.append("--upgrade")
-        if quiet:
-            cmd.append("-q")
-        cmd.extend(packages)
-
-        try:
-            subprocess.check_call(cmd)
+
+        ok = self.package_manager.ensure(*packages, upgrade=upgrade, quiet=quiet)
+        if ok:
             self.packages.update(packages)
-            return True
-        except subprocess.CalledProcessError:
+        else:
             self.log.error("依赖安装失败: {}", " ".join(packages))
-        
-        return False
+        return ok
 
     def ensure_requirements(self, path="requirements.txt", **kwargs):
         with open(path) as f:
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" warm persistent interpreter servers for node/bash code execution """
+
+import os
+import json
+import uuid
+import queue
+import shlex
+import signal
+import atexit
+import shutil
+import tempfile
+import threading
+import subprocess
+import weakref
+from typing import Any, Dict, Optional, List
+
+from loguru import logger
+
+from .limits import get_current_limits, add_process_group
+from .venv import get_current_env
+
+RESTARTED = 'Interpreter restarted, variables from previous blocks were lost'
+
+# 在同一个进程中依次执行代码块：捕获 stdout/stderr，全局变量在代码块之间保留。
+# 编译失败（例如顶层 await）或重复声明 let/const 时包装成 async 函数执行。
+NODE_DRIVER = r"""
+const vm = require('vm');
+const path = require('path');
+const Module = require('module');
+const readline = require('readline');
+const MARKER = process.argv[process.argv.length - 1];
+const realWrite = process.stdout.write.bind(process.stdout);
+let out = [], err = [];
+function capture(buf) {
+  return (chunk, enc, cb) => {
+    buf().push(String(chunk));
+    if (typeof enc === 'function') enc(); else if (typeof cb === 'function') cb();
+    return true;
+  };
+}
+process.stdout.write = capture(() => out);
+process.stderr.write = capture(() => err);
+process.on('uncaughtException', e => err.push(String((e && e.stack) || e) + '\n'));
+process.on('unhandledRejection', e => err.push(String((e && e.stack) || e) + '\n'));
+globalThis.require = Module.createRequire(path.join(process.cwd(), '__aipy__.js'));
+
+function wrap(code, filename) {
+  return new vm.Script('(async () => {\n' + code + '\n})()', {filename, lineOffset: -1});
+}
+
+async function run(req) {
+  out = []; err = [];
+  let returncode = 0;
+  globalThis.__filename = req.file;
+  globalThis.__dirname = path.dirname(req.file);
+  try {
+    let script, wrapped = false, result;
+    try {
+      script = new vm.Script(req.code, {filename: req.file});
+    } catch (e) {
+      if (!(e instanceof SyntaxError)) throw e;
+      script = wrap(req.code, req.file);
+      wrapped = true;
+    }
+    try {
+      result = script.runInThisContext();
+    } catch (e) {
+      if (wrapped || !(e instanceof SyntaxError) || !/already been declared/.test(e.message)) throw e;
+      result = wrap(req.code, req.file).runInThisContext();
+    }
+    if (result && typeof result.then === 'function') await result;
+  } catch (e) {
+    err.push(String((e && e.stack) || e) + '\n');
+    returncode = 1;
+  }
+  await new Promise(resolve => setImmediate(resolve));
+  realWrite(MARKER + JSON.stringify({stdout: out.join(''), stderr: err.join(''), returncode}) + '\n');
+}
+
+let pending = Promise.resolve();
+const rl = readline.createInterface({input: process.stdin});
+rl.on('line', line => { pending = pending.then(() => run(JSON.parse(line))); });
+rl.on('close', () => pending.then(() => process.exit(0)));
+"""
+
+_servers = weakref.WeakSet()
+
+@atexit.register
+def _close_servers():
+    for server in list(_servers):
+        server.close()
+
+class ReplExecutor:
+    """在常驻解释器进程中执行代码块
+
+    解释器在第一次执行时启动（如果代码块在 overlay 环境中执行则在该环境中启动），之后的代码块复用同一个进程，
+    省去启动开销并保留变量等状态。空闲 idle_timeout 秒后自动关闭；进程崩溃、超时或被取消后下次执行时重新启动，
+    此时结果中附带 warning 说明之前的状态已丢失。
+    """
+    name = None
+    timeout = 30
+    idle_timeout = 600
+
+    def __init__(self, runtime=None, idle_timeout: Optional[float] = None):
+        self.runtime = runtime
+        if idle_timeout is not None:
+            self.idle_timeout = idle_timeout
+        self.marker = f"__AIPY_{uuid.uuid4().hex}__"
+        self.log = logger.bind(src=f'{self.name}_repl')
+        self.proc = None
+        self._queue = None
+        self._stray: List[str] = []
+        self._lock = threading.Lock()
+        self._idle_timer = None
+        self._lost_state = False
+        _servers.add(self)
+
+    def __repr__(self):
+        pid = self.proc.pid if self.proc else None
+        return f"<{self.__class__.__name__} pid={pid}>"
+
+    def get_command(self) -> List[str]:
+        raise NotImplementedError
+
+    def make_request(self, block) -> str:
+        """返回发送给解释器的一行请求"""
+        raise NotImplementedError
+
+    def parse_response(self, line: Optional[str], block) -> Dict[str, Any]:
+        """解析响应行，line 为 None 表示解释器已退出"""
+        raise NotImplementedError
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def _start(self):
+        env = get_current_env()
+        new_session = os.name == 'posix'
+        self.proc = subprocess.Popen(
+            self.get_command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding='utf-8',
+            errors='ignore',
+            bufsize=1,
+            env=env.environ() if env else None,
+            start_new_session=new_session
+        )
+        self._queue = queue.Queue()
+        self._stray = []
+        reader = threading.Thread(target=self._read, args=(self.proc, self._queue), name=f'{self.name}-repl-reader', daemon=True)
+        reader.start()
+        self.log.info(f"Started {self.name} interpreter", pid=self.proc.pid)
+
+    def _read(self, proc, lines):
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def _readline(self, timeout: float) -> Optional[str]:
+        """读取一行响应，非响应行保存为额外输出。超时抛出 queue.Empty"""
+        while True:
+            line = self._queue.get(timeout=timeout)
+            if line is None or line.startswith(self.marker):
+                return line
+            self._stray.append(line)
+
+    def _stop(self):
+        proc, self.proc = self.proc, None
+        if proc is None:
+            return
+        try:
+            if os.name == 'posix':
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except OSError:
+            pass
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+
+    def __call__(self, block) -> Dict[str, Any]:
+        if not block.abs_path:
+            return {'errstr': 'No file to execute'}
+
+        limits = get_current_limits()
+        timeout = self.timeout
+        if limits and limits.wall_time is not None:
+            timeout = limits.wall_time
+
+        with self._lock:
+            self._cancel_idle_timer()
+            restarted = False
+            if not self.alive:
+                restarted = self._lost_state or self.proc is not None
+                self._stop()
+                self._start()
+                self._lost_state = False
+            if os.name == 'posix':
+                # 取消或超出资源限制时终止整个解释器进程组
+                add_process_group(self.proc.pid)
+
+            self.log.info(f"Exec: {block.name}", pid=self.proc.pid)
+            self._stray = []
+            try:
+                self.proc.stdin.write(self.make_request(block) + '\n')
+                self.proc.stdin.flush()
+                line = self._readline(timeout)
+            except queue.Empty:
+                self._stop()
+                self._lost_state = True
+                result = {'errstr': f'Execution timed out after {timeout} seconds'}
+            except OSError as e:
+                self._stop()
+                self._lost_state = True
+                result = {'errstr': str(e)}
+            else:
+                if line is None:
+                    self._lost_state = True
+                    if self.proc:
+                        self.proc.wait()
+                result = self.parse_response(line, block)
+
+            if self._stray:
+                stray = ''.join(self._stray).strip()
+                result['stdout'] = '\n'.join(s for s in (result.get('stdout'), stray) if s)
+            if restarted:
+                result['warning'] = RESTARTED
+            self._start_idle_timer()
+        return result
+
+    def _cancel_idle_timer(self):
+        if self._idle_timer:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _start_idle_timer(self):
+        if self.idle_timeout and self.alive:
+            self._idle_timer = threading.Timer(self.idle_timeout, self._on_idle)
+            self._idle_timer.daemon = True
+            self._idle_timer.start()
+
+    def _on_idle(self):
+        with self._lock:
+            if self.alive:
+                self.log.info(f"Closing idle {self.name} interpreter", pid=self.proc.pid)
+                self._stop()
+                self._lost_state = True
+
+    def close(self):
+        """关闭解释器进程"""
+        with self._lock:
+            self._cancel_idle_timer()
+            self._stop()
+            self._lost_state = False
+
+class NodeReplExecutor(ReplExecutor):
+    name = 'javascript'
+
+    def get_command(self) -> List[str]:
+        return ['node', '-e', NODE_DRIVER, self.marker]
+
+    def make_request(self, block) -> str:
+        return json.dumps({'code': block.code, 'file': str(block.abs_path)})
+
+    def parse_response(self, line, block):
+        if line is None:
+            return {'errstr': f'Interpreter exited with code {self.proc.returncode if self.proc else None}'}
+        data = json.loads(line[len(self.marker):])
+        return {
+            'stdout': data['stdout'].strip() or None,
+            'stderr': data['stderr'].strip() or None,
+            'returncode': data['returncode']
+        }
+
+class BashReplExecutor(ReplExecutor):
+    """在常驻 bash 中 source 代码块文件，变量、函数和当前目录在代码块之间保留"""
+    name = 'bash'
+
+    def __init__(self, runtime=None, idle_timeout: Optional[float] = None):
+        super().__init__(runtime, idle_timeout)
+        self.tmpdir = None
+
+    def get_command(self) -> List[str]:
+        return ['bash', '--noprofile', '--norc']
+
+    def _start(self):
+        if not self.tmpdir:
+            self.tmpdir = tempfile.mkdtemp(prefix='aipy-bash-')
+        super()._start()
+
+    @property
+    def _outputs(self):
+        return os.path.join(self.tmpdir, 'stdout'), os.path.join(self.tmpdir, 'stderr')
+
+    def make_request(self, block) -> str:
+        out, err = (shlex.quote(p) for p in self._outputs)
+        return f"source {shlex.quote(str(block.abs_path))} >{out} 2>{err} </dev/null; printf '%s %d\\n' {self.marker} $?"
+
+    def parse_response(self, line, block):
+        outputs = []
+        for path in self._outputs:
+            try:
+                with open(path, encoding='utf-8', errors='ignore') as f:
+                    outputs.append(f.read().strip() or None)
+            except OSError:
+                outputs.append(None)
+        if line is None:
+            # 代码块中执行了 exit
+            returncode = self.proc.returncode if self.proc else None
+        else:
+            returncode = int(line[len(self.marker):].strip() or 0)
+        return {'stdout': outputs[0], 'stderr': outputs[1], 'returncode': returncode}
+
+    def close(self):
+        super().close()
+        if self.tmpdir:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+            self.tmpdir = None
+
+REPL_EXECUTORS = {executor.name: executor for executor in [NodeReplExecutor, BashReplExecutor]}
+
+def get_repl_overrides(langs, idle_timeout: Optional[float] = None) -> Dict[str, Any]:
+    """返回 BlockExecutor 的 overrides 参数，使指定语言使用常驻解释器"""
+    overrides = {}
+    for lang in langs or []:
+        cls = REPL_EXECUTORS.get(lang)
+        if cls is None:
+            logger.bind(src='repl').warning(f"No warm interpreter for {lang}")
+            continue
+        overrides[lang] = lambda runtime, cls=cls: cls(runtime, idle_timeout=idle_timeout)
+    return overrides
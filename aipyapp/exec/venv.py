@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" lightweight per-task/per-role overlay virtual environments """
+
+import os
+import sys
+import json
+import site
+import atexit
+import shutil
+import sysconfig
+import threading
+import importlib.abc
+import importlib.machinery
+from pathlib import Path
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, List
+from venv import EnvBuilder
+
+from loguru import logger
+
+from .python.packages import PackageManager, new_package_manager, get_wheel_dir
+
+TEMPLATE = 'template'
+TEMPLATE_MARKER = 'aipy-template.json'
+RECORD_FILE = 'aipy-packages.json'
+MODES = ('none', 'task', 'role')
+
+_current_env = ContextVar('current_overlay_env', default=None)
+
+def get_current_env() -> Optional['OverlayEnv']:
+    """返回当前正在执行的代码块所在的 overlay 环境"""
+    return _current_env.get()
+
+def _venv_paths(path: Path) -> Dict[str, Path]:
+    scheme = 'venv' if 'venv' in sysconfig.get_scheme_names() else None
+    vars = {'base': str(path), 'platbase': str(path), 'installed_base': str(path), 'installed_platbase': str(path)}
+    paths = sysconfig.get_paths(scheme, vars=vars) if scheme else sysconfig.get_paths(vars=vars)
+    return {'purelib': Path(paths['purelib']), 'scripts': Path(paths['scripts'])}
+
+def _base_site_dirs() -> List[str]:
+    """当前进程的 site-packages 目录（包括所在虚拟环境、系统和用户目录）"""
+    dirs = list(site.getsitepackages())
+    if site.ENABLE_USER_SITE:
+        dirs.append(site.getusersitepackages())
+    return [d for d in dirs if os.path.isdir(d)]
+
+def _link_or_copy(src, dst):
+    """优先硬链接，跨文件系统等情况下退回复制"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+class OverlayFinder(importlib.abc.MetaPathFinder):
+    """进程内唯一的查找器，代码块执行期间优先从当前 overlay 环境导入顶层模块"""
+    def find_spec(self, fullname, path, target=None):
+        env = _current_env.get()
+        if env is None or path is not None:
+            return None
+        return importlib.machinery.PathFinder.find_spec(fullname, [str(env.site_packages)])
+
+_finder = OverlayFinder()
+
+def install_finder():
+    """安装查找器（只安装一次）"""
+    if _finder not in sys.meta_path:
+        sys.meta_path.insert(0, _finder)
+
+class OverlayEnv:
+    """叠加在 aipy 所在环境之上的虚拟环境
+
+    环境中只包含解释器链接和一个 .pth 文件，通过 .pth 可以看到 aipy 所在环境的所有包，
+    新安装的包（子进程中的 pip 和进程内的 runtime.install_packages）只写入本环境的 site-packages，不影响其它任务。
+    """
+    def __init__(self, name: str, path: Path):
+        self.name = name
+        self.path = Path(path)
+        paths = _venv_paths(self.path)
+        self.site_packages = paths['purelib']
+        self.bin_dir = paths['scripts']
+        exe = 'python.exe' if os.name == 'nt' else 'python'
+        self.python = str(self.bin_dir / exe)
+        self._package_manager = None
+
+    def __repr__(self):
+        return f"<OverlayEnv {self.name}: {self.path}>"
+
+    @property
+    def package_manager(self) -> PackageManager:
+        """安装到本环境的包管理器，与其它环境共用 wheel 缓存，安装记录保存在环境目录中"""
+        if self._package_manager is None:
+            path = [str(self.site_packages)] + [p for p in sys.path if p]
+            self._package_manager = new_package_manager(self.python, path, self.path / RECORD_FILE)
+        return self._package_manager
+
+    def loaded_modules(self) -> List[str]:
+        """进程内已经从本环境导入的模块"""
+        prefix = str(self.path) + os.sep
+        return [name for name, module in list(sys.modules.items())
+                if (getattr(module, '__file__', None) or '').startswith(prefix)]
+
+    def environ(self, base: Dict[str, str] = None) -> Dict[str, str]:
+        """返回激活本环境后的环境变量，用于启动子进程"""
+        env = dict(os.environ if base is None else base)
+        env['VIRTUAL_ENV'] = str(self.path)
+        env['PATH'] = str(self.bin_dir) + os.pathsep + env.get('PATH', '')
+        env.pop('PYTHONHOME', None)
+        wheel_dir = get_wheel_dir()
+        if wheel_dir and wheel_dir.is_dir():
+            # 子进程中的 pip 也可以使用共用的 wheel 缓存
+            links = env.get('PIP_FIND_LINKS')
+            env['PIP_FIND_LINKS'] = f"{links} {wheel_dir}" if links else str(wheel_dir)
+        return env
+
+    @contextmanager
+    def activated(self):
+        """在 with 语句内激活本环境：进程内导入优先使用本环境，子进程在本环境中启动"""
+        install_finder()
+        token = _current_env.set(self)
+        try:
+            yield self
+        finally:
+            _current_env.reset(token)
+
+class EnvManager:
+    """创建和管理 overlay 环境
+
+    首次使用时在 root/template 创建一个不含 pip 的模板环境，之后每个环境都通过硬链接复制模板创建，
+    几乎没有开销。mode 为 task 时每个任务一个环境，任务结束后删除；为 role 时每个角色共享一个环境。
+    所有环境共用 packages 配置中的本地 wheel 缓存。
+    """
+    def __init__(self, root, mode: str = 'task'):
+        if mode not in MODES:
+            raise ValueError(f"Invalid venv mode: {mode}")
+        self.root = Path(root)
+        self.mode = mode
+        self.envs: Dict[str, OverlayEnv] = {}
+        self.log = logger.bind(src='venv')
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != 'none'
+
+    @property
+    def template(self) -> Path:
+        return self.root / TEMPLATE
+
+    def _template_info(self) -> Dict[str, str]:
+        return {'python': sys.executable, 'version': sys.version, 'site': _base_site_dirs()}
+
+    def ensure_template(self) -> Path:
+        """创建或更新模板环境，Python 解释器变化时重建"""
+        template = self.template
+        marker = template / TEMPLATE_MARKER
+        info = self._template_info()
+        try:
+            if json.loads(marker.read_text(encoding='utf-8')) == info:
+                return template
+        except (OSError, ValueError):
+            pass
+
+        self.log.info(f"Creating venv template: {template}")
+        shutil.rmtree(template, ignore_errors=True)
+        EnvBuilder(with_pip=False, symlinks=os.name != 'nt', clear=True).create(str(template))
+
+        paths = _venv_paths(template)
+        # 通过 .pth 叠加 aipy 所在环境的包，addsitedir 会继续处理这些目录中的 .pth（例如可编辑安装）
+        pth = f"import site; list(map(site.addsitedir, {info['site']!r}))\n"
+        (paths['purelib'] / '_aipy_overlay.pth').write_text(pth, encoding='utf-8')
+
+        # 代码块中的 pip 命令安装到当前环境
+        if os.name == 'posix':
+            for name in ('pip', 'pip3'):
+                script = paths['scripts'] / name
+                script.write_text('#!/bin/sh\nexec "$(dirname "$0")/python" -m pip "$@"\n', encoding='utf-8')
+                script.chmod(0o755)
+
+        marker.write_text(json.dumps(info), encoding='utf-8')
+        return template
+
+    def _env_dir(self, name: str) -> Path:
+        return self.root / self.mode / name
+
+    def acquire(self, name: str) -> Optional[OverlayEnv]:
+        """返回指定任务或角色的环境，不存在时从模板创建"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            env = self.envs.get(name)
+            if env:
+                return env
+            template = self.ensure_template()
+            path = self._env_dir(name)
+            if not (path / 'pyvenv.cfg').exists():
+                shutil.rmtree(path, ignore_errors=True)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copytree(template, path, symlinks=True, copy_function=_link_or_copy,
+                                ignore=shutil.ignore_patterns(TEMPLATE_MARKER))
+                self.log.info(f"Created overlay env: {path}")
+            env = OverlayEnv(name, path)
+            self.envs[name] = env
+            return env
+
+    def release(self, env: Optional[OverlayEnv]):
+        """任务结束时调用，task 模式下删除任务环境"""
+        if env is None or self.mode != 'task':
+            return
+        with self._lock:
+            self.envs.pop(env.name, None)
+        loaded = env.loaded_modules()
+        if loaded:
+            # 已导入的模块仍然在进程中使用（例如延迟导入子模块），进程退出时再删除
+            self.log.info(f"Overlay env in use by {len(loaded)} modules, removing at exit: {env.path}")
+            atexit.register(shutil.rmtree, env.path, ignore_errors=True)
+            return
+        shutil.rmtree(env.path, ignore_errors=True)
+        self.log.info(f"Removed overlay env: {env.path}")
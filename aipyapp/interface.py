@@ -3,6 +3,7 @@
 
 import threading
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from typing import Callable, Any, Dict, List, Optional, Protocol
 
 from loguru import logger
@@ -46,6 +47,8 @@ class Stoppable():
     def __init__(self):
         super().__init__()
         self._stop_event = threading.Event()
+        self._cancel_callbacks = []
+        self._cancel_lock = threading.Lock()
 
     def on_stop(self):
         pass
@@ -53,6 +56,29 @@ class Stoppable():
     def stop(self):
         self._stop_event.set()
         self.on_stop()
+        with self._cancel_lock:
+            callbacks = list(self._cancel_callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                logger.exception('Cancel callback failed')
+
+    @contextmanager
+    def cancel_scope(self, callback: Callable[[], None]):
+        """在 with 语句期间注册取消回调：stop() 时调用 callback 中止正在进行的操作
+
+        进入时已经停止的话立即调用 callback。
+        """
+        with self._cancel_lock:
+            self._cancel_callbacks.append(callback)
+        try:
+            if self.is_stopped():
+                callback()
+            yield
+        finally:
+            with self._cancel_lock:
+                self._cancel_callbacks.remove(callback)
         
     def is_stopped(self):
         return self._stop_event.is_set()
@@ -96,6 +122,9 @@ class EventBus:
             count += 1
         self._eb_logger.info(f"Registered {count} events for {obj.__class__.__name__}")
 
+    def clear_listeners(self):
+        self._listeners.clear()
+
     def emit(self, event_name: str, **kwargs):
         event = Event(event_name, **kwargs)
         for handler in self._listeners.get(event_name, []):
@@ -3,14 +3,15 @@
 
 
 from .. import T
-from .base import ChatMessage, BaseClient
+from .base import ChatMessage, LLMClient, BaseClient, StreamCancelled, parse_tool_arguments
 from .base_openai import OpenAIBaseClient
 from .client_claude import ClaudeClient
 from .client_ollama import OllamaClient
 from .client_oauth2 import OAuth2Client
+from .client_router import RouterClient
 from .models import ModelRegistry, ModelCapability
 
-__all__ = ['ChatMessage', 'CLIENTS', 'ModelRegistry', 'ModelCapability']
+__all__ = ['ChatMessage', 'CLIENTS', 'ModelRegistry', 'ModelCapability', 'StreamCancelled', 'parse_tool_arguments', 'RouterClient']
 
 class OpenAIClient(OpenAIBaseClient): 
     MODEL = 'gpt-4o'
@@ -2,14 +2,16 @@
 # -*- coding: utf-8 -*-
 
 import time
+import json
 from collections import Counter
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Union, List, Dict, Any
+from typing import Union, List, Dict, Any, Optional
 
 from loguru import logger
 
 from .. import T
+from .stats import StreamTimer, LatencyStats
 
 @dataclass
 class ChatMessage:
@@ -17,16 +19,24 @@ class ChatMessage:
     content: Union[str, List[Dict[str, Any]]]
     reason: str = None
     usage: Counter = field(default_factory=Counter)
+    # 原生工具调用：assistant 消息中的 [{'id', 'name', 'arguments'}]，以及 tool 消息对应的调用 id
+    tool_calls: Optional[List[Dict[str, Any]]] = None
+    tool_call_id: Optional[str] = None
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典用于序列化"""
-        return {
+        data = {
             '__type__': 'ChatMessage',
             'role': self.role,
             'content': self.content,
             'reason': self.reason,
             'usage': dict(self.usage) if self.usage else {}
         }
+        if self.tool_calls:
+            data['tool_calls'] = self.tool_calls
+        if self.tool_call_id:
+            data['tool_call_id'] = self.tool_call_id
+        return data
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'ChatMessage':
@@ -35,13 +45,40 @@ class ChatMessage:
             role=data.get('role', 'assistant'),
             content=data.get('content', ''),
             reason=data.get('reason', ''),
-            usage=Counter(data.get('usage', {}))
+            usage=Counter(data.get('usage', {})),
+            tool_calls=data.get('tool_calls'),
+            tool_call_id=data.get('tool_call_id')
         )
 
-class BaseClient(ABC):
-    MODEL = None
-    BASE_URL = None
-    TEMPERATURE = 0.5
+    def to_message(self) -> Dict[str, Any]:
+        """转换为发送给 LLM 的消息，工具调用字段由各客户端转换为对应 API 的格式"""
+        msg = {'role': self.role, 'content': self.content}
+        if self.tool_calls:
+            msg['tool_calls'] = self.tool_calls
+        if self.tool_call_id:
+            msg['tool_call_id'] = self.tool_call_id
+        return msg
+
+def parse_tool_arguments(arguments: str) -> Dict[str, Any]:
+    """解析流式拼接的工具参数 JSON，无法解析时保留原始字符串，由调用方返回错误给 LLM"""
+    if not arguments:
+        return {}
+    try:
+        value = json.loads(arguments)
+    except json.JSONDecodeError:
+        return {'__raw__': arguments}
+    return value if isinstance(value, dict) else {'__raw__': arguments}
+
+class StreamCancelled(Exception):
+    """流式响应被取消"""
+
+class LLMClient(ABC):
+    """LLM 客户端接口：维护对话历史、回复缓存和延迟统计，请求由子类的 _request 完成
+
+    BaseClient 通过服务商的 API 完成请求，RouterClient 把请求转给其它客户端。
+    """
+    # 是否支持原生工具调用（get_completion 接受 tools 参数）
+    SUPPORTS_TOOLS = False
 
     def __init__(self, config):
         self.name = config['name']
@@ -50,11 +87,90 @@ class BaseClient(ABC):
         self.config = config
         self.kind = config.get("type", "openai")
         self.max_tokens = config.get("max_tokens")
+        self._stream = config.get("stream", True)
+        # 回复缓存，由 ClientManager 根据配置设置
+        self.response_cache = None
+        self.stats = LatencyStats()
+
+    @property
+    def model(self):
+        return None
+
+    @property
+    def base_url(self):
+        return None
+
+    def usable(self):
+        return True
+
+    def add_system_prompt(self, history, system_prompt):
+        history.add("system", system_prompt)
+
+    @abstractmethod
+    def get_fingerprint(self, messages, tools=None) -> Dict[str, Any]:
+        """返回决定回复内容的请求参数，用于计算回复缓存的键"""
+        pass
+
+    @abstractmethod
+    def _request(self, messages, stream_processor=None, **kwargs) -> ChatMessage:
+        """请求 LLM 并返回回复，出错时抛出异常"""
+        pass
+
+    def __call__(self, history, prompt, system_prompt=None, stream_processor=None, tools=None):
+        """发送 prompt 并返回回复
+
+        prompt 为 None 时不添加用户消息（例如已经添加了工具调用结果）。
+        tools 为工具列表 [{'name', 'description', 'parameters'}]，只在 SUPPORTS_TOOLS 时传入。
+        """
+        # We shall only send system prompt once
+        if not history and system_prompt:
+            self.add_system_prompt(history, system_prompt)
+        if prompt is not None:
+            history.add("user", prompt)
+
+        messages = history.get_messages()
+        kwargs = {'tools': tools} if tools and self.SUPPORTS_TOOLS else {}
+        cache_key = None
+        if self.response_cache:
+            cache_key = self.response_cache.make_key(self.get_fingerprint(messages, **kwargs))
+            msg = self.response_cache.load(cache_key, stream_processor if self._stream else None)
+            if msg is not None:
+                if msg.role != 'error':
+                    history.add_message(msg)
+                return msg
+
+        start = time.time()
+        try:
+            msg = self._request(messages, stream_processor, **kwargs)
+        except Exception as e:
+            if getattr(stream_processor, 'cancelled', False):
+                self.log.info('Stream cancelled')
+                return ChatMessage(role='error', content=T('Cancelled'))
+            self.log.error(f"❌ [bold red]{self.name} API {T('Call failed')}: [yellow]{str(e)}")
+            return ChatMessage(role='error', content=str(e))
+        if self._stream and getattr(stream_processor, 'cancelled', False):
+            # 不完整的回复不加入历史
+            self.log.info('Stream cancelled')
+            return ChatMessage(role='error', content=T('Cancelled'))
+
+        msg.usage['time'] = round(time.time() - start, 3)
+        history.add_message(msg)
+        if cache_key:
+            self.response_cache.save(cache_key, msg)
+        return msg
+
+class BaseClient(LLMClient):
+    """通过服务商 API 完成请求的客户端，子类实现 get_completion 和回复解析"""
+    MODEL = None
+    BASE_URL = None
+    TEMPERATURE = 0.5
+
+    def __init__(self, config):
+        super().__init__(config)
         self._model = config.get("model") or self.MODEL
         self._timeout = config.get("timeout")
         self._api_key = config.get("api_key")
         self._base_url = self.get_base_url()
-        self._stream = config.get("stream", True)
         self._tls_verify = bool(config.get("tls_verify", True))
         self._client = None
         params = self.get_params()
@@ -88,9 +204,17 @@ class BaseClient(ABC):
     @abstractmethod
     def get_completion(self, messages):
         pass
-        
-    def add_system_prompt(self, history, system_prompt):
-        history.add("system", system_prompt)
+
+    def get_fingerprint(self, messages, tools=None) -> Dict[str, Any]:
+        return {
+            'kind': self.kind,
+            'model': self._model,
+            'temperature': self._temperature,
+            'max_tokens': self.max_tokens,
+            'params': self._params,
+            'messages': messages,
+            'tools': tools
+        }
 
     @abstractmethod
     def _parse_usage(self, response):
@@ -104,25 +228,28 @@ class BaseClient(ABC):
     def _parse_response(self, response):
         pass
     
-    def __call__(self, history, prompt, system_prompt=None, stream_processor=None):
-        # We shall only send system prompt once
-        if not history and system_prompt:
-            self.add_system_prompt(history, system_prompt)
-        history.add("user", prompt)
-
-        start = time.time()
+    def _request(self, messages, stream_processor=None, **kwargs) -> ChatMessage:
+        """请求 LLM 并解析回复，出错时抛出异常。usage 中记录首字节、首 token 时间和输出速度"""
+        timer = StreamTimer(stream_processor)
         try:
-            response = self.get_completion(history.get_messages())
-        except Exception as e:
-            self.log.error(f"❌ [bold red]{self.name} API {T('Call failed')}: [yellow]{str(e)}")
-            return ChatMessage(role='error', content=str(e))
-
-        if self._stream:
-            msg = self._parse_stream_response(response, stream_processor)
-        else:
-            msg = self._parse_response(response)
-
-        msg.usage['time'] = round(time.time() - start, 3)
-        history.add_message(msg)
+            msg = self._do_request(messages, stream_processor, timer, **kwargs)
+        except Exception:
+            if not getattr(stream_processor, 'cancelled', False):
+                self.stats.record_error()
+            raise
+        timer.apply(msg.usage)
+        self.stats.record(msg.usage)
         return msg
-    
\ No newline at end of file
+
+    def _do_request(self, messages, stream_processor, timer, **kwargs) -> ChatMessage:
+        response = self.get_completion(messages, **kwargs)
+        timer.first_byte = time.time()
+        if not self._stream:
+            return self._parse_response(response)
+        if stream_processor is not None:
+            # 记录响应对象，取消时直接关闭连接中止流式读取
+            stream_processor.response = response
+            stream_processor = timer
+        if getattr(stream_processor, 'cancelled', False):
+            raise StreamCancelled()
+        return self._parse_stream_response(response, stream_processor)
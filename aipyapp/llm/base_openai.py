@@ -1,6 +1,7 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import json
 from collections import Counter
 
 import httpx
@@ -8,12 +9,13 @@ import openai
 from loguru import logger
 
 from .. import T
-from . import BaseClient, ChatMessage
+from . import BaseClient, ChatMessage, parse_tool_arguments
 
 # https://platform.openai.com/docs/api-reference/chat/create
 # https://api-docs.deepseek.com/api/create-chat-completion
 class OpenAIBaseClient(BaseClient):
     """ OpenAI compatible client """
+    SUPPORTS_TOOLS = True
     
     def get_params(self):
         params = {'stream_options': {'include_usage': True}}
@@ -47,8 +49,35 @@ class OpenAIBaseClient(BaseClient):
                 'output_tokens': usage.completion_tokens + reasoning_tokens})
         return usage
     
+    def _convert_messages(self, messages):
+        """把工具调用消息转换为 OpenAI 格式"""
+        ret = []
+        for msg in messages:
+            if msg.get('tool_calls'):
+                msg = {
+                    'role': msg['role'],
+                    'content': msg['content'] or None,
+                    'tool_calls': [{
+                        'id': call['id'],
+                        'type': 'function',
+                        'function': {'name': call['name'], 'arguments': json.dumps(call['arguments'], ensure_ascii=False)}
+                    } for call in msg['tool_calls']]
+                }
+            ret.append(msg)
+        return ret
+
+    def _convert_tools(self, tools):
+        return [{'type': 'function', 'function': tool} for tool in tools]
+
+    def _parse_tool_calls(self, calls):
+        """calls: {index: {'id', 'name', 'arguments'}}，arguments 为拼接的 JSON 字符串"""
+        # 部分兼容 API 不返回调用 id
+        return [{'id': call['id'] or f"call_{i}", 'name': call['name'], 'arguments': parse_tool_arguments(call['arguments'])}
+                for i, call in sorted(calls.items())] or None
+
     def _parse_stream_response(self, response, stream_processor):
         usage = Counter()
+        tool_calls = {}
         with stream_processor as lm:
             for chunk in response:
                 #print(chunk)
@@ -66,30 +95,46 @@ class OpenAIBaseClient(BaseClient):
                         content = delta.reasoning_content
                     if content:
                         lm.process_chunk(content, reason=reason)
+                    # 工具调用按 index 分片返回，参数 JSON 逐段拼接
+                    for delta_call in getattr(delta, 'tool_calls', None) or []:
+                        call = tool_calls.setdefault(delta_call.index, {'id': None, 'name': '', 'arguments': ''})
+                        if delta_call.id:
+                            call['id'] = delta_call.id
+                        function = delta_call.function
+                        if function is not None:
+                            call['name'] += function.name or ''
+                            call['arguments'] += function.arguments or ''
 
-        return ChatMessage(role="assistant", content=lm.content, reason=lm.reason, usage=usage)
+        return ChatMessage(role="assistant", content=lm.content, reason=lm.reason, usage=usage,
+                           tool_calls=self._parse_tool_calls(tool_calls))
 
     def _parse_response(self, response):
         message = response.choices[0].message
         reason = getattr(message, "reasoning_content", None)
+        calls = {i: {'id': call.id, 'name': call.function.name, 'arguments': call.function.arguments}
+                 for i, call in enumerate(getattr(message, 'tool_calls', None) or [])}
         return ChatMessage(
             role=message.role,
-            content=message.content,
+            content=message.content or '',
             reason=reason,
-            usage=self._parse_usage(response.usage)
+            usage=self._parse_usage(response.usage),
+            tool_calls=self._parse_tool_calls(calls)
         )
 
-    def get_completion(self, messages):
+    def get_completion(self, messages, tools=None):
         if not self._client:
             self._client = self._get_client()
 
+        params = dict(self._params)
+        if tools:
+            params['tools'] = self._convert_tools(tools)
         response = self._client.chat.completions.create(
             model = self._model,
-            messages = messages,
+            messages = self._convert_messages(messages),
             stream=self._stream,
             max_tokens = self.max_tokens,
             temperature = self._temperature,
-            **self._params
+            **params
         )
         return response
     
\ No newline at end of file
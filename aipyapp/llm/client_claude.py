@@ -3,12 +3,13 @@
 
 from collections import Counter
 
-from . import BaseClient, ChatMessage
+from . import BaseClient, ChatMessage, parse_tool_arguments
 
 # https://docs.anthropic.com/en/api/messages
 class ClaudeClient(BaseClient):
     MODEL = "claude-sonnet-4-20250514"
     ENV_API_KEY = "ANTHROPIC_API_KEY"
+    SUPPORTS_TOOLS = True
     #PARAMS = {'thinking': {'type': 'enabled', 'budget_tokens': 1024}}
 
     def __init__(self, config):
@@ -28,11 +29,45 @@ class ClaudeClient(BaseClient):
         ret['total_tokens'] = ret['input_tokens'] + ret['output_tokens']
         return ret
 
+    def _convert_messages(self, messages):
+        """把工具调用消息转换为 Claude 的 tool_use/tool_result 内容块，连续的工具结果合并为一条用户消息"""
+        ret = []
+        for msg in messages:
+            if msg['role'] == 'tool':
+                block = {'type': 'tool_result', 'tool_use_id': msg['tool_call_id'], 'content': msg['content']}
+                last = ret[-1] if ret else None
+                if last and last['role'] == 'user' and isinstance(last['content'], list) \
+                        and last['content'] and last['content'][-1].get('type') == 'tool_result':
+                    last['content'].append(block)
+                else:
+                    ret.append({'role': 'user', 'content': [block]})
+                continue
+            if msg.get('tool_calls'):
+                content = [{'type': 'text', 'text': msg['content']}] if msg['content'] else []
+                content.extend({'type': 'tool_use', 'id': call['id'], 'name': call['name'], 'input': call['arguments']}
+                               for call in msg['tool_calls'])
+                msg = {'role': msg['role'], 'content': content}
+            ret.append(msg)
+        return ret
+
+    def _convert_tools(self, tools):
+        return [{'name': tool['name'], 'description': tool['description'], 'input_schema': tool['parameters']}
+                for tool in tools]
+
     def _parse_stream_response(self, response, stream_processor):
         usage = Counter()    
+        tool_calls = {}
         with stream_processor as lm:
             for event in response:
-                if hasattr(event, 'delta') and hasattr(event.delta, 'text') and event.delta.text:
+                event_type = getattr(event, 'type', None)
+                if event_type == 'content_block_start' and getattr(event.content_block, 'type', None) == 'tool_use':
+                    block = event.content_block
+                    tool_calls[event.index] = {'id': block.id, 'name': block.name, 'arguments': ''}
+                elif event_type == 'content_block_delta' and getattr(event.delta, 'type', None) == 'input_json_delta':
+                    # 工具参数 JSON 逐段返回
+                    if event.index in tool_calls:
+                        tool_calls[event.index]['arguments'] += event.delta.partial_json or ''
+                elif hasattr(event, 'delta') and hasattr(event.delta, 'text') and event.delta.text:
                     content = event.delta.text
                     lm.process_chunk(content)
                 elif hasattr(event, 'message') and hasattr(event.message, 'usage') and event.message.usage:
@@ -43,28 +78,52 @@ class ClaudeClient(BaseClient):
                     usage['output_tokens'] += getattr(event.usage, 'output_tokens', 0)
 
         usage['total_tokens'] = usage['input_tokens'] + usage['output_tokens']
-        return ChatMessage(role="assistant", content=lm.content, usage=usage)
+        calls = [{'id': call['id'], 'name': call['name'], 'arguments': parse_tool_arguments(call['arguments'])}
+                 for _, call in sorted(tool_calls.items())]
+        return ChatMessage(role="assistant", content=lm.content, usage=usage, tool_calls=calls or None)
 
     def _parse_response(self, response):
-        content = response.content[0].text
+        content = ''.join(block.text for block in response.content if getattr(block, 'type', 'text') == 'text')
+        calls = [{'id': block.id, 'name': block.name, 'arguments': block.input or {}}
+                 for block in response.content if getattr(block, 'type', None) == 'tool_use']
         role = response.role
-        return ChatMessage(role=role, content=content, usage=self._parse_usage(response))
+        return ChatMessage(role=role, content=content, usage=self._parse_usage(response), tool_calls=calls or None)
     
     def add_system_prompt(self, history, system_prompt):
         self._system_prompt = system_prompt
 
-    def get_completion(self, messages):
+    def _split_system(self, messages):
+        """Claude 的系统提示词单独传递，返回 (本次请求的系统提示词, 其余消息)
+
+        消息列表以系统消息开头时（例如经路由客户端转发的请求）只使用消息中的系统提示词，不读写共享的 _system_prompt；
+        否则使用 add_system_prompt 设置的。
+        """
+        system = [msg['content'] for msg in messages if msg['role'] == 'system']
+        if self._system_prompt and not (messages and messages[0]['role'] == 'system'):
+            system.insert(0, self._system_prompt)
+        messages = [msg for msg in messages if msg['role'] != 'system']
+        return '\n\n'.join(system) or None, messages
+
+    def get_fingerprint(self, messages, tools=None):
+        # 系统提示词不在消息列表中
+        return dict(super().get_fingerprint(messages, tools), system=self._system_prompt)
+
+    def get_completion(self, messages, tools=None):
         if not self._client:
             self._client = self._get_client()
 
+        params = dict(self._params)
+        if tools:
+            params['tools'] = self._convert_tools(tools)
+        system, messages = self._split_system(messages)
         message = self._client.messages.create(
             model = self._model,
-            messages = messages,
+            messages = self._convert_messages(messages),
             stream=self._stream,
-            system=self._system_prompt,
+            system=system,
             max_tokens = self.max_tokens,
             temperature = self._temperature,
-            **self._params
+            **params
         )
         return message
     
\ No newline at end of file
@@ -61,8 +61,8 @@ class OAuth2Client(OpenAIBaseClient):
 
         return self._access_token
         
-    def get_completion(self, messages):
-        response = super().get_completion(messages)
+    def get_completion(self, messages, tools=None):
+        response = super().get_completion(messages, tools=tools)
         self._client = None
 
         return response
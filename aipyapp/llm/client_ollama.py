@@ -50,6 +50,7 @@ class OllamaClient(BaseClient):
                 "options": {"num_predict": self.max_tokens, "temperature": self._temperature}
             },
             timeout=self._timeout,
+            stream=self._stream,
             **self._params
         )
         response.raise_for_status()
@@ -0,0 +1,307 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import queue
+import random
+import threading
+from typing import Any, Dict, List, Optional
+
+from . import LLMClient, BaseClient, ChatMessage, StreamCancelled
+
+# 这些状态码表示服务暂时不可用，等待后重试
+RETRYABLE_STATUS = {408, 409, 425, 429}
+
+def _status_code(e: Exception) -> Optional[int]:
+    status = getattr(e, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(e, 'response', None), 'status_code', None)
+    return status if isinstance(status, int) else None
+
+def is_retryable(e: Exception) -> bool:
+    """429/5xx 和网络错误（没有状态码）可以重试"""
+    status = _status_code(e)
+    return status is None or status in RETRYABLE_STATUS or status >= 500
+
+def _retry_after(e: Exception) -> Optional[float]:
+    headers = getattr(getattr(e, 'response', None), 'headers', None)
+    try:
+        return float(headers.get('retry-after')) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+class ProviderHealth:
+    """路由使用的单个服务商的滑动平均指标：首 token 延迟、输出速度和错误率"""
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self.ttft = None
+        self.tps = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def _ewma(self, old, value):
+        return value if old is None else old + self.alpha * (value - old)
+
+    @property
+    def healthy(self) -> bool:
+        return time.time() >= self.cooldown_until
+
+    def score(self, error_penalty: float) -> float:
+        """越小越好，没有数据的服务商优先尝试"""
+        return (self.ttft or 0.0) + self.error_rate * error_penalty
+
+    def record_success(self, ttft: float, tps: Optional[float]):
+        self.ttft = self._ewma(self.ttft, ttft)
+        if tps:
+            self.tps = self._ewma(self.tps, tps)
+        self.error_rate = self._ewma(self.error_rate, 0.0)
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def record_failure(self, cooldown: float):
+        self.error_rate = self._ewma(self.error_rate, 1.0)
+        self.failures += 1
+        self.cooldown_until = time.time() + cooldown
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'ttft': self.ttft, 'tps': self.tps, 'error_rate': round(self.error_rate, 3),
+                'failures': self.failures, 'healthy': self.healthy}
+
+class _Race:
+    """一次请求的多个并发尝试，第一个输出内容或完成的尝试获胜，其它尝试被中止"""
+    def __init__(self, stream_processor):
+        self.stream_processor = stream_processor
+        self.lock = threading.Lock()
+        self.winner = None
+        self.attempts = []
+        self.cancelled = False
+
+    def claim(self, attempt) -> bool:
+        with self.lock:
+            if self.winner is None and not self.cancelled:
+                self.winner = attempt
+        if self.winner is not attempt:
+            return False
+        for other in self.attempts:
+            if other is not attempt:
+                other.close()
+        return True
+
+    def close(self):
+        """StreamProcessor.cancel 调用：中止所有尝试"""
+        self.cancelled = True
+        for attempt in self.attempts:
+            attempt.close()
+
+class _Attempt:
+    """对单个服务商的一次请求，作为该服务商的 StreamProcessor：获胜前不输出，获胜后转发给真正的 StreamProcessor"""
+    def __init__(self, race: _Race, provider: BaseClient):
+        self.race = race
+        self.provider = provider
+        self.target = race.stream_processor
+        self.response = None
+        self._entered = False
+        self._content = []
+        self._reason = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.race.cancelled or self.race.winner not in (None, self) \
+            or bool(getattr(self.target, 'cancelled', False))
+
+    @property
+    def content(self):
+        return self.target.content if self._entered else ''.join(self._content)
+
+    @property
+    def reason(self):
+        return self.target.reason if self._entered else ''.join(self._reason)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._entered:
+            self.target.__exit__(exc_type, exc_val, exc_tb)
+
+    def process_chunk(self, content, *, reason=False):
+        if self.cancelled:
+            raise StreamCancelled()
+        if not content:
+            return
+        if not self.race.claim(self):
+            raise StreamCancelled()
+        if self.target is None:
+            (self._reason if reason else self._content).append(content)
+            return
+        if not self._entered:
+            self.target.__enter__()
+            self._entered = True
+        self.target.process_chunk(content, reason=reason)
+
+    def close(self):
+        response = self.response
+        if response is not None and hasattr(response, 'close'):
+            try:
+                response.close()
+            except Exception:
+                pass
+
+class RouterClient(LLMClient):
+    """在多个已配置的 LLM 之间路由请求
+
+    每个请求发送给当前最快（首 token 延迟的滑动平均最小、错误率低）且健康的服务商；
+    hedge_delay 秒内没有输出时同时请求下一个服务商，先输出的获胜，另一个被中止；
+    失败的服务商暂时标记为不健康，429/5xx 和网络错误按指数退避后换服务商重试。
+    本身不请求 API，请求由服务商的 _request 完成。
+    """
+    ERROR_PENALTY = 30
+
+    def __init__(self, config, providers: List[BaseClient]):
+        super().__init__(config)
+        self.providers = providers
+        self.hedge_delay = config.get('hedge_delay', 5)
+        self.max_attempts = config.get('max_attempts', 3)
+        self.backoff = config.get('backoff', 1)
+        self.max_backoff = config.get('max_backoff', 30)
+        self.health = {provider.name: ProviderHealth(config.get('alpha', 0.3)) for provider in providers}
+        self.SUPPORTS_TOOLS = bool(providers) and all(provider.SUPPORTS_TOOLS for provider in providers)
+
+    def usable(self):
+        return bool(self.providers)
+
+    @property
+    def model(self):
+        providers = self.ranked()
+        return providers[0].model if providers else None
+
+    def __repr__(self):
+        return f"{self.name}/{self.kind}:{','.join(provider.name for provider in self.providers)}"
+
+    def ranked(self) -> List[BaseClient]:
+        """健康的服务商按得分排序，全部不健康时按恢复时间排序"""
+        healthy = [p for p in self.providers if self.health[p.name].healthy]
+        if healthy:
+            return sorted(healthy, key=lambda p: self.health[p.name].score(self.ERROR_PENALTY))
+        return sorted(self.providers, key=lambda p: self.health[p.name].cooldown_until)
+
+    def get_fingerprint(self, messages, tools=None) -> Dict[str, Any]:
+        # 回复可能来自任意一个服务商，缓存键包含所有服务商的请求参数
+        providers = [provider.get_fingerprint(None, tools) for provider in self.providers]
+        return {'kind': self.kind, 'providers': providers, 'messages': messages, 'tools': tools}
+
+    def get_health(self) -> Dict[str, Dict[str, Any]]:
+        return {name: health.to_dict() for name, health in self.health.items()}
+
+    def _backoff_delay(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _run(self, attempt: _Attempt, messages, kwargs, results):
+        provider = attempt.provider
+        try:
+            # 系统提示词保留在消息列表中，由服务商按自己的方式随请求传递
+            msg = provider._request(messages, attempt, **kwargs)
+        except Exception as e:
+            results.put((attempt, None, e))
+        else:
+            results.put((attempt, msg, None))
+
+    def _finish(self, attempt: _Attempt, msg: ChatMessage):
+        # 服务商的 _request 已经在 usage 中记录了 ttft 和 tps
+        ttft = msg.usage.get('ttft', 0)
+        self.health[attempt.provider.name].record_success(ttft, msg.usage.get('tps'))
+        self.log.info('Routed request', provider=attempt.provider.name, ttft=ttft)
+
+    def _race(self, providers: List[BaseClient], messages, kwargs, stream_processor, failed: set):
+        """返回 (消息, 错误)，错误为最后一个失败的异常，失败的服务商加入 failed"""
+        race = _Race(stream_processor)
+        if stream_processor is not None:
+            stream_processor.response = race
+        results = queue.Queue()
+        pending = 0
+        error = None
+        candidates = list(providers)
+        hedge_at = None
+
+        def launch():
+            nonlocal pending, hedge_at
+            attempt = _Attempt(race, candidates.pop(0))
+            race.attempts.append(attempt)
+            threading.Thread(target=self._run, args=(attempt, messages, kwargs, results), daemon=True).start()
+            pending += 1
+            hedge_at = time.time() + self.hedge_delay if self.hedge_delay and candidates else None
+
+        launch()
+        while pending:
+            if getattr(stream_processor, 'cancelled', False):
+                race.close()
+                raise StreamCancelled()
+            timeout = 0.1
+            if hedge_at is not None and race.winner is None:
+                timeout = max(0, min(timeout, hedge_at - time.time()))
+            try:
+                attempt, msg, e = results.get(timeout=timeout)
+            except queue.Empty:
+                if hedge_at is not None and race.winner is None and time.time() >= hedge_at:
+                    self.log.info('Hedging request', provider=candidates[0].name)
+                    launch()
+                continue
+
+            pending -= 1
+            if e is None and race.claim(attempt):
+                self._finish(attempt, msg)
+                race.close()
+                return msg, None
+            if race.winner is not None and race.winner is not attempt:
+                # 被获胜的尝试中止
+                continue
+            error = e or error
+            failed.add(attempt.provider.name)
+            if not attempt.cancelled:
+                self.log.error(f"{attempt.provider.name} failed: {e}")
+                health = self.health[attempt.provider.name]
+                health.record_failure(self._backoff_delay(health.failures))
+            if race.winner is attempt:
+                # 已经输出了部分内容，不能再换服务商
+                raise error
+        return None, error
+
+    def _request(self, messages, stream_processor=None, **kwargs) -> ChatMessage:
+        try:
+            msg = self._route(messages, stream_processor, **kwargs)
+        except Exception:
+            if not getattr(stream_processor, 'cancelled', False):
+                self.stats.record_error()
+            raise
+        self.stats.record(msg.usage)
+        return msg
+
+    def _route(self, messages, stream_processor=None, **kwargs) -> ChatMessage:
+        failed = set()
+        error = None
+        for i in range(self.max_attempts):
+            providers = [p for p in self.ranked() if p.name not in failed] or self.ranked()
+            msg, error = self._race(providers, messages, kwargs, stream_processor, failed)
+            if msg is not None:
+                return msg
+            untried = [p for p in self.ranked() if p.name not in failed]
+            if not is_retryable(error) and not untried:
+                break
+            # 还有没失败过的健康服务商时直接转给它，否则退避后重试
+            if i + 1 < self.max_attempts and is_retryable(error) and not untried:
+                delay = _retry_after(error) or self._backoff_delay(i)
+                self.log.info(f"Retrying in {delay:.1f}s", error=str(error))
+                if self._wait(delay, stream_processor):
+                    raise StreamCancelled()
+        raise error or RuntimeError('No LLM provider available')
+
+    def _wait(self, seconds: float, stream_processor) -> bool:
+        """等待 seconds 秒，返回是否被取消"""
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            if getattr(stream_processor, 'cancelled', False):
+                return True
+            time.sleep(min(0.1, max(0, deadline - time.time())))
+        return getattr(stream_processor, 'cancelled', False)
@@ -37,6 +37,9 @@ class ModelInfo:
     def has_capability(self, cap: ModelCapability) -> bool:
         return cap in self.capabilities
 
+    def get_extra(self, key: str, default: Any = None) -> Any:
+        return (self.extra or {}).get(key, default)
+
 class ModelRegistry:
     def __init__(self, config_path: str):
         self.models: Dict[str, ModelInfo] = {}
@@ -0,0 +1,111 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from typing import Any, Dict, Optional
+
+# StreamTimer 写入 usage 的时间指标
+TIMING_KEYS = ('ttfb', 'ttft', 'reason_time', 'content_time', 'gen_time', 'tps')
+
+class StreamTimer:
+    """记录一次请求的时间点，流式请求时包装 StreamProcessor 记录内容 token 的时间
+
+    - sent: 发送请求
+    - first_byte: 收到响应头（get_completion 返回）
+    - first_token: 第一个输出（思考或正文）
+    - first_content: 第一个正文输出
+    - last_token: 最后一个输出
+    """
+    def __init__(self, stream_processor=None):
+        self.stream_processor = stream_processor
+        self.sent = time.time()
+        self.first_byte = None
+        self.first_token = None
+        self.first_content = None
+        self.last_token = None
+
+    def __getattr__(self, name):
+        # content、reason、cancelled 等属性由被包装的 StreamProcessor 提供
+        return getattr(self.stream_processor, name)
+
+    def __enter__(self):
+        self.stream_processor.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self.stream_processor.__exit__(exc_type, exc_val, exc_tb)
+
+    def process_chunk(self, content, *, reason=False):
+        if content:
+            now = time.time()
+            if self.first_token is None:
+                self.first_token = now
+            if not reason and self.first_content is None:
+                self.first_content = now
+            self.last_token = now
+        self.stream_processor.process_chunk(content, reason=reason)
+
+    def apply(self, usage):
+        """把时间指标（秒）写入 usage：ttfb、ttft、reason_time（思考）、content_time（正文）、gen_time 和 tps"""
+        end = time.time()
+        first_byte = self.first_byte or end
+        usage['ttfb'] = round(first_byte - self.sent, 3)
+        if self.first_token is None:
+            # 非流式请求或只返回了工具调用
+            usage['ttft'] = round(end - self.sent, 3)
+            return
+        usage['ttft'] = round(self.first_token - self.sent, 3)
+        if self.first_content is not None:
+            usage['reason_time'] = round(self.first_content - self.first_token, 3)
+            usage['content_time'] = round(self.last_token - self.first_content, 3)
+        else:
+            usage['reason_time'] = round(self.last_token - self.first_token, 3)
+        gen_time = self.last_token - self.first_token
+        usage['gen_time'] = round(gen_time, 3)
+        if gen_time > 0 and usage.get('output_tokens'):
+            usage['tps'] = round(usage['output_tokens'] / gen_time, 1)
+
+class LatencyStats:
+    """单个 LLM 客户端的累计时间指标"""
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self.requests = 0
+        self.errors = 0
+        self.ttft_total = 0.0
+        self.ttfb_total = 0.0
+        self.gen_time = 0.0
+        self.output_tokens = 0
+        self.recent_ttft = None
+        self.recent_tps = None
+        self._lock = threading.Lock()
+
+    def _ewma(self, old: Optional[float], value: float) -> float:
+        return value if old is None else old + self.alpha * (value - old)
+
+    def record(self, usage):
+        with self._lock:
+            self.requests += 1
+            self.ttft_total += usage.get('ttft', 0)
+            self.ttfb_total += usage.get('ttfb', 0)
+            self.recent_ttft = self._ewma(self.recent_ttft, usage.get('ttft', 0))
+            if usage.get('tps'):
+                self.gen_time += usage.get('gen_time', 0)
+                self.output_tokens += usage.get('output_tokens', 0)
+                self.recent_tps = self._ewma(self.recent_tps, usage['tps'])
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'avg_ttfb': self.ttfb_total / self.requests if self.requests else None,
+                'avg_ttft': self.ttft_total / self.requests if self.requests else None,
+                'recent_ttft': self.recent_ttft,
+                'avg_tps': self.output_tokens / self.gen_time if self.gen_time else None,
+                'recent_tps': self.recent_tps,
+            }
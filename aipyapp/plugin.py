@@ -101,6 +101,14 @@ class TaskPlugin(Plugin):
         """
         return PluginType.TASK
 
+    def reset(self):
+        """重置插件状态，Task 复用时调用
+
+        默认按配置重新初始化，丢弃上一个任务留下的状态。
+        没有任务相关状态的插件可以覆盖为空操作，保留连接池等资源。
+        """
+        self.init()
+
     def get_functions(self) -> Dict[str, Callable]:
         """Get all functions
         
@@ -2,13 +2,26 @@
 # -*- coding: utf-8 -*-
 
 import os
+import json
 import base64
+import hashlib
 import mimetypes
-from typing import Union
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, List, Dict, Any, Tuple
+from urllib.parse import urlparse
 
+import requests
 from openai import OpenAI
 
 from aipyapp import TaskPlugin, PluginInitError
+from aipyapp.aipy.cache import get_default_cache
+from aipyapp.aipy.multimodal import prepare_image
+from aipyapp.aipy.utils import format_size
+
+# 已编码图片的内存缓存数量
+ENCODED_CACHE_SIZE = 32
 
 class ImageToolPlugin(TaskPlugin):
     """图片识别工具插件"""
@@ -31,7 +44,25 @@ class ImageToolPlugin(TaskPlugin):
             base_url=base_url
         )
         self.model = model
+        self.max_tokens = self.config.get('max_tokens', 1000)
+        self.max_workers = self.config.get('max_workers', 4)
+        self.timeout = self.config.get('timeout', 30)
+
+        # 缩放到模型实际使用的分辨率（OpenAI high detail: 长边 2048，短边 768）
+        self.max_side = self.config.get('max_side', 2048)
+        self.max_short_side = self.config.get('max_short_side', 768)
+        self.jpeg_quality = self.config.get('jpeg_quality', 85)
+
+        # 识别结果缓存，按图片内容哈希、模型和提示词索引
+        self.cache = get_default_cache() if self.config.get('cache', True) else None
+        self.cache_ttl = self.config.get('cache_ttl', 7 * 24 * 3600)
+        self._encoded: OrderedDict[str, Tuple[str, str]] = OrderedDict()
+        self._encoded_lock = threading.Lock()
         self.logger.info(f"初始化OpenAI客户端，模型: {model}")
+
+    def reset(self):
+        """没有任务相关状态，复用任务时保留客户端和已编码图片"""
+        pass
     
     def fn_recognize_image(self,
         image_source: str,
@@ -51,6 +82,34 @@ class ImageToolPlugin(TaskPlugin):
         """
         return self._recognize_image(image_source, prompt, return_json)
     
+    def fn_recognize_images(self,
+        image_sources: List[str],
+        prompt: str = "请描述这张图片的内容。",
+        return_json: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        并发识别多张图片
+        
+        Args:
+            image_sources: 本地图片路径或远程图片URL列表
+            prompt: 分析提示词
+            return_json: 是否返回完整JSON响应
+            
+        Returns:
+            与 image_sources 顺序一致的结果列表，每项包含 image_source、success 以及 result 或 error
+        """
+        def recognize(image_source):
+            try:
+                result = self._recognize_image(image_source, prompt, return_json)
+                return {"image_source": image_source, "success": True, "result": result}
+            except Exception as e:
+                return {"image_source": image_source, "success": False, "error": str(e)}
+
+        if len(image_sources) <= 1:
+            return [recognize(source) for source in image_sources]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(image_sources))) as executor:
+            return list(executor.map(recognize, image_sources))
+
     def fn_analyze_image(self, image_source: str, analysis_type: str = "general") -> str:
         """
         深度分析图片内容
@@ -72,26 +131,73 @@ class ImageToolPlugin(TaskPlugin):
         prompt = prompts.get(analysis_type, prompts["general"])
         return self._recognize_image(image_source, prompt, False)
     
+    def _read_image(self, image_source: str) -> Tuple[bytes, str]:
+        """读取本地图片或下载远程图片
+
+        Returns:
+            (图片内容, MIME 类型)
+        """
+        if image_source.startswith("http://") or image_source.startswith("https://"):
+            # 下载后按内容索引缓存，URL 不变而内容更新时不会返回旧结果
+            response = requests.get(image_source, timeout=self.timeout)
+            response.raise_for_status()
+            mime_type = response.headers.get('content-type', '').split(';')[0].strip()
+            if not mime_type.startswith('image/'):
+                mime_type, _ = mimetypes.guess_type(urlparse(image_source).path)
+            return response.content, mime_type or "image/jpeg"
+
+        if not os.path.exists(image_source):
+            raise FileNotFoundError(f"文件不存在: {image_source}")
+
+        with open(image_source, "rb") as f:
+            image_bytes = f.read()
+        mime_type, _ = mimetypes.guess_type(image_source)
+        return image_bytes, mime_type or "image/jpeg"  # 默认MIME类型
+
+    def _encode_image(self, digest: str, image_bytes: bytes, mime_type: str, image_source: str) -> str:
+        """缩放图片并编码为 data URL"""
+        # 同一图片配合不同提示词使用时复用缩放和编码结果
+        with self._encoded_lock:
+            data_url = self._encoded.get(digest)
+            if data_url:
+                self._encoded.move_to_end(digest)
+                return data_url
+
+        # 缩放规则与任务附图共用，只是按插件配置的分辨率输出 JPEG/PNG
+        size = len(image_bytes)
+        image_bytes, mime_type = prepare_image(image_bytes, mime_type, self.max_side, self.max_short_side,
+                                               format='jpeg', quality=self.jpeg_quality)
+        if len(image_bytes) != size:
+            self.logger.info(f"图片压缩 {image_source}：{format_size(size)} -> {format_size(len(image_bytes))}")
+        base64_image = base64.b64encode(image_bytes).decode("utf-8")
+        data_url = f"data:{mime_type};base64,{base64_image}"
+
+        with self._encoded_lock:
+            self._encoded[digest] = data_url
+            while len(self._encoded) > ENCODED_CACHE_SIZE:
+                self._encoded.popitem(last=False)
+        return data_url
+
+    def _cache_key(self, digest: str, prompt: str, return_json: bool) -> str:
+        key_data = json.dumps([digest, self.model, prompt, self.max_tokens, return_json], ensure_ascii=False)
+        return f"image_tool:{hashlib.sha256(key_data.encode()).hexdigest()}"
+
     def _recognize_image(self, image_source: str, prompt: str, return_json: bool) -> Union[str, dict]:
         """内部图片识别实现"""
         try:
-            # 判断是本地文件还是远程URL
-            if image_source.startswith("http://") or image_source.startswith("https://"):
-                image_url = {"type": "image_url", "image_url": {"url": image_source}}
-            else:
-                # 本地文件处理
-                if not os.path.exists(image_source):
-                    raise FileNotFoundError(f"文件不存在: {image_source}")
+            image_bytes, mime_type = self._read_image(image_source)
+            digest = hashlib.sha256(image_bytes).hexdigest()
 
-                mime_type, _ = mimetypes.guess_type(image_source)
-                if mime_type is None:
-                    mime_type = "image/jpeg"  # 默认MIME类型
+            # 先查结果缓存，未命中时才缩放编码
+            key = self._cache_key(digest, prompt, return_json)
+            if self.cache:
+                result = self.cache.get(key)
+                if result is not None:
+                    self.logger.info(f"图片识别命中缓存: {image_source}")
+                    return result
 
-                with open(image_source, "rb") as f:
-                    image_bytes = f.read()
-                base64_image = base64.b64encode(image_bytes).decode("utf-8")
-                data_url = f"data:{mime_type};base64,{base64_image}"
-                image_url = {"type": "image_url", "image_url": {"url": data_url}}
+            data_url = self._encode_image(digest, image_bytes, mime_type, image_source)
+            image_url = {"type": "image_url", "image_url": {"url": data_url}}
 
             # 调用OpenAI Chat接口
             response = self.client.chat.completions.create(
@@ -105,15 +211,19 @@ class ImageToolPlugin(TaskPlugin):
                         ],
                     }
                 ],
-                max_tokens=self.config.get('max_tokens', 1000),
+                max_tokens=self.max_tokens,
             )
 
             # 返回值处理
             if return_json:
-                return response.model_dump()
+                result = response.model_dump()
             else:
-                return response.choices[0].message.content
+                result = response.choices[0].message.content
+
+            if self.cache and result is not None:
+                self.cache.set(key, result, self.cache_ttl)
+            return result
                 
         except Exception as e:
             self.logger.error(f"图片识别失败: {e}")
-            raise
\ No newline at end of file
+            raise
@@ -54,6 +54,10 @@ class DisplayAgent(RichDisplayPlugin):
             'metadata': {}
         }
 
+    def reset(self):
+        """Task 复用时清空捕获的数据"""
+        self.clear_captured_data()
+
     # 重写父类方法，捕获输出而不显示
     def print(self, message: str, style: str = None):
         """捕获打印消息"""
@@ -99,7 +103,8 @@ class DisplayAgent(RichDisplayPlugin):
         result_data = {
             'block_name': block.name if (block and hasattr(block, 'name')) else 'unknown',
             'language': block.lang if (block and hasattr(block, 'lang')) else 'unknown',
-            'result': result
+            'result': result,
+            'usage': event.data.get('usage')
         }
         self._add_message('exec_result', result_data)
         self.captured_data['results'].append(result_data)
@@ -305,6 +305,13 @@ class DisplayClassic(RichDisplayPlugin):
         # JSON格式化和高亮显示结果
         json_result = json.dumps(result, ensure_ascii=False, indent=2, default=str)
         tree.add(Syntax(json_result, "json", word_wrap=True))
+        if data.get('cached'):
+            tree.add(Text(T('Result reused from execution cache'), style="dim"))
+        usage = data.get('usage')
+        if usage:
+            tree.add(Text(f"{T('Resource usage')}: wall {usage['wall_time']}s, cpu {usage['cpu_user'] + usage['cpu_sys']:.2f}s, "
+                          f"mem +{usage['mem_delta'] // 1024 // 1024}MB, written {usage['bytes_written'] // 1024}KB, "
+                          f"children {usage['children']}", style="dim"))
         self.console.print(tree)
 
     def on_mcp_call(self, event):
@@ -312,6 +319,15 @@ class DisplayClassic(RichDisplayPlugin):
         title = self._get_title(T("Start calling MCP tool"))
         self.console.print(title)
                 
+    def on_mcp_progress(self, event):
+        """MCP 工具调用进度事件处理"""
+        data = event.data
+        progress, total = data.get('progress'), data.get('total')
+        text = f"{progress:g}/{total:g}" if total else f"{progress:g}"
+        if data.get('message'):
+            text = f"{text} {data['message']}"
+        self.console.print(Text(f"{T('MCP tool progress')}: {text}", style="dim"))
+
     def on_mcp_result(self, event):
         """MCP 工具调用结果事件处理"""
         data = event.data
@@ -293,6 +293,15 @@ class DisplayMinimal(RichDisplayPlugin):
         title = self._get_title(T("Start calling MCP tool"))
         self.console.print(title)
                 
+    def on_mcp_progress(self, event):
+        """MCP 工具调用进度事件处理"""
+        data = event.data
+        progress, total = data.get('progress'), data.get('total')
+        text = f"{progress:g}/{total:g}" if total else f"{progress:g}"
+        if data.get('message'):
+            text = f"{text} {data['message']}"
+        self.console.print(Text(f"{T('MCP tool progress')}: {text}", style="dim"))
+
     def on_mcp_result(self, event):
         """MCP 工具调用结果事件处理"""
         data = event.data
@@ -1,11 +1,25 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import requests
-from typing import Dict, Any, Optional
+import base64
+import threading
+import importlib.util
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List
 from urllib.parse import urlparse
 
+import requests
+from requests.adapters import HTTPAdapter
+from requests.compat import chardet
+
 from aipyapp import TaskPlugin
+from aipyapp.aipy.cache import KVCache
+from aipyapp.aipy.config import CONFIG_DIR
+
+# lxml 可用时使用更快的解析器
+HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+CHUNK_SIZE = 64 * 1024
 
 class WebToolsPlugin(TaskPlugin):
     """网络工具插件 - 提供网页抓取、URL分析等功能"""
@@ -24,8 +38,28 @@ class WebToolsPlugin(TaskPlugin):
             'User-Agent': self.user_agent,
             **self.config.get('default_headers', {})
         }
+        self.max_workers = self.config.get('max_workers', 8)
+        self.per_host_limit = self.config.get('per_host_limit', 4)
+
+        # 连接池复用 DNS/TCP/TLS 连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._host_slots: Dict[str, threading.Semaphore] = {}
+        self._host_lock = threading.Lock()
+
+        # 可选的磁盘 HTTP 缓存，使用 ETag/Last-Modified 重新验证
+        self.cache = None
+        if self.config.get('cache', False):
+            cache_file = self.config.get('cache_file') or CONFIG_DIR / 'web_cache.db'
+            self.cache = KVCache(str(cache_file), default_ttl=self.config.get('cache_ttl', 86400))
         
-        self.logger.info(f"初始化网络工具，超时: {self.timeout}s")
+        self.logger.info(f"初始化网络工具，超时: {self.timeout}s，解析器: {HTML_PARSER}")
+
+    def reset(self):
+        """没有任务相关状态，复用任务时保留连接池和缓存"""
+        pass
     
     def fn_fetch_webpage(self, url: str, extract_text: bool = True) -> Dict[str, Any]:
         """
@@ -46,6 +80,35 @@ class WebToolsPlugin(TaskPlugin):
         """
         return self._fetch_webpage(url, extract_text)
     
+    def fn_fetch_many(self, urls: List[str], extract_text: bool = True) -> List[Dict[str, Any]]:
+        """
+        并发抓取多个网页，同一主机的并发数受限
+        
+        Args:
+            urls: 目标URL列表
+            extract_text: 是否只提取文本内容
+            
+        Returns:
+            与 urls 顺序一致的结果列表，每项格式同 fetch_webpage
+        
+        Examples:
+            >>> fn_fetch_many(["https://www.baidu.com", "https://www.qq.com"])
+            [{'success': True, 'url': 'https://www.baidu.com', ...}, {'success': True, 'url': 'https://www.qq.com', ...}]
+        """
+        return self._map(lambda url: self._fetch_webpage(url, extract_text), urls)
+
+    def fn_check_urls(self, urls: List[str]) -> List[Dict[str, Any]]:
+        """
+        并发检查多个URL的状态
+        
+        Args:
+            urls: 目标URL列表
+            
+        Returns:
+            与 urls 顺序一致的结果列表，每项格式同 check_url_status 并包含 url
+        """
+        return self._map(lambda url: {'url': url, **self._check_url_status(url)}, urls)
+
     def fn_http_request(self, url: str, method: str = "GET", headers: Optional[Dict[str, str]] = None, params: Optional[Dict[str, Any]] = None, json_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         发送HTTP请求
@@ -94,55 +157,87 @@ class WebToolsPlugin(TaskPlugin):
         """
         return self._check_url_status(url)
     
+    def _map(self, func, urls: List[str]) -> List[Dict[str, Any]]:
+        """在线程池中并发执行，结果保持输入顺序"""
+        if len(urls) <= 1:
+            return [func(url) for url in urls]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as executor:
+            return list(executor.map(func, urls))
+
+    @contextmanager
+    def _host_slot(self, url: str):
+        """限制同一主机的并发请求数"""
+        host = urlparse(url).netloc
+        with self._host_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.Semaphore(self.per_host_limit)
+        with slot:
+            yield
+
+    def _read_body(self, response) -> Optional[bytes]:
+        """流式读取响应体，超过限制时返回 None"""
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            size += len(chunk)
+            if size > self.max_content_length:
+                return None
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def _detect_encoding(self, response, body: bytes) -> str:
+        """响应头声明了字符集时使用声明的编码，否则与 response.apparent_encoding 一样按内容检测"""
+        if 'charset' in response.headers.get('content-type', '').lower():
+            return response.encoding
+        return chardet.detect(body)['encoding'] or 'utf-8'
+
+    def _get_page(self, url: str) -> Dict[str, Any]:
+        """GET 请求网页，启用缓存时进行条件请求"""
+        key = f"page:{url}"
+        cached = self.cache.get(key) if self.cache else None
+        headers = self.headers
+        if cached:
+            headers = headers.copy()
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        with self._host_slot(url):
+            with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                if cached and response.status_code == 304:
+                    self.logger.info(f"缓存未修改: {url}")
+                    return {**cached, 'body': base64.b64decode(cached['body']), 'from_cache': True}
+
+                # 检查内容长度
+                content_length = response.headers.get('content-length')
+                if content_length and int(content_length) > self.max_content_length:
+                    raise ValueError(f"内容太大 ({content_length} bytes)，超过限制 ({self.max_content_length} bytes)")
+
+                response.raise_for_status()
+                body = self._read_body(response)
+                if body is None:
+                    raise ValueError(f"内容太大，超过限制 ({self.max_content_length} bytes)")
+
+                page = {
+                    'status_code': response.status_code,
+                    'headers': dict(response.headers),
+                    'content_type': response.headers.get('content-type', ''),
+                    'encoding': self._detect_encoding(response, body),
+                    'etag': response.headers.get('etag'),
+                    'last_modified': response.headers.get('last-modified'),
+                }
+
+        if self.cache and (page['etag'] or page['last_modified']):
+            # 缓存原始字节和首次请求时确定的编码，命中时与新请求按同样的方式解码
+            self.cache.set(key, {**page, 'body': base64.b64encode(body).decode('ascii')})
+        return {**page, 'body': body, 'from_cache': False}
+
     def _fetch_webpage(self, url: str, extract_text: bool) -> Dict[str, Any]:
         """抓取网页内容"""
         try:
-            response = requests.get(
-                url, 
-                headers=self.headers,
-                timeout=self.timeout,
-                stream=True
-            )
-            
-            # 检查内容长度
-            content_length = response.headers.get('content-length')
-            if content_length and int(content_length) > self.max_content_length:
-                return {
-                    "success": False,
-                    "error": f"内容太大 ({content_length} bytes)，超过限制 ({self.max_content_length} bytes)"
-                }
-            
-            response.raise_for_status()
-            
-            result = {
-                "success": True,
-                "url": url,
-                "status_code": response.status_code,
-                "headers": dict(response.headers),
-                "content_type": response.headers.get('content-type', ''),
-                "encoding": response.encoding
-            }
-            
-            if extract_text and 'text/html' in response.headers.get('content-type', ''):
-                try:
-                    from bs4 import BeautifulSoup
-                    soup = BeautifulSoup(response.content, 'html.parser')
-                    
-                    # 移除script和style标签
-                    for script in soup(["script", "style"]):
-                        script.decompose()
-                    
-                    result["text"] = soup.get_text(separator=' ', strip=True)
-                    result["title"] = soup.title.string if soup.title else ""
-                    
-                except ImportError:
-                    result["text"] = response.text
-                    result["raw_html"] = response.text[:2000] + "..." if len(response.text) > 2000 else response.text
-            else:
-                result["content"] = response.text[:2000] + "..." if len(response.text) > 2000 else response.text
-            
-            return result
-            
+            page = self._get_page(url)
         except Exception as e:
             self.logger.error(f"抓取网页失败 {url}: {e}")
             return {
@@ -150,6 +245,40 @@ class WebToolsPlugin(TaskPlugin):
                 "url": url,
                 "error": str(e)
             }
+
+        content_type = page['content_type']
+        body = page['body']
+        result = {
+            "success": True,
+            "url": url,
+            "status_code": page['status_code'],
+            "headers": page['headers'],
+            "content_type": content_type,
+            "encoding": page['encoding']
+        }
+        if page['from_cache']:
+            result["from_cache"] = True
+
+        text = body.decode(page['encoding'], errors='replace')
+        if extract_text and 'text/html' in content_type:
+            try:
+                from bs4 import BeautifulSoup
+                soup = BeautifulSoup(body, HTML_PARSER)
+                
+                # 移除script和style标签
+                for script in soup(["script", "style"]):
+                    script.decompose()
+                
+                result["text"] = soup.get_text(separator=' ', strip=True)
+                result["title"] = soup.title.string if soup.title else ""
+                
+            except ImportError:
+                result["text"] = text
+                result["raw_html"] = text[:2000] + "..." if len(text) > 2000 else text
+        else:
+            result["content"] = text[:2000] + "..." if len(text) > 2000 else text
+        
+        return result
     
     def _analyze_url(self, url: str) -> Dict[str, str]:
         """分析URL结构"""
@@ -186,7 +315,8 @@ class WebToolsPlugin(TaskPlugin):
             if json_data:
                 kwargs['json'] = json_data
             
-            response = requests.request(method.upper(), url, **kwargs)
+            with self._host_slot(url):
+                response = self.session.request(method.upper(), url, **kwargs)
             
             return {
                 "success": True,
@@ -206,7 +336,8 @@ class WebToolsPlugin(TaskPlugin):
     def _check_url_status(self, url: str) -> Dict[str, Any]:
         """检查URL状态"""
         try:
-            response = requests.head(url, headers=self.headers, timeout=self.timeout)
+            with self._host_slot(url):
+                response = self.session.head(url, headers=self.headers, timeout=self.timeout)
             return {
                 "accessible": True,
                 "status_code": response.status_code,
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Task 创建吞吐量基准测试
+
+对比每次新建 Task 与通过 TaskPool 复用 Task 的每秒任务数（单进程）。
+
+用法:
+    python tests/benchmarks/bench_task_pool.py [-n 200] [--role aipy]
+"""
+
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+from dynaconf import Dynaconf
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from aipyapp.aipy.taskmgr import TaskManager
+from aipyapp.aipy.task import Task
+from aipyapp.aipy.task_pool import TaskPool
+from aipyapp.display import DisplayManager
+
+def create_manager(workdir: Path, role: str) -> TaskManager:
+    settings = Dynaconf(settings_files=[])
+    settings.update({
+        'workdir': str(workdir),
+        'role': role,
+        'enable_replay_recording': True,
+        'llm': {
+            'bench': {'type': 'openai', 'api_key': 'sk-bench', 'model': 'gpt-4o', 'enable': True}
+        },
+    })
+    settings.gui = False
+    display_manager = DisplayManager({'style': 'agent', 'quiet': True})
+    return TaskManager(settings, display_manager=display_manager)
+
+def bench_fresh(manager: TaskManager, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        Task(manager.task_context)
+    return count / (time.perf_counter() - start)
+
+def bench_pool(manager: TaskManager, count: int) -> float:
+    pool = TaskPool(manager.task_context, size=4)
+    pool.prewarm()
+    start = time.perf_counter()
+    for _ in range(count):
+        task = pool.acquire()
+        pool.release(task)
+    return count / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Task creation benchmark")
+    parser.add_argument('-n', '--count', type=int, default=200, help="Number of tasks to create")
+    parser.add_argument('--role', default='aipy', help="Role to use")
+    args = parser.parse_args()
+    logger.remove()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = create_manager(Path(tmp), args.role)
+        # 预热：加载模块并构建首个角色的函数模式
+        Task(manager.task_context)
+
+        fresh = bench_fresh(manager, args.count)
+        pooled = bench_pool(manager, args.count)
+
+    print(f"Tasks: {args.count}, role: {args.role}")
+    print(f"new Task():          {fresh:10.1f} tasks/s")
+    print(f"TaskPool acquire:    {pooled:10.1f} tasks/s")
+    print(f"Speedup:             {pooled / fresh:10.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the code block execution cache
+"""
+
+import pytest
+
+from aipyapp.aipy.blocks import CodeBlock
+from aipyapp.aipy.block_cache import BlockCache
+from aipyapp.aipy.cache import KVCache
+from aipyapp.aipy.task import Task
+from aipyapp.exec import BlockExecutor
+
+from .test_python_executor import Runtime
+
+
+class Env:
+    """通过 Task.run_code_block 执行代码块，只初始化执行代码块用到的属性"""
+    def __init__(self, cwd, default=True, persistent=False):
+        self.cwd = cwd
+        self.runtime = Runtime()
+        self.runtime.persistent_namespace = persistent
+        task = Task.__new__(Task)
+        super(Task, task).__init__()
+        task.cwd = cwd
+        task.event_recorder = None
+        task.runtime = self.runtime
+        task.runner = BlockExecutor()
+        task.runner.set_python_runtime(self.runtime)
+        task.block_cache = BlockCache(KVCache(str(cwd / 'cache.db')), default=default)
+        self.task = task
+        self.hits = 0
+        task.on_event('exec_result', self.on_exec_result)
+
+    def on_exec_result(self, event):
+        if event.data.get('cached'):
+            self.hits += 1
+
+    def run(self, code, **kwargs):
+        block = CodeBlock(name='main', version=1, lang='python', code=code, **kwargs)
+        return self.task.run_code_block(block)
+
+
+@pytest.fixture
+def env(temp_dir, monkeypatch):
+    monkeypatch.chdir(temp_dir)
+    return Env(temp_dir)
+
+
+class TestBlockCache:
+    """测试代码块执行缓存"""
+
+    @pytest.mark.unit
+    def test_input_file_change_invalidates(self, env):
+        """测试引用的输入文件内容变化后重新执行"""
+        data = env.cwd / 'data.csv'
+        data.write_text('a\n1\n2\n')
+        code = f"print(len(open(r'{data}').read().splitlines()))"
+
+        assert env.run(code) == {'stdout': '3'}
+        assert env.run(code) == {'stdout': '3'}
+        assert env.hits == 1
+
+        data.write_text('a\n1\n')
+        assert env.run(code) == {'stdout': '2'}
+        assert env.hits == 1
+
+    @pytest.mark.unit
+    def test_state_deps_and_replay(self, env):
+        """测试读取的会话状态变化后重新执行，命中时恢复写入的状态"""
+        code = ("from aipyapp import utils\n"
+                "x = utils.get_persistent_state('x')\n"
+                "utils.set_persistent_state(y=x * 2)\n"
+                "utils.set_state(success=True, x=x)")
+        env.runtime.session['x'] = 1
+        first = env.run(code)
+        env.runtime.session.pop('y')
+
+        assert env.run(code) == first
+        assert env.hits == 1
+        assert env.runtime.session['y'] == 2
+        assert env.runtime.current_state == {'success': True, 'x': 1}
+
+        env.runtime.session['x'] = 5
+        env.run(code)
+        assert env.hits == 1
+        assert env.runtime.session['y'] == 10
+
+    @pytest.mark.unit
+    def test_uncacheable_results(self, env):
+        """测试失败、写文件和显式关闭缓存的代码块不缓存"""
+        env.run("raise ValueError('x')")
+        env.run("raise ValueError('x')")
+        env.run("open('out.txt', 'w').write('x')")
+        env.run("open('out.txt', 'w').write('x')")
+        env.run("print(1)", cache=False)
+        env.run("print(1)", cache=False)
+
+        assert env.hits == 0
+
+    @pytest.mark.unit
+    def test_persistent_namespace_not_cached(self, temp_dir, monkeypatch):
+        """测试共享命名空间时 Python 代码块不缓存，重复执行的代码块仍然定义变量"""
+        monkeypatch.chdir(temp_dir)
+        env = Env(temp_dir, persistent=True)
+        env.run("x = 1")
+        code = "x = x + 1\nprint(x)"
+
+        assert env.run(code) == {'stdout': '2'}
+        assert env.run(code) == {'stdout': '3'}
+        assert env.hits == 0
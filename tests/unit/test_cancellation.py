@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for cancelling running blocks, LLM streams and scopes
+"""
+
+import sys
+import time
+import subprocess
+import threading
+from unittest.mock import Mock
+
+import psutil
+import pytest
+
+from aipyapp.aipy.blocks import CodeBlock
+from aipyapp.aipy.llm import StreamProcessor
+from aipyapp.exec import BlockExecutor
+from aipyapp.interface import Stoppable
+from aipyapp.llm.base import BaseClient, ChatMessage
+
+from .test_python_executor import Runtime
+
+
+def cancel_later(executor, delay=0.2):
+    timer = threading.Timer(delay, executor.cancel)
+    timer.start()
+    return timer
+
+
+class FakeStreamClient(BaseClient):
+    """每 0.05 秒返回一行的流式客户端"""
+    def get_completion(self, messages):
+        def stream():
+            for i in range(100):
+                time.sleep(0.05)
+                yield f"line {i}\n"
+        return stream()
+
+    def _parse_usage(self, response):
+        return {}
+
+    def _parse_response(self, response):
+        return None
+
+    def _parse_stream_response(self, response, stream_processor):
+        with stream_processor as lm:
+            for chunk in response:
+                lm.process_chunk(chunk)
+        return ChatMessage(role='assistant', content=lm.content)
+
+
+class TestStoppable:
+    """测试取消回调"""
+
+    @pytest.mark.unit
+    def test_cancel_scope(self):
+        """测试 stop() 调用当前注册的回调，已停止时进入即调用"""
+        stoppable = Stoppable()
+        calls = []
+        with stoppable.cancel_scope(lambda: calls.append('first')):
+            stoppable.stop()
+        assert calls == ['first']
+
+        with stoppable.cancel_scope(lambda: calls.append('second')):
+            pass
+        assert calls == ['first', 'second']
+
+        stoppable.reset()
+        stoppable.stop()
+        assert calls == ['first', 'second']
+
+
+class TestBlockCancellation:
+    """测试取消正在执行的代码块"""
+
+    @pytest.mark.unit
+    def test_cancel_python_block(self):
+        """测试取消进程内死循环，即使代码捕获了 Exception"""
+        executor = BlockExecutor()
+        executor.set_python_runtime(Runtime())
+        code = "while True:\n    try:\n        sum(range(1000))\n    except Exception:\n        pass"
+        cancel_later(executor)
+
+        start = time.time()
+        result = executor(CodeBlock(name='loop', version=1, lang='python', code=code))
+        assert time.time() - start < 5
+        assert result['errstr'] == 'Execution cancelled'
+        assert executor.last_usage['cancelled'] is True
+
+        # 取消后执行器仍然可用
+        assert executor(CodeBlock(name='ok', version=1, lang='python', code='print(1)')) == {'stdout': '1'}
+
+    @pytest.mark.unit
+    @pytest.mark.skipif(sys.platform == 'win32', reason='requires bash and process groups')
+    def test_cancel_kills_process_group(self, temp_dir):
+        """测试取消时终止子进程及其后台进程"""
+        pid_file = temp_dir / 'bg.pid'
+        block = CodeBlock(name='bg', version=1, lang='bash', path=str(temp_dir / 'bg.sh'),
+                          code=f'sleep 30 &\necho $! > {pid_file}\nwait')
+        block.save()
+        executor = BlockExecutor()
+        cancel_later(executor, 0.5)
+
+        start = time.time()
+        result = executor(block)
+        assert time.time() - start < 5
+        assert result['errstr'] == 'Execution cancelled'
+
+        pid = int(pid_file.read_text())
+        time.sleep(0.1)
+        assert not psutil.pid_exists(pid) or psutil.Process(pid).status() == psutil.STATUS_ZOMBIE
+
+    @pytest.mark.unit
+    @pytest.mark.skipif(sys.platform == 'win32', reason='requires sleep')
+    def test_cancel_spares_other_blocks(self):
+        """测试取消一个代码块时不终止其它线程启动的子进程"""
+        others = []
+        # 代码块执行期间由其它线程（如另一个任务）启动的进程
+        timer = threading.Timer(0.2, lambda: others.append(subprocess.Popen(['sleep', '30'])))
+        timer.start()
+        executor = BlockExecutor()
+        executor.set_python_runtime(Runtime())
+        code = "import subprocess\nsubprocess.run(['sleep', '30'])"
+        cancel_later(executor, 0.5)
+        try:
+            result = executor(CodeBlock(name='sleep', version=1, lang='python', code=code))
+            assert result['errstr'] == 'Execution cancelled'
+            assert executor.last_usage['children'] == 1
+            assert others[0].poll() is None
+        finally:
+            timer.join()
+            for other in others:
+                other.kill()
+                other.wait()
+
+
+class TestStreamCancellation:
+    """测试取消 LLM 流式响应"""
+
+    @pytest.mark.unit
+    def test_cancel_stream(self):
+        """测试取消后停止读取流，并且不完整的回复不加入历史"""
+        client = FakeStreamClient({'name': 'fake', 'model': 'fake'})
+        history = Mock()
+        history.__bool__ = Mock(return_value=True)
+        processor = StreamProcessor(Mock(), 'fake')
+        threading.Timer(0.2, processor.cancel).start()
+
+        start = time.time()
+        msg = client(history, 'hello', stream_processor=processor)
+        assert time.time() - start < 2
+        assert msg.role == 'error'
+        history.add_message.assert_not_called()
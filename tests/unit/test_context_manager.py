@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for context compression
+"""
+
+import pytest
+from PIL import Image
+
+from aipyapp.aipy.context_manager import ContextConfig, ContextManager, ContextStrategy, MessageCompressor
+from aipyapp.aipy.multimodal import MMContent
+from aipyapp.llm import ChatMessage
+
+
+def tool_call_messages():
+    """较早一轮的工具调用、一条用户消息和最近一轮的工具调用"""
+    return [
+        {'role': 'system', 'content': 'system'},
+        {'role': 'user', 'content': 'first ' * 50},
+        {'role': 'assistant', 'content': '', 'tool_calls': [{'id': 'c1', 'name': 'search', 'arguments': {}}]},
+        {'role': 'tool', 'tool_call_id': 'c1', 'content': 'result one ' * 50},
+        {'role': 'user', 'content': 'second'},
+        {'role': 'assistant', 'content': '', 'tool_calls': [{'id': 'c2', 'name': 'read', 'arguments': {}}]},
+        {'role': 'tool', 'tool_call_id': 'c2', 'content': 'result two'},
+    ]
+
+
+def assert_paired(messages):
+    """每条 tool 消息前面都有对应的调用，每个调用都有对应的 tool 消息"""
+    pending = set()
+    for msg in messages:
+        if msg['role'] == 'tool':
+            assert msg['tool_call_id'] in pending
+            pending.discard(msg['tool_call_id'])
+        else:
+            assert not pending
+            pending = {call['id'] for call in msg.get('tool_calls') or []}
+    assert not pending
+
+
+class TestToolCallCompression:
+    """测试压缩时工具调用消息和工具结果一起保留或丢弃"""
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize('strategy', [s for s in ContextStrategy])
+    def test_no_orphan_tool_messages(self, strategy):
+        """测试各压缩策略的结果中没有孤立的 tool 消息"""
+        messages = tool_call_messages()
+        compressor = MessageCompressor(ContextConfig(max_tokens=150, preserve_recent=2, strategy=strategy))
+        total = sum(compressor._estimate_message_tokens(msg) for msg in messages)
+
+        compressed, _ = compressor.compress_messages(messages, total)
+        assert len(compressed) < len(messages)
+        assert_paired(compressed)
+
+    @pytest.mark.unit
+    def test_sliding_window_keeps_unit(self):
+        """测试滑动窗口不会从工具调用单元中间截断"""
+        compressor = MessageCompressor(ContextConfig(max_tokens=150, preserve_recent=2,
+                                                     strategy=ContextStrategy.SLIDING_WINDOW))
+        compressed, _ = compressor.compress_messages(tool_call_messages(), 1000)
+        assert [msg['role'] for msg in compressed] == ['system', 'user', 'assistant', 'tool']
+
+
+def image_types(messages):
+    """每条用户消息中各项的类型"""
+    return [[item['type'] for item in msg['content']] for msg in messages
+            if msg['role'] == 'user' and isinstance(msg['content'], list)]
+
+
+class TestImageDedup:
+    """测试重复图片只和压缩后仍在上下文中的图片去重"""
+
+    @pytest.mark.unit
+    def test_reattach_after_compression(self, temp_dir):
+        """测试之前的图片被压缩掉后，再次引用会重新发送完整图片"""
+        path = temp_dir / 'img.png'
+        Image.new('RGB', (64, 64), (255, 0, 0)).save(path, format='PNG')
+        manager = ContextManager(ContextConfig(max_tokens=300, preserve_recent=1, auto_compress=False,
+                                               strategy=ContextStrategy.SLIDING_WINDOW))
+        manager.add_message(ChatMessage(role='system', content='system'))
+
+        manager.add_message(ChatMessage(role='user', content=MMContent(f'look @{path}').content))
+        manager.add_message(ChatMessage(role='assistant', content='a red square'))
+        manager.add_message(ChatMessage(role='user', content=MMContent(f'again @{path}').content))
+        assert image_types(manager.get_messages()) == [['text', 'image_url'], ['text', 'text']]
+        assert image_types(manager.get_messages()[:2]) == [['text', 'image_url']]
+
+        for i in range(4):
+            manager.add_message(ChatMessage(role='assistant', content=f'reply {i} ' * 100))
+            manager.add_message(ChatMessage(role='user', content=f'question {i} ' * 100))
+        manager.add_message(ChatMessage(role='user', content=MMContent(f'once more @{path}').content))
+        messages = manager.get_messages(force_compress=True)
+        assert image_types(messages) == [['text', 'image_url']]
+        # 保存的历史不受影响
+        assert image_types([msg.to_message() for msg in manager.chat_history.messages]) == \
+            [['text', 'image_url'], ['text', 'image_url'], ['text', 'image_url']]
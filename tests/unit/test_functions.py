@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for FunctionManager schema registry and fast-path validation
+"""
+
+from typing import List
+
+import pytest
+
+from aipyapp.aipy.functions import FunctionManager, ParameterValidationError, get_function_schema
+
+
+class Calculator:
+    def fn_scale(self, value: float, factor: int = 2, label: str = 'x') -> str:
+        return f"{label}={value * factor}"
+
+    def fn_total(self, values: List[int]) -> int:
+        return sum(values)
+
+
+class TestFunctionSchemaRegistry:
+    """测试进程级函数模式缓存"""
+
+    @pytest.mark.unit
+    def test_schema_shared_between_instances(self):
+        """测试不同实例的同一方法复用同一份模式"""
+        first = get_function_schema(Calculator().fn_scale, 'scale')
+        second = get_function_schema(Calculator().fn_scale, 'scale')
+
+        assert first is second
+        assert first['fast_params'] == (('value', float, True), ('factor', int, False), ('label', str, False))
+        assert get_function_schema(Calculator().fn_total, 'total')['fast_params'] is None
+
+    @pytest.mark.unit
+    def test_register_uses_registry(self):
+        """测试注册函数时不重复创建参数模型"""
+        fm1, fm2 = FunctionManager(), FunctionManager()
+        fm1.register_function(Calculator().fn_scale, 'scale')
+        fm2.register_function(Calculator().fn_scale, 'scale')
+
+        assert fm1.function_registry['scale']['param_model'] is fm2.function_registry['scale']['param_model']
+
+
+class TestFunctionCall:
+    """测试函数调用参数校验"""
+
+    @pytest.mark.unit
+    def test_fast_path(self):
+        """测试简单标量参数走快速路径"""
+        fm = FunctionManager()
+        fm.register_function(Calculator().fn_scale, 'scale')
+
+        assert fm.call('scale', value=3) == 'x=6.0'
+        assert fm.call('scale', value=1.5, factor=3, label='y', extra=1) == 'y=4.5'
+
+    @pytest.mark.unit
+    def test_fallback_to_pydantic(self):
+        """测试需要转换或校验失败时回退到 pydantic"""
+        fm = FunctionManager()
+        fm.register_function(Calculator().fn_scale, 'scale')
+        fm.register_function(Calculator().fn_total, 'total')
+
+        assert fm.call('scale', value='2', factor='4') == 'x=8.0'
+        assert fm.call('total', values=[1, '2']) == 3
+        with pytest.raises(ParameterValidationError):
+            fm.call('scale', factor=1)
+        with pytest.raises(ParameterValidationError):
+            fm.call('scale', value='abc')
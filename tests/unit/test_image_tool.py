@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the image_tool plugin
+"""
+
+import io
+import base64
+from unittest.mock import Mock
+
+import pytest
+from PIL import Image
+
+from aipyapp.aipy.cache import KVCache
+from aipyapp.plugins.p_image_tool import ImageToolPlugin
+
+
+def make_plugin(temp_dir, **config):
+    plugin = ImageToolPlugin({'api_key': 'sk-test', **config})
+    plugin.init()
+    plugin.cache = KVCache(str(temp_dir / 'cache.db'))
+    response = Mock()
+    response.choices = [Mock(message=Mock(content='a red square'))]
+    plugin.client = Mock()
+    plugin.client.chat.completions.create = Mock(return_value=response)
+    return plugin
+
+
+def make_image(path, size=(4000, 3000)):
+    Image.new('RGB', size, (255, 0, 0)).save(path, format='PNG')
+    return str(path)
+
+
+class TestImageTool:
+    """测试图片识别插件"""
+
+    @pytest.mark.unit
+    def test_downscale_before_encoding(self, temp_dir):
+        """测试大图在编码前被缩小"""
+        plugin = make_plugin(temp_dir)
+
+        def encode(path):
+            image_bytes, mime_type = plugin._read_image(path)
+            return plugin._encode_image(path, image_bytes, mime_type, path)
+
+        data_url = encode(make_image(temp_dir / 'big.png'))
+        assert data_url.startswith('data:image/jpeg;base64,')
+        with Image.open(io.BytesIO(base64.b64decode(data_url.split(',', 1)[1]))) as img:
+            assert max(img.size) <= 2048 and min(img.size) <= 768
+
+        path = make_image(temp_dir / 'small.png', (100, 100))
+        small = open(path, 'rb').read()
+        data_url = encode(path)
+        assert data_url == 'data:image/png;base64,' + base64.b64encode(small).decode()
+
+    @pytest.mark.unit
+    def test_result_cache(self, temp_dir):
+        """测试相同图片和提示词命中缓存"""
+        plugin = make_plugin(temp_dir)
+        path = make_image(temp_dir / 'img.png', (200, 100))
+
+        assert plugin.fn_recognize_image(path) == 'a red square'
+        assert plugin.fn_recognize_image(path) == 'a red square'
+        plugin.fn_analyze_image(path, 'text')
+
+        assert plugin.client.chat.completions.create.call_count == 2
+
+    @pytest.mark.unit
+    def test_cache_hit_skips_encoding(self, temp_dir):
+        """测试命中结果缓存时不再缩放编码"""
+        plugin = make_plugin(temp_dir)
+        path = make_image(temp_dir / 'img.png', (200, 100))
+        plugin.fn_recognize_image(path)
+
+        plugin._encoded.clear()
+        plugin._encode_image = Mock(side_effect=AssertionError('encoded on cache hit'))
+        assert plugin.fn_recognize_image(path) == 'a red square'
+        assert plugin.client.chat.completions.create.call_count == 1
+
+    @pytest.mark.unit
+    def test_remote_cache_keyed_by_content(self, temp_dir, monkeypatch):
+        """测试远程图片按内容索引缓存，URL 不变内容更新时重新识别"""
+        plugin = make_plugin(temp_dir)
+        images = [make_image(temp_dir / f'remote{i}.png', (60 + i, 60)) for i in range(2)]
+        current = [images[0]]
+
+        def get(url, timeout):
+            response = Mock(headers={'content-type': 'image/png'})
+            response.content = open(current[0], 'rb').read()
+            return response
+        monkeypatch.setattr('aipyapp.plugins.p_image_tool.requests.get', get)
+
+        url = 'https://example.com/latest.png'
+        plugin.fn_recognize_image(url)
+        plugin.fn_recognize_image(url)
+        assert plugin.client.chat.completions.create.call_count == 1
+
+        current[0] = images[1]
+        plugin.fn_recognize_image(url)
+        assert plugin.client.chat.completions.create.call_count == 2
+        content = plugin.client.chat.completions.create.call_args.kwargs['messages'][0]['content']
+        assert content[1]['image_url']['url'].startswith('data:image/png;base64,')
+
+    @pytest.mark.unit
+    def test_recognize_images_batch(self, temp_dir):
+        """测试批量识别保持顺序并单独返回错误"""
+        plugin = make_plugin(temp_dir, cache=False)
+        plugin.cache = None
+        paths = [make_image(temp_dir / f'img{i}.png', (50 + i, 50)) for i in range(3)]
+        sources = paths + [str(temp_dir / 'missing.png')]
+
+        results = plugin.fn_recognize_images(sources)
+        assert [r['image_source'] for r in results] == sources
+        assert [r['success'] for r in results] == [True, True, True, False]
+        assert results[0]['result'] == 'a red square'
+        assert plugin.client.chat.completions.create.call_count == 3
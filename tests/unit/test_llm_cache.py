@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the LLM response cache
+"""
+
+from unittest.mock import Mock
+
+import pytest
+
+from aipyapp.aipy.cache import KVCache
+from aipyapp.aipy.llm import StreamProcessor
+from aipyapp.aipy.llm_cache import ResponseCache
+from aipyapp.llm.base import BaseClient, ChatMessage
+
+
+class FakeClient(BaseClient):
+    """按行流式返回固定回复并记录请求次数"""
+    def get_completion(self, messages):
+        self.calls = getattr(self, 'calls', 0) + 1
+        return iter(['hello\n', f'call {self.calls}\n'])
+
+    def _parse_usage(self, response):
+        return {}
+
+    def _parse_response(self, response):
+        return None
+
+    def _parse_stream_response(self, response, stream_processor):
+        with stream_processor as lm:
+            for chunk in response:
+                lm.process_chunk(chunk)
+        return ChatMessage(role='assistant', content=lm.content, usage={'total_tokens': 10})
+
+
+class FakeHistory:
+    def __init__(self):
+        self.messages = []
+
+    def __bool__(self):
+        return bool(self.messages)
+
+    def add(self, role, content):
+        self.messages.append({'role': role, 'content': content})
+
+    def add_message(self, msg):
+        self.messages.append({'role': msg.role, 'content': msg.content})
+
+    def get_messages(self):
+        return list(self.messages)
+
+
+@pytest.fixture
+def make_client(temp_dir):
+    def make(mode, **kwargs):
+        client = FakeClient({'name': 'fake', 'model': 'fake'})
+        client.response_cache = ResponseCache(KVCache(str(temp_dir / 'llm_cache.db')), mode, **kwargs)
+        return client
+    return make
+
+
+def ask(client, prompt):
+    task = Mock()
+    msg = client(FakeHistory(), prompt, system_prompt='system', stream_processor=StreamProcessor(task, 'fake'))
+    lines = [line for call in task.emit.call_args_list if call.args[0] == 'stream' for line in call.kwargs['lines']]
+    return msg, lines
+
+
+class TestResponseCache:
+    """测试 LLM 回复缓存"""
+
+    @pytest.mark.unit
+    def test_read_through(self, make_client):
+        """测试命中时不请求 LLM，并通过 StreamProcessor 重放回复"""
+        client = make_client('read')
+        msg, _ = ask(client, 'Today is 2025-01-01')
+        assert client.calls == 1
+        assert not msg.usage.get('cached')
+
+        msg, lines = ask(client, 'Today is 2025-02-03')
+        assert client.calls == 1
+        assert msg.content == 'hello\ncall 1'
+        assert msg.usage['total_tokens'] == 10
+        assert msg.usage['cached'] == 1
+        assert lines == ['hello', 'call 1']
+
+        ask(client, 'another prompt')
+        assert client.calls == 2
+
+    @pytest.mark.unit
+    def test_record_and_replay(self, make_client):
+        """测试 record 总是请求 LLM，replay 只使用缓存且未命中时返回错误"""
+        recorder = make_client('record')
+        ask(recorder, 'hi')
+        ask(recorder, 'hi')
+        assert recorder.calls == 2
+
+        player = make_client('replay')
+        msg, _ = ask(player, 'hi')
+        assert msg.content == 'hello\ncall 2'
+        assert not hasattr(player, 'calls')
+
+        msg, _ = ask(player, 'unknown')
+        assert msg.role == 'error'
+        assert not hasattr(player, 'calls')
+
+    @pytest.mark.unit
+    def test_fingerprint(self, make_client):
+        """测试温度等参数参与缓存键"""
+        client = make_client('read')
+        fingerprint = client.get_fingerprint([{'role': 'user', 'content': 'hi'}])
+        key = client.response_cache.make_key(fingerprint)
+        assert key == client.response_cache.make_key(dict(fingerprint))
+        assert key != client.response_cache.make_key(dict(fingerprint, temperature=0.9))
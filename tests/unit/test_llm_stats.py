@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for LLM latency instrumentation
+"""
+
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from aipyapp.aipy.context_manager import ChatHistory
+from aipyapp.aipy.llm import StreamProcessor
+from aipyapp.llm.base import BaseClient, ChatMessage
+
+
+class SlowClient(BaseClient):
+    """0.1 秒后开始输出思考内容，再过 0.1 秒输出正文"""
+    def get_completion(self, messages):
+        if self.config.get('fail'):
+            raise RuntimeError('boom')
+        return iter([('thinking\n', True), ('answer\n', False), ('done\n', False)])
+
+    def _parse_usage(self, response):
+        return {}
+
+    def _parse_response(self, response):
+        return None
+
+    def _parse_stream_response(self, response, stream_processor):
+        with stream_processor as lm:
+            for chunk, reason in response:
+                time.sleep(0.1)
+                lm.process_chunk(chunk, reason=reason)
+        return ChatMessage(role='assistant', content=lm.content, reason=lm.reason,
+                           usage={'output_tokens': 20, 'total_tokens': 30})
+
+
+class TestLatencyStats:
+    """测试首 token 时间和输出速度统计"""
+
+    @pytest.mark.unit
+    def test_stream_timing(self):
+        """测试流式回复记录首 token 时间、思考/正文时间和输出速度，并按客户端累计"""
+        client = SlowClient({'name': 'slow', 'model': 'slow'})
+        history = ChatHistory()
+        msg = client(history, 'hi', stream_processor=StreamProcessor(Mock(), 'slow'))
+
+        usage = msg.usage
+        assert usage['ttfb'] < 0.05
+        assert 0.1 <= usage['ttft'] < 0.2
+        assert 0.1 <= usage['reason_time'] < 0.2
+        assert 0.1 <= usage['content_time'] < 0.2
+        assert 70 < usage['tps'] < 110
+
+        summary = history.get_summary()
+        assert summary['ttft'] == usage['ttft']
+        assert summary['tps'] == pytest.approx(20 / usage['gen_time'])
+
+        stats = client.stats.to_dict()
+        assert stats['requests'] == 1
+        assert stats['avg_ttft'] == usage['ttft']
+
+    @pytest.mark.unit
+    def test_error_counted(self):
+        """测试失败的请求计入错误数"""
+        client = SlowClient({'name': 'slow', 'model': 'slow', 'fail': True})
+        msg = client(ChatHistory(), 'hi', stream_processor=StreamProcessor(Mock(), 'slow'))
+        assert msg.role == 'error'
+        assert client.stats.to_dict()['errors'] == 1
+        assert client.stats.to_dict()['avg_ttft'] is None
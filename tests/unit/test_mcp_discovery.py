@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for parallel MCP server discovery
+"""
+
+import sys
+import json
+import threading
+
+import psutil
+import pytest
+
+from aipyapp.aipy import cache
+from aipyapp.aipy.cache import KVCache
+from aipyapp.aipy.mcp_tool import MCPToolManager
+
+# 最小的 stdio MCP 服务器：argv[1] 不为空时等到该文件存在后才启动，argv[2] 为 changed 时在首次列出工具后
+# 新增一个工具并发送通知，调用工具时返回服务器进程号
+SERVER = r'''
+import os
+import sys
+import time
+import asyncio
+import mcp.types as types
+from mcp.server.lowlevel import Server, NotificationOptions
+from mcp.server.stdio import stdio_server
+
+gate, changed = sys.argv[1], sys.argv[2] == 'changed'
+while gate and not os.path.exists(gate):
+    time.sleep(0.05)
+server = Server('test')
+names = ['first']
+tasks = []
+
+async def add_tool(session):
+    names.append('second')
+    await session.send_tool_list_changed()
+
+@server.list_tools()
+async def list_tools():
+    if changed and len(names) == 1 and not tasks:
+        tasks.append(asyncio.create_task(add_tool(server.request_context.session)))
+    return [types.Tool(name=name, description=name, inputSchema={'type': 'object'}) for name in names]
+
+@server.call_tool()
+async def call_tool(name, arguments):
+    return [types.TextContent(type='text', text=str(os.getpid()))]
+
+async def main():
+    async with stdio_server() as (read, write):
+        options = server.create_initialization_options(NotificationOptions(tools_changed=changed))
+        await server.run(read, write, options)
+
+asyncio.run(main())
+'''
+
+
+@pytest.fixture
+def make_manager(temp_dir, monkeypatch):
+    monkeypatch.setattr(cache, '_default_cache', KVCache(str(temp_dir / 'cache.db')))
+    script = temp_dir / 'server.py'
+    script.write_text(SERVER, encoding='utf-8')
+    managers = []
+
+    def make(servers, **kwargs):
+        config = {name: {'command': sys.executable, 'args': [str(script), *args]} for name, args in servers.items()}
+        config_file = temp_dir / 'mcp.json'
+        config_file.write_text(json.dumps({'mcpServers': config}), encoding='utf-8')
+        manager = MCPToolManager(str(config_file), None, **kwargs)
+        managers.append(manager)
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.discovery.close()
+        manager.sessions.close()
+
+
+class Loaded:
+    """包装工具列表回调，每次回调后唤醒等待的线程"""
+    def __init__(self, manager):
+        self.on_tools = manager.discovery.on_tools
+        self.cond = threading.Condition()
+        manager.discovery.on_tools = self
+
+    def __call__(self, name, tools, error=None):
+        self.on_tools(name, tools, error)
+        with self.cond:
+            self.cond.notify_all()
+
+    def wait_for(self, predicate, timeout=60):
+        with self.cond:
+            return self.cond.wait_for(predicate, timeout)
+
+
+class TestMCPDiscovery:
+    """测试 MCP 服务器并发加载"""
+
+    @pytest.mark.unit
+    def test_partial_results_while_slow_server_loads(self, make_manager, temp_dir):
+        """测试慢服务器不阻塞快服务器，加载完成后工具自动可用"""
+        gate = temp_dir / 'slow.gate'
+        manager = make_manager({'fast': ['', 'static'], 'slow': [str(gate), 'static']}, wait_timeout=0)
+        loaded = Loaded(manager)
+        manager.list_tools(force_load=True)
+        assert loaded.wait_for(lambda: 'fast' in manager._tools_dict)
+
+        # 慢服务器在断言之后才放行
+        assert [tool['server'] for tool in manager.list_tools(force_load=True)] == ['fast']
+        assert manager.loading_servers == {'slow'}
+
+        gate.touch()
+        assert loaded.wait_for(lambda: not manager.loading_servers)
+        assert sorted(tool['server'] for tool in manager.list_tools(force_load=True)) == ['fast', 'slow']
+
+    @pytest.mark.unit
+    def test_init_timeout(self, make_manager, temp_dir):
+        """测试单个服务器超时后返回空工具列表"""
+        manager = make_manager({'slow': [str(temp_dir / 'never.gate'), 'static']}, discovery_timeout=0.5)
+        assert manager.list_tools(force_load=True) == []
+        assert manager.loading_servers == set()
+
+    @pytest.mark.unit
+    def test_tools_list_changed(self, make_manager):
+        """测试收到 tools/list_changed 通知后刷新工具列表和缓存"""
+        manager = make_manager({'dyn': ['', 'changed']})
+        loaded = Loaded(manager)
+        assert [tool['name'] for tool in manager.list_tools(force_load=True)] == ['first']
+
+        assert loaded.wait_for(lambda: len(manager._tools_dict['dyn']) == 2)
+        tools = manager.list_tools(force_load=True)
+        assert [tool['name'] for tool in tools] == ['first', 'second']
+        key = manager._cache_key('dyn', manager.mcp_servers['dyn'])
+        assert [tool['name'] for tool in cache.get_cache(key)] == ['first', 'second']
+
+    @pytest.mark.unit
+    def test_discovery_and_calls_share_session(self, make_manager, temp_dir):
+        """测试获取工具列表和调用工具使用同一个会话，每个服务器只有一个进程"""
+        manager = make_manager({'dyn': ['', 'changed'], 'static': ['', 'static']})
+        loaded = Loaded(manager)
+        manager.enable_user_mcp(True)
+        manager.list_tools(force_load=True)
+        assert loaded.wait_for(lambda: len(manager._tools_dict.get('dyn', [])) == 2)
+
+        def servers(kind=None):
+            procs = []
+            for proc in psutil.Process().children(recursive=True):
+                try:
+                    cmdline = proc.cmdline()
+                    if str(temp_dir / 'server.py') in cmdline and kind in (None, cmdline[-1]):
+                        procs.append(proc)
+                except psutil.NoSuchProcess:
+                    pass
+            return procs
+        # 不支持 listChanged 的服务器获取工具列表后关闭会话，等待进程退出
+        _, alive = psutil.wait_procs(servers('static'), timeout=60)
+        assert not alive
+        pid = manager.call_tool('dyn.first', {})['content'][0]['text']
+        assert [proc.pid for proc in servers()] == [int(pid)]
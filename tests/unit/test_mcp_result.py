@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for MCP tool result size control and progress notifications
+"""
+
+import sys
+import base64
+
+import pytest
+
+from aipyapp.aipy.libmcp import MCPSessionPool
+from aipyapp.aipy.mcp_result import MCPResultProcessor
+
+# 调用 work 工具时发送两次进度通知
+SERVER = r'''
+import asyncio
+import mcp.types as types
+from mcp.server.lowlevel import Server
+from mcp.server.stdio import stdio_server
+
+server = Server('test')
+
+@server.list_tools()
+async def list_tools():
+    return [types.Tool(name='work', description='work', inputSchema={'type': 'object'})]
+
+@server.call_tool()
+async def call_tool(name, arguments):
+    ctx = server.request_context
+    token = ctx.meta.progressToken if ctx.meta else None
+    for i in (1, 2):
+        if token is not None:
+            await ctx.session.send_progress_notification(token, i, 2, f'step {i}')
+    return [types.TextContent(type='text', text='done')]
+
+async def main():
+    async with stdio_server() as (read, write):
+        await server.run(read, write, server.create_initialization_options())
+
+asyncio.run(main())
+'''
+
+
+class TestMCPResultProcessor:
+    """测试 MCP 工具调用结果压缩"""
+
+    @pytest.mark.unit
+    def test_small_result_unchanged(self, temp_dir):
+        """测试小结果保持不变，不创建文件"""
+        result = {'content': [{'type': 'text', 'text': 'hello'}], 'structuredContent': {'a': 1}, 'isError': False}
+        assert MCPResultProcessor(max_chars=100).process(result, 'files.read', temp_dir) == result
+        assert not (temp_dir / 'mcp').exists()
+
+    @pytest.mark.unit
+    def test_large_text_and_images_saved(self, temp_dir):
+        """测试超出预算的文本截断，图片保存为文件"""
+        image = b'\x89PNG\r\n\x1a\n' + b'0' * 100
+        text = 'x' * 1000
+        result = {'content': [
+            {'type': 'text', 'text': text},
+            {'type': 'image', 'data': base64.b64encode(image).decode(), 'mimeType': 'image/png'},
+            {'type': 'resource', 'resource': {'uri': 'file:///a.csv', 'mimeType': 'text/csv', 'text': 'y' * 500}},
+        ], 'isError': False}
+
+        compact = MCPResultProcessor(max_chars=300).process(result, 'web.fetch', temp_dir)
+        text_item, image_item, resource_item = compact['content']
+
+        assert text_item['text'].startswith('x' * 300 + '\n... [truncated 700 of 1000 chars, full content saved to mcp/')
+        path = text_item['text'].rsplit(' ', 1)[-1].rstrip(']')
+        assert (temp_dir / path).read_text() == text
+
+        assert 'data' not in image_item and image_item['size'] == len(image)
+        assert image_item['path'].endswith('.png')
+        assert (temp_dir / image_item['path']).read_bytes() == image
+
+        # 预算已用完，资源文本只保留路径
+        assert resource_item['resource']['text'].startswith('\n... [truncated 500 of 500 chars')
+        assert '.csv]' in resource_item['resource']['text']
+        assert result['content'][0]['text'] == text
+
+    @pytest.mark.unit
+    def test_without_artifacts(self, temp_dir):
+        """测试关闭文件保存时直接丢弃超出的内容"""
+        result = {'structuredContent': {'items': ['z' * 50] * 10},
+                  'content': [{'type': 'audio', 'data': base64.b64encode(b'abc').decode(), 'mimeType': 'audio/wav'}]}
+        compact = MCPResultProcessor(max_chars=300, artifacts=False).process(result, 'x', temp_dir)
+        assert compact['content'][0]['data'] == '[3 bytes omitted]'
+        assert compact['structuredContent']['truncated'].startswith('{"items": ["zzz')
+        assert 'saved' not in compact['structuredContent']['truncated']
+        assert not (temp_dir / 'mcp').exists()
+
+
+class TestMCPProgress:
+    """测试 MCP 工具调用进度通知"""
+
+    @pytest.mark.unit
+    def test_progress_callback(self, temp_dir):
+        """测试通过保持的会话调用工具时接收进度通知"""
+        script = temp_dir / 'server.py'
+        script.write_text(SERVER, encoding='utf-8')
+        pool = MCPSessionPool()
+        progress = []
+
+        try:
+            future = pool.call_tool('test', {'command': sys.executable, 'args': [str(script)]}, 'work', {},
+                                    progress_callback=lambda *args: progress.append(args))
+            result = future.result(timeout=60)
+        finally:
+            pool.close()
+        assert result['content'][0]['text'] == 'done'
+        assert progress == [(1, 2, 'step 1'), (2, 2, 'step 2')]
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for MCP tool index and tools prompt
+"""
+
+import sys
+import json
+from types import SimpleNamespace
+
+import anyio
+
+import pytest
+
+from aipyapp.aipy import cache
+from aipyapp.aipy.blocks import CodeBlocks
+from aipyapp.aipy.cache import KVCache
+from aipyapp.aipy.libmcp import MCPSessionPool
+from aipyapp.aipy.mcp_tool import MCPToolManager, build_function_call_tool_name
+
+# wait 工具等待指定秒数后返回服务器进程号；指定 barrier 时等到同时有 barrier 个调用到达后才返回，
+# 超时返回 timeout；指定 crash 时把进程号追加到该文件后退出服务器进程
+SERVER = r'''
+import os
+import asyncio
+import mcp.types as types
+from mcp.server.lowlevel import Server
+from mcp.server.stdio import stdio_server
+
+server = Server('test')
+arrived = []
+released = asyncio.Event()
+
+@server.list_tools()
+async def list_tools():
+    schema = {'type': 'object', 'properties': {'seconds': {'type': 'number'}}, 'required': ['seconds']}
+    return [types.Tool(name='wait', description='wait', inputSchema=schema)]
+
+@server.call_tool()
+async def call_tool(name, arguments):
+    await asyncio.sleep(arguments['seconds'])
+    if arguments.get('barrier'):
+        arrived.append(name)
+        if len(arrived) >= arguments['barrier']:
+            released.set()
+        try:
+            await asyncio.wait_for(released.wait(), 60)
+        except asyncio.TimeoutError:
+            return [types.TextContent(type='text', text='timeout')]
+    if arguments.get('crash'):
+        with open(arguments['crash'], 'a') as f:
+            f.write(f'{os.getpid()}\n')
+        os._exit(1)
+    return [types.TextContent(type='text', text=str(os.getpid()))]
+
+async def main():
+    async with stdio_server() as (read, write):
+        await server.run(read, write, server.create_initialization_options())
+
+asyncio.run(main())
+'''
+
+
+def make_tool(server, name, properties=None, required=None):
+    tool = {'name': name, 'description': name, 'id': build_function_call_tool_name(server, name)}
+    if properties is not None:
+        tool['inputSchema'] = {
+            'type': 'object',
+            'properties': {p: {'type': 'string'} for p in properties},
+            'required': required or [],
+            '$schema': 'http://json-schema.org/draft-07/schema#',
+        }
+    return tool
+
+
+@pytest.fixture
+def manager():
+    manager = MCPToolManager(None, None)
+    manager.user_mcp = {'files': {}, 'web': {}}
+    manager.mcp_servers = dict(manager.user_mcp)
+    manager._inited = True
+    manager._user_mcp_enabled = True
+    manager._set_tools('files', [make_tool('files', 'read', ['path'], ['path']), make_tool('files', 'list')])
+    manager._set_tools('web', [make_tool('web', 'fetch', ['url', 'timeout'], ['url'])])
+    return manager
+
+
+class TestMCPToolIndex:
+    """测试工具索引和工具提示缓存"""
+
+    @pytest.mark.unit
+    def test_prompt_regenerated_only_on_change(self, manager):
+        """测试工具提示在工具列表或启用状态变化时才重新生成"""
+        prompt = manager.get_tools_prompt()
+        assert '"files.read"' in prompt and '"web.fetch"' in prompt
+        assert '$schema' not in prompt
+        assert manager.get_tools_prompt() is prompt
+
+        manager.enable_user_server('web', False)
+        prompt = manager.get_tools_prompt()
+        assert '"web.fetch"' not in prompt
+
+        manager._set_tools('files', [make_tool('files', 'write', ['path'], ['path'])])
+        prompt = manager.get_tools_prompt()
+        assert '"files.write"' in prompt and '"files.read"' not in prompt
+        assert [tool['id'] for tool in manager.get_available_tools()] == ['files.write']
+
+    @pytest.mark.unit
+    def test_lookup(self, manager):
+        """测试按 id 查找工具并检查必需参数"""
+        entries = manager._index['web.fetch']
+        assert manager.select_tool(entries, {'url': 'x'}).tool['name'] == 'fetch'
+        assert manager.select_tool(entries, {'timeout': 1}) is None
+        assert manager.select_tool(manager._index['files.list'], {'any': 1}).server == 'files'
+
+        result = manager.call_tool('web.missing', {})
+        assert result['content'][0]['text'] == 'No tool found with name: web.missing'
+        result = manager.call_tool('web.fetch', {'timeout': 1})
+        assert result['content'][0]['text'] == 'No suitable tool found for web.fetch with given arguments'
+
+        manager.enable_user_server('web', False)
+        result = manager.call_tool('web.fetch', {'url': 'x'})
+        assert result['content'][0]['text'] == 'No tool found with name: web.fetch'
+
+
+class TestMCPMultiCall:
+    """测试一次回复中的多个工具调用"""
+
+    @pytest.mark.unit
+    def test_parse_multiple_calls(self):
+        """测试解析回复中的所有工具调用并去重"""
+        call1 = '{"action": "call_tool", "name": "web.search", "arguments": {"q": "a"}}'
+        call2 = '{"action": "call_tool", "name": "web.search", "arguments": {"q": "b"}}'
+        markdown = f"Searching:\n```json\n{call1}\n```\n```json\n{call2}\n```\n```json\n{call1}\n```\n"
+        ret = CodeBlocks().parse(markdown, parse_mcp=True)
+        assert [json.loads(c)['arguments']['q'] for c in ret['call_tools']] == ['a', 'b']
+
+        ret = CodeBlocks().parse(f"```json\n[{call1}, {call2}]\n```", parse_mcp=True)
+        assert len(ret['call_tools']) == 2
+
+    @pytest.mark.unit
+    def test_concurrent_calls_share_session(self, temp_dir, monkeypatch):
+        """测试多个调用同时执行并复用同一个服务器会话"""
+        monkeypatch.setattr(cache, '_default_cache', KVCache(str(temp_dir / 'cache.db')))
+        script = temp_dir / 'server.py'
+        script.write_text(SERVER, encoding='utf-8')
+        config_file = temp_dir / 'mcp.json'
+        config = {'mcpServers': {'srv': {'command': sys.executable, 'args': [str(script)]}}}
+        config_file.write_text(json.dumps(config), encoding='utf-8')
+        manager = MCPToolManager(str(config_file), None)
+        try:
+            manager.enable_user_mcp(True)
+            manager.call_tool('srv.wait', {'seconds': 0})
+
+            # 三个调用都到达服务器后才一起返回，串行执行时第一个调用会超时
+            calls = [{'name': 'srv.wait', 'arguments': {'seconds': 0, 'barrier': 3}}] * 3 + [{'name': 'srv.missing'}]
+            results = manager.call_tools(calls)
+
+            pids = {r['content'][0]['text'] for r in results[:3]}
+            assert len(pids) == 1 and 'timeout' not in pids
+            assert results[3]['isError'] and 'srv.missing' in results[3]['content'][0]['text']
+        finally:
+            manager.discovery.close()
+            manager.sessions.close()
+
+    @pytest.mark.unit
+    def test_failed_call_not_retried(self, temp_dir):
+        """测试请求发出后会话断开时不重试（工具只执行一次），下次调用重新建立会话"""
+        script = temp_dir / 'server.py'
+        script.write_text(SERVER, encoding='utf-8')
+        config = {'command': sys.executable, 'args': [str(script)]}
+        log = temp_dir / 'calls.log'
+        pool = MCPSessionPool()
+        try:
+            first = pool.call_tool('srv', config, 'wait', {'seconds': 0}).result(timeout=60)
+            with pytest.raises(Exception):
+                pool.call_tool('srv', config, 'wait', {'seconds': 0, 'crash': str(log)}).result(timeout=60)
+            assert len(log.read_text().splitlines()) == 1
+
+            second = pool.call_tool('srv', config, 'wait', {'seconds': 0}).result(timeout=60)
+            assert second['content'][0]['text'] != first['content'][0]['text']
+        finally:
+            pool.close()
+
+    @pytest.mark.unit
+    def test_retry_only_unsent_requests(self, monkeypatch):
+        """测试只有请求没有发出（会话已断开）时才在新会话上重试"""
+        calls = []
+
+        class Session:
+            def __init__(self, error):
+                self.error = error
+
+            async def call_tool(self, name, arguments, progress_callback=None):
+                calls.append(self)
+                if self.error:
+                    raise self.error
+                return SimpleNamespace(model_dump=lambda: {'content': []})
+
+        pool = MCPSessionPool()
+        sessions = []
+
+        async def get_session(name, config):
+            pool._ready[name] = None
+            return sessions.pop(0)
+        monkeypatch.setattr(pool, '_get_session', get_session)
+        monkeypatch.setattr(pool, '_drop_session', lambda name, session: None)
+        try:
+            pool._ready['srv'] = None
+            sessions[:] = [Session(anyio.ClosedResourceError()), Session(None)]
+            assert pool.call_tool('srv', {}, 'wait', {}).result(timeout=10) == {'content': []}
+            assert len(calls) == 2
+
+            calls.clear()
+            sessions[:] = [Session(RuntimeError('invalid result')), Session(None)]
+            with pytest.raises(RuntimeError):
+                pool.call_tool('srv', {}, 'wait', {}).result(timeout=10)
+            assert len(calls) == 1
+        finally:
+            pool.close()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the metrics registry
+"""
+
+import threading
+
+import pytest
+
+from aipyapp.aipy.blocks import CodeBlock
+from aipyapp.aipy.metrics import MetricsRegistry, MetricsListener
+from aipyapp.interface import EventBus
+from aipyapp.llm import ChatMessage
+
+
+class TestMetricsRegistry:
+    """测试计数器、直方图和 Prometheus 文本格式"""
+
+    @pytest.mark.unit
+    def test_render(self):
+        """测试多线程计数汇总、直方图累计桶和回调指标"""
+        registry = MetricsRegistry()
+        counter = registry.counter('jobs_total', 'Jobs', ('status',))
+        histogram = registry.histogram('job_seconds', 'Job duration', buckets=(1, 5))
+        registry.gauge('queue', 'Queue depth', lambda: {('pending',): 2}, ('status',))
+
+        def work():
+            for _ in range(1000):
+                counter.labels('ok').inc()
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for value in (0.5, 3, 10):
+            histogram.observe(value)
+
+        text = registry.render()
+        assert '# TYPE jobs_total counter' in text
+        assert 'jobs_total{status="ok"} 4000' in text
+        assert 'job_seconds_bucket{le="1"} 1' in text
+        assert 'job_seconds_bucket{le="5"} 2' in text
+        assert 'job_seconds_bucket{le="+Inf"} 3' in text
+        assert 'job_seconds_sum 13.5' in text
+        assert 'job_seconds_count 3' in text
+        assert 'queue{status="pending"} 2' in text
+        assert registry.counter('jobs_total', 'Jobs', ('status',)) is counter
+        with pytest.raises(ValueError):
+            registry.histogram('jobs_total', 'Jobs')
+
+    @pytest.mark.unit
+    def test_listener(self):
+        """测试任务事件转换为指标"""
+        registry = MetricsRegistry()
+        bus = EventBus()
+        bus.add_listener(MetricsListener(registry))
+
+        msg = ChatMessage(role='assistant', content='ok',
+                          usage={'time': 1.2, 'ttft': 0.3, 'input_tokens': 100, 'output_tokens': 20})
+        bus.emit('response_complete', llm='gpt', msg=msg)
+        bus.emit('response_complete', llm='gpt', msg=ChatMessage(role='error', content='boom'))
+        bus.emit('response_complete', llm='gpt', msg=ChatMessage(role='assistant', content='ok',
+                 usage={'time': 0.01, 'input_tokens': 100, 'output_tokens': 20, 'cached': 1}))
+        block = CodeBlock(code='print(1)', lang='python', name='b1', version=1)
+        bus.emit('exec_result', result={}, block=block, usage={'wall_time': 0.2})
+        bus.emit('exec_result', result={'errstr': 'boom'}, block=block, usage={'wall_time': 0.1})
+        bus.emit('exec_result', result={}, block=block, usage=None, cached=True)
+        bus.emit('mcp_call', block={})
+        bus.emit('mcp_result', block=block, result={'isError': True})
+        bus.emit('round_end', summary={}, response='')
+
+        text = registry.render()
+        assert 'aipy_llm_requests_total{llm="gpt",status="ok"} 1' in text
+        assert 'aipy_llm_requests_total{llm="gpt",status="error"} 1' in text
+        assert 'aipy_llm_requests_total{llm="gpt",status="cached"} 1' in text
+        assert 'aipy_llm_tokens_total{llm="gpt",type="input"} 100' in text
+        assert 'aipy_llm_latency_seconds_count{llm="gpt"} 1' in text
+        assert 'aipy_llm_ttft_seconds_count{llm="gpt"} 1' in text
+        assert 'aipy_exec_total{lang="python",status="ok"} 1' in text
+        assert 'aipy_exec_total{lang="python",status="error"} 1' in text
+        assert 'aipy_exec_total{lang="python",status="cached"} 1' in text
+        assert 'aipy_exec_duration_seconds_count{lang="python"} 2' in text
+        assert 'aipy_mcp_calls_total{status="error"} 1' in text
+        assert 'aipy_mcp_latency_seconds_count 1' in text
+        assert 'aipy_rounds_total 1' in text
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the block and runtime module importers
+"""
+
+import sys
+import threading
+
+import pytest
+
+from aipyapp.exec.python.mod_dict import DictModuleImporter
+from aipyapp.exec.python.mod_obj import ObjectImporter
+
+BLOCK = """
+import builtins
+builtins._block_runs = getattr(builtins, '_block_runs', 0) + 1
+value = {value}
+"""
+
+
+def import_block(importer, name='main'):
+    with importer:
+        return __import__(f'blocks.{name}', fromlist=['value'])
+
+
+class TestBlockImporter:
+    """测试代码块模块缓存"""
+
+    @pytest.fixture(autouse=True)
+    def reset_counter(self):
+        import builtins
+        builtins._block_runs = 0
+        yield
+        del builtins._block_runs
+
+    @pytest.mark.unit
+    def test_module_cached_per_version(self):
+        """测试同一版本只执行一次模块体，版本变化后重新执行"""
+        import builtins
+        importer = DictModuleImporter()
+        importer.add_module('main', compile(BLOCK.format(value=1), 'main', 'exec'), 1)
+
+        assert import_block(importer).value == 1
+        assert not importer.add_module('main', compile(BLOCK.format(value=1), 'main', 'exec'), 1)
+        assert import_block(importer).value == 1
+        assert builtins._block_runs == 1
+
+        assert importer.add_module('main', compile(BLOCK.format(value=2), 'main', 'exec'), 2)
+        with importer:
+            from blocks import main
+        assert main.value == 2
+        assert builtins._block_runs == 2
+
+    @pytest.mark.unit
+    def test_modules_isolated_between_importers(self):
+        """测试缓存的模块只在 with 语句内可见"""
+        first, second = DictModuleImporter(), DictModuleImporter()
+        first.add_module('main', BLOCK.format(value=1), 1)
+        second.add_module('main', BLOCK.format(value=2), 1)
+
+        assert import_block(first).value == 1
+        assert 'blocks.main' not in sys.modules
+        assert import_block(second).value == 2
+
+
+class TestRuntimeImporter:
+    """测试运行时对象模块"""
+
+    @pytest.mark.unit
+    def test_module_built_once_and_lazy(self):
+        """测试运行时模块只创建一次，属性在访问时获取"""
+        class Runtime:
+            name = 'first'
+
+        runtime = Runtime()
+        importer = ObjectImporter({'utils': runtime})
+        with importer:
+            from aipyapp import utils as first
+        runtime.name = 'second'
+        with importer:
+            from aipyapp import utils as second
+
+        assert first is second
+        assert second.name == 'second'
+        assert 'aipyapp.utils' not in sys.modules
+        import aipyapp
+        assert not hasattr(aipyapp, 'utils')
+
+
+class TestConcurrentImporters:
+    """测试不同线程中同时激活的导入器互不影响"""
+
+    @pytest.mark.unit
+    def test_two_threads(self):
+        """测试两个线程同时在 with 语句内导入各自的代码块和运行时对象"""
+        class Runtime:
+            def __init__(self, name):
+                self.name = name
+
+        importers = []
+        for value in (1, 2):
+            block_importer = DictModuleImporter()
+            block_importer.add_module('main', f'value = {value}', 1)
+            runtime_importer = ObjectImporter({'utils': Runtime(f'runtime{value}')})
+            importers.append((value, block_importer, runtime_importer))
+            # 预先缓存模块
+            with block_importer, runtime_importer:
+                from blocks import main
+                from aipyapp import utils
+
+        barrier = threading.Barrier(2, timeout=10)
+        results = {}
+
+        def run(value, block_importer, runtime_importer):
+            with block_importer, runtime_importer:
+                barrier.wait()
+                from blocks import main
+                from aipyapp import utils
+                barrier.wait()
+                import blocks.main
+                results[value] = (main.value, blocks.main.value, utils.name)
+
+        threads = [threading.Thread(target=run, args=args) for args in importers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == {1: (1, 1, 'runtime1'), 2: (2, 2, 'runtime2')}
+        assert 'blocks' not in sys.modules and 'blocks.main' not in sys.modules
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for MMContent attachment handling
+"""
+
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from aipyapp.aipy import multimodal
+from aipyapp.aipy.multimodal import MMContent, _detect_encoding, clear_image_memo, detect_encoding
+
+
+class TestAttachments:
+    """测试附件处理"""
+
+    @pytest.mark.unit
+    def test_small_document_inlined(self, temp_dir):
+        """测试小文件完整内联，并支持非 UTF-8 编码"""
+        path = temp_dir / 'notes.txt'
+        path.write_text('你好，世界\n' * 20, encoding='gbk')
+
+        content = MMContent(f'read @{path}').content
+        assert f'<attachment filename="{path}">' in content
+        assert '你好，世界' in content
+
+    @pytest.mark.unit
+    def test_large_csv_outline(self, temp_dir):
+        """测试大 CSV 只给出表头、行数和头尾"""
+        path = temp_dir / 'data.csv'
+        with open(path, 'w') as f:
+            f.write('id,name\n')
+            for i in range(5000):
+                f.write(f'{i},name_{i}\n')
+
+        content = MMContent(f'@{path}', max_inline_size=1024).content
+        assert 'truncated="true"' in content
+        assert 'CSV columns: id,name' in content
+        assert 'Data rows: 5000' in content
+        assert '4999,name_4999' in content
+        assert '2500,name_2500' not in content
+
+    @pytest.mark.unit
+    def test_large_json_schema(self, temp_dir):
+        """测试大 JSON 给出结构示例"""
+        path = temp_dir / 'data.json'
+        path.write_text('{"items": [' + ','.join(f'{{"id": {i}}}' for i in range(1000)) + ']}')
+
+        content = MMContent(f'@{path}', max_inline_size=1024).content
+        assert 'JSON schema sample: {"items": [{"id": 0}, "... 1000 items"]}' in content
+
+    @pytest.mark.unit
+    def test_large_image_not_encoded(self, temp_dir):
+        """测试超过大小限制的图片不做 base64 编码"""
+        path = temp_dir / 'photo.png'
+        path.write_bytes(b'\x89PNG' + b'\x00' * 2048)
+
+        content = MMContent(f'look @{path}', max_image_size=1024).content
+        assert content[1]['type'] == 'text'
+        assert 'too large' in content[1]['text']
+
+    @pytest.mark.unit
+    def test_encoding_detection_cached(self, temp_dir):
+        """测试编码检测按路径和修改时间缓存"""
+        path = temp_dir / 'a.txt'
+        path.write_text('hello world\n')
+        _detect_encoding.cache_clear()
+
+        detect_encoding(path)
+        detect_encoding(path)
+        assert _detect_encoding.cache_info().hits == 1
+
+
+def make_image(path, size=(3000, 2000)):
+    Image.new('RGB', size, (0, 128, 255)).save(path, format='PNG')
+    return path
+
+
+def decode_image(item):
+    data = item['image_url']['url'].split(',', 1)[1]
+    return Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+class TestImagePreparation:
+    """测试图片预处理、缓存和去重"""
+
+    @pytest.mark.unit
+    def test_downscale_with_model_options(self, temp_dir):
+        """测试按模型参数缩小并重新编码图片"""
+        clear_image_memo()
+        path = make_image(temp_dir / 'big.png')
+
+        content = MMContent(f'look @{path}', image_options={'max_side': 1024, 'max_short_side': 512, 'format': 'jpeg'}).content
+        assert content[1]['image_url']['url'].startswith('data:image/jpeg;base64,')
+        with decode_image(content[1]) as img:
+            assert img.size == (768, 512)
+
+    @pytest.mark.unit
+    def test_encoded_image_memoized(self, temp_dir, monkeypatch):
+        """测试相同内容和参数的图片只处理一次"""
+        clear_image_memo()
+        first = make_image(temp_dir / 'a.png')
+        second = temp_dir / 'b.png'
+        second.write_bytes(first.read_bytes())
+        calls = []
+        prepare = multimodal.prepare_image
+        monkeypatch.setattr(multimodal, 'prepare_image', lambda *args: calls.append(args) or prepare(*args))
+
+        url1 = MMContent(f'@{first}').content[0]['image_url']['url']
+        url2 = MMContent(f'@{second}').content[0]['image_url']['url']
+        assert url1 == url2
+        assert len(calls) == 1
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for native function calling
+"""
+
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from aipyapp.aipy.llm import StreamProcessor
+from aipyapp.aipy.functions import FunctionManager
+from aipyapp.aipy.native_tools import NativeTools
+from aipyapp.llm import OpenAIBaseClient, ClaudeClient, parse_tool_arguments
+
+
+def delta_chunk(content=None, tool_calls=None):
+    delta = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=delta)])
+
+
+def call_delta(index, id=None, name=None, arguments=None):
+    return SimpleNamespace(index=index, id=id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+class TestClients:
+    """测试客户端工具调用格式转换"""
+
+    @pytest.mark.unit
+    def test_openai_stream_tool_calls(self):
+        """测试流式响应中按 index 拼接多个工具调用的参数"""
+        client = OpenAIBaseClient({'name': 'openai', 'model': 'gpt-4o'})
+        chunks = [
+            delta_chunk('Let me check'),
+            delta_chunk(tool_calls=[call_delta(0, 'call_a', 'search', '{"q": '), call_delta(1, 'call_b', 'read', '{"path"')]),
+            delta_chunk(tool_calls=[call_delta(0, arguments='"aipy"}'), call_delta(1, arguments=': "a.txt"}')]),
+            delta_chunk(tool_calls=[call_delta(2, None, 'broken', '{"x": ')]),
+        ]
+        msg = client._parse_stream_response(chunks, StreamProcessor(Mock(), 'openai'))
+        assert msg.content == 'Let me check'
+        assert msg.tool_calls == [
+            {'id': 'call_a', 'name': 'search', 'arguments': {'q': 'aipy'}},
+            {'id': 'call_b', 'name': 'read', 'arguments': {'path': 'a.txt'}},
+            {'id': 'call_2', 'name': 'broken', 'arguments': {'__raw__': '{"x": '}},
+        ]
+
+        messages = client._convert_messages([msg.to_message()])
+        assert messages[0]['tool_calls'][0] == {
+            'id': 'call_a', 'type': 'function', 'function': {'name': 'search', 'arguments': '{"q": "aipy"}'}
+        }
+
+    @pytest.mark.unit
+    def test_claude_convert_messages(self):
+        """测试连续的工具结果合并为一条用户消息"""
+        client = ClaudeClient({'name': 'claude', 'model': 'claude-sonnet-4-20250514', 'api_key': 'test'})
+        messages = client._convert_messages([
+            {'role': 'user', 'content': 'hi'},
+            {'role': 'assistant', 'content': '', 'tool_calls': [
+                {'id': 't1', 'name': 'a', 'arguments': {}},
+                {'id': 't2', 'name': 'b', 'arguments': {'x': 1}},
+            ]},
+            {'role': 'tool', 'content': 'r1', 'tool_call_id': 't1'},
+            {'role': 'tool', 'content': 'r2', 'tool_call_id': 't2'},
+        ])
+        assert [msg['role'] for msg in messages] == ['user', 'assistant', 'user']
+        assert messages[1]['content'][1] == {'type': 'tool_use', 'id': 't2', 'name': 'b', 'input': {'x': 1}}
+        assert [block['tool_use_id'] for block in messages[2]['content']] == ['t1', 't2']
+
+    @pytest.mark.unit
+    def test_parse_tool_arguments(self):
+        """测试参数解析"""
+        assert parse_tool_arguments('') == {}
+        assert parse_tool_arguments('{"a": 1}') == {'a': 1}
+        assert parse_tool_arguments('[1]') == {'__raw__': '[1]'}
+
+
+class TestNativeTools:
+    """测试工具定义生成和名称映射"""
+
+    @pytest.mark.unit
+    def test_specs_and_resolve(self):
+        """测试工具名清理、去重，并随 MCP 版本变化重新生成"""
+        def get_weather(city: str) -> str:
+            """Get the weather"""
+            return city
+
+        functions = FunctionManager()
+        functions.register_function(get_weather)
+        mcp = Mock(version=1)
+        mcp.get_tool_specs.return_value = [
+            {'name': 'fs:read.file', 'description': 'Read', 'arguments': {}},
+            {'name': 'fs:read_file', 'description': 'Read2', 'arguments': {'type': 'object'}},
+        ]
+        tools = NativeTools(mcp, functions)
+
+        specs = tools.get_specs()
+        assert [spec['name'] for spec in specs] == ['fs_read_file', 'fs_read_file_2', 'get_weather']
+        assert specs[0]['parameters'] == {'type': 'object', 'properties': {}}
+        assert specs[2]['description'] == 'Get the weather'
+        assert specs[2]['parameters']['required'] == ['city']
+        assert tools.resolve('fs_read_file_2') == ('mcp', 'fs:read_file')
+        assert tools.resolve('get_weather') == ('function', 'get_weather')
+        assert tools.resolve('missing') is None
+
+        tools.get_specs()
+        assert mcp.get_tool_specs.call_count == 1
+        mcp.version = 2
+        tools.get_specs()
+        assert mcp.get_tool_specs.call_count == 2
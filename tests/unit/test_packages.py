@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the package install manager
+"""
+
+import os
+import time
+import threading
+
+import pytest
+
+from aipyapp.exec.python.packages import PackageManager, parse_requirement, is_pinned
+
+
+class FakePip:
+    """记录安装请求，安装包含 bad 的批次时失败"""
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, requirements, upgrade=False, quiet=False):
+        self.calls.append(sorted(requirements))
+        return not any(req.startswith('bad') for req in requirements)
+
+
+@pytest.fixture
+def manager(temp_dir):
+    manager = PackageManager(record_file=temp_dir / 'record.json')
+    manager._pip_install = FakePip()
+    return manager
+
+
+class TestPackageManager:
+    """测试包安装管理"""
+
+    @pytest.mark.unit
+    def test_parse_requirement(self):
+        """测试需求字符串规范化"""
+        assert parse_requirement('Foo_Bar')[0] == 'foo-bar'
+        assert parse_requirement('Foo_Bar')[2] is True
+        assert parse_requirement('foo>=1.0')[2] is False
+
+    @pytest.mark.unit
+    def test_installed_packages_skip_pip(self, manager):
+        """测试已安装并满足版本要求的包不调用 pip"""
+        assert manager.is_satisfied('pytest')
+        assert manager.is_satisfied('PyTest>=1.0')
+        assert not manager.is_satisfied('pytest<1.0')
+        assert not manager.is_satisfied('no-such-package-aipy')
+
+        assert manager.ensure('pytest', 'loguru')
+        assert manager._pip_install.calls == []
+
+    @pytest.mark.unit
+    def test_concurrent_requests_batched(self, manager):
+        """测试并发请求合并为一次安装，失败时逐个重试"""
+        results = {}
+
+        def request(name):
+            results[name] = manager.ensure(name)
+
+        with manager._install_lock:
+            threads = [threading.Thread(target=request, args=(name,)) for name in ('pkg-a', 'pkg-b', 'bad-c')]
+            for thread in threads:
+                thread.start()
+            while len(manager._pending) < 3:
+                time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+
+        calls = manager._pip_install.calls
+        assert calls[0] == ['bad-c', 'pkg-a', 'pkg-b']
+        assert sorted(calls[1:]) == [['bad-c'], ['pkg-a'], ['pkg-b']]
+        assert results == {'pkg-a': True, 'pkg-b': True, 'bad-c': False}
+
+    @pytest.mark.unit
+    def test_install_record_persisted(self, manager, temp_dir):
+        """测试安装记录跨实例复用"""
+        assert not manager.is_satisfied('pytest[fake-extra]')
+        assert manager.ensure('pytest[fake-extra]')
+        assert 'pytest[fake-extra]' in manager.installed
+
+        other = PackageManager(record_file=temp_dir / 'record.json')
+        assert other.is_satisfied('pytest[fake-extra]')
+
+    @pytest.mark.unit
+    def test_wheel_cache(self, temp_dir):
+        """测试只有固定版本的需求先尝试离线安装，构建后超出大小上限的旧 wheel 被删除"""
+        wheels = temp_dir / 'wheels'
+        wheels.mkdir()
+        old = wheels / 'old-1.0-py3-none-any.whl'
+        old.write_bytes(b'x' * 1024 * 1024)
+        os.utime(old, (1, 1))
+        manager = PackageManager(wheel_dir=wheels, wheel_max_size=1)
+        commands = []
+
+        def pip(*args, quiet=False, silent=False):
+            commands.append(args[0] if '--no-index' not in args else 'offline')
+            if args[0] == 'wheel':
+                (wheels / 'new-1.0-py3-none-any.whl').write_bytes(b'x' * 1024)
+            return args[0] == 'wheel' or commands[-2:] == ['wheel', 'offline']
+        manager._pip = pip
+
+        assert is_pinned('foo[bar] == 1.0') and not is_pinned('foo>=1.0') and not is_pinned('foo==1.*')
+        assert manager._pip_install(['foo'])
+        assert commands == ['wheel', 'offline']
+        assert sorted(path.name for path in wheels.iterdir()) == ['new-1.0-py3-none-any.whl']
+
+        commands.clear()
+        assert manager._pip_install(['foo==1.0'])
+        assert commands == ['offline', 'wheel', 'offline']
+
+    @pytest.mark.unit
+    def test_shared_wheel_cache_serialized(self, temp_dir):
+        """测试不同环境的管理器共用 wheel 缓存时，构建和安装按缓存目录串行执行"""
+        wheels = temp_dir / 'wheels'
+        managers = [PackageManager(python=f'python{i}', wheel_dir=wheels) for i in range(2)]
+        started = threading.Barrier(2)
+        active = []
+        overlaps = []
+
+        def pip(*args, quiet=False, silent=False):
+            active.append(args[0])
+            overlaps.append(len(active))
+            time.sleep(0.02)
+            active.pop()
+            return True
+
+        def install(manager):
+            manager._pip = pip
+            started.wait()
+            manager._pip_install(['foo'])
+
+        threads = [threading.Thread(target=install, args=(manager,)) for manager in managers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(overlaps) == 4 and max(overlaps) == 1
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for PythonExecutor namespace modes
+"""
+
+import sys
+
+import pytest
+
+from aipyapp.aipy.blocks import CodeBlock
+from aipyapp.exec.python import PythonExecutor, PythonRuntime
+from aipyapp.exec.python.executor import sizeof
+
+
+class Runtime(PythonRuntime):
+    def install_packages(self, *packages):
+        return True
+
+    def get_env(self, name, default=None, *, desc=None):
+        return default
+
+    def getenv(self, name, desc=None):
+        return None
+
+    def show_image(self, path=None, url=None):
+        pass
+
+    def input(self, prompt=''):
+        return ''
+
+
+def block(name, code, version=1):
+    return CodeBlock(name=name, version=version, lang='python', code=code)
+
+
+class TestPythonExecutor:
+    """测试 Python 执行器"""
+
+    @pytest.mark.unit
+    def test_isolated_by_default(self):
+        """测试默认模式下变量不在代码块之间保留"""
+        executor = PythonExecutor(Runtime())
+        executor(block('a', 'data = [1, 2, 3]'))
+        result = executor(block('b', 'print(data)'))
+
+        assert "name 'data' is not defined" in result['errstr']
+
+    @pytest.mark.unit
+    def test_persistent_namespace(self):
+        """测试共享命名空间模式下变量保留，reset 后清空"""
+        executor = PythonExecutor(Runtime(), persistent=True)
+        executor(block('a', 'data = list(range(1000))\nname = "x"'))
+        result = executor(block('b', 'print(len(data))'))
+        assert result == {'stdout': '1000'}
+
+        total, usage = executor.get_namespace_usage()
+        assert [item[0] for item in usage] == ['data', 'name']
+        assert usage[0][1] == 'list'
+        assert total >= sys.getsizeof(list(range(1000)))
+
+        executor.reset()
+        assert executor.get_namespace_usage() == (0, [])
+        assert 'errstr' in executor(block('c', 'print(data)'))
+
+    @pytest.mark.unit
+    def test_output_buffers_reused(self):
+        """测试复用的输出缓冲区不会残留上一个代码块的输出"""
+        executor = PythonExecutor(Runtime())
+        executor(block('a', 'print("first")'))
+
+        assert executor(block('b', 'print("second")')) == {'stdout': 'second'}
+        assert executor(block('c', 'x = 1')) == {}
+
+    @pytest.mark.unit
+    def test_sizeof_samples_large_containers(self):
+        """测试大容器按抽样估算大小"""
+        small = sizeof(['x' * 100] * 10)
+        large = sizeof([str(i) * 100 for i in range(10000)])
+
+        assert small < 2000
+        assert large > 10000 * 100
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the executor registry and warm node/bash interpreters
+"""
+
+import sys
+import shutil
+import time
+
+import pytest
+
+from aipyapp.aipy.blocks import CodeBlock
+from aipyapp.exec import BlockExecutor, register_executor
+from aipyapp.exec.executor import EXECUTORS
+from aipyapp.exec.repl import NodeReplExecutor, BashReplExecutor, get_repl_overrides, RESTARTED
+
+requires_node = pytest.mark.skipif(shutil.which('node') is None, reason='requires node')
+requires_bash = pytest.mark.skipif(sys.platform == 'win32' or shutil.which('bash') is None, reason='requires bash')
+
+
+@pytest.fixture
+def make_block(temp_dir):
+    def make(lang, code, name='main', ext='js'):
+        block = CodeBlock(name=name, version=1, lang=lang, code=code, path=str(temp_dir / f'{name}.{ext}'))
+        block.save()
+        return block
+    return make
+
+
+class TestExecutorRegistry:
+    """测试执行器注册"""
+
+    @pytest.mark.unit
+    def test_register_executor(self, make_block):
+        """测试注册的执行器用于对应语言，关闭时调用 close"""
+        closed = []
+
+        @register_executor
+        class EchoExecutor:
+            name = 'echo-test'
+
+            def __init__(self, runtime):
+                pass
+
+            def __call__(self, block):
+                return {'stdout': block.code}
+
+            def close(self):
+                closed.append(True)
+
+        try:
+            executor = BlockExecutor()
+            assert executor(make_block('echo-test', 'hello')) == {'stdout': 'hello'}
+            executor.close()
+            assert closed == [True]
+        finally:
+            EXECUTORS.pop('echo-test')
+
+
+@requires_node
+class TestNodeRepl:
+    """测试常驻 node 解释器"""
+
+    @pytest.mark.unit
+    def test_state_kept_between_blocks(self, make_block):
+        """测试变量在代码块之间保留，支持重复声明和顶层 await"""
+        executor = BlockExecutor(overrides=get_repl_overrides(['javascript']))
+        try:
+            result = executor(make_block('javascript', 'const x = 21;\nconsole.log("start")'))
+            assert result == {'stdout': 'start', 'stderr': None, 'returncode': 0}
+            pid = executor.get_lang_executor('javascript').proc.pid
+
+            result = executor(make_block('javascript', 'console.log(x * 2)', name='b'))
+            assert result['stdout'] == '42'
+            result = executor(make_block('javascript', 'const x = 1;\nawait Promise.resolve();\nconsole.log(x)', name='c'))
+            assert result['stdout'] == '1'
+            assert executor.get_lang_executor('javascript').proc.pid == pid
+
+            result = executor(make_block('javascript', 'throw new Error("boom")', name='d'))
+            assert result['returncode'] == 1
+            assert 'boom' in result['stderr']
+        finally:
+            executor.close()
+
+    @pytest.mark.unit
+    def test_restart_after_crash(self, make_block):
+        """测试解释器退出后重新启动并提示状态丢失"""
+        repl = NodeReplExecutor()
+        try:
+            result = repl(make_block('javascript', 'process.exit(3)'))
+            assert 'exited with code 3' in result['errstr']
+
+            result = repl(make_block('javascript', 'console.log("ok")', name='b'))
+            assert result['stdout'] == 'ok'
+            assert result['warning'] == RESTARTED
+        finally:
+            repl.close()
+
+    @pytest.mark.unit
+    def test_idle_timeout(self, make_block):
+        """测试空闲超时后关闭解释器"""
+        repl = NodeReplExecutor(idle_timeout=0.2)
+        try:
+            repl(make_block('javascript', 'console.log(1)'))
+            assert repl.alive
+            time.sleep(0.5)
+            assert not repl.alive
+        finally:
+            repl.close()
+
+
+@requires_bash
+class TestBashRepl:
+    """测试常驻 bash"""
+
+    @pytest.mark.unit
+    def test_state_kept_between_blocks(self, make_block):
+        """测试变量和当前目录在代码块之间保留，exit 后重新启动"""
+        repl = BashReplExecutor()
+        try:
+            result = repl(make_block('bash', 'NAME=aipy\ncd /\necho start\necho err >&2', ext='sh'))
+            assert result == {'stdout': 'start', 'stderr': 'err', 'returncode': 0}
+
+            result = repl(make_block('bash', 'echo "$NAME $PWD"\nfalse', name='b', ext='sh'))
+            assert result == {'stdout': 'aipy /', 'stderr': None, 'returncode': 1}
+
+            result = repl(make_block('bash', 'echo bye\nexit 5', name='c', ext='sh'))
+            assert result['stdout'] == 'bye'
+            assert result['returncode'] == 5
+
+            result = repl(make_block('bash', 'echo "[$NAME]"', name='d', ext='sh'))
+            assert result['stdout'] == '[]'
+            assert result['warning'] == RESTARTED
+        finally:
+            repl.close()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for per-block resource accounting and limits
+"""
+
+import sys
+import time
+
+import pytest
+
+from aipyapp.aipy.blocks import CodeBlock
+from aipyapp.exec import BlockExecutor, ResourceLimits
+from aipyapp.exec.limits import ResourceMonitor
+
+from .test_python_executor import Runtime
+
+
+def python_block(code):
+    return CodeBlock(name='main', version=1, lang='python', code=code)
+
+
+def make_executor(**limits):
+    executor = BlockExecutor(ResourceLimits(interval=0.02, **limits))
+    executor.set_python_runtime(Runtime())
+    return executor
+
+
+class TestResourceAccounting:
+    """测试资源统计"""
+
+    @pytest.mark.unit
+    def test_usage_recorded(self):
+        """测试执行结果附带资源使用情况"""
+        executor = make_executor()
+        code = "import subprocess, sys\nsubprocess.run([sys.executable, '-c', 'pass'])\nx = sum(range(10**5))"
+        result = executor(python_block(code))
+
+        assert 'errstr' not in result
+        usage = executor.last_usage
+        assert usage['wall_time'] > 0
+        assert usage['cpu_user'] + usage['cpu_sys'] > 0
+        assert usage['max_rss'] > 0
+        assert usage['limit_exceeded'] is None
+        assert executor.history[-1]['usage'] is usage
+
+    @pytest.mark.unit
+    def test_limits_from_dict(self):
+        """测试从配置创建限制，忽略未知和空值"""
+        limits = ResourceLimits.from_dict({'wall_time': 5, 'max_memory': None, 'other': 1})
+
+        assert limits.wall_time == 5
+        assert limits.max_memory is None
+        assert limits.enabled
+        assert not ResourceLimits.from_dict(None).enabled
+
+
+class TestResourceLimits:
+    """测试资源限制"""
+
+    @pytest.mark.unit
+    def test_in_process_wall_time(self):
+        """测试进程内执行的死循环被看门狗中断"""
+        executor = make_executor(wall_time=0.2)
+        result = executor(python_block("while True:\n    pass"))
+
+        assert 'wall time' in result['errstr']
+        assert executor.last_usage['limit_exceeded'].startswith('wall time')
+
+    @pytest.mark.unit
+    @pytest.mark.skipif(sys.platform == 'win32', reason='requires bash')
+    def test_subprocess_wall_time(self, temp_dir):
+        """测试子进程超出墙钟时间被终止"""
+        block = CodeBlock(name='sleep', version=1, lang='bash', code='sleep 10', path=str(temp_dir / 'sleep.sh'))
+        block.save()
+
+        executor = make_executor(wall_time=0.3)
+        result = executor(block)
+
+        assert 'timed out' in result['errstr'] or 'Resource limit exceeded' in result['errstr']
+        assert executor.last_usage['wall_time'] < 5
+
+    @pytest.mark.unit
+    def test_monitor_does_not_fire_after_exit(self):
+        """测试代码块结束后看门狗不再抛出异常"""
+        with ResourceMonitor(ResourceLimits(wall_time=0.05, interval=0.01)) as monitor:
+            pass
+        time.sleep(0.1)
+
+        assert monitor.usage.limit_exceeded is None
+
+    @pytest.mark.unit
+    @pytest.mark.skipif(not sys.platform.startswith('linux'), reason='requires prlimit')
+    def test_subprocess_rlimit(self, temp_dir):
+        """测试子进程启动后通过 prlimit 限制写入文件的大小"""
+        out = temp_dir / 'big.bin'
+        block = CodeBlock(name='big', version=1, lang='bash', path=str(temp_dir / 'big.sh'),
+                          code=f'sleep 0.2\nhead -c 3000000 /dev/zero > {out}')
+        block.save()
+
+        executor = make_executor(max_output=1)
+        result = executor(block)
+
+        assert result['returncode'] != 0
+        assert out.stat().st_size <= 1024 * 1024
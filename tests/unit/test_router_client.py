@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the multi-provider routing client
+"""
+
+import time
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from aipyapp.aipy.cache import KVCache
+from aipyapp.aipy.llm import StreamProcessor
+from aipyapp.aipy.llm_cache import ResponseCache
+from aipyapp.llm import RouterClient, ClaudeClient
+from aipyapp.llm.base import BaseClient, ChatMessage
+
+
+class APIError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeProvider(BaseClient):
+    """流式返回一行回复；errors 中的状态码依次作为前几次请求的错误"""
+    def __init__(self, name, delay=0, errors=()):
+        super().__init__({'name': name, 'model': name})
+        self.delay = delay
+        self.errors = list(errors)
+        self.calls = 0
+
+    def get_completion(self, messages):
+        self.calls += 1
+        if self.errors:
+            raise APIError(self.errors.pop(0))
+        return iter([f'{self.name}\n'])
+
+    def _parse_usage(self, response):
+        return {}
+
+    def _parse_response(self, response):
+        return None
+
+    def _parse_stream_response(self, response, stream_processor):
+        with stream_processor as lm:
+            deadline = time.time() + self.delay
+            while time.time() < deadline:
+                if stream_processor.cancelled:
+                    raise Exception('aborted')
+                time.sleep(0.01)
+            for chunk in response:
+                lm.process_chunk(chunk)
+        return ChatMessage(role='assistant', content=lm.content)
+
+
+class FakeHistory(list):
+    def add(self, role, content):
+        self.append({'role': role, 'content': content})
+
+    def add_message(self, msg):
+        self.append({'role': msg.role, 'content': msg.content})
+
+    def get_messages(self):
+        return list(self)
+
+
+def ask(router):
+    task = Mock()
+    msg = router(FakeHistory(), 'hi', system_prompt='system', stream_processor=StreamProcessor(task, router.name))
+    lines = [line for call in task.emit.call_args_list if call.args[0] == 'stream' for line in call.kwargs['lines']]
+    return msg, lines
+
+
+def make_router(providers, **config):
+    config = dict({'name': 'router', 'type': 'router', 'backoff': 0.01, 'hedge_delay': 0}, **config)
+    return RouterClient(config, providers)
+
+
+class TestRouterClient:
+    """测试路由、故障转移、对冲请求和退避重试"""
+
+    @pytest.mark.unit
+    def test_failover(self):
+        """测试服务商返回 5xx 时换下一个服务商，失败的服务商暂时不再使用"""
+        a, b = FakeProvider('a', errors=[503]), FakeProvider('b')
+        router = make_router([a, b], backoff=5)
+        msg, lines = ask(router)
+        assert msg.content == 'b'
+        assert lines == ['b']
+        assert router.ranked() == [b]
+        assert router.get_health()['a']['failures'] == 1
+
+    @pytest.mark.unit
+    def test_hedge_slow_provider(self):
+        """测试首个服务商没有及时输出时同时请求下一个，先输出的获胜"""
+        a, b = FakeProvider('a', delay=3), FakeProvider('b')
+        router = make_router([a, b], hedge_delay=0.2)
+        start = time.time()
+        msg, lines = ask(router)
+        assert time.time() - start < 2
+        assert msg.content == 'b'
+        assert lines == ['b']
+        assert router.get_health()['a']['failures'] == 0
+        assert router.ranked()[0] is a
+
+    @pytest.mark.unit
+    def test_backoff_retry(self):
+        """测试 429 后退避重试，非重试错误直接返回"""
+        provider = FakeProvider('a', errors=[429, 429])
+        msg, _ = ask(make_router([provider]))
+        assert msg.content == 'a'
+        assert provider.calls == 3
+
+        provider = FakeProvider('a', errors=[400])
+        msg, _ = ask(make_router([provider]))
+        assert msg.role == 'error'
+        assert provider.calls == 1
+
+    @pytest.mark.unit
+    def test_system_prompt_per_request(self):
+        """测试系统提示词随每个请求传给 Claude 服务商，不修改服务商共享的状态"""
+        claude = ClaudeClient({'name': 'claude', 'model': 'claude-sonnet-4-20250514', 'api_key': 'test', 'stream': False})
+        claude.add_system_prompt(None, 'standalone')
+        claude._client = Mock()
+        claude._client.messages.create.return_value = SimpleNamespace(
+            content=[SimpleNamespace(type='text', text='ok')], role='assistant',
+            usage=SimpleNamespace(input_tokens=1, output_tokens=1))
+        router = make_router([claude])
+
+        msg, _ = ask(router)
+        assert msg.content == 'ok'
+        kwargs = claude._client.messages.create.call_args.kwargs
+        assert kwargs['system'] == 'system'
+        assert kwargs['messages'] == [{'role': 'user', 'content': 'hi'}]
+        assert claude._system_prompt == 'standalone'
+
+    @pytest.mark.unit
+    def test_cache_replay(self, temp_dir):
+        """测试路由客户端不继承服务商的请求模板，命中回复缓存时直接重放，不请求服务商"""
+        provider = FakeProvider('a')
+        router = make_router([provider])
+        router.response_cache = ResponseCache(KVCache(str(temp_dir / 'llm_cache.db')))
+        assert not isinstance(router, BaseClient)
+
+        msg, _ = ask(router)
+        assert msg.content == 'a'
+        msg, lines = ask(router)
+        assert msg.content == 'a' and msg.usage['cached']
+        assert lines == ['a']
+        assert provider.calls == 1
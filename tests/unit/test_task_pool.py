@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for TaskPool and Task recycling
+"""
+
+import pytest
+from unittest.mock import Mock
+
+from aipyapp.aipy.task_pool import TaskPool
+from aipyapp.aipy.functions import FunctionManager
+
+
+def make_display():
+    display = Mock()
+    display.name = 'agent'
+    display.get_handlers.return_value = {}
+    return display
+
+
+@pytest.fixture
+def pool_context(mock_context):
+    """使用默认上下文配置和 agent 显示风格的任务上下文"""
+    get = mock_context.settings.get.side_effect
+    mock_context.settings.get.side_effect = lambda key, default=None: {} if key == 'context_manager' else get(key, default)
+    mock_context.display_manager.style = 'agent'
+    mock_context.display_manager.create_display_plugin.side_effect = make_display
+    return mock_context
+
+
+class TestTaskPool:
+    """测试 TaskPool"""
+
+    @pytest.mark.unit
+    def test_prewarm_and_acquire(self, pool_context):
+        """测试预热后获取的是预先创建的 Task"""
+        pool = TaskPool(pool_context, size=2)
+
+        assert pool.prewarm() == 2
+        assert pool.prewarm() == 0
+        pool.acquire()
+        status = pool.get_status()
+        assert status['idle'] == 1
+        assert status['created'] == 2
+        assert status['reused'] == 1
+
+    @pytest.mark.unit
+    def test_release_recycles_task(self, pool_context):
+        """测试放回池中的 Task 被重置"""
+        pool = TaskPool(pool_context, size=2)
+        task = pool.acquire()
+        old_id = task.task_id
+        task.instruction = 'old instruction'
+        task.start_time = 1.0
+        task.runtime.session['key'] = 'value'
+        task.code_blocks.blocks['main'] = object()
+        task.stop()
+
+        assert pool.release(task)
+        assert task.task_id != old_id
+        assert task.cwd == pool_context.cwd / task.task_id
+        assert task.instruction is None
+        assert task.start_time is None
+        assert not task.is_stopped()
+        assert task.runtime.session == {}
+        assert len(task.code_blocks.blocks) == 0
+        pool_context.display_manager.reset_display_plugin.assert_called_with(task.display)
+
+        assert pool.acquire() is task
+
+    @pytest.mark.unit
+    def test_recycle_resets_plugins_and_listeners(self, pool_context):
+        """测试复用时重置插件并丢弃上一次运行注册的事件处理器"""
+        plugin = Mock()
+        plugin.get_handlers.side_effect = lambda: {'task_end': plugin.on_task_end}
+        plugin.get_functions.return_value = {}
+        pool_context.role_manager.current_role.plugins = {'demo': {}}
+        pool_context.plugin_manager.create_task_plugin.return_value = plugin
+        pool = TaskPool(pool_context, size=1)
+        task = pool.acquire()
+        stale = Mock()
+        task.on_event('task_end', stale)
+
+        assert pool.release(task)
+        plugin.reset.assert_called_once()
+        task.emit('task_end')
+        stale.assert_not_called()
+        plugin.on_task_end.assert_called_once()
+
+    @pytest.mark.unit
+    def test_release_when_full(self, pool_context):
+        """测试池满时丢弃 Task"""
+        pool = TaskPool(pool_context, size=1)
+        first, second = pool.acquire(), pool.acquire()
+
+        assert pool.release(first)
+        assert not pool.release(second)
+        assert pool.get_status()['dropped'] == 1
+
+
+class TestSharedFunctionSchemas:
+    """测试插件函数模式共享"""
+
+    @pytest.mark.unit
+    def test_schemas_shared_between_managers(self):
+        """测试多个 FunctionManager 共享同一份参数模型"""
+        def add(a: int, b: int = 1) -> int:
+            return a + b
+
+        schemas = {}
+        fm1, fm2 = FunctionManager(), FunctionManager()
+        fm1.register_functions({'add': add}, schemas)
+        fm2.register_functions({'add': add}, schemas)
+
+        assert 'add' in schemas
+        assert fm1.function_registry['add']['param_model'] is fm2.function_registry['add']['param_model']
+        assert fm2.call('add', a=2) == 3
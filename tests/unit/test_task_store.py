@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for AgentTaskStore and agent task eviction
+"""
+
+import time
+import asyncio
+import pytest
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+from aipyapp.aipy.task_store import AgentTaskStore
+from aipyapp.aipy.agent_taskmgr import AgentTask, AgentTaskManager
+
+
+def make_record(task_id, status='completed', created_at=None, completed_at=None):
+    now = time.time()
+    return {
+        'task_id': task_id,
+        'instruction': f'instruction {task_id}',
+        'status': status,
+        'created_at': created_at or now,
+        'started_at': now,
+        'completed_at': completed_at,
+        'error': None,
+    }
+
+
+class TestAgentTaskStore:
+    """测试 AgentTaskStore"""
+
+    @pytest.mark.unit
+    def test_save_and_get(self, temp_dir):
+        """测试保存和读取任务记录"""
+        store = AgentTaskStore(temp_dir / 'tasks.db')
+        store.save(make_record('t1', status='running'))
+        store.save(make_record('t1', completed_at=time.time()), {'results': [1, 2]})
+
+        record = store.get('t1')
+        assert record['status'] == 'completed'
+        assert record['data'] == {'results': [1, 2]}
+        assert store.get('missing') is None
+
+    @pytest.mark.unit
+    def test_save_without_data_keeps_data(self, temp_dir):
+        """测试不带数据更新时保留已有数据"""
+        store = AgentTaskStore(temp_dir / 'tasks.db')
+        store.save(make_record('t1'), {'messages': []})
+        store.save(make_record('t1', status='cancelled'))
+
+        record = store.get('t1')
+        assert record['status'] == 'cancelled'
+        assert record['data'] == {'messages': []}
+
+    @pytest.mark.unit
+    def test_list_pagination_and_filter(self, temp_dir):
+        """测试分页和按状态过滤"""
+        store = AgentTaskStore(temp_dir / 'tasks.db')
+        base = time.time()
+        for i in range(5):
+            status = 'completed' if i % 2 else 'error'
+            store.save(make_record(f't{i}', status=status, created_at=base + i))
+
+        total, records = store.list(offset=0, limit=2)
+        assert total == 5
+        assert [r['task_id'] for r in records] == ['t4', 't3']
+
+        total, records = store.list(status='completed', offset=1, limit=10)
+        assert total == 2
+        assert [r['task_id'] for r in records] == ['t1']
+
+    @pytest.mark.unit
+    def test_mark_interrupted_and_delete(self, temp_dir):
+        """测试重启后标记中断任务和按时间删除"""
+        store = AgentTaskStore(temp_dir / 'tasks.db')
+        store.save(make_record('running', status='running'))
+        store.save(make_record('old', completed_at=time.time() - 7200))
+
+        assert store.mark_interrupted() == 1
+        assert store.get('running')['status'] == 'error'
+
+        assert store.delete_finished(time.time() - 3600) == 1
+        assert store.get('old') is None
+        assert store.count() == 1
+
+
+class TestAgentTaskEviction:
+    """测试 Agent 任务内存淘汰"""
+
+    def _make_manager(self, temp_dir, max_hot_tasks=2, hot_ttl=600):
+        manager = AgentTaskManager.__new__(AgentTaskManager)
+        manager.tasks = []
+        manager.agent_tasks = OrderedDict()
+        manager.max_hot_tasks = max_hot_tasks
+        manager.hot_ttl = hot_ttl
+        manager.evict_interval = 0.05
+        manager._evict_task = None
+        manager.store = AgentTaskStore(temp_dir / 'tasks.db')
+        manager.task_pool = None
+        manager.log = Mock()
+        return manager
+
+    def _add_task(self, manager, task_id, status='completed', age=0):
+        display = Mock()
+        display.get_captured_data = Mock(return_value={'messages': [], 'results': [task_id], 'errors': [], 'metadata': {}})
+        agent_task = AgentTask(task_id, 'test', Mock(), display)
+        agent_task.status = status
+        agent_task.completed_at = datetime.now() - timedelta(seconds=age)
+        manager.agent_tasks[task_id] = agent_task
+        manager.tasks.append(agent_task.task)
+        manager._save(agent_task, with_data=True)
+        return agent_task
+
+    @pytest.mark.unit
+    def test_lru_eviction(self, temp_dir):
+        """测试超过容量时淘汰最久未使用的已完成任务"""
+        manager = self._make_manager(temp_dir, max_hot_tasks=2)
+        self._add_task(manager, 'a')
+        self._add_task(manager, 'b')
+        self._add_task(manager, 'running', status='running')
+        manager._evict()
+
+        assert list(manager.agent_tasks) == ['b', 'running']
+        assert len(manager.tasks) == 2
+
+    @pytest.mark.unit
+    def test_ttl_eviction(self, temp_dir):
+        """测试过期的已完成任务被淘汰"""
+        manager = self._make_manager(temp_dir, max_hot_tasks=10, hot_ttl=60)
+        self._add_task(manager, 'old', age=120)
+        self._add_task(manager, 'new')
+        manager._evict()
+
+        assert list(manager.agent_tasks) == ['new']
+
+    @pytest.mark.unit
+    def test_cancelled_running_task_not_evicted(self, temp_dir):
+        """测试已取消但执行线程还没有返回的任务不会被淘汰和回收"""
+        manager = self._make_manager(temp_dir, max_hot_tasks=0)
+        agent_task = self._add_task(manager, 'cancelled', status='cancelled')
+        agent_task.running = True
+        manager._evict()
+        assert 'cancelled' in manager.agent_tasks
+
+        agent_task.running = False
+        manager._evict()
+        assert 'cancelled' not in manager.agent_tasks
+
+    @pytest.mark.unit
+    async def test_periodic_eviction(self, temp_dir):
+        """测试没有新任务提交和执行时定时淘汰过期任务"""
+        manager = self._make_manager(temp_dir, max_hot_tasks=10, hot_ttl=60)
+        self._add_task(manager, 'old', age=120)
+        manager.start()
+        try:
+            await asyncio.sleep(0.2)
+        finally:
+            manager.stop()
+        assert 'old' not in manager.agent_tasks
+        assert AgentTaskManager.MAX_TASKS is None
+
+    @pytest.mark.unit
+    async def test_evicted_task_result_from_store(self, temp_dir):
+        """测试淘汰后的任务可以从存储读取结果"""
+        manager = self._make_manager(temp_dir, max_hot_tasks=0)
+        self._add_task(manager, 'a')
+        manager._evict()
+        assert 'a' not in manager.agent_tasks
+
+        result = await manager.get_task_result('a')
+        assert result['status'] == 'completed'
+        assert result['output']['results'] == ['a']
+
+        listing = await manager.list_tasks(limit=10)
+        assert listing['total'] == 1
+        assert 'a' in listing['tasks']
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for task tracing
+"""
+
+import json
+
+import pytest
+
+from aipyapp.aipy.blocks import CodeBlock
+from aipyapp.aipy.tracing import Tracer
+from aipyapp.interface import EventBus
+
+
+def run_task(tracer):
+    """按任务的事件顺序模拟一轮：LLM 调用、解析、执行代码块、MCP 调用、保存"""
+    bus = EventBus()
+    bus.add_listener(tracer)
+    bus.emit('task_start', instruction='hello', task_id='0' * 32, title=None)
+    with tracer.span('llm_call', llm='gpt', model='gpt-4o') as span:
+        span.set(input_tokens=100, output_tokens=20)
+    bus.emit('parse_reply', result={'commands': [{'type': 'exec'}]})
+    block = CodeBlock(code='print(1)', lang='python', name='main', version=1)
+    bus.emit('exec', block=block)
+    bus.emit('exec_result', result={'errstr': 'boom'}, block=block, usage=None)
+    bus.emit('mcp_call', block={'content': json.dumps({'name': 'search'}), 'language': 'json'})
+    bus.emit('mcp_call', block={'content': json.dumps({'name': 'fetch'}), 'language': 'json'})
+    bus.emit('mcp_result', block=block, result={})
+    bus.emit('mcp_result', block=block, result={'isError': True})
+    bus.emit('round_end', summary={}, response='')
+    with tracer.span('save'):
+        pass
+    bus.emit('task_end', path='hello')
+
+
+class TestTracer:
+    """测试 span 的层级、属性和 OTLP JSON 导出"""
+
+    @pytest.mark.unit
+    def test_span_tree(self):
+        """测试事件和 with 块创建的 span 组成 task → round → 各阶段的层级"""
+        tracer = Tracer()
+        run_task(tracer)
+
+        tree = [(depth, span.name) for depth, span in tracer.get_tree()]
+        assert tree == [(0, 'task'), (1, 'round'), (2, 'llm_call'), (2, 'parse'), (2, 'exec_block'),
+                        (2, 'mcp_call'), (2, 'mcp_call'), (1, 'save')]
+        spans = {span.name: span for span in tracer.spans}
+        assert all(span.end is not None for span in tracer.spans)
+        assert spans['llm_call'].attributes == {'llm': 'gpt', 'model': 'gpt-4o', 'input_tokens': 100, 'output_tokens': 20}
+        assert spans['parse'].start == spans['llm_call'].end
+        assert spans['exec_block'].attributes['block'] == 'main'
+        assert spans['exec_block'].error == 'boom'
+        mcp = [span for span in tracer.spans if span.name == 'mcp_call']
+        assert [span.attributes['tool'] for span in mcp] == ['search', 'fetch']
+        assert mcp[0].error is None and mcp[1].error == 'isError'
+
+    @pytest.mark.unit
+    def test_export(self, tmp_path):
+        """测试任务结束时追加一行 OTLP JSON"""
+        path = tmp_path / 'traces.jsonl'
+        tracer = Tracer(file=str(path))
+        run_task(tracer)
+        run_task(tracer)
+
+        lines = path.read_text(encoding='utf-8').splitlines()
+        assert len(lines) == 2
+        spans = json.loads(lines[0])['resourceSpans'][0]['scopeSpans'][0]['spans']
+        assert len(spans) == 8
+        assert {span['traceId'] for span in spans} == {'0' * 32}
+        ids = {span['spanId'] for span in spans}
+        assert all(span['parentSpanId'] in ids for span in spans if span['name'] != 'task')
+        llm = next(span for span in spans if span['name'] == 'llm_call')
+        assert {'key': 'input_tokens', 'value': {'intValue': '100'}} in llm['attributes']
+        assert int(llm['endTimeUnixNano']) >= int(llm['startTimeUnixNano'])
+        exec_block = next(span for span in spans if span['name'] == 'exec_block')
+        assert exec_block['status'] == {'code': 2, 'message': 'boom'}
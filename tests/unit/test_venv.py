@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for overlay virtual environments
+"""
+
+import sys
+import subprocess
+
+import pytest
+
+from aipyapp.aipy.blocks import CodeBlock
+from aipyapp.exec import BlockExecutor
+from aipyapp.exec.python.packages import configure, get_package_manager
+from aipyapp.exec.venv import EnvManager
+
+from .test_python_executor import Runtime
+
+
+@pytest.fixture
+def env_manager(temp_dir):
+    return EnvManager(temp_dir / 'venvs', 'task')
+
+
+class TestEnvManager:
+    """测试 overlay 环境的创建和释放"""
+
+    @pytest.mark.unit
+    def test_overlay_sees_base_packages(self, env_manager):
+        """测试 overlay 环境的解释器可以导入 aipy 所在环境的包"""
+        env = env_manager.acquire('task1')
+        assert env_manager.acquire('task1') is env
+        assert env.site_packages.is_dir()
+
+        out = subprocess.check_output([env.python, '-c', 'import sys, loguru; print(sys.prefix)'], text=True)
+        assert out.strip() == str(env.path)
+
+    @pytest.mark.unit
+    def test_envs_isolated_and_released(self, env_manager):
+        """测试不同任务的环境互不影响，task 模式下释放后删除"""
+        first, second = env_manager.acquire('a'), env_manager.acquire('b')
+        (first.site_packages / 'overlay_only_mod.py').write_text('value = 42\n')
+
+        assert not (second.site_packages / 'overlay_only_mod.py').exists()
+        env_manager.release(first)
+        assert not first.path.exists()
+        assert second.path.exists()
+
+
+class TestOverlayExecution:
+    """测试代码块在 overlay 环境中执行"""
+
+    @pytest.mark.unit
+    def test_python_block_imports_from_overlay(self, env_manager):
+        """测试进程内代码块优先从 overlay 环境导入并安装到该环境，环境外不可见"""
+        env = env_manager.acquire('task1')
+        (env.site_packages / 'overlay_only_mod.py').write_text('value = 42\n')
+        runtime = Runtime()
+        executor = BlockExecutor()
+        executor.set_python_runtime(runtime)
+        executor.env = env
+
+        code = 'import overlay_only_mod\nprint(overlay_only_mod.value)'
+        try:
+            assert executor(CodeBlock(name='a', version=1, lang='python', code=code))['stdout'] == '42'
+            assert env.loaded_modules() == ['overlay_only_mod']
+            # 进程内还有从环境导入的模块时，释放环境不会立即删除目录
+            env_manager.release(env)
+            assert env.path.exists()
+        finally:
+            sys.modules.pop('overlay_only_mod', None)
+        with env.activated():
+            assert runtime.package_manager is env.package_manager
+        assert runtime.package_manager is get_package_manager()
+
+        executor.env = None
+        result = executor(CodeBlock(name='b', version=1, lang='python', code=code))
+        assert 'overlay_only_mod' in result['errstr']
+
+    @pytest.mark.unit
+    def test_overlay_package_manager(self, env_manager, temp_dir):
+        """测试 overlay 环境的包管理器安装到本环境，并使用共用的 wheel 缓存"""
+        configure(wheel_dir=str(temp_dir / 'wheels'))
+        try:
+            first, second = env_manager.acquire('a'), env_manager.acquire('b')
+            manager = first.package_manager
+            assert manager is not second.package_manager
+            assert manager.python == first.python
+            assert manager.wheel_dir == temp_dir / 'wheels'
+            assert manager.record_file.parent == first.path
+            (temp_dir / 'wheels').mkdir()
+            assert first.environ({})['PIP_FIND_LINKS'] == str(temp_dir / 'wheels')
+        finally:
+            configure()
+
+    @pytest.mark.unit
+    @pytest.mark.skipif(sys.platform == 'win32', reason='requires bash')
+    def test_subprocess_runs_in_overlay(self, env_manager, temp_dir):
+        """测试子进程在 overlay 环境中启动"""
+        env = env_manager.acquire('task1')
+        block = CodeBlock(name='env', version=1, lang='bash', path=str(temp_dir / 'env.sh'),
+                          code='echo $VIRTUAL_ENV\npython -c "import sys; print(sys.prefix)"')
+        block.save()
+        executor = BlockExecutor()
+        executor.env = env
+
+        result = executor(block)
+        assert result['stdout'].splitlines() == [str(env.path), str(env.path)]
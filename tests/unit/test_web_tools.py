@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the web_tools plugin
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from aipyapp.plugins.p_web_tools import WebToolsPlugin
+
+GBK_TEXT = "这是一个没有在响应头中声明字符集的中文页面，内容使用 GBK 编码保存。缓存命中时也要正确解码。".encode('gbk')
+PAGE = b"<html><head><title>Test</title><script>x()</script></head><body><p>Hello</p></body></html>"
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        Handler.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.path == '/big':
+            # 不带 Content-Length，只能在流式读取时限制大小
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.end_headers()
+            self.wfile.write(b'x' * 4096)
+            return
+        if self.path == '/gbk':
+            if self.headers.get('If-None-Match') == '"gbk"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('ETag', '"gbk"')
+            self.end_headers()
+            self.wfile.write(GBK_TEXT)
+            return
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(PAGE)))
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def do_HEAD(self):
+        self.send_response(200 if self.path != '/missing' else 404)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.requests = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_plugin(**config):
+    plugin = WebToolsPlugin(config)
+    plugin.init()
+    return plugin
+
+
+class TestWebTools:
+    """测试网络工具插件"""
+
+    @pytest.mark.unit
+    def test_fetch_many_keeps_order(self, server):
+        """测试并发抓取结果保持输入顺序"""
+        plugin = make_plugin()
+        urls = [f"{server}/page{i}" for i in range(5)]
+        results = plugin.fn_fetch_many(urls)
+
+        assert [r['url'] for r in results] == urls
+        assert all(r['success'] for r in results)
+        assert results[0]['title'] == 'Test'
+        assert results[0]['text'] == 'Test Hello'
+
+    @pytest.mark.unit
+    def test_check_urls(self, server):
+        """测试并发检查URL状态"""
+        plugin = make_plugin()
+        results = plugin.fn_check_urls([f"{server}/ok", f"{server}/missing"])
+
+        assert [r['status_code'] for r in results] == [200, 404]
+        assert results[1]['url'] == f"{server}/missing"
+
+    @pytest.mark.unit
+    def test_streaming_byte_limit(self, server):
+        """测试流式读取时执行大小限制"""
+        plugin = make_plugin(max_content_length=1024)
+        result = plugin.fn_fetch_webpage(f"{server}/big")
+
+        assert not result['success']
+        assert '1024' in result['error']
+
+    @pytest.mark.unit
+    def test_etag_revalidation(self, server, temp_dir):
+        """测试缓存使用 ETag 重新验证"""
+        plugin = make_plugin(cache=True, cache_file=temp_dir / 'web_cache.db')
+        first = plugin.fn_fetch_webpage(f"{server}/page")
+        second = plugin.fn_fetch_webpage(f"{server}/page")
+
+        assert Handler.requests[-1] == ('/page', '"v1"')
+        assert 'from_cache' not in first
+        assert second['from_cache'] is True
+        assert second['title'] == first['title']
+
+    @pytest.mark.unit
+    def test_cached_encoding(self, server, temp_dir):
+        """测试未声明字符集的页面首次抓取和命中缓存时按同样的编码解码"""
+        plugin = make_plugin(cache=True, cache_file=temp_dir / 'web_cache.db')
+        first = plugin.fn_fetch_webpage(f"{server}/gbk")
+        second = plugin.fn_fetch_webpage(f"{server}/gbk")
+
+        assert second['from_cache'] is True
+        assert first['content'] == second['content'] == GBK_TEXT.decode('gbk')
+        assert first['encoding'] == second['encoding']